@@ -0,0 +1,198 @@
+"""
+Admission Control Module - Global concurrency governor for LLM-bound work
+
+Requests acquire one of a fixed number of slots before invoking the conversation
+graph. When all slots are busy they wait in a bounded priority queue; requests
+that cannot be served before their deadline are rejected straight away so the
+caller can return 503 + Retry-After instead of piling onto the LLM provider.
+"""
+
+import os
+import math
+import time
+import heapq
+import asyncio
+import itertools
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import metrics
+
+# Lower value = served first
+PRIORITY_HIGH = 0        # short questions / cheap requests
+PRIORITY_NORMAL = 1
+PRIORITY_LOW = 2         # long multi-day planning jobs
+PRIORITY_BACKGROUND = 3  # speculative / batch work, only runs on spare capacity
+
+PRIORITY_NAMES = {
+    PRIORITY_HIGH: "high",
+    PRIORITY_NORMAL: "normal",
+    PRIORITY_LOW: "low",
+    PRIORITY_BACKGROUND: "background",
+}
+
+QUEUE_DEPTH = metrics.gauge("travel_light_admission_queue_depth", "Requests waiting for an LLM slot")
+ACTIVE_SLOTS = metrics.gauge("travel_light_admission_active", "LLM slots currently in use")
+QUEUE_WAIT_SECONDS = metrics.histogram(
+    "travel_light_admission_wait_seconds", "Time spent queued before admission", ("priority",)
+)
+REJECTIONS = metrics.counter(
+    "travel_light_admission_rejections", "Requests rejected by admission control", ("priority", "reason")
+)
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted before its deadline"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Admission rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+def _granted(future: asyncio.Future) -> bool:
+    """True if a slot was handed to this waiter"""
+    return future.done() and not future.cancelled() and future.exception() is None
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "future", "enqueued_at")
+
+    def __init__(self, priority: int, seq: int, future: asyncio.Future):
+        self.priority = priority
+        self.seq = seq
+        self.future = future
+        self.enqueued_at = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+
+class AdmissionController:
+    """Bounded priority queue in front of a fixed number of concurrent slots"""
+
+    def __init__(self, max_concurrency: int = 8, max_queue: int = 64, queue_timeout: float = 10.0):
+        self.max_concurrency = max(1, max_concurrency)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._queue: List[_Waiter] = []
+        self._seq = itertools.count()
+        # Moving average of how long a slot is held, used to estimate queue wait
+        self._service_time = 2.0
+        self.admitted = 0
+        self.rejected = 0
+        QUEUE_DEPTH.set_function(self.queue_depth)
+        ACTIVE_SLOTS.set_function(lambda: self._active)
+
+    def queue_depth(self) -> int:
+        return sum(1 for waiter in self._queue if not waiter.future.done())
+
+    @property
+    def spare_capacity(self) -> int:
+        """Free slots with nobody waiting for them"""
+        if self.queue_depth():
+            return 0
+        return self.max_concurrency - self._active
+
+    def estimated_wait(self, ahead: int) -> float:
+        """Expected queue time for a request with `ahead` requests in front of it"""
+        return (ahead + 1) / self.max_concurrency * self._service_time
+
+    def _reject(self, priority: int, reason: str, retry_after: float) -> AdmissionRejected:
+        self.rejected += 1
+        REJECTIONS.inc(priority=PRIORITY_NAMES.get(priority, str(priority)), reason=reason)
+        return AdmissionRejected(reason, retry_after)
+
+    async def acquire(self, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> float:
+        """Wait for a slot; returns seconds spent queued or raises AdmissionRejected"""
+        timeout = self.queue_timeout if timeout is None else timeout
+        priority_name = PRIORITY_NAMES.get(priority, str(priority))
+
+        if self._active < self.max_concurrency and not self.queue_depth():
+            self._active += 1
+            self.admitted += 1
+            QUEUE_WAIT_SECONDS.observe(0.0, priority=priority_name)
+            return 0.0
+
+        ahead = sum(1 for w in self._queue if not w.future.done() and w.priority <= priority)
+        expected_wait = self.estimated_wait(ahead)
+        if timeout <= 0 or expected_wait > timeout:
+            raise self._reject(priority, "deadline", expected_wait)
+
+        if self.queue_depth() >= self.max_queue:
+            # Shed the lowest-priority waiter if the newcomer outranks it
+            worst = max((w for w in self._queue if not w.future.done()), default=None)
+            if worst is None or not priority < worst.priority:
+                raise self._reject(priority, "queue_full", expected_wait)
+            worst.future.set_exception(self._reject(worst.priority, "shed", expected_wait))
+
+        waiter = _Waiter(priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._queue, waiter)
+        try:
+            # asyncio.wait, not wait_for: wait_for can swallow a cancellation that
+            # arrives together with the slot, leaving a departed caller holding it
+            await asyncio.wait({waiter.future}, timeout=timeout)
+        except asyncio.CancelledError:
+            # Caller went away; give back a slot we may have been handed
+            if _granted(waiter.future):
+                self.release()
+            else:
+                waiter.future.cancel()
+            raise
+        if not waiter.future.done():
+            waiter.future.cancel()
+            raise self._reject(priority, "timeout", self.estimated_wait(self.queue_depth()))
+        if not _granted(waiter.future):
+            # Shed by a higher-priority request
+            raise waiter.future.exception()
+
+        waited = time.monotonic() - waiter.enqueued_at
+        self.admitted += 1
+        QUEUE_WAIT_SECONDS.observe(waited, priority=priority_name)
+        return waited
+
+    def release(self, held_for: Optional[float] = None):
+        """Free a slot, handing it straight to the best waiting request"""
+        if held_for is not None:
+            self._service_time = 0.8 * self._service_time + 0.2 * held_for
+        while self._queue:
+            waiter = heapq.heappop(self._queue)
+            if not waiter.future.done():
+                # Slot ownership transfers without touching the active count
+                waiter.future.set_result(True)
+                return
+        self._active = max(0, self._active - 1)
+
+    @asynccontextmanager
+    async def slot(self, priority: int = PRIORITY_NORMAL, timeout: Optional[float] = None) -> AsyncIterator[float]:
+        """``async with controller.slot(priority): ...`` - holds a slot for the block"""
+        waited = await self.acquire(priority, timeout)
+        start = time.monotonic()
+        try:
+            yield waited
+        finally:
+            self.release(time.monotonic() - start)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "max_concurrency": self.max_concurrency,
+            "active": self._active,
+            "queue_depth": self.queue_depth(),
+            "max_queue": self.max_queue,
+            "queue_timeout": self.queue_timeout,
+            "avg_service_time": round(self._service_time, 3),
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+        }
+
+
+controller = AdmissionController(
+    max_concurrency=int(os.getenv("TRAVEL_LIGHT_MAX_CONCURRENCY", "8")),
+    max_queue=int(os.getenv("TRAVEL_LIGHT_MAX_QUEUE", "64")),
+    queue_timeout=float(os.getenv("TRAVEL_LIGHT_QUEUE_TIMEOUT", "10")),
+)
@@ -1,20 +1,35 @@
+import os
+import sys
 import threading
 import time
 import logging
+import gzip
 import hashlib
 import json
-from typing import List, Dict, Any, Optional
-from contextlib import asynccontextmanager
+from typing import List, Dict, Any, AsyncIterator, Callable, Iterable, Optional
+from contextlib import aclosing, asynccontextmanager
 import asyncio
 
 from fastapi import FastAPI, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.middleware.gzip import GZipMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse, PlainTextResponse, JSONResponse
 from fastapi.middleware.trustedhost import TrustedHostMiddleware
-import uvicorn
+from starlette.routing import Match
 
-from travel_graph import build_conversation_graph
+import admission
+import batch
+import cache_store
+import destinations
+import jobs
+import metrics
+import prefetch
+import request_log
+import resilience
+import streaming
+import tracing
+import usage
+from travel_graph import build_conversation_graph, get_active_model
 
 # Configure logging
 logging.basicConfig(
@@ -26,14 +41,57 @@ logger = logging.getLogger(__name__)
 # Global state for conversation graph
 _conversation_graph: Optional[Any] = None
 _graph_initialized = False
+_graph_init_task: Optional[asyncio.Task] = None
+_model_label: Optional[str] = None
 
 # Response cache for frequently requested queries
 _response_cache: Dict[str, Dict[str, Any]] = {}
-_cache_ttl = 300  # 5 minutes
+_cache_ttl = int(os.getenv("TRAVEL_LIGHT_CACHE_TTL", "300"))  # 5 minutes
+
+# Cache persistence and warm-up (set TRAVEL_LIGHT_CACHE_FILE= to disable persistence)
+_cache_file = os.getenv("TRAVEL_LIGHT_CACHE_FILE", "cache/response_cache.log")
+_cache_store = cache_store.CacheSnapshotStore(_cache_file) if _cache_file else None
+_cache_restored = False
+_SNAPSHOT_INTERVAL = float(os.getenv("TRAVEL_LIGHT_CACHE_SNAPSHOT_INTERVAL", "60"))
+_SNAPSHOT_MAX_ENTRIES = int(os.getenv("TRAVEL_LIGHT_CACHE_SNAPSHOT_MAX", "500"))
+_WARMUP_LOGS = [p for p in os.getenv("TRAVEL_LIGHT_WARMUP_LOG", "").split(",") if p]
+_WARMUP_TOP_N = int(os.getenv("TRAVEL_LIGHT_WARMUP_TOP_N", "20"))
+_WARMUP_CONCURRENCY = int(os.getenv("TRAVEL_LIGHT_WARMUP_CONCURRENCY", "2"))
+_warmed_up = False
+
+# Pre-encoded cache bodies
+_GZIP_MIN_SIZE = 1000  # same threshold as GZipMiddleware
+_STREAM_CHUNK_SIZE = 64 * 1024  # larger bodies are streamed from a memoryview
 
 # Request deduplication
 _pending_requests: Dict[str, Any] = {}
 
+# Misses still generating after this many seconds are streamed (headers, then
+# heartbeats until the answer is ready) instead of holding the response back
+_STREAM_MISS_AFTER = float(os.getenv("TRAVEL_LIGHT_STREAM_MISS_AFTER", "0.5"))
+_STREAM_MISS_HEARTBEAT = float(os.getenv("TRAVEL_LIGHT_STREAM_HEARTBEAT", str(streaming.DEFAULT_HEARTBEAT_INTERVAL)))
+_streamed_misses: set = set()  # completion tasks of streamed misses (kept referenced)
+
+# Batch and plan jobs wait longer in the admission queue and retry when rejected
+_JOB_QUEUE_TIMEOUT = 60.0
+_JOB_MAX_ATTEMPTS = 10
+
+# Itineraries rendered per export request
+_EXPORT_BATCH_MAX = 50
+
+# Requests mentioning these are treated as long planning jobs for admission
+_PLANNING_KEYWORDS = ("plan", "itinerary", "trip", "days", "week")
+
+# Background server thread (Streamlit embedding)
+_server_started = False
+
+# Pre-fork worker identity (set by prefork_server in each worker process)
+_worker_slot: Optional[int] = None
+_worker_board: Optional[Any] = None
+_worker_started_at = time.time()
+_requests_served = 0
+_HEARTBEAT_INTERVAL = 2.0  # seconds
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup
@@ -41,23 +99,180 @@ async def lifespan(app: FastAPI):
     logger.info("📍 Server will be available at: http://127.0.0.1:8787")
     logger.info("📚 API docs available at: http://127.0.0.1:8787/docs")
     
-    # Initialize conversation graph
+    # Initialize the conversation graph in the background so the server
+    # starts accepting connections (health checks, cache hits) immediately.
+    # Pre-forked workers inherit a graph already built by warm_up().
+    global _graph_init_task
+    if not _graph_initialized:
+        _graph_init_task = asyncio.create_task(asyncio.to_thread(_init_conversation_graph))
+
+    background_tasks = []
+    if not _cache_restored:
+        background_tasks.append(asyncio.create_task(asyncio.to_thread(_restore_cache)))
+    if _cache_store is not None:
+        background_tasks.append(asyncio.create_task(_snapshot_loop()))
+    if _WARMUP_LOGS and not _warmed_up:
+        background_tasks.append(asyncio.create_task(_replay_warmup()))
+    if _worker_board is not None:
+        background_tasks.append(asyncio.create_task(_heartbeat_loop()))
+    background_tasks.append(asyncio.create_task(_job_manager.start()))
+    
+    yield
+
+    for task in background_tasks:
+        task.cancel()
+    _prefetcher.cancel_all()
+    await _job_manager.stop()
+    if _cache_store is not None:
+        await asyncio.to_thread(_snapshot_cache)
+    await asyncio.to_thread(request_log.close)
+    # Only a worker that exported something has a render pool to stop
+    if "exporter" in sys.modules:
+        sys.modules["exporter"].shutdown()
+    tracing.shutdown()
+    
+    # Shutdown
+    logger.info("🛑 Shutting down Travel Light API Server...")
+
+def _init_conversation_graph():
+    """Build the conversation graph (runs in a worker thread at startup)"""
     global _conversation_graph, _graph_initialized
     try:
         logger.info("🔄 Initializing conversation graph...")
         start_time = time.time()
         _conversation_graph = build_conversation_graph()
+        # Compile/map the destination index now so prefork workers share it
+        destinations.index()
+        # The chat path's modules (NumPy, SQLite) load here rather than when
+        # api_server is imported, and before the first chat needs them
+        import itinerary  # noqa: F401
+        import offer_index  # noqa: F401
+        import session_store  # noqa: F401
         init_time = time.time() - start_time
         logger.info(f"✅ Conversation graph initialized in {init_time:.2f}s")
         _graph_initialized = True
     except Exception as e:
         logger.error(f"❌ Failed to initialize conversation graph: {e}")
         _graph_initialized = False
-    
-    yield
-    
-    # Shutdown
-    logger.info("🛑 Shutting down Travel Light API Server...")
+
+def warm_up():
+    """Load the conversation graph and warm caches before forking workers"""
+    if not _graph_initialized:
+        _init_conversation_graph()
+    if not _cache_restored:
+        _restore_cache()
+    if _WARMUP_LOGS and not _warmed_up:
+        asyncio.run(_replay_warmup())
+
+def _restore_cache() -> int:
+    """Load unexpired entries from the on-disk snapshot into the response cache"""
+    global _cache_restored
+    _cache_restored = True
+    if _cache_store is None:
+        return 0
+    start_time = time.time()
+    try:
+        records = _cache_store.load(max_age=_cache_ttl)
+    except Exception as e:
+        logger.warning(f"⚠️ Failed to restore response cache: {e}")
+        return 0
+    restored = 0
+    for key, record in records.items():
+        if key in _response_cache:
+            continue
+        _response_cache[key] = {
+            'data': _build_cache_entry(record.get("content", ""), record.get("processing_time", 0.0),
+                                       record.get("usage")),
+            'timestamp': record.get("timestamp", time.time()),
+            'hits': record.get("hits", 0)
+        }
+        restored += 1
+    if restored:
+        logger.info(f"💾 Restored {restored} cached responses in {time.time() - start_time:.2f}s")
+    return restored
+
+def _snapshot_cache() -> int:
+    """Write the hottest unexpired cache entries to disk"""
+    if _cache_store is None:
+        return 0
+    now = time.time()
+    live = [
+        (key, cached) for key, cached in list(_response_cache.items())
+        if now - cached['timestamp'] < _cache_ttl
+    ]
+    live.sort(key=lambda item: item[1].get('hits', 0), reverse=True)
+    records = (
+        {
+            "key": key,
+            "content": cached['data'].get("content", ""),
+            "processing_time": cached['data'].get("processing_time", 0.0),
+            "usage": cached['data'].get("usage"),
+            "timestamp": cached['timestamp'],
+            "hits": cached.get('hits', 0)
+        }
+        for key, cached in live[:_SNAPSHOT_MAX_ENTRIES]
+    )
+    suffix = f".{_worker_slot}" if _worker_slot is not None else ""
+    try:
+        return _cache_store.write_snapshot(records, suffix=suffix)
+    except OSError as e:
+        logger.warning(f"⚠️ Failed to write cache snapshot: {e}")
+        return 0
+
+async def _snapshot_loop():
+    """Periodically persist hot cache entries"""
+    while True:
+        await asyncio.sleep(_SNAPSHOT_INTERVAL)
+        await asyncio.to_thread(_snapshot_cache)
+
+async def _replay_warmup():
+    """Replay the most frequent logged prompts so popular answers are cached"""
+    global _warmed_up
+    _warmed_up = True
+    if not await _ensure_graph():
+        return
+    prompts = await asyncio.to_thread(cache_store.top_prompts, _WARMUP_LOGS, _WARMUP_TOP_N)
+    if not prompts:
+        return
+
+    async def warm(messages: List[Dict[str, Any]]):
+        cache_key = _get_cache_key(messages)
+        if _get_cached_response(cache_key) is None and cache_key not in _pending_requests:
+            await _generate_response(cache_key, messages, admission.PRIORITY_BACKGROUND, timeout=60.0)
+
+    start_time = time.time()
+    succeeded, failed = await cache_store.replay_prompts(prompts, warm, _WARMUP_CONCURRENCY)
+    logger.info(f"🔥 Cache warm-up replayed {succeeded} prompts ({failed} failed) in {time.time() - start_time:.2f}s")
+
+def set_worker_context(slot: int, board: Any):
+    """Register this process as a pre-fork worker reporting to the master's board"""
+    global _worker_slot, _worker_board, _worker_started_at
+    _worker_slot = slot
+    _worker_board = board
+    _worker_started_at = time.time()
+    # Each worker exports its own counters: start them from zero rather than the
+    # master's warm-up counts, and label them so their series stay apart
+    metrics.reset_totals()
+    metrics.set_constant_labels(worker=slot)
+
+async def _heartbeat_loop():
+    """Tell the master this worker's event loop is responsive"""
+    while True:
+        _worker_board.heartbeat(_worker_slot, _requests_served)
+        await asyncio.sleep(_HEARTBEAT_INTERVAL)
+
+async def _ensure_graph() -> bool:
+    """Wait for startup graph initialization if it is still running"""
+    if _graph_init_task is not None and not _graph_init_task.done():
+        await asyncio.shield(_graph_init_task)
+    return _graph_initialized and _conversation_graph is not None
+
+def _get_model_label() -> str:
+    """Model name used as the "model" metrics label"""
+    global _model_label
+    if _model_label is None:
+        _model_label = get_active_model()
+    return _model_label
 
 app = FastAPI(
     title="Travel Light API",
@@ -82,7 +297,48 @@ app.add_middleware(
 )
 
 # Compression middleware
-app.add_middleware(GZipMiddleware, minimum_size=1000)
+# Endpoints that stream results incrementally; gzip would hold frames back until
+# its compressor block fills
+_INCREMENTAL_STREAM_PREFIXES = ("/api/batch",)
+_INCREMENTAL_STREAM_SUFFIXES = ("/events",)
+
+class _StreamAwareGZipMiddleware(GZipMiddleware):
+    """GZipMiddleware that leaves incremental streams uncompressed"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and (scope["path"].startswith(_INCREMENTAL_STREAM_PREFIXES)
+                                        or scope["path"].endswith(_INCREMENTAL_STREAM_SUFFIXES)):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+app.add_middleware(_StreamAwareGZipMiddleware, minimum_size=_GZIP_MIN_SIZE)
+
+# Gauges are computed at scrape time so the hot path never touches them
+metrics.CACHE_SIZE.set_function(lambda: len(_response_cache))
+metrics.PENDING_REQUESTS.set_function(lambda: len(_pending_requests))
+
+@app.middleware("http")
+async def metrics_middleware(request: Request, call_next):
+    """Bind route/model labels and record total request time"""
+    global _requests_served
+    _requests_served += 1
+    start_time = time.perf_counter()
+    model = _get_model_label()
+    # Use the route template (not the raw path) to keep label cardinality bounded
+    route = _route_template(request.scope)
+    with metrics.bind_labels(route=route, model=model):
+        response = await call_next(request)
+    metrics.REQUEST_SECONDS.observe(time.perf_counter() - start_time, route=route, model=model)
+    return response
+
+def _route_template(scope) -> str:
+    """Path template of the route a request will hit (e.g. /api/plans/{job_id}); routing hasn't run yet"""
+    for route in app.router.routes:
+        match, _ = route.matches(scope)
+        if match is Match.FULL:
+            return getattr(route, "path", "unmatched")
+    return "unmatched"
 
 # Rate limiting (simple in-memory implementation)
 _request_counts: Dict[str, List[float]] = {}
@@ -124,30 +380,152 @@ def _get_cache_key(messages: List[Dict[str, Any]]) -> str:
 
 def _get_cached_response(cache_key: str) -> Optional[Dict[str, Any]]:
     """Get cached response if available and not expired"""
-    if cache_key in _response_cache:
-        cached = _response_cache[cache_key]
-        if time.time() - cached['timestamp'] < _cache_ttl:
-            return cached['data']
-        else:
-            # Remove expired cache entry
-            del _response_cache[cache_key]
-    return None
+    with tracing.start_span("cache.get", **{"cache.key": cache_key}) as span:
+        if cache_key in _response_cache:
+            cached = _response_cache[cache_key]
+            if time.time() - cached['timestamp'] < _cache_ttl:
+                span.set_attribute("cache.hit", True)
+                cached['hits'] = cached.get('hits', 0) + 1
+                return cached['data']
+            else:
+                # Remove expired cache entry
+                del _response_cache[cache_key]
+        span.set_attribute("cache.hit", False)
+        return None
+
+def _build_cache_entry(content: str, processing_time: float,
+                       usage_data: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """Pre-encode a response so cache hits can be sent without re-serializing"""
+    body = streaming.encode_text_body(content)
+    return {
+        "content": content,
+        "processing_time": processing_time,
+        # Tokens spent generating this answer; a hit saves this much
+        "usage": usage_data,
+        "body": body,
+        # Matches GZipMiddleware's threshold; pre-compressed once instead of per hit
+        "gzip_body": gzip.compress(body, compresslevel=6, mtime=0) if len(body) >= _GZIP_MIN_SIZE else None,
+        "etag": '"' + hashlib.blake2b(body, digest_size=16).hexdigest() + '"'
+    }
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against an ETag"""
+    if not if_none_match:
+        return False
+    candidates = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in candidates or etag in (tag[2:] if tag.startswith("W/") else tag for tag in candidates)
+
+async def _iter_buffer(buffer: bytes, chunk_size: int = _STREAM_CHUNK_SIZE):
+    """Stream a large buffer as zero-copy memoryview slices"""
+    view = memoryview(buffer)
+    for i in range(0, len(view), chunk_size):
+        yield view[i : i + chunk_size]
+
+def _encoded_response(request: Request, entry: Dict[str, Any], cache_status: str,
+                      processing_time: float = 0.0) -> Response:
+    """Serve a pre-encoded cache entry, honoring If-None-Match and Accept-Encoding"""
+    headers = {
+        **streaming.SSE_HEADERS,
+        "ETag": entry["etag"],
+        "Cache-Control": "public, max-age=300",
+        "Vary": "Accept-Encoding",
+        "X-Cache": cache_status,
+        "X-Processing-Time": f"{processing_time:.2f}" if cache_status == "HIT" else str(processing_time)
+    }
+    if _etag_matches(request.headers.get("if-none-match"), entry["etag"]):
+        return Response(status_code=304, headers=headers)
+
+    body = entry["body"]
+    if entry.get("gzip_body") is not None and "gzip" in request.headers.get("accept-encoding", ""):
+        # Content-Encoding makes GZipMiddleware pass the body through untouched
+        body = entry["gzip_body"]
+        headers["Content-Encoding"] = "gzip"
+
+    if len(body) > _STREAM_CHUNK_SIZE:
+        headers["Content-Length"] = str(len(body))
+        return StreamingResponse(
+            _timed_stream(_iter_buffer(body), "/api/chat"),
+            media_type=streaming.SSE_MEDIA_TYPE,
+            headers=headers
+        )
+    return Response(content=body, media_type=streaming.SSE_MEDIA_TYPE, headers=headers)
 
 def _set_cached_response(cache_key: str, data: Dict[str, Any]):
     """Cache response data with timestamp"""
-    _response_cache[cache_key] = {
-        'data': data,
-        'timestamp': time.time()
+    with tracing.start_span("cache.set", **{"cache.key": cache_key}):
+        _response_cache[cache_key] = {
+            'data': data,
+            'timestamp': time.time(),
+            'hits': 0
+        }
+
+def _classify_priority(messages: List[Dict[str, Any]]) -> int:
+    """Short questions go ahead of long itinerary-planning requests"""
+    content = ""
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = str(message.get("content", ""))
+            break
+    lowered = content.lower()
+    if len(content) > 400 or any(word in lowered for word in _PLANNING_KEYWORDS):
+        return admission.PRIORITY_LOW
+    if len(content) <= 120:
+        return admission.PRIORITY_HIGH
+    return admission.PRIORITY_NORMAL
+
+def _invoke_graph(messages: List[Dict[str, Any]],
+                  recorder: Optional[usage.UsageRecorder] = None,
+                  progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+    """Run the conversation graph (blocking; call from a worker thread)"""
+    graph_state = {"messages": messages}
+    with tracing.start_span("graph.invoke"), metrics.timer(metrics.LLM_SECONDS):
+        callbacks = tracing.langchain_callbacks()
+        if recorder is not None:
+            callbacks = callbacks + recorder.callbacks()
+        if progress is not None:
+            callbacks = callbacks + jobs.progress_callbacks(progress)
+        if callbacks:
+            return _conversation_graph.invoke(graph_state, config={"callbacks": callbacks})
+        return _conversation_graph.invoke(graph_state)
+
+def _extract_assistant_text(result: Dict[str, Any]) -> str:
+    """Get the last assistant message content from a graph result"""
+    bot_messages = result.get("messages", [])
+    if not bot_messages:
+        return ""
+    latest = bot_messages[-1]
+    if hasattr(latest, "content"):
+        return latest.content or ""
+    if isinstance(latest, dict):
+        return latest.get("content", "") or ""
+    return str(latest)
+
+def _usage_headers(run_usage: usage.Usage, cost: float, saved: bool = False) -> Dict[str, str]:
+    """Token accounting headers; cache hits report the tokens they saved"""
+    if saved:
+        return {"X-Tokens-Total": "0", "X-Tokens-Saved": str(run_usage.total_tokens), "X-Cost-USD": "0"}
+    return {
+        "X-Tokens-Input": str(run_usage.input_tokens),
+        "X-Tokens-Output": str(run_usage.output_tokens),
+        "X-Tokens-Cached": str(run_usage.cached_tokens),
+        "X-Tokens-Total": str(run_usage.total_tokens),
+        "X-LLM-Calls": str(run_usage.calls),
+        "X-Cost-USD": f"{cost:.6f}"
     }
 
-def _chunk_text(text: str, size: int = 40):
-    """Efficient text chunking"""
-    for i in range(0, len(text), size):
-        yield text[i : i + size]
+async def _timed_stream(frames, route: str):
+    """Record how long it takes to stream a response body"""
+    start_time = time.perf_counter()
+    try:
+        async for frame in frames:
+            yield frame
+    finally:
+        metrics.STREAM_SECONDS.observe(time.perf_counter() - start_time, route=route, model=_get_model_label())
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
+    import session_store
     return {
         "status": "healthy",
         "timestamp": time.time(),
@@ -156,20 +534,79 @@ async def health_check():
         "cache_stats": {
             "cache_size": len(_response_cache),
             "pending_requests": len(_pending_requests)
+        },
+        "admission": admission.controller.stats(),
+        "prefetch": _prefetcher.stats(),
+        "providers": resilience.snapshot(),
+        "jobs": _job_manager.stats(),
+        "sessions": session_store.store().stats(),
+        "worker": {
+            "pid": os.getpid(),
+            "slot": _worker_slot,
+            "uptime": time.time() - _worker_started_at,
+            "requests_served": _requests_served
         }
     }
 
+@app.get("/health/workers")
+async def workers_health():
+    """Health of every pre-fork worker, as reported to the master"""
+    if _worker_board is None:
+        return {"mode": "single", "workers": [{"pid": os.getpid(), "requests": _requests_served}]}
+    return {"mode": "prefork", "workers": _worker_board.snapshot(), "timestamp": time.time()}
+
 @app.post("/api/chat")
 async def api_chat(request: Request):
     """Main chat endpoint with rate limiting, caching, and error handling"""
+    start_time = time.perf_counter()
+    record: Dict[str, Any] = {"route": "/api/chat", "cache": "NONE", "timings_ms": {}}
+    status_code = 500
+    with tracing.start_span("api_chat", kind="SERVER", **{"http.route": "/api/chat"}) as span:
+        try:
+            response = await _handle_chat(request, record)
+            status_code = response.status_code
+        except HTTPException as e:
+            span.set_attribute("http.status_code", e.status_code)
+            status_code = e.status_code
+            raise
+        finally:
+            record["status"] = status_code
+            record["timings_ms"]["total"] = round((time.perf_counter() - start_time) * 1000, 2)
+            if span.sampled:
+                record["trace_id"] = span.trace_id
+            # Streamed misses are logged when their answer is complete
+            if not record.get("streamed"):
+                _log_request(record)
+        if span.sampled:
+            response.headers["X-Trace-Id"] = span.trace_id
+        return response
+
+def _log_request(record: Dict[str, Any]):
+    """Hand a finished request record to the background log writer"""
+    record["ts"] = time.time()
+    record["model"] = _get_model_label()
+    if _worker_slot is not None:
+        record["worker"] = _worker_slot
+    request_log.log_request(record)
+
+async def _handle_chat(request: Request, record: Dict[str, Any]):
+    """Serve a chat request from cache or by invoking the conversation graph"""
+    import itinerary
+    import offer_index
+    import session_store
+    timings = record["timings_ms"]
     # Rate limiting
     client_ip = _get_client_ip(request)
+    record["client"] = request_log.hash_client(client_ip)
+    account = usage.client_id(request.headers.get("X-API-Key"), client_ip)
     if not _check_rate_limit(client_ip):
         logger.warning(f"Rate limit exceeded for {client_ip}")
+        metrics.RATE_LIMITED.inc()
+        record["cache"] = "RATE_LIMITED"
         raise HTTPException(status_code=429, detail="Rate limit exceeded")
     
     # Check if graph is initialized
-    if not _graph_initialized or _conversation_graph is None:
+    if not await _ensure_graph():
         logger.error("Conversation graph not initialized")
         raise HTTPException(status_code=503, detail="Service temporarily unavailable")
     
@@ -177,90 +614,144 @@ async def api_chat(request: Request):
         # Parse request
         payload = await request.json()
         messages: List[Dict[str, Any]] = payload.get("messages", [])
+        message = payload.get("message")
+        session_id = payload.get("sessionId") or request.headers.get("X-Session-Id")
         
-        if not messages:
+        if not messages and not message:
             raise HTTPException(status_code=400, detail="No messages provided")
+        if message and not session_id:
+            raise HTTPException(status_code=400, detail="message requires a sessionId")
+        # Conversations are kept server-side per session (shared with the Streamlit
+        # app), so a client only has to send its latest message
+        if session_id:
+            await _claim_session(session_id, account)
+            messages = await asyncio.to_thread(session_store.store().turn, session_id, messages or None, message)
         
         # Check cache first
         cache_key = _get_cache_key(messages)
-        cached_response = _get_cached_response(cache_key)
+        record["prompt_hash"] = cache_key
+        # A new turn makes the conversation's speculative work moot, unless it predicted this one
+        conversation = session_id or account
+        _prefetcher.cancel(conversation, keep_key=cache_key)
+        # Searches run for this request are remembered for the conversation's follow-ups
+        offer_index.bind_session(conversation)
+        record["intent"] = request_log.normalize_intent(messages)
+        record.update(request_log.message_fields(messages))
+        lookup_start = time.perf_counter()
+        with metrics.timer(metrics.CACHE_LOOKUP_SECONDS):
+            cached_response = _get_cached_response(cache_key)
+        timings["cache_lookup"] = round((time.perf_counter() - lookup_start) * 1000, 3)
         if cached_response:
             logger.info(f"Cache hit for {client_ip}")
-            return StreamingResponse(
-                _stream_cached_response(cached_response),
-                media_type="text/plain",
-                headers={"X-Cache": "HIT", "X-Processing-Time": "0.00"}
-            )
+            metrics.CACHE_HITS.inc()
+            record["cache"] = "HIT"
+            if cached_response.get("prefetched"):
+                prefetch.PREFETCH_HITS.inc()
+                record["prefetched"] = True
+            response = _cache_hit_response(request, cached_response, account, session_id)
+            _schedule_prefetch(response, conversation, messages, cached_response["content"])
+            await _remember_reply(session_id, cached_response["content"])
+            return response
         
         # Check if request is already being processed
         if cache_key in _pending_requests:
             logger.info(f"Request deduplication for {client_ip}")
+            metrics.COALESCED_REQUESTS.inc()
             # Wait for the pending request to complete
+            wait_start = time.perf_counter()
             while cache_key in _pending_requests:
                 await asyncio.sleep(0.1)
+            timings["coalesce_wait"] = round((time.perf_counter() - wait_start) * 1000, 2)
             
             # Check cache again after waiting
             cached_response = _get_cached_response(cache_key)
             if cached_response:
-                return StreamingResponse(
-                    _stream_cached_response(cached_response),
-                    media_type="text/plain",
-                    headers={"X-Cache": "HIT", "X-Processing-Time": "0.00"}
-                )
+                record["cache"] = "COALESCED"
+                if cached_response.get("prefetched"):
+                    prefetch.PREFETCH_HITS.inc()
+                    record["prefetched"] = True
+                response = _cache_hit_response(request, cached_response, account, session_id)
+                _schedule_prefetch(response, conversation, messages, cached_response["content"])
+                await _remember_reply(session_id, cached_response["content"])
+                return response
         
-        # Mark request as pending
-        _pending_requests[cache_key] = True
+        # Short factual destination questions are answered from the offline index
+        # without waiting for an LLM slot
+        answer = destinations.direct_answer(messages)
+        if answer is not None:
+            record["cache"] = "DIRECT"
+            entry = _build_cache_entry(answer, 0.0, usage.Usage().to_dict())
+            _set_cached_response(cache_key, entry)
+            await _remember_reply(session_id, answer)
+            return _encoded_response(request, entry, "DIRECT")
+        # Narrowing follow-ups ("under $150", "4-star only") filter the hotels and
+        # flights this conversation already fetched; not cached since the answer
+        # depends on the conversation's latest search rather than the messages alone
+        answer = offer_index.direct_refinement(messages)
+        if answer is not None:
+            record["cache"] = "DIRECT"
+            await _remember_reply(session_id, answer)
+            return _encoded_response(request, _build_cache_entry(answer, 0.0, usage.Usage().to_dict()), "DIRECT")
+        # Edits to the session's structured itinerary rewrite only the days they touch
+        if session_id:
+            itinerary_id = await asyncio.to_thread(itinerary.match_edit, session_id, messages)
+            if itinerary_id is not None:
+                return await _chat_itinerary_edit(request, record, itinerary_id, str(messages[-1]["content"]),
+                                                  account, session_id)
         
+        # Wait for an LLM slot (failing fast with 503 when overloaded) and generate
+        metrics.CACHE_MISSES.inc()
+        record["cache"] = "MISS"
+        priority = _classify_priority(messages)
+        record["priority"] = admission.PRIORITY_NAMES.get(priority, str(priority))
         try:
-            # Build and invoke the conversation graph
-            start_time = time.time()
-            graph_state = {"messages": messages}
-            result = _conversation_graph.invoke(graph_state)
-            processing_time = time.time() - start_time
-            
-            logger.info(f"Chat processed in {processing_time:.2f}s for {client_ip}")
-            
-            bot_messages = result.get("messages", [])
-
-            # Get the last assistant message content
-            assistant_text = ""
-            if bot_messages:
-                latest = bot_messages[-1]
-                if hasattr(latest, "content"):
-                    assistant_text = latest.content or ""
-                elif isinstance(latest, dict):
-                    assistant_text = latest.get("content", "") or ""
-                else:
-                    assistant_text = str(latest)
-
-            # Cache the response
-            _set_cached_response(cache_key, {"content": assistant_text, "processing_time": processing_time})
-
-            def streamer():
-                """Stream response with proper error handling"""
-                try:
-                    # Stream NDJSON-like lines prefixed with "data: "
-                    for chunk in _chunk_text(assistant_text, size=40):
-                        yield f"data: {{\"delta\": {chunk!r}, \"done\": false}}\n"
-                    yield "data: {\"done\": true}\n"
-                except Exception as e:
-                    logger.error(f"Error in streaming: {e}")
-                    yield f"data: {{\"error\": \"Streaming error\", \"done\": true}}\n"
-
-            return StreamingResponse(
-                streamer(), 
-                media_type="text/plain",
-                headers={
-                    "Cache-Control": "public, max-age=300",
-                    "X-Processing-Time": str(processing_time),
-                    "X-Cache": "MISS"
-                }
+            usage.ledger.check_budget(account)
+        except usage.BudgetExceeded as e:
+            logger.warning(f"Token budget exceeded for {client_ip}")
+            record["cache"] = "BUDGET_EXCEEDED"
+            raise HTTPException(
+                status_code=429,
+                detail="Token budget exceeded",
+                headers={"Retry-After": str(max(1, int(e.retry_after)))}
             )
-            
-        finally:
-            # Remove from pending requests
-            if cache_key in _pending_requests:
-                del _pending_requests[cache_key]
+        admitted = asyncio.get_running_loop().create_future()
+        generation = asyncio.create_task(
+            _generate_response(cache_key, messages, priority, stats=record, admitted=admitted))
+        try:
+            # Rejections still get a 503; once admitted, answers slower than
+            # _STREAM_MISS_AFTER are streamed with heartbeats while they generate
+            await asyncio.wait({generation, admitted}, return_when=asyncio.FIRST_COMPLETED)
+            if not generation.done():
+                await asyncio.wait({generation}, timeout=_STREAM_MISS_AFTER)
+        except asyncio.CancelledError:
+            # A client that leaves while queued gives its place up; an admitted
+            # generation finishes and is cached
+            if not admitted.done():
+                generation.cancel()
+            raise
+        if not generation.done():
+            return _streamed_miss(generation, record, account, session_id, conversation, messages)
+        try:
+            entry = generation.result()
+        except admission.AdmissionRejected as e:
+            logger.warning(f"Admission rejected for {client_ip}: {e.reason}")
+            record["cache"] = "REJECTED"
+            record["rejection"] = e.reason
+            raise HTTPException(
+                status_code=503,
+                detail="Server busy, please retry",
+                headers={"Retry-After": e.retry_after_header}
+            )
+        
+        run_usage = usage.Usage.from_dict(entry["usage"])
+        cost = usage.ledger.record(account, session_id, run_usage, _get_model_label())
+        record["usage"] = {**run_usage.to_dict(), "cost_usd": round(cost, 6)}
+        logger.info(f"Chat processed in {entry['processing_time']:.2f}s for {client_ip}")
+        response = _encoded_response(request, entry, "MISS", entry["processing_time"])
+        response.headers.update(_usage_headers(run_usage, cost))
+        _schedule_prefetch(response, conversation, messages, entry["content"])
+        await _remember_reply(session_id, entry["content"])
+        return response
         
     except HTTPException:
         raise
@@ -268,12 +759,646 @@ async def api_chat(request: Request):
         logger.error(f"Unexpected error in chat endpoint: {e}")
         raise HTTPException(status_code=500, detail="Internal server error")
 
-def _stream_cached_response(cached_data: Dict[str, Any]):
-    """Stream cached response data"""
-    content = cached_data.get("content", "")
-    for chunk in _chunk_text(content, size=40):
-        yield f"data: {{\"delta\": {chunk!r}, \"done\": false}}\n"
-    yield "data: {\"done\": true}\n"
+def _streamed_miss(generation: asyncio.Task, record: Dict[str, Any], account: str,
+                   session_id: Optional[str], conversation: str,
+                   messages: List[Dict[str, Any]]) -> StreamingResponse:
+    """Stream a MISS that is still generating: headers and heartbeats now, the answer when ready
+
+    Accounting, prefetch and the session reply run in their own task so they
+    happen even if the client disconnects; the request is logged once it ends.
+    """
+    record["streamed"] = True
+    started = time.perf_counter()
+
+    async def finish():
+        try:
+            entry = await generation
+            run_usage = usage.Usage.from_dict(entry["usage"])
+            cost = usage.ledger.record(account, session_id, run_usage, _get_model_label())
+            record["usage"] = {**run_usage.to_dict(), "cost_usd": round(cost, 6)}
+            _prefetcher.schedule(conversation, messages, entry["content"], _get_cache_key)
+            await _remember_reply(session_id, entry["content"])
+            return entry, run_usage, cost
+        except Exception as e:
+            logger.error(f"Streamed chat generation failed: {e}")
+            record["status"] = 500
+            raise
+        finally:
+            record["timings_ms"]["stream"] = round((time.perf_counter() - started) * 1000, 2)
+            _log_request(record)
+
+    finishing = asyncio.create_task(finish())
+    _streamed_misses.add(finishing)
+    finishing.add_done_callback(_forget_streamed_miss)
+
+    async def answer():
+        entry, _, _ = await asyncio.shield(finishing)
+        yield entry["content"]
+
+    def done_fields() -> Dict[str, Any]:
+        entry, run_usage, cost = finishing.result()
+        return {"processing_time": round(entry["processing_time"], 3),
+                "usage": run_usage.to_dict(), "cost_usd": round(cost, 6)}
+
+    async def frames():
+        # First byte right away so proxies see the response start
+        yield streaming.HEARTBEAT_FRAME
+        async for frame in streaming.sse_stream(answer(), heartbeat_interval=_STREAM_MISS_HEARTBEAT,
+                                                done_fields=done_fields):
+            yield frame
+
+    headers = {
+        **streaming.SSE_HEADERS,
+        "Cache-Control": "no-cache",
+        # Makes GZipMiddleware pass the frames through instead of holding them back
+        "Content-Encoding": "identity",
+        "X-Cache": "MISS",
+    }
+    return StreamingResponse(_timed_stream(frames(), "/api/chat"),
+                             media_type=streaming.SSE_MEDIA_TYPE, headers=headers)
+
+def _forget_streamed_miss(task: asyncio.Task):
+    _streamed_misses.discard(task)
+    # Failures were logged by the task; this only marks them retrieved
+    if not task.cancelled():
+        task.exception()
+
+async def _claim_session(session_id: str, account: str):
+    """Bind a session to the caller on first use; 403 if it belongs to another client"""
+    import session_store
+    if not await asyncio.to_thread(session_store.store().claim, session_id, account):
+        raise HTTPException(status_code=403, detail="Session belongs to another client")
+
+async def _remember_reply(session_id: Optional[str], content: str):
+    """Add the assistant's reply to the session's stored conversation"""
+    import session_store
+    if session_id:
+        await asyncio.to_thread(session_store.store().append, session_id, {"role": "assistant", "content": content})
+
+def _cache_hit_response(request: Request, entry: Dict[str, Any], account: str,
+                        session_id: Optional[str]) -> Response:
+    """Serve a cache hit and account the tokens it saved"""
+    saved = usage.Usage.from_dict(entry.get("usage"))
+    usage.ledger.record_cache_hit(account, session_id, saved, _get_model_label())
+    response = _encoded_response(request, entry, "HIT")
+    response.headers.update(_usage_headers(saved, 0.0, saved=True))
+    return response
+
+def _schedule_prefetch(response: Response, conversation: str, messages: List[Dict[str, Any]], reply: str):
+    """Speculatively precompute likely follow-ups to a reply (opt-in)"""
+    if _prefetcher.schedule(conversation, messages, reply, _get_cache_key):
+        response.headers["X-Prefetch"] = "scheduled"
+
+async def _prefetch_generate(messages: List[Dict[str, Any]]) -> bool:
+    """Precompute one predicted follow-up into the response cache"""
+    cache_key = _get_cache_key(messages)
+    cached = _response_cache.get(cache_key)
+    if cached is not None and time.time() - cached['timestamp'] < _cache_ttl:
+        return False
+    if cache_key in _pending_requests:
+        return False
+
+    async def generate():
+        # timeout=0: only runs on a free slot, never queues behind real requests
+        entry = await _generate_response(cache_key, messages, admission.PRIORITY_BACKGROUND, timeout=0.0)
+        entry["prefetched"] = True
+        usage.ledger.record("system:prefetch", None, usage.Usage.from_dict(entry["usage"]), _get_model_label())
+
+    # Cancelling the prefetch job stops further follow-ups but lets this one finish
+    await asyncio.shield(generate())
+    return True
+
+_prefetcher = prefetch.Prefetcher(
+    _prefetch_generate,
+    enabled=prefetch.ENABLED,
+    top_k=prefetch.TOP_K,
+    follow_ups=prefetch.FOLLOW_UPS
+)
+
+async def _generate_response(cache_key: str, messages: List[Dict[str, Any]], priority: int,
+                             timeout: Optional[float] = None,
+                             stats: Optional[Dict[str, Any]] = None,
+                             progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+                             admitted: Optional[asyncio.Future] = None) -> Dict[str, Any]:
+    """Invoke the graph under admission control and cache the encoded response
+
+    When `stats` is given (a request log record) per-stage timings are
+    recorded on it; `progress` receives graph node/tool events (plan jobs).
+    `admitted` is resolved once the request holds an LLM slot.
+    Token usage is stored on the returned entry.
+    """
+    # Mark request as pending
+    _pending_requests[cache_key] = True
+    try:
+        async with admission.controller.slot(priority, timeout) as waited:
+            if admitted is not None and not admitted.done():
+                admitted.set_result(waited)
+            # Build and invoke the conversation graph off the event loop
+            recorder = usage.UsageRecorder()
+            start_time = time.time()
+            result = await asyncio.to_thread(_invoke_graph, messages, recorder, progress)
+            processing_time = time.time() - start_time
+
+        # Graphs without LangChain callbacks still report usage on their messages
+        run_usage = recorder.usage if recorder.usage.calls else usage.usage_from_messages(result.get("messages", []))
+
+        # Cache the encoded response so hits (and this response) send the same buffer
+        encode_start = time.perf_counter()
+        entry = _build_cache_entry(_extract_assistant_text(result), processing_time, run_usage.to_dict())
+        _set_cached_response(cache_key, entry)
+        if stats is not None:
+            timings = stats.setdefault("timings_ms", {})
+            timings["queue"] = round(waited * 1000, 2)
+            timings["graph"] = round(processing_time * 1000, 2)
+            timings["encode"] = round((time.perf_counter() - encode_start) * 1000, 3)
+        return entry
+    finally:
+        # Remove from pending requests
+        _pending_requests.pop(cache_key, None)
+
+@app.post("/api/batch")
+async def api_batch(request: Request, job_id: Optional[str] = None,
+                    concurrency: int = batch.DEFAULT_CONCURRENCY):
+    """Run a JSONL batch of planning requests, streaming JSONL results as they complete
+
+    Pass ``job_id`` (from the ``X-Batch-Job-Id`` header of an earlier call) with
+    an empty body to resume a partially finished batch.
+    """
+    client_ip = _get_client_ip(request)
+    if not _check_rate_limit(client_ip):
+        metrics.RATE_LIMITED.inc()
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+    if not await _ensure_graph():
+        raise HTTPException(status_code=503, detail="Service temporarily unavailable")
+
+    try:
+        if job_id:
+            job = batch.BatchJob.open(job_id)
+        else:
+            body = await request.body()
+            items = batch.parse_lines(body.decode("utf-8", errors="replace").splitlines())
+            job = await asyncio.to_thread(batch.BatchJob.create, items)
+    except batch.BatchError as e:
+        raise HTTPException(status_code=404 if job_id else 400, detail=str(e))
+
+    account = usage.client_id(request.headers.get("X-API-Key"), client_ip)
+    concurrency = max(1, min(concurrency, admission.controller.max_concurrency))
+    logger.info(f"Batch {job.job_id} started for {client_ip} (concurrency {concurrency})")
+
+    async def lines():
+        async for result in batch.run_batch(job, _batch_generator(account), _batch_lookup, _get_cache_key,
+                                            concurrency):
+            yield streaming.dumps(result) + b"\n"
+
+    return StreamingResponse(
+        lines(),
+        media_type="application/x-ndjson",
+        headers={"X-Batch-Job-Id": job.job_id, **streaming.SSE_HEADERS}
+    )
+
+@app.get("/api/batch/{job_id}")
+async def batch_status(job_id: str):
+    """Progress of a batch job"""
+    try:
+        job = batch.BatchJob.open(job_id)
+    except batch.BatchError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+    return {**(await asyncio.to_thread(job.status)), "timestamp": time.time()}
+
+def _batch_lookup(messages: List[Dict[str, Any]]) -> Optional[str]:
+    cached = _get_cached_response(_get_cache_key(messages))
+    if cached is None:
+        return None
+    metrics.CACHE_HITS.inc()
+    return cached["content"]
+
+def _batch_generator(account: str):
+    """Generate batch misses at background priority, waiting out admission rejections"""
+
+    async def generate(messages: List[Dict[str, Any]]) -> str:
+        cache_key = _get_cache_key(messages)
+        for _ in range(_JOB_MAX_ATTEMPTS):
+            if cache_key in _pending_requests:
+                # Same prompt already running (another batch or a chat request)
+                while cache_key in _pending_requests:
+                    await asyncio.sleep(0.1)
+                cached = _get_cached_response(cache_key)
+                if cached is not None:
+                    return cached["content"]
+            usage.ledger.check_budget(account)
+            metrics.CACHE_MISSES.inc()
+            try:
+                entry = await _generate_response(cache_key, messages, admission.PRIORITY_BACKGROUND,
+                                                 timeout=_JOB_QUEUE_TIMEOUT)
+            except admission.AdmissionRejected as e:
+                await asyncio.sleep(e.retry_after)
+                continue
+            usage.ledger.record(account, None, usage.Usage.from_dict(entry["usage"]), _get_model_label(),
+                                route="/api/batch")
+            return entry["content"]
+        raise RuntimeError("Server busy, retry the batch later")
+
+    return generate
+
+@app.post("/api/plans", status_code=202)
+async def create_plan(request: Request):
+    """Queue a full-trip plan and return its job ID immediately"""
+    client_ip = _get_client_ip(request)
+    if not _check_rate_limit(client_ip):
+        metrics.RATE_LIMITED.inc()
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+    payload = await request.json()
+    messages: List[Dict[str, Any]] = payload.get("messages", [])
+    if not messages:
+        raise HTTPException(status_code=400, detail="No messages provided")
+    webhook = payload.get("webhook")
+    if webhook:
+        try:
+            jobs.validate_webhook(webhook)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    job_id = await _job_manager.submit(
+        messages,
+        session_id=payload.get("sessionId") or request.headers.get("X-Session-Id"),
+        client=usage.client_id(request.headers.get("X-API-Key"), client_ip),
+        webhook=webhook
+    )
+    status_url = f"/api/plans/{job_id}"
+    return JSONResponse(
+        status_code=202,
+        content={
+            "job_id": job_id,
+            "status": jobs.STATUS_QUEUED,
+            "status_url": status_url,
+            "events_url": f"{status_url}/events"
+        },
+        headers={"Location": status_url}
+    )
+
+@app.get("/api/plans/{job_id}")
+async def get_plan(job_id: str):
+    """Status, latest progress and (when finished) the result of a plan job"""
+    job = await asyncio.to_thread(_job_manager.store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+    return {
+        "job_id": job_id,
+        "status": job["status"],
+        "progress": job["progress"],
+        "result": job["result"],
+        "error": job["error"],
+        "created_at": job["created_at"],
+        "started_at": job["started_at"],
+        "finished_at": job["finished_at"]
+    }
+
+@app.get("/api/plans/{job_id}/events")
+async def plan_events(job_id: str):
+    """Server-Sent Events stream of a plan job's progress and final result"""
+    if await asyncio.to_thread(_job_manager.store.get, job_id) is None:
+        raise HTTPException(status_code=404, detail="Unknown job")
+
+    async def frames():
+        async for event in _job_manager.subscribe(job_id, streaming.DEFAULT_HEARTBEAT_INTERVAL):
+            yield streaming.HEARTBEAT_FRAME if event is None else streaming.encode_event(event)
+
+    return StreamingResponse(frames(), media_type=streaming.SSE_MEDIA_TYPE, headers=streaming.SSE_HEADERS)
+
+async def _run_plan_job(job: Dict[str, Any], emit: Callable[[Dict[str, Any]], None]) -> Dict[str, Any]:
+    """Run one plan job through the cache and the conversation graph"""
+    if not await _ensure_graph():
+        raise RuntimeError("Conversation graph not initialized")
+    messages = job["messages"]
+    cache_key = _get_cache_key(messages)
+    account = job.get("client") or "jobs"
+
+    for _ in range(_JOB_MAX_ATTEMPTS):
+        # Same prompt already running (chat request, batch or another job)
+        while cache_key in _pending_requests:
+            await asyncio.sleep(0.1)
+        cached = _get_cached_response(cache_key)
+        if cached is not None:
+            metrics.CACHE_HITS.inc()
+            emit({"type": "cache_hit"})
+            return {"content": cached["content"], "cache": "HIT"}
+
+        usage.ledger.check_budget(account)
+        metrics.CACHE_MISSES.inc()
+        try:
+            entry = await _generate_response(cache_key, messages, admission.PRIORITY_LOW,
+                                             timeout=_JOB_QUEUE_TIMEOUT, progress=emit)
+        except admission.AdmissionRejected as e:
+            emit({"type": "waiting", "retry_after": e.retry_after})
+            await asyncio.sleep(e.retry_after)
+            continue
+        run_usage = usage.Usage.from_dict(entry["usage"])
+        usage.ledger.record(account, job.get("session_id"), run_usage, _get_model_label(), route="/api/plans")
+        return {
+            "content": entry["content"],
+            "cache": "MISS",
+            "processing_time": entry["processing_time"],
+            "usage": run_usage.to_dict()
+        }
+    raise RuntimeError("Server busy, job could not be admitted")
+
+_job_manager = jobs.JobManager(
+    jobs.JobStore(jobs.JOB_DB),
+    _run_plan_job,
+    workers=jobs.JOB_WORKERS,
+    retention=jobs.JOB_RETENTION
+)
+
+@app.get("/api/itinerary/schema")
+async def itinerary_schema():
+    """JSON Schema of structured itineraries"""
+    import itinerary
+    return itinerary.ITINERARY_SCHEMA
+
+@app.post("/api/itinerary")
+async def create_itinerary(request: Request):
+    """Structured itinerary as SSE (header, then each day as it is written) or JSON with "stream": false"""
+    import itinerary
+    client_ip = _get_client_ip(request)
+    if not _check_rate_limit(client_ip):
+        metrics.RATE_LIMITED.inc()
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+    payload = await request.json()
+    try:
+        trip = await asyncio.to_thread(itinerary.parse_trip_request, payload)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    session_id = payload.get("sessionId") or request.headers.get("X-Session-Id")
+    account = usage.client_id(request.headers.get("X-API-Key"), client_ip)
+    if session_id:
+        await _claim_session(session_id, account)
+    try:
+        usage.ledger.check_budget(account)
+    except usage.BudgetExceeded as e:
+        raise HTTPException(status_code=429, detail="Token budget exceeded",
+                            headers={"Retry-After": str(max(1, int(e.retry_after)))})
+    events = await _start_itinerary(lambda callbacks: itinerary.generate(trip, session_id, callbacks),
+                                    account, session_id, admission.PRIORITY_LOW)
+    if payload.get("stream", True):
+        return StreamingResponse(_itinerary_frames(events), media_type=streaming.SSE_MEDIA_TYPE,
+                                 headers=streaming.SSE_HEADERS)
+    async with aclosing(events):
+        async for event in events:
+            if event["type"] == "error":
+                raise HTTPException(status_code=event.get("status", 422), detail=event["message"])
+            if event["type"] == "complete":
+                return JSONResponse(event["itinerary"])
+    raise HTTPException(status_code=500, detail="Internal server error")
+
+@app.post("/api/itinerary/{itinerary_id}/edit")
+async def edit_itinerary(itinerary_id: str, request: Request):
+    """Rewrite only the days an edit touches; streams the changed days (SSE) or returns JSON"""
+    import itinerary
+    client_ip = _get_client_ip(request)
+    if not _check_rate_limit(client_ip):
+        metrics.RATE_LIMITED.inc()
+        raise HTTPException(status_code=429, detail="Rate limit exceeded")
+
+    payload = await request.json()
+    instruction = str(payload.get("instruction") or "")
+    days = payload.get("days")
+    if not instruction and not days:
+        raise HTTPException(status_code=400, detail="No instruction provided")
+    session_id = payload.get("sessionId") or request.headers.get("X-Session-Id")
+    account = usage.client_id(request.headers.get("X-API-Key"), client_ip)
+    if session_id:
+        await _claim_session(session_id, account)
+    try:
+        usage.ledger.check_budget(account)
+    except usage.BudgetExceeded as e:
+        raise HTTPException(status_code=429, detail="Token budget exceeded",
+                            headers={"Retry-After": str(max(1, int(e.retry_after)))})
+    events = await _start_itinerary(lambda callbacks: itinerary.edit(itinerary_id, instruction, days, callbacks),
+                                    account, session_id, admission.PRIORITY_NORMAL)
+    if payload.get("stream", True):
+        return StreamingResponse(_itinerary_frames(events), media_type=streaming.SSE_MEDIA_TYPE,
+                                 headers=streaming.SSE_HEADERS)
+    async with aclosing(events):
+        async for event in events:
+            if event["type"] == "error":
+                raise HTTPException(status_code=event.get("status", 422), detail=event["message"])
+            if event["type"] == "complete":
+                return JSONResponse({**event["itinerary"], "changed": event["changed"]})
+    raise HTTPException(status_code=500, detail="Internal server error")
+
+async def _chat_itinerary_edit(request: Request, record: Dict[str, Any], itinerary_id: str,
+                               instruction: str, account: str, session_id: str) -> Response:
+    """Answer a chat turn that edits the session's itinerary with just the rewritten days"""
+    import itinerary
+    try:
+        usage.ledger.check_budget(account)
+    except usage.BudgetExceeded as e:
+        record["cache"] = "BUDGET_EXCEEDED"
+        raise HTTPException(status_code=429, detail="Token budget exceeded",
+                            headers={"Retry-After": str(max(1, int(e.retry_after)))})
+    start = time.time()
+    events = await _start_itinerary(lambda callbacks: itinerary.edit(itinerary_id, instruction, None, callbacks),
+                                    account, session_id, admission.PRIORITY_NORMAL, record)
+    content = "Sorry, I couldn't apply that change to your itinerary."
+    async with aclosing(events):
+        async for event in events:
+            if event["type"] == "complete":
+                changed = event["changed"]
+                content = itinerary.to_markdown(event["itinerary"], only_days=changed) + \
+                    f"\n\n(Updated day{'s' if len(changed) > 1 else ''} {', '.join(map(str, changed))}; " \
+                    "the rest of the itinerary is unchanged.)"
+    record["cache"] = "EDIT"
+    processing_time = time.time() - start
+    await _remember_reply(session_id, content)
+    return _encoded_response(request, _build_cache_entry(content, processing_time), "EDIT", processing_time)
+
+@app.post("/api/itinerary/export")
+async def export_itineraries(request: Request):
+    """Render several itineraries in parallel; returns download URLs"""
+    import exporter
+    import itinerary
+    payload = await request.json()
+    ids = [str(i) for i in payload.get("ids") or []][:_EXPORT_BATCH_MAX]
+    fmt = payload.get("format", "pdf")
+    if not ids:
+        raise HTTPException(status_code=400, detail="No itinerary ids provided")
+    if fmt not in exporter.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(exporter.FORMATS)}")
+    loaded = await asyncio.gather(*(asyncio.to_thread(itinerary.load, i) for i in ids))
+    found = [trip for trip in loaded if trip is not None]
+    paths = await asyncio.gather(*(exporter.export(trip, fmt) for trip in found))
+    return {
+        "exports": [
+            {"id": trip["id"], "url": f"/api/itinerary/{trip['id']}/export?format={fmt}",
+             "bytes": os.path.getsize(path)}
+            for trip, path in zip(found, paths)
+        ],
+        "missing": [i for i, trip in zip(ids, loaded) if trip is None],
+    }
+
+@app.get("/api/itinerary/{itinerary_id}/export")
+async def export_itinerary(itinerary_id: str, request: Request, format: str = "pdf"):
+    """Download an itinerary as PDF or HTML (rendered once per content, then served from disk)"""
+    import exporter
+    import itinerary
+    if format not in exporter.FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of {', '.join(exporter.FORMATS)}")
+    stored = await asyncio.to_thread(itinerary.load, itinerary_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Unknown itinerary")
+    etag = '"' + exporter.content_hash(stored, format) + '"'
+    headers = {"ETag": etag, "Cache-Control": "private, max-age=300"}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+    path = await exporter.export(stored, format)
+    return FileResponse(path, media_type=exporter.FORMATS[format], filename=exporter.filename(stored, format),
+                        headers=headers)
+
+@app.get("/api/itinerary/{itinerary_id}")
+async def get_itinerary(itinerary_id: str):
+    """A stored structured itinerary (latest version)"""
+    import itinerary
+    stored = await asyncio.to_thread(itinerary.load, itinerary_id)
+    if stored is None:
+        raise HTTPException(status_code=404, detail="Unknown itinerary")
+    return stored
+
+async def _start_itinerary(produce: Callable[[List[Any]], Iterable[Dict[str, Any]]], account: str,
+                           session_id: Optional[str], priority: int,
+                           record: Optional[Dict[str, Any]] = None) -> AsyncIterator[Dict[str, Any]]:
+    """Admit an itinerary run and return its event stream, already holding its LLM slot (503 when busy)"""
+    events = _itinerary_events(produce, account, session_id, priority)
+    try:
+        # The first event only confirms admission; once started, closing the stream releases the slot
+        await events.__anext__()
+    except admission.AdmissionRejected as e:
+        if record is not None:
+            record["cache"] = "REJECTED"
+            record["rejection"] = e.reason
+        raise HTTPException(status_code=503, detail="Server busy, please retry",
+                            headers={"Retry-After": e.retry_after_header})
+    return events
+
+async def _itinerary_events(produce: Callable[[List[Any]], Iterable[Dict[str, Any]]], account: str,
+                            session_id: Optional[str], priority: int) -> AsyncIterator[Dict[str, Any]]:
+    """Run a blocking itinerary event generator in a thread and relay its events
+
+    Holds one admission slot for the whole run (its days share it), starting
+    with an ``{"type": "admitted"}`` event, and records token usage. When the
+    stream is closed early (client gone) the run stops at its next event.
+    """
+    import itinerary
+    waited = await admission.controller.acquire(priority)
+    start = time.monotonic()
+    loop = asyncio.get_running_loop()
+    queue: asyncio.Queue = asyncio.Queue()
+    recorder = usage.UsageRecorder()
+    stop = threading.Event()
+
+    def emit(item: Optional[Dict[str, Any]]):
+        if not stop.is_set():
+            loop.call_soon_threadsafe(queue.put_nowait, item)
+
+    def run():
+        try:
+            for event in produce(recorder.callbacks()):
+                if stop.is_set():
+                    break
+                emit(event)
+        except itinerary.VersionConflict as e:
+            emit({"type": "error", "message": str(e), "status": 409})
+        except ValueError as e:
+            # Infeasible budgets, unknown currencies, edits that match nothing
+            emit({"type": "error", "message": str(e)})
+        except Exception as e:
+            logger.error(f"Itinerary generation failed: {e}")
+            emit({"type": "error", "message": "Itinerary generation failed"})
+        finally:
+            emit(None)
+
+    worker = asyncio.create_task(asyncio.to_thread(run))
+    try:
+        yield {"type": "admitted", "queued_seconds": round(waited, 3)}
+        while True:
+            event = await queue.get()
+            if event is None:
+                break
+            yield event
+    finally:
+        stop.set()
+        worker.cancel()
+        admission.controller.release(time.monotonic() - start)
+        if recorder.usage.calls:
+            usage.ledger.record(account, session_id, recorder.usage, _get_model_label(), route="/api/itinerary")
+
+async def _itinerary_frames(events: AsyncIterator[Dict[str, Any]]) -> AsyncIterator[bytes]:
+    """SSE frames: one JSON object per event, the last one with "done": true"""
+    async with aclosing(events):
+        async for event in events:
+            if event["type"] == "error":
+                yield streaming.error_frame(event["message"])
+                return
+            yield streaming.encode_event({**event, "done": event["type"] == "complete"})
+
+async def _check_session_access(request: Request, session_id: str):
+    import session_store
+    account = usage.client_id(request.headers.get("X-API-Key"), _get_client_ip(request))
+    if not await asyncio.to_thread(session_store.store().allows, session_id, account):
+        raise HTTPException(status_code=403, detail="Session belongs to another client")
+
+@app.get("/api/sessions/{session_id}")
+async def get_session(session_id: str, request: Request, limit: int = 50):
+    """A stored conversation's latest messages, e.g. to pick it up in another UI"""
+    import session_store
+    await _check_session_access(request, session_id)
+    sessions = session_store.store()
+    if not await asyncio.to_thread(sessions.exists, session_id):
+        raise HTTPException(status_code=404, detail="Session not found")
+    length = await asyncio.to_thread(sessions.length, session_id)
+    messages = await asyncio.to_thread(sessions.history, session_id, max(0, length - max(0, limit)))
+    return {"sessionId": session_id, "length": length, "messages": messages}
+
+@app.delete("/api/sessions/{session_id}")
+async def delete_session(session_id: str, request: Request):
+    """Forget a stored conversation"""
+    import session_store
+    await _check_session_access(request, session_id)
+    await asyncio.to_thread(session_store.store().delete, session_id)
+    return {"status": "deleted", "sessionId": session_id}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus metrics endpoint"""
+    return PlainTextResponse(metrics.render_latest(), media_type=metrics.CONTENT_TYPE_LATEST)
+
+@app.get("/api/traces")
+async def get_traces(limit: int = 100, trace_id: Optional[str] = None):
+    """Recent spans from the in-process trace collector"""
+    return {
+        "sample_rate": tracing.get_sample_rate(),
+        "spans": tracing.collector.recent(limit=limit, trace_id=trace_id),
+        "timestamp": time.time()
+    }
+
+@app.get("/api/usage")
+async def get_usage(request: Request, client: Optional[str] = None, session: Optional[str] = None,
+                    limit: int = 50):
+    """Token usage and estimated cost: the caller's own, or anyone's with the admin token"""
+    if not usage.is_admin(request.headers.get("X-Admin-Token")):
+        caller = usage.client_id(request.headers.get("X-API-Key"), _get_client_ip(request))
+        if client not in (None, caller):
+            raise HTTPException(status_code=403, detail="Usage of other clients requires the admin token")
+        if session is not None:
+            await _check_session_access(request, session)
+        else:
+            client = caller
+    return {
+        "model": _get_model_label(),
+        **usage.ledger.snapshot(client=client, session=session, limit=limit),
+        "timestamp": time.time()
+    }
 
 @app.exception_handler(Exception)
 async def global_exception_handler(request: Request, exc: Exception):
@@ -307,6 +1432,7 @@ def start_server_in_thread(host: str = "127.0.0.1", port: int = 8787):
     _server_started = True
 
     def run():
+        import uvicorn
         try:
             uvicorn.run(
                 app, 
@@ -323,6 +1449,21 @@ def start_server_in_thread(host: str = "127.0.0.1", port: int = 8787):
     logger.info(f"🚀 Server started in background thread on {host}:{port}")
 
 if __name__ == "__main__":
+    import argparse
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description="Travel Light API Server")
+    parser.add_argument("--host", default=os.getenv("TRAVEL_LIGHT_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("TRAVEL_LIGHT_PORT", "8787")))
+    parser.add_argument("--workers", type=int, default=int(os.getenv("TRAVEL_LIGHT_WORKERS", "1")),
+                        help="Run N pre-forked workers sharing warm state (see prefork_server.py)")
+    args = parser.parse_args()
+
+    if args.workers > 1:
+        import prefork_server
+        prefork_server.serve(args.host, args.port, args.workers)
+        raise SystemExit(0)
+
     print("🚀 Starting Travel Light API Server...")
     print("📍 Server will be available at: http://127.0.0.1:8787")
     print("📚 API docs available at: http://127.0.0.1:8787/docs")
@@ -330,8 +1471,8 @@ if __name__ == "__main__":
     
     uvicorn.run(
         app, 
-        host="127.0.0.1", 
-        port=8787, 
+        host=args.host, 
+        port=args.port, 
         log_level="info",
         access_log=True
     )
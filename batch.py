@@ -0,0 +1,219 @@
+"""
+Batch Module - Run many planning requests in one job
+
+A batch is a JSONL file of planning requests, one per line, either
+``{"id": "...", "messages": [...]}`` or ``{"id": "...", "prompt": "..."}``.
+Requests are de-duplicated (against each other and the response cache), the
+misses run with bounded parallelism behind provider rate limits, and results
+are emitted as JSONL as each one completes.
+
+Every job is persisted under ``TRAVEL_LIGHT_BATCH_DIR/<job_id>/`` (its input
+plus an append-only results file), so a partially finished batch can be resumed
+from its job ID and only the missing items are run again.
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import asyncio
+import logging
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional
+
+import metrics
+import ratelimit
+
+logger = logging.getLogger(__name__)
+
+BATCH_DIR = os.getenv("TRAVEL_LIGHT_BATCH_DIR", "batches")
+DEFAULT_CONCURRENCY = int(os.getenv("TRAVEL_LIGHT_BATCH_CONCURRENCY", "4"))
+MAX_ITEMS = int(os.getenv("TRAVEL_LIGHT_BATCH_MAX_ITEMS", "5000"))
+
+BATCH_ITEMS = metrics.counter("travel_light_batch_items", "Batch items completed", ("cache", "status"))
+
+_JOB_ID_RE = re.compile(r"^[0-9a-f]{32}$")
+
+
+class BatchError(ValueError):
+    """Raised for malformed batch input or unknown job IDs"""
+
+
+def parse_item(obj: Any, index: int) -> Dict[str, Any]:
+    """Normalize one input line to {"id", "messages"}"""
+    if not isinstance(obj, dict):
+        raise BatchError(f"line {index + 1}: expected a JSON object")
+    messages = obj.get("messages")
+    if messages is None and obj.get("prompt"):
+        messages = [{"role": "user", "content": str(obj["prompt"])}]
+    if not isinstance(messages, list) or not messages:
+        raise BatchError(f"line {index + 1}: needs 'messages' or 'prompt'")
+    return {"id": str(obj.get("id", f"line-{index + 1}")), "messages": messages}
+
+
+def parse_lines(lines: Iterable[str]) -> List[Dict[str, Any]]:
+    """Parse JSONL input, skipping blank lines"""
+    items = []
+    seen_ids = set()
+    for index, line in enumerate(lines):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            obj = json.loads(line)
+        except ValueError:
+            raise BatchError(f"line {index + 1}: invalid JSON")
+        item = parse_item(obj, index)
+        if item["id"] in seen_ids:
+            raise BatchError(f"line {index + 1}: duplicate id {item['id']!r}")
+        seen_ids.add(item["id"])
+        items.append(item)
+        if len(items) > MAX_ITEMS:
+            raise BatchError(f"batch exceeds {MAX_ITEMS} items")
+    if not items:
+        raise BatchError("batch is empty")
+    return items
+
+
+class BatchJob:
+    """A persisted batch: input.jsonl plus append-only results.jsonl"""
+
+    def __init__(self, job_id: str, root: str = BATCH_DIR):
+        self.job_id = job_id
+        self.directory = os.path.join(root, job_id)
+        self.input_path = os.path.join(self.directory, "input.jsonl")
+        self.results_path = os.path.join(self.directory, "results.jsonl")
+        self._results_file = None
+
+    @classmethod
+    def create(cls, items: List[Dict[str, Any]], root: str = BATCH_DIR) -> "BatchJob":
+        job = cls(uuid.uuid4().hex, root)
+        os.makedirs(job.directory, exist_ok=True)
+        tmp_path = job.input_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item, separators=(",", ":")) + "\n")
+        os.replace(tmp_path, job.input_path)
+        return job
+
+    @classmethod
+    def open(cls, job_id: str, root: str = BATCH_DIR) -> "BatchJob":
+        if not _JOB_ID_RE.match(job_id or ""):
+            raise BatchError("invalid job id")
+        job = cls(job_id, root)
+        if not os.path.isfile(job.input_path):
+            raise BatchError(f"unknown job id {job_id}")
+        return job
+
+    def items(self) -> List[Dict[str, Any]]:
+        with open(self.input_path, "r", encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+    def completed(self) -> Dict[str, Dict[str, Any]]:
+        """Successful results already written, by item id (a torn last line is ignored)"""
+        done: Dict[str, Dict[str, Any]] = {}
+        if not os.path.isfile(self.results_path):
+            return done
+        with open(self.results_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    result = json.loads(line)
+                except ValueError:
+                    continue
+                if result.get("status") == "ok":
+                    done[result["id"]] = result
+        return done
+
+    def append_result(self, result: Dict[str, Any]):
+        if self._results_file is None:
+            self._results_file = open(self.results_path, "a", encoding="utf-8")
+        self._results_file.write(json.dumps(result, separators=(",", ":")) + "\n")
+        self._results_file.flush()
+
+    def close(self):
+        if self._results_file is not None:
+            self._results_file.close()
+            self._results_file = None
+
+    def status(self) -> Dict[str, Any]:
+        items = self.items()
+        done = self.completed()
+        return {
+            "job_id": self.job_id,
+            "total": len(items),
+            "completed": sum(1 for item in items if item["id"] in done),
+            "pending": [item["id"] for item in items if item["id"] not in done][:100],
+        }
+
+
+async def run_batch(
+    job: BatchJob,
+    generate: Callable[[List[Dict[str, Any]]], Awaitable[str]],
+    lookup: Callable[[List[Dict[str, Any]]], Optional[str]],
+    key_for: Callable[[List[Dict[str, Any]]], str],
+    concurrency: int = DEFAULT_CONCURRENCY,
+) -> AsyncIterator[Dict[str, Any]]:
+    """Run a job's unfinished items, yielding each result as it completes.
+
+    ``lookup`` returns a cached answer or None; ``generate`` produces one.
+    Results finished by an earlier run are yielded first with ``"resumed": true``.
+    """
+    done = job.completed()
+    pending = []
+    for item in job.items():
+        if item["id"] in done:
+            yield {**done[item["id"]], "resumed": True}
+        else:
+            pending.append(item)
+    if not pending:
+        return
+
+    llm_bucket = ratelimit.limiter("openai")
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    in_flight: Dict[str, asyncio.Future] = {}
+    results: "asyncio.Queue[Dict[str, Any]]" = asyncio.Queue()
+
+    async def produce(messages: List[Dict[str, Any]]) -> str:
+        async with semaphore:
+            if llm_bucket is not None:
+                await llm_bucket.acquire_async()
+            return await generate(messages)
+
+    async def run_item(item: Dict[str, Any]):
+        start_time = time.time()
+        result: Dict[str, Any] = {"id": item["id"]}
+        try:
+            cached = lookup(item["messages"])
+            if cached is not None:
+                result.update(status="ok", cache="HIT", content=cached)
+            else:
+                key = key_for(item["messages"])
+                future = in_flight.get(key)
+                if future is None:
+                    future = in_flight[key] = asyncio.ensure_future(produce(item["messages"]))
+                    result["cache"] = "MISS"
+                else:
+                    # Identical request earlier in the batch; share its answer
+                    result["cache"] = "DEDUP"
+                result.update(status="ok", content=await asyncio.shield(future))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            result.update(status="error", error=str(e) or type(e).__name__)
+        result["elapsed"] = round(time.time() - start_time, 3)
+        BATCH_ITEMS.inc(cache=result.get("cache", "NONE"), status=result["status"])
+        job.append_result(result)
+        await results.put(result)
+
+    tasks = [asyncio.ensure_future(run_item(item)) for item in pending]
+    try:
+        for _ in range(len(tasks)):
+            yield await results.get()
+    finally:
+        # Client went away or the run finished: stop outstanding work and keep
+        # what completed so the job can be resumed
+        for task in tasks:
+            task.cancel()
+        for future in in_flight.values():
+            future.cancel()
+        job.close()
@@ -0,0 +1,156 @@
+"""
+Cache Store Module - Persists hot response-cache entries across restarts
+
+Entries are written to a compact append-only log of length-prefixed, zlib
+compressed JSON records. Snapshots are written to a temporary file and renamed
+into place, so a crash mid-write never corrupts the previous snapshot, and a
+truncated tail record is simply ignored on load.
+
+The warm-up helpers replay the most frequent prompts found in request logs so
+popular answers are cached again before users ask for them.
+"""
+
+import os
+import glob
+import gzip
+import json
+import zlib
+import time
+import struct
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+_HEADER = struct.Struct(">I")
+_MAGIC = b"TLC1"
+
+
+def _encode_record(record: Dict[str, Any]) -> bytes:
+    payload = zlib.compress(json.dumps(record, separators=(",", ":")).encode("utf-8"))
+    return _HEADER.pack(len(payload)) + payload
+
+
+def _iter_records(path: str) -> Iterator[Dict[str, Any]]:
+    """Read records from one log file, stopping quietly at a truncated tail"""
+    with open(path, "rb") as f:
+        if f.read(len(_MAGIC)) != _MAGIC:
+            logger.warning(f"Ignoring cache snapshot with unknown format: {path}")
+            return
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                return
+            (length,) = _HEADER.unpack(header)
+            payload = f.read(length)
+            if len(payload) < length:
+                return
+            try:
+                yield json.loads(zlib.decompress(payload))
+            except (zlib.error, ValueError):
+                return
+
+
+class CacheSnapshotStore:
+    """Append-only on-disk log of response-cache entries"""
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def snapshot_paths(self) -> List[str]:
+        """The main snapshot plus per-worker snapshots (path.<slot>)"""
+        return [p for p in [self.path] + sorted(glob.glob(self.path + ".*")) if not p.endswith(".tmp")
+                and os.path.isfile(p)]
+
+    def write_snapshot(self, records: Iterable[Dict[str, Any]], suffix: str = "") -> int:
+        """Atomically replace the snapshot with the given records"""
+        path = self.path + suffix
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = path + ".tmp"
+        count = 0
+        with open(tmp_path, "wb") as f:
+            f.write(_MAGIC)
+            for record in records:
+                f.write(_encode_record(record))
+                count += 1
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        return count
+
+    def load(self, max_age: Optional[float] = None) -> Dict[str, Dict[str, Any]]:
+        """Load the newest record per key from every snapshot file"""
+        now = time.time()
+        entries: Dict[str, Dict[str, Any]] = {}
+        for path in self.snapshot_paths():
+            try:
+                for record in _iter_records(path):
+                    key = record.get("key")
+                    if not key:
+                        continue
+                    if max_age is not None and now - record.get("timestamp", 0) >= max_age:
+                        continue
+                    previous = entries.get(key)
+                    if previous is None or record.get("timestamp", 0) > previous.get("timestamp", 0):
+                        entries[key] = record
+            except OSError as e:
+                logger.warning(f"Failed to read cache snapshot {path}: {e}")
+        return entries
+
+
+def _open_log(path: str):
+    return gzip.open(path, "rt", encoding="utf-8") if path.endswith(".gz") else open(path, "r", encoding="utf-8")
+
+
+def top_prompts(log_patterns: Iterable[str], top_n: int) -> List[List[Dict[str, Any]]]:
+    """Most frequent message lists found in JSONL request logs (plain or .gz)"""
+    counts: Counter = Counter()
+    examples: Dict[str, List[Dict[str, Any]]] = {}
+    for pattern in log_patterns:
+        for path in sorted(glob.glob(pattern)):
+            try:
+                with _open_log(path) as f:
+                    for line in f:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        messages = record.get("messages")
+                        # Only the latest message is logged, so only opening turns can be replayed
+                        if not messages or record.get("turns", len(messages)) != len(messages):
+                            continue
+                        key = json.dumps(messages, sort_keys=True)
+                        counts[key] += 1
+                        examples.setdefault(key, messages)
+            except OSError as e:
+                logger.warning(f"Failed to read request log {path}: {e}")
+    return [examples[key] for key, _ in counts.most_common(top_n)]
+
+
+async def replay_prompts(
+    prompts: List[List[Dict[str, Any]]],
+    generate: Callable[[List[Dict[str, Any]]], Awaitable[Any]],
+    concurrency: int = 2,
+) -> Tuple[int, int]:
+    """Run `generate` for each prompt with bounded concurrency; returns (succeeded, failed)"""
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    succeeded = failed = 0
+
+    async def run(messages):
+        nonlocal succeeded, failed
+        async with semaphore:
+            try:
+                await generate(messages)
+                succeeded += 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                failed += 1
+                logger.debug(f"Warm-up request failed: {e}")
+
+    await asyncio.gather(*(run(messages) for messages in prompts))
+    return succeeded, failed
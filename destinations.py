@@ -0,0 +1,441 @@
+"""
+Destinations Module - Offline destination facts and points of interest
+
+Cities, IATA city codes, coordinates, best seasons, typical daily costs and top
+points of interest are bundled in ``datasets/destinations.json``. On first use
+that file is compiled into a columnar binary index (fixed-width numeric columns
+plus a string table) which is memory-mapped, so every worker process shares the
+same pages and a lookup never parses JSON.
+
+The index supports exact, prefix and fuzzy name lookup and k-nearest-neighbour
+search by coordinates. Short factual questions ("best time to visit Paris",
+"things to do in Tokyo") are answered directly from it without an LLM call;
+questions with anything more ("... with kids", "... in winter") go to the agent.
+
+Configuration (environment):
+    TRAVEL_LIGHT_DESTINATIONS_FILE   - source data (default datasets/destinations.json)
+    TRAVEL_LIGHT_DESTINATIONS_INDEX  - compiled index (default cache/destinations.idx)
+    TRAVEL_LIGHT_DIRECT_ANSWERS      - set to 0 to send factual questions to the LLM (default 1)
+"""
+
+import os
+import re
+import json
+import math
+import mmap
+import heapq
+import struct
+import difflib
+import logging
+import threading
+import unicodedata
+from array import array
+from typing import Any, Dict, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+SOURCE_FILE = os.getenv(
+    "TRAVEL_LIGHT_DESTINATIONS_FILE",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets", "destinations.json"),
+)
+INDEX_FILE = os.getenv("TRAVEL_LIGHT_DESTINATIONS_INDEX", os.path.join("cache", "destinations.idx"))
+DIRECT_ANSWERS = os.getenv("TRAVEL_LIGHT_DIRECT_ANSWERS", "1") not in ("0", "false", "False")
+
+DIRECT_ANSWERS_SERVED = metrics.counter(
+    "travel_light_direct_answers", "Questions answered from the destination index without an LLM call", ("topic",)
+)
+
+EARTH_RADIUS_KM = 6371.0
+
+_MAGIC = b"TLDX"
+_VERSION = 1
+# magic, version, destinations, points of interest, lookup keys, strings
+_HEADER = struct.Struct("<4sIIIII")
+_COST_TIERS = ("budget", "mid", "luxury")
+_MONTHS = ("January", "February", "March", "April", "May", "June", "July",
+           "August", "September", "October", "November", "December")
+
+
+def _layout(n: int, p: int, k: int, s: int) -> List[Tuple[str, str, int]]:
+    """Column order, type codes and lengths; shared by the writer and the reader"""
+    return [
+        ("lat", "d", n), ("lon", "d", n), ("x", "d", n), ("y", "d", n), ("z", "d", n),
+        ("name", "I", n), ("country", "I", n), ("code", "I", n), ("currency", "I", n), ("season", "I", n),
+        ("months", "I", n), ("cost", "I", 3 * n), ("poi_start", "I", n + 1),
+        ("poi_lat", "d", p), ("poi_lon", "d", p), ("poi_hours", "d", p), ("poi_name", "I", p), ("poi_kind", "I", p),
+        ("key", "I", k), ("key_dest", "I", k),
+        ("str_offset", "I", s + 1),
+    ]
+
+
+def _align(offset: int) -> int:
+    return (offset + 7) & ~7
+
+
+def normalize(text: str) -> str:
+    """Lowercase, strip accents and punctuation ("Reykjavík!" -> "reykjavik")"""
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(ch for ch in text if not unicodedata.combining(ch)).lower()
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def _unit_vector(lat: float, lon: float) -> Tuple[float, float, float]:
+    phi, lam = math.radians(lat), math.radians(lon)
+    return math.cos(phi) * math.cos(lam), math.cos(phi) * math.sin(lam), math.sin(phi)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    """Great-circle distance between two coordinates"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def build_index(records: List[Dict[str, Any]]) -> bytes:
+    """Compile destination records into the columnar binary format"""
+    strings: List[str] = []
+    string_ids: Dict[str, int] = {}
+
+    def sid(value: str) -> int:
+        if value not in string_ids:
+            string_ids[value] = len(strings)
+            strings.append(value)
+        return string_ids[value]
+
+    cols: Dict[str, array] = {name: array(code) for name, code, _ in _layout(0, 0, 0, 0)}
+    keys: Dict[str, int] = {}
+    cols["poi_start"].append(0)
+    for index, record in enumerate(records):
+        lat, lon = float(record["lat"]), float(record["lon"])
+        x, y, z = _unit_vector(lat, lon)
+        for name, value in (("lat", lat), ("lon", lon), ("x", x), ("y", y), ("z", z)):
+            cols[name].append(value)
+        for name in ("name", "country", "code", "currency", "season"):
+            cols[name].append(sid(str(record.get(name, ""))))
+        cols["months"].append(sum(1 << (m - 1) for m in record.get("best_months", [])))
+        for tier in _COST_TIERS:
+            cols["cost"].append(int(record.get("daily_cost_usd", {}).get(tier, 0)))
+        for poi in record.get("pois", []):
+            cols["poi_lat"].append(float(poi["lat"]))
+            cols["poi_lon"].append(float(poi["lon"]))
+            cols["poi_hours"].append(float(poi.get("hours", 1.0)))
+            cols["poi_name"].append(sid(poi["name"]))
+            cols["poi_kind"].append(sid(poi.get("kind", "sight")))
+        cols["poi_start"].append(len(cols["poi_lat"]))
+        for key in [record["name"], record.get("code", "")] + list(record.get("aliases", [])):
+            key = normalize(key)
+            if key:
+                keys.setdefault(key, index)
+
+    for key in sorted(keys):
+        cols["key"].append(sid(key))
+        cols["key_dest"].append(keys[key])
+    blob = bytearray()
+    for value in strings:
+        cols["str_offset"].append(len(blob))
+        blob += value.encode("utf-8")
+    cols["str_offset"].append(len(blob))
+
+    out = bytearray(_HEADER.pack(_MAGIC, _VERSION, len(records), len(cols["poi_lat"]), len(keys), len(strings)))
+    for name, _, _ in _layout(0, 0, 0, 0):
+        out += b"\0" * (_align(len(out)) - len(out))
+        out += cols[name].tobytes()
+    out += b"\0" * (_align(len(out)) - len(out))
+    out += blob
+    return bytes(out)
+
+
+class DestinationIndex:
+    """Read-only view over a compiled index buffer (usually an mmap)"""
+
+    def __init__(self, buffer):
+        self._buffer = buffer
+        view = memoryview(buffer)
+        magic, version, n, p, k, s = _HEADER.unpack_from(view, 0)
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("not a destination index (or an older format)")
+        self.size, self.poi_count = n, p
+        self._keys = k
+        self._cols: Dict[str, memoryview] = {}
+        offset = _HEADER.size
+        for name, code, count in _layout(n, p, k, s):
+            offset = _align(offset)
+            end = offset + count * array(code).itemsize
+            self._cols[name] = view[offset:end].cast(code)
+            offset = end
+        self._blob = view[_align(offset):]
+        self._records: Dict[int, Dict[str, Any]] = {}
+        self._key_list: Optional[List[str]] = None
+
+    @classmethod
+    def load(cls, source: str = SOURCE_FILE, path: str = INDEX_FILE) -> "DestinationIndex":
+        """Memory-map the compiled index, (re)building it when the source is newer"""
+        try:
+            stale = not os.path.isfile(path) or os.path.getmtime(path) < os.path.getmtime(source)
+            if not stale:
+                return cls._map(path)
+        except ValueError:
+            pass
+        with open(source, "r", encoding="utf-8") as f:
+            data = build_index(json.load(f)["destinations"])
+        try:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+            return cls._map(path)
+        except OSError as e:
+            logger.warning(f"Could not write destination index {path}: {e}; using it from memory")
+            return cls(data)
+
+    @classmethod
+    def _map(cls, path: str) -> "DestinationIndex":
+        with open(path, "rb") as f:
+            return cls(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+
+    def _string(self, string_id: int) -> str:
+        offsets = self._cols["str_offset"]
+        return bytes(self._blob[offsets[string_id]:offsets[string_id + 1]]).decode("utf-8")
+
+    def _key(self, position: int) -> str:
+        return self._string(self._cols["key"][position])
+
+    def __len__(self) -> int:
+        return self.size
+
+    def get(self, index: int) -> Dict[str, Any]:
+        """Decoded record for one destination"""
+        record = self._records.get(index)
+        if record is not None:
+            return record
+        c = self._cols
+        months = c["months"][index]
+        start, end = c["poi_start"][index], c["poi_start"][index + 1]
+        record = {
+            "index": index,
+            "name": self._string(c["name"][index]),
+            "country": self._string(c["country"][index]),
+            "code": self._string(c["code"][index]),
+            "lat": c["lat"][index],
+            "lon": c["lon"][index],
+            "currency": self._string(c["currency"][index]),
+            "best_months": [m + 1 for m in range(12) if months & (1 << m)],
+            "season": self._string(c["season"][index]),
+            "daily_cost_usd": dict(zip(_COST_TIERS, c["cost"][3 * index:3 * index + 3].tolist())),
+            "pois": [
+                {
+                    "name": self._string(c["poi_name"][i]),
+                    "kind": self._string(c["poi_kind"][i]),
+                    "lat": c["poi_lat"][i],
+                    "lon": c["poi_lon"][i],
+                    "hours": c["poi_hours"][i],
+                }
+                for i in range(start, end)
+            ],
+        }
+        self._records[index] = record
+        return record
+
+    def _lower_bound(self, key: str) -> int:
+        lo, hi = 0, self._keys
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(mid) < key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def complete(self, prefix: str, limit: int = 10) -> List[Dict[str, Any]]:
+        """Destinations whose name, alias or code starts with `prefix`"""
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        found: List[int] = []
+        position = self._lower_bound(prefix)
+        while position < self._keys and len(found) < limit and self._key(position).startswith(prefix):
+            dest = self._cols["key_dest"][position]
+            if dest not in found:
+                found.append(dest)
+            position += 1
+        return [self.get(i) for i in found]
+
+    def lookup(self, name: str) -> Optional[Dict[str, Any]]:
+        """Best match for a destination name: exact, then unique prefix, then fuzzy"""
+        key = normalize(name)
+        if not key:
+            return None
+        position = self._lower_bound(key)
+        if position < self._keys and self._key(position) == key:
+            return self.get(self._cols["key_dest"][position])
+        candidates = self.complete(key, limit=2)
+        if len(candidates) == 1:
+            return candidates[0]
+        if self._key_list is None:
+            self._key_list = [self._key(i) for i in range(self._keys)]
+        close = difflib.get_close_matches(key, self._key_list, n=1, cutoff=0.75)
+        if close:
+            return self.get(self._cols["key_dest"][self._key_list.index(close[0])])
+        return None
+
+    def nearest(self, lat: float, lon: float, k: int = 5,
+                exclude: Optional[int] = None) -> List[Tuple[Dict[str, Any], float]]:
+        """The k destinations closest to a coordinate, with distances in km"""
+        qx, qy, qz = _unit_vector(lat, lon)
+        xs, ys, zs = self._cols["x"], self._cols["y"], self._cols["z"]
+        # Largest dot product of unit vectors == smallest great-circle distance
+        best = heapq.nlargest(
+            k,
+            (i for i in range(self.size) if i != exclude),
+            key=lambda i: xs[i] * qx + ys[i] * qy + zs[i] * qz,
+        )
+        results = []
+        for i in best:
+            dot = max(-1.0, min(1.0, xs[i] * qx + ys[i] * qy + zs[i] * qz))
+            results.append((self.get(i), EARTH_RADIUS_KM * math.acos(dot)))
+        return results
+
+    def find_in_text(self, text: str) -> List[Dict[str, Any]]:
+        """Destinations mentioned by name or alias in free text (codes are ignored)"""
+        return [dest for dest, _ in self.mentions(text)]
+
+    def mentions(self, text: str) -> List[Tuple[Dict[str, Any], str]]:
+        """Like find_in_text, with the (normalized) name or alias each destination matched on"""
+        haystack = f" {normalize(text)} "
+        found: Dict[int, str] = {}
+        codes = {self._cols["code"][i] for i in range(self.size)}
+        for position in range(self._keys):
+            if self._cols["key"][position] in codes:
+                continue
+            key = self._key(position)
+            if f" {key} " in haystack:
+                dest = self._cols["key_dest"][position]
+                if len(key) > len(found.get(dest, "")):
+                    found[dest] = key
+        return [(self.get(i), found[i]) for i in sorted(found, key=lambda i: -len(found[i]))]
+
+
+_index: Optional[DestinationIndex] = None
+_index_lock = threading.Lock()
+
+
+def index() -> DestinationIndex:
+    """The shared destination index, loaded on first use"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = DestinationIndex.load()
+    return _index
+
+
+def _month_list(months: List[int]) -> str:
+    names = [_MONTHS[m - 1] for m in months]
+    return ", ".join(names[:-1]) + f" and {names[-1]}" if len(names) > 1 else "".join(names)
+
+
+def _local_prices(dest: Dict[str, Any]) -> str:
+    currency = dest["currency"]
+    if currency == "USD":
+        return ""
+    import pricing
+
+    try:
+        low, high = (pricing.convert(dest["daily_cost_usd"][tier], "USD", currency) for tier in ("budget", "mid"))
+    except pricing.UnknownCurrency:
+        return f" Local currency: {currency}."
+    return (f" Local currency: {currency} (budget ~{pricing.format_price(low, currency, whole=True)}, "
+            f"mid-range ~{pricing.format_price(high, currency, whole=True)} a day).")
+
+
+def describe(dest: Dict[str, Any], topic: str = "overview") -> str:
+    """Format destination facts for one topic (or all of them)"""
+    name = dest["name"]
+    cost = dest["daily_cost_usd"]
+    sections = {
+        "best_time": f"🗓️ Best time to visit {name}: {_month_list(dest['best_months'])}. {dest['season']}",
+        "activities": f"📍 Top things to do in {name}:\n" + "\n".join(
+            f"- {poi['name']} ({poi['kind']}, ~{poi['hours']:g}h)" for poi in dest["pois"]
+        ),
+        "cost": (f"💰 Typical daily spend per person in {name} (USD): budget ~${cost['budget']}, "
+                 f"mid-range ~${cost['mid']}, luxury ~${cost['luxury']}.{_local_prices(dest)}"),
+        "code": f"✈️ {name}, {dest['country']} - IATA city code {dest['code']}.",
+    }
+    if topic == "nearby":
+        near = index().nearest(dest["lat"], dest["lon"], k=5, exclude=dest["index"])
+        return f"🧭 Destinations near {name}:\n" + "\n".join(
+            f"- {other['name']}, {other['country']} (~{km:,.0f} km)" for other, km in near
+        )
+    if topic in sections:
+        return sections[topic]
+    return "\n\n".join([f"{name}, {dest['country']}", sections["code"], sections["best_time"],
+                        sections["cost"], sections["activities"]])
+
+
+_TOPIC_PATTERNS = [
+    ("best_time", re.compile(r"\b(best|good|ideal|right)\s+(time|months?|season)\b|\bwhen\s+(should|to|is)\b.*\b(visit|go|travel)\b")),
+    ("activities", re.compile(r"\b(things|what)\s+to\s+(do|see)\b|\b(attractions|sights|sightseeing|must see|landmarks)\b")),
+    ("cost", re.compile(r"\bhow\s+(much|expensive)\b|\b(daily|per day)\s+(budget|cost|spend)\b|\bcost\s+of\s+(a\s+)?(trip|visit|travel)")),
+    ("code", re.compile(r"\b(iata|airport|city)\s+code\b")),
+    ("nearby", re.compile(r"\b(near|nearby|close to|around)\b.*\b(cities|destinations|places to visit)\b|\b(cities|destinations)\s+(near|close to)\b")),
+]
+# Requests that need real planning or live data stay with the agent
+_AGENT_ONLY = re.compile(r"\b(plan|itinerary|book|hotels?|flights?|tickets?|\d+\s*-?\s*days?|weeks?|my trip)\b")
+_MAX_DIRECT_LENGTH = 160
+# Words a plain "<intent> <city>" question may contain besides the intent and the
+# city; anything else ("if", "with kids", "in winter", "rainy") is a qualifier
+# the canned answer would ignore, so the question goes to the agent
+_FILLER_WORDS = frozenset("""
+    a an the in at to of for on is are was be s what whats which where when how
+    i we me us you your should can could would do does did please tell show give
+    list know about there some any top main best most good great popular famous
+    visit visiting go going travel traveling travelling see do things places
+    really worth city town
+""".split())
+_TOPIC_WORDS = {"cost": frozenset("cost costs trip day daily per spend budget expensive money".split())}
+
+
+def direct_answer(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """Answer a short factual destination question from the index, or None"""
+    if not DIRECT_ANSWERS or not messages or messages[-1].get("role") != "user":
+        return None
+    content = str(messages[-1].get("content", ""))
+    if len(content) > _MAX_DIRECT_LENGTH:
+        return None
+    text = content.lower()
+    if _AGENT_ONLY.search(text):
+        return None
+    topic, pattern = next(((name, pattern) for name, pattern in _TOPIC_PATTERNS if pattern.search(text)),
+                          (None, None))
+    if topic is None:
+        return None
+    mentioned = index().mentions(content)
+    if len(mentioned) != 1:
+        return None
+    dest, name = mentioned[0]
+    rest = pattern.sub(" ", f" {normalize(content)} ".replace(f" {name} ", " "))
+    allowed = _TOPIC_WORDS.get(topic, frozenset())
+    if any(word not in _FILLER_WORDS and word not in allowed for word in rest.split()):
+        return None
+    DIRECT_ANSWERS_SERVED.inc(topic=topic)
+    return describe(dest, topic)
+
+
+__all__ = ["DestinationIndex", "build_index", "describe", "direct_answer", "haversine_km", "index", "normalize"]
+
+
+if __name__ == "__main__":
+    import sys
+    import time
+
+    idx = DestinationIndex.load()
+    query = " ".join(sys.argv[1:]) or "Paris"
+    start = time.perf_counter()
+    dest = idx.lookup(query)
+    elapsed = (time.perf_counter() - start) * 1000
+    print(describe(dest) if dest else f"No destination matches {query!r}")
+    print(f"\n({len(idx)} destinations, {idx.poi_count} points of interest; lookup took {elapsed:.3f} ms)")
@@ -0,0 +1,342 @@
+"""
+Exporter Module - PDF and static HTML exports of structured itineraries
+
+Exports are rendered in a pool of worker processes (the PDF layout is CPU-bound
+and would otherwise hold the GIL in the server), written straight to disk and
+cached there by a hash of the itinerary's content, so downloading the same trip
+again - or an identical trip - costs a file read. Downloads are streamed from
+the file in chunks, so exports are never held in the server's memory. Rendering
+a batch of trips spreads them across all cores.
+
+Configuration (environment):
+    TRAVEL_LIGHT_EXPORT_DIR        - rendered files (default "cache/exports")
+    TRAVEL_LIGHT_EXPORT_WORKERS    - render processes (default: CPU count)
+    TRAVEL_LIGHT_EXPORT_RETENTION  - seconds an unused export is kept (default 604800)
+"""
+
+import os
+import sys
+import html
+import json
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional
+
+import forksafe
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+EXPORT_DIR = os.getenv("TRAVEL_LIGHT_EXPORT_DIR", os.path.join("cache", "exports"))
+WORKERS = int(os.getenv("TRAVEL_LIGHT_EXPORT_WORKERS", "0")) or (os.cpu_count() or 1)
+RETENTION = float(os.getenv("TRAVEL_LIGHT_EXPORT_RETENTION", str(7 * 86400)))
+
+# Bump when the layout changes so cached renders are not reused
+RENDER_VERSION = 1
+FORMATS = {"pdf": "application/pdf", "html": "text/html; charset=utf-8"}
+
+EXPORTS = metrics.counter("travel_light_exports", "Itinerary exports served", ("format", "cache"))
+EXPORT_SECONDS = metrics.histogram("travel_light_export_seconds", "Time to render one export", ("format",))
+
+# Core PDF fonts are Latin-1 only
+_PDF_REPLACEMENTS = str.maketrans({
+    "€": "EUR ", "£": "GBP ", "¥": "JPY ", "₹": "INR ", "₩": "KRW ", "฿": "THB ", "₺": "TRY ",
+    "—": "-", "–": "-", "’": "'", "‘": "'", "“": '"', "”": '"', "…": "...", "œ": "oe", "Œ": "OE", "★": "*",
+})
+
+
+def content_hash(itinerary: Dict[str, Any], fmt: str) -> str:
+    """Hash of everything an export's content depends on (not the itinerary's id or version)"""
+    content = {k: v for k, v in itinerary.items() if k not in ("id", "version")}
+    payload = json.dumps([RENDER_VERSION, fmt, content], sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def export_path(digest: str, fmt: str) -> str:
+    return os.path.abspath(os.path.join(EXPORT_DIR, digest[:2], f"{digest}.{fmt}"))
+
+
+def filename(itinerary: Dict[str, Any], fmt: str) -> str:
+    trip = itinerary["trip"]
+    slug = "".join(c if c.isalnum() else "-" for c in trip["destination"].lower()).strip("-") or "trip"
+    return f"{slug}-{trip['days']}-days.{fmt}"
+
+
+def _money(amount: float, currency: str) -> str:
+    import pricing
+
+    return pricing.format_price(amount, currency, whole=True)
+
+
+def iter_html(itinerary: Dict[str, Any]) -> Iterator[str]:
+    """Self-contained HTML page, produced piece by piece"""
+    trip = itinerary["trip"]
+    currency = trip["currency"]
+    esc = html.escape
+    title = f"{trip['days']}-day {trip['destination']} itinerary"
+    yield ("<!DOCTYPE html>\n<html lang=\"en\"><head><meta charset=\"utf-8\">"
+           "<meta name=\"viewport\" content=\"width=device-width, initial-scale=1\">"
+           f"<title>{esc(title)}</title><style>"
+           "body{font-family:system-ui,sans-serif;max-width:760px;margin:2em auto;padding:0 1em;color:#222}"
+           "h1{color:#1d4e89}h2{border-bottom:2px solid #1d4e89;padding-bottom:.2em;margin-top:1.6em}"
+           "table{width:100%;border-collapse:collapse}td{padding:.35em .5em;vertical-align:top;border-bottom:1px solid #eee}"
+           "td.time{width:4em;color:#1d4e89;font-weight:600}td.cost{text-align:right;white-space:nowrap}"
+           ".muted{color:#666}.summary{background:#f4f7fb;padding:.8em 1em;border-radius:8px}"
+           "@media print{body{margin:0}h2{break-after:avoid}}"
+           "</style></head><body>\n")
+    yield f"<h1>{esc(title)}</h1>\n"
+    if trip.get("country"):
+        yield f"<p class=\"muted\">{esc(trip['destination'])}, {esc(trip['country'])} &middot; {esc(trip['style'])} style</p>\n"
+    facts = []
+    if itinerary.get("flight"):
+        facts.append(f"<b>Flight:</b> {esc(itinerary['flight']['name'])} - {esc(_money(itinerary['flight']['price'], currency))}")
+    if itinerary.get("hotel"):
+        hotel = itinerary["hotel"]
+        facts.append(f"<b>Hotel:</b> {esc(hotel['name'])} - {esc(_money(hotel['price_per_night'], currency))}/night "
+                     f"for {hotel['nights']} nights")
+    budget = itinerary.get("budget", {})
+    if "planned" in budget:
+        facts.append(f"<b>Budget:</b> {esc(_money(budget['planned'], currency))} of "
+                     f"{esc(_money(budget['total'], currency))} planned, "
+                     f"{esc(_money(budget['remaining'], currency))} left")
+    if facts:
+        yield "<div class=\"summary\">" + "<br>".join(facts) + "</div>\n"
+    for day in itinerary["days"]:
+        parts = [f"<h2>Day {day['day']}: {esc(day['title'])}</h2>\n"]
+        if day.get("summary"):
+            parts.append(f"<p>{esc(day['summary'])}</p>\n")
+        parts.append("<table>")
+        for activity in day["activities"]:
+            notes = f"<br><span class=\"muted\">{esc(activity['notes'])}</span>" if activity.get("notes") else ""
+            cost = esc(_money(activity["cost"], currency)) if activity["cost"] else "free"
+            parts.append(f"<tr><td class=\"time\">{esc(activity['time'])}</td><td><b>{esc(activity['name'])}</b> "
+                         f"(~{activity['hours']:g}h){notes}</td><td class=\"cost\">{cost}</td></tr>")
+        for meal in day.get("meals", []):
+            parts.append(f"<tr><td class=\"time\"></td><td>{esc(str(meal.get('meal', 'meal')).capitalize())}: "
+                         f"{esc(str(meal.get('suggestion', '')))}</td><td></td></tr>")
+        parts.append(f"</table>\n<p class=\"muted\">Day cost {esc(_money(day['cost'], currency))}")
+        if day.get("tips"):
+            parts.append(" &middot; Tips: " + "; ".join(esc(t) for t in day["tips"]))
+        parts.append("</p>\n")
+        yield "".join(parts)
+    if itinerary.get("unscheduled"):
+        yield f"<p class=\"muted\">Did not fit: {esc(', '.join(itinerary['unscheduled']))}</p>\n"
+    yield "</body></html>\n"
+
+
+def render_pdf(itinerary: Dict[str, Any], path: str):
+    """Lay out the itinerary as a PDF file at `path` (fpdf core fonts)"""
+    from fpdf import FPDF
+
+    def text(value: Any) -> str:
+        return str(value).translate(_PDF_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1")
+
+    trip = itinerary["trip"]
+    currency = trip["currency"]
+    pdf = FPDF()
+    pdf.set_auto_page_break(True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 18)
+    pdf.cell(0, 10, text(f"{trip['days']}-day {trip['destination']} itinerary"), ln=1)
+    pdf.set_font("Helvetica", "", 10)
+    if itinerary.get("flight"):
+        pdf.cell(0, 6, text(f"Flight: {itinerary['flight']['name']} - {_money(itinerary['flight']['price'], currency)}"), ln=1)
+    if itinerary.get("hotel"):
+        hotel = itinerary["hotel"]
+        pdf.cell(0, 6, text(f"Hotel: {hotel['name']} - {_money(hotel['price_per_night'], currency)}/night "
+                            f"for {hotel['nights']} nights"), ln=1)
+    budget = itinerary.get("budget", {})
+    if "planned" in budget:
+        pdf.cell(0, 6, text(f"Budget: {_money(budget['planned'], currency)} of {_money(budget['total'], currency)} "
+                            f"planned, {_money(budget['remaining'], currency)} left"), ln=1)
+    for day in itinerary["days"]:
+        pdf.ln(4)
+        pdf.set_font("Helvetica", "B", 13)
+        pdf.cell(0, 8, text(f"Day {day['day']}: {day['title']}"), ln=1)
+        pdf.set_font("Helvetica", "", 10)
+        if day.get("summary"):
+            pdf.multi_cell(0, 5, text(day["summary"]))
+        for activity in day["activities"]:
+            cost = _money(activity["cost"], currency) if activity["cost"] else "free"
+            pdf.set_font("Helvetica", "B", 10)
+            pdf.cell(14, 6, text(activity["time"]))
+            pdf.cell(0, 6, text(f"{activity['name']} (~{activity['hours']:g}h, {cost})"), ln=1)
+            if activity.get("notes"):
+                pdf.set_font("Helvetica", "I", 9)
+                pdf.set_x(pdf.l_margin + 14)
+                pdf.multi_cell(0, 5, text(activity["notes"]))
+        pdf.set_font("Helvetica", "", 10)
+        for meal in day.get("meals", []):
+            pdf.multi_cell(0, 5, text(f"{str(meal.get('meal', 'meal')).capitalize()}: {meal.get('suggestion', '')}"))
+        for tip in day.get("tips", []):
+            pdf.multi_cell(0, 5, text(f"Tip: {tip}"))
+        pdf.cell(0, 6, text(f"Day cost: {_money(day['cost'], currency)}"), ln=1)
+    if itinerary.get("unscheduled"):
+        pdf.ln(3)
+        pdf.multi_cell(0, 5, text("Did not fit: " + ", ".join(itinerary["unscheduled"])))
+    pdf.output(path, "F")
+
+
+def render_to_file(itinerary: Dict[str, Any], fmt: str, path: str) -> int:
+    """Render one export to `path` atomically; runs in a worker process. Returns its size."""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        if fmt == "pdf":
+            render_pdf(itinerary, tmp_path)
+        else:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                for piece in iter_html(itinerary):
+                    f.write(piece)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return os.path.getsize(path)
+
+
+def _timed_render(itinerary: Dict[str, Any], fmt: str, path: str) -> float:
+    start = time.perf_counter()
+    render_to_file(itinerary, fmt, path)
+    return time.perf_counter() - start
+
+
+# Renders in progress by path, so concurrent downloads of the same trip share one
+_inflight: Dict[str, Future] = {}
+_inflight_lock = threading.Lock()
+
+
+# spawn: forking a threaded server process can deadlock the children
+_render_pool = forksafe.per_process(
+    lambda: ProcessPoolExecutor(max_workers=WORKERS, mp_context=multiprocessing.get_context("spawn"))
+)
+
+
+def _submit(itinerary: Dict[str, Any], fmt: str, path: str) -> Future:
+    pool = _render_pool()
+    with _inflight_lock:
+        future = _inflight.get(path)
+        if future is not None:
+            return future
+        future = _inflight[path] = pool.submit(_timed_render, itinerary, fmt, path)
+
+    def finished(done: Future):
+        with _inflight_lock:
+            _inflight.pop(path, None)
+        if not done.cancelled() and done.exception() is None:
+            EXPORT_SECONDS.observe(done.result(), format=fmt)
+
+    future.add_done_callback(finished)
+    return future
+
+
+def _cached(path: str) -> bool:
+    try:
+        # Touch so retention counts from the last download
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def _check_format(fmt: str):
+    if fmt not in FORMATS:
+        raise ValueError(f"format must be one of {', '.join(FORMATS)}")
+
+
+async def export(itinerary: Dict[str, Any], fmt: str = "pdf") -> str:
+    """Path of the rendered export, rendering it in the pool unless already cached"""
+    _check_format(fmt)
+    digest = content_hash(itinerary, fmt)
+    path = export_path(digest, fmt)
+    if await asyncio.to_thread(_cached, path):
+        EXPORTS.inc(format=fmt, cache="hit")
+        return path
+    EXPORTS.inc(format=fmt, cache="miss")
+    # Render processes can't see our contextvars, so the span is kept on this side of the pool
+    with tracing.start_span("export.render", **{"export.format": fmt}):
+        await asyncio.wrap_future(_submit(itinerary, fmt, path))
+    return path
+
+
+@tracing.traced("export.batch")
+def export_many(itineraries: List[Dict[str, Any]], fmt: str = "pdf") -> List[str]:
+    """Render a batch of itineraries across all worker processes (blocking); returns their paths"""
+    _check_format(fmt)
+    paths = [export_path(content_hash(itinerary, fmt), fmt) for itinerary in itineraries]
+    futures = []
+    for itinerary, path in zip(itineraries, paths):
+        if _cached(path):
+            EXPORTS.inc(format=fmt, cache="hit")
+        else:
+            EXPORTS.inc(format=fmt, cache="miss")
+            futures.append(_submit(itinerary, fmt, path))
+    for future in futures:
+        future.result()
+    return paths
+
+
+def prune(max_age: float = RETENTION) -> int:
+    """Delete exports not downloaded within `max_age` seconds"""
+    cutoff = time.time() - max_age
+    removed = 0
+    for root, _, files in os.walk(EXPORT_DIR):
+        for name in files:
+            path = os.path.join(root, name)
+            try:
+                if os.path.getmtime(path) < cutoff:
+                    os.remove(path)
+                    removed += 1
+            except OSError:
+                continue
+    return removed
+
+
+def shutdown():
+    pool = _render_pool.reset()
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    import shutil
+    import itinerary as itineraries
+
+    parser = argparse.ArgumentParser(description="Export stored itineraries to PDF or HTML")
+    parser.add_argument("ids", nargs="+", help="itinerary IDs")
+    parser.add_argument("--format", choices=sorted(FORMATS), default="pdf")
+    parser.add_argument("--out", default=".", help="directory to copy the exports to")
+    args = parser.parse_args(argv)
+
+    loaded = []
+    for itinerary_id in args.ids:
+        found = itineraries.load(itinerary_id)
+        if found is None:
+            print(f"Unknown itinerary: {itinerary_id}", file=sys.stderr)
+            continue
+        loaded.append(found)
+    start = time.perf_counter()
+    paths = export_many(loaded, args.format)
+    os.makedirs(args.out, exist_ok=True)
+    for found, path in zip(loaded, paths):
+        target = os.path.join(args.out, f"{found['id']}-{filename(found, args.format)}")
+        shutil.copyfile(path, target)
+        print(target)
+    print(f"📄 {len(paths)} exports in {time.perf_counter() - start:.2f}s with {WORKERS} workers", file=sys.stderr)
+    shutdown()
+
+
+__all__ = ["FORMATS", "content_hash", "export", "export_many", "export_path", "filename", "iter_html", "prune",
+           "render_pdf", "render_to_file", "shutdown"]
+
+if __name__ == "__main__":
+    main()
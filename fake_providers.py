@@ -0,0 +1,437 @@
+"""
+Fake Providers - Local Amadeus and AviationStack stand-ins for offline testing
+
+Serves recorded provider responses from ``fixtures/`` with configurable latency
+distributions, error/rate-limit injection and pagination, so the real HTTP code
+paths in ``travel_light.py`` (rate limits, circuit breakers, hedging, caching)
+can be exercised without network access or API quota.
+
+Usage:
+    python fake_providers.py serve --port 8790 --latency lognormal:80,0.6 --error-rate 0.05
+    python fake_providers.py bench --requests 5000 --concurrency 64
+    python fake_providers.py record-hotels PAR 2025-06-01 2025-06-03   # needs real credentials
+
+Point the app at the fake server with:
+    AMADEUS_BASE_URL=http://127.0.0.1:8790 AVIATIONSTACK_BASE_URL=http://127.0.0.1:8790
+
+Faults can be changed while the server runs (e.g. to trip a circuit breaker):
+    curl -X POST localhost:8790/__faults -d '{"amadeus": {"error_rate": 1.0}}'
+"""
+
+import os
+import json
+import math
+import time
+import random
+import asyncio
+import argparse
+import threading
+from typing import Any, Dict, List, Optional
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+HOTEL_FIXTURES = os.path.join(FIXTURE_DIR, "amadeus_hotel_offers.json")
+FLIGHT_FIXTURES = os.path.join(FIXTURE_DIR, "aviationstack_flights.json")
+
+FAKE_TOKEN = "fake-amadeus-token"
+PROVIDERS = ("amadeus", "aviationstack")
+
+
+class LatencyModel:
+    """Latency distribution parsed from a spec string.
+
+    ``fixed:MS``, ``uniform:MIN_MS,MAX_MS``, ``lognormal:MEDIAN_MS,SIGMA`` or
+    ``none``; samples are returned in seconds.
+    """
+
+    def __init__(self, spec: str = "none"):
+        self.spec = spec
+        kind, _, args = spec.partition(":")
+        values = [float(v) for v in args.split(",") if v]
+        if kind == "none":
+            self._sample = lambda: 0.0
+        elif kind == "fixed" and len(values) == 1:
+            self._sample = lambda: values[0] / 1000
+        elif kind == "uniform" and len(values) == 2:
+            self._sample = lambda: random.uniform(values[0], values[1]) / 1000
+        elif kind == "lognormal" and len(values) == 2:
+            mu = math.log(values[0])
+            self._sample = lambda: random.lognormvariate(mu, values[1]) / 1000
+        else:
+            raise ValueError(f"Invalid latency spec: {spec!r}")
+
+    def sample(self) -> float:
+        return self._sample()
+
+
+class Faults:
+    """Injected behaviour for one provider"""
+
+    def __init__(self, latency: str = "none", error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 hang_rate: float = 0.0):
+        self.update(latency=latency, error_rate=error_rate, rate_limit_rate=rate_limit_rate, hang_rate=hang_rate)
+
+    def update(self, latency: Optional[str] = None, error_rate: Optional[float] = None,
+               rate_limit_rate: Optional[float] = None, hang_rate: Optional[float] = None):
+        if latency is not None:
+            self.latency = LatencyModel(latency)
+        if error_rate is not None:
+            self.error_rate = float(error_rate)
+        if rate_limit_rate is not None:
+            self.rate_limit_rate = float(rate_limit_rate)
+        if hang_rate is not None:
+            self.hang_rate = float(hang_rate)  # requests that never answer in time
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "latency": self.latency.spec,
+            "error_rate": self.error_rate,
+            "rate_limit_rate": self.rate_limit_rate,
+            "hang_rate": self.hang_rate,
+        }
+
+
+def _load_json(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def _expand(items: List[Dict[str, Any]], factor: int, vary) -> List[Dict[str, Any]]:
+    """Repeat fixture records `factor` times with deterministic variations (for pagination/load tests)"""
+    if factor <= 1:
+        return items
+    return [vary(item, copy) for copy in range(factor) for item in items]
+
+
+def _vary_hotel(item: Dict[str, Any], copy: int) -> Dict[str, Any]:
+    if copy == 0:
+        return item
+    item = json.loads(json.dumps(item))
+    item["hotel"]["hotelId"] = f"{item['hotel']['hotelId']}{copy:03d}"
+    item["hotel"]["name"] = f"{item['hotel']['name']} {copy + 1}"
+    for offer in item["offers"]:
+        factor = 0.8 + (copy * 7 % 11) / 20
+        price = offer["price"]
+        price["total"] = f"{float(price['total']) * factor:.2f}"
+        price["base"] = f"{float(price['base']) * factor:.2f}"
+    return item
+
+
+def _vary_flight(item: Dict[str, Any], copy: int) -> Dict[str, Any]:
+    if copy == 0:
+        return item
+    item = json.loads(json.dumps(item))
+    number = f"{int(item['flight']['number']) + copy * 1000}"
+    item["flight"] = {"number": number, "iata": f"{item['airline']['iata']}{number}"}
+    return item
+
+
+def create_app(faults: Optional[Dict[str, Faults]] = None, expand: int = 1):
+    """FastAPI app emulating the provider endpoints used by travel_light.py"""
+    from fastapi import FastAPI, Request
+    from fastapi.responses import JSONResponse, Response
+
+    faults = faults or {name: Faults() for name in PROVIDERS}
+    hotels = {
+        code: _expand(items, expand, _vary_hotel)
+        for code, items in _load_json(HOTEL_FIXTURES)["responses"].items()
+    }
+    flights = _expand(_load_json(FLIGHT_FIXTURES)["data"], expand, _vary_flight)
+    # Encoded pages are cached so the server itself is never the bottleneck
+    encoded: Dict[Any, bytes] = {}
+
+    app = FastAPI(title="Travel Light fake providers")
+
+    async def inject(provider: str) -> Optional[Response]:
+        fault = faults[provider]
+        delay = fault.latency.sample()
+        roll = random.random()
+        if roll < fault.hang_rate:
+            delay = max(delay, 60.0)
+        if delay:
+            await asyncio.sleep(delay)
+        roll = random.random()
+        if roll < fault.error_rate:
+            return JSONResponse({"errors": [{"status": 500, "title": "INTERNAL ERROR"}]}, status_code=500)
+        if roll < fault.error_rate + fault.rate_limit_rate:
+            return JSONResponse({"errors": [{"status": 429, "title": "Too many requests"}]}, status_code=429)
+        return None
+
+    def cached_json(key: Any, build) -> Response:
+        body = encoded.get(key)
+        if body is None:
+            body = encoded[key] = json.dumps(build(), separators=(",", ":")).encode("utf-8")
+        return Response(content=body, media_type="application/json")
+
+    @app.post("/v1/security/oauth2/token")
+    async def token():
+        failure = await inject("amadeus")
+        if failure is not None:
+            return failure
+        return {"type": "amadeusOAuth2Token", "access_token": FAKE_TOKEN, "token_type": "Bearer",
+                "expires_in": 1799, "state": "approved"}
+
+    @app.get("/v2/shopping/hotel-offers")
+    async def hotel_offers(request: Request):
+        if request.headers.get("authorization") != f"Bearer {FAKE_TOKEN}":
+            return JSONResponse({"errors": [{"status": 401, "title": "Invalid access token"}]}, status_code=401)
+        failure = await inject("amadeus")
+        if failure is not None:
+            return failure
+        params = request.query_params
+        city = params.get("cityCode", "").upper()
+        check_in, check_out = params.get("checkInDate", ""), params.get("checkOutDate", "")
+        limit = int(params.get("page[limit]", "10"))
+        offset = int(params.get("page[offset]", "0"))
+
+        def build():
+            items = hotels.get(city, [])
+            page = json.loads(json.dumps(items[offset : offset + limit]))
+            for item in page:
+                for offer in item["offers"]:
+                    offer["checkInDate"], offer["checkOutDate"] = check_in, check_out
+            meta: Dict[str, Any] = {"count": len(items)}
+            if offset + limit < len(items):
+                meta["links"] = {"next": f"/v2/shopping/hotel-offers?cityCode={city}&checkInDate={check_in}"
+                                         f"&checkOutDate={check_out}&page[offset]={offset + limit}&page[limit]={limit}"}
+            return {"data": page, "meta": meta}
+
+        return cached_json(("hotels", city, check_in, check_out, limit, offset), build)
+
+    @app.get("/v1/flights")
+    async def flight_list(request: Request):
+        params = request.query_params
+        if not params.get("access_key"):
+            return JSONResponse({"error": {"code": "missing_access_key"}}, status_code=401)
+        failure = await inject("aviationstack")
+        if failure is not None:
+            return failure
+        dep, arr = params.get("dep_iata", "").upper(), params.get("arr_iata", "").upper()
+        date = params.get("flight_date", "")
+        limit = min(int(params.get("limit", "100")), 100)
+        offset = int(params.get("offset", "0"))
+
+        def build():
+            matching = [
+                f for f in flights
+                if (not dep or f["departure"]["iata"] == dep) and (not arr or f["arrival"]["iata"] == arr)
+            ]
+            page = json.loads(json.dumps(matching[offset : offset + limit]))
+            if date:
+                for f in page:
+                    f["flight_date"] = date
+                    scheduled = f["departure"].get("scheduled")
+                    if scheduled:
+                        f["departure"]["scheduled"] = date + scheduled[10:]
+            return {
+                "pagination": {"limit": limit, "offset": offset, "count": len(page), "total": len(matching)},
+                "data": page,
+            }
+
+        return cached_json(("flights", dep, arr, date, limit, offset), build)
+
+    @app.get("/__faults")
+    async def get_faults():
+        return {name: fault.to_dict() for name, fault in faults.items()}
+
+    @app.post("/__faults")
+    async def set_faults(request: Request):
+        """Change injected latency/errors at runtime: {"amadeus": {"error_rate": 1.0}}"""
+        changes = await request.json()
+        for name, settings in changes.items():
+            if name in faults:
+                faults[name].update(**{k: v for k, v in settings.items()
+                                       if k in ("latency", "error_rate", "rate_limit_rate", "hang_rate")})
+        return {name: fault.to_dict() for name, fault in faults.items()}
+
+    return app
+
+
+def serve(host: str = "127.0.0.1", port: int = 8790, faults: Optional[Dict[str, Faults]] = None,
+          expand: int = 1, log_level: str = "warning"):
+    import uvicorn
+
+    uvicorn.run(create_app(faults, expand), host=host, port=port, log_level=log_level, access_log=False)
+
+
+def start_in_thread(host: str = "127.0.0.1", port: int = 0, faults: Optional[Dict[str, Faults]] = None,
+                    expand: int = 1) -> str:
+    """Run the fake server in a daemon thread; returns its base URL once it is listening"""
+    import socket
+    import uvicorn
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    config = uvicorn.Config(create_app(faults, expand), log_level="warning", access_log=False)
+    server = uvicorn.Server(config)
+    thread = threading.Thread(target=server.run, kwargs={"sockets": [sock]}, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return f"http://{host}:{sock.getsockname()[1]}"
+
+
+def _percentile(ordered: List[float], q: float) -> float:
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+def bench(total: int = 2000, concurrency: int = 32, target: str = "hotels", url: Optional[str] = None,
+          faults: Optional[Dict[str, Faults]] = None, respect_rate_limits: bool = False,
+          use_cache: bool = False) -> Dict[str, Any]:
+    """Drive travel_light's provider code paths against the fake server and report throughput"""
+    from concurrent.futures import ThreadPoolExecutor
+
+    base_url = url or start_in_thread(faults=faults)
+    os.environ["AMADEUS_BASE_URL"] = base_url
+    os.environ["AVIATIONSTACK_BASE_URL"] = base_url
+    os.environ.setdefault("AMADEUS_API_KEY", "fake")
+    os.environ.setdefault("AMADEUS_API_SECRET", "fake")
+    os.environ.setdefault("AVIATIONSTACK_API_KEY", "fake")
+    if not respect_rate_limits:
+        os.environ["TRAVEL_LIGHT_RATE_AMADEUS"] = "0"
+        os.environ["TRAVEL_LIGHT_RATE_AVIATIONSTACK"] = "0"
+
+    import resilience
+    import travel_light
+
+    cities = ["PAR", "LON", "NYC", "DPS", "TYO"]
+
+    def one(i: int):
+        start = time.perf_counter()
+        if target == "hotels":
+            args = (cities[i % len(cities)], "2025-06-01", "2025-06-03", 1)
+            result = (travel_light.hotel_search_tool(*args) if use_cache else travel_light.search_hotels(*args))
+        else:
+            route = travel_light.EXAMPLE_FLIGHT_ROUTE
+            result = travel_light.flight_search_tool(*route) if use_cache else travel_light.search_flight_route(*route)
+        return time.perf_counter() - start, not result.startswith(("Error", "Failed"))
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        outcomes = list(pool.map(one, range(total)))
+    elapsed = time.perf_counter() - start
+    latencies = sorted(latency for latency, _ in outcomes)
+    ok = sum(1 for _, success in outcomes if success)
+    return {
+        "target": target,
+        "requests": total,
+        "concurrency": concurrency,
+        "succeeded": ok,
+        "failed": total - ok,
+        "elapsed_s": round(elapsed, 3),
+        "requests_per_s": round(total / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(_percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(_percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(_percentile(latencies, 0.99) * 1000, 2),
+        "breakers": resilience.snapshot(),
+    }
+
+
+def record_hotels(city_code: str, check_in: str, check_out: str, adults: int = 1):
+    """Fetch a live hotel-offers response and store it as the fixture for `city_code`"""
+    import travel_light
+
+    token = travel_light.get_amadeus_access_token()
+    response = travel_light._http_request(
+        "GET", f"{travel_light.amadeus_base_url()}/v2/shopping/hotel-offers", "amadeus",
+        params={"cityCode": city_code, "checkInDate": check_in, "checkOutDate": check_out, "adults": adults},
+        headers={"Authorization": f"Bearer {token}"},
+    )
+    response.raise_for_status()
+    fixtures = _load_json(HOTEL_FIXTURES)
+    fixtures["responses"][city_code.upper()] = response.json().get("data", [])
+    _write_fixture(HOTEL_FIXTURES, fixtures)
+    print(f"Recorded {len(fixtures['responses'][city_code.upper()])} hotel offers for {city_code}")
+
+
+def record_flights(dep_iata: str, arr_iata: str, flight_date: Optional[str] = None):
+    """Fetch live flights for a route and merge them into the flight fixtures"""
+    import travel_light
+
+    travel_light.load_environment()
+    params = {"access_key": os.getenv("AVIATIONSTACK_API_KEY"), "dep_iata": dep_iata, "arr_iata": arr_iata}
+    if flight_date:
+        params["flight_date"] = flight_date
+    response = travel_light._http_request(
+        "GET", f"{travel_light.aviationstack_base_url()}/v1/flights", "aviationstack", params=params
+    )
+    response.raise_for_status()
+    recorded = response.json().get("data", [])
+    fixtures = _load_json(FLIGHT_FIXTURES)
+    fixtures["data"] = [
+        f for f in fixtures["data"]
+        if not (f["departure"]["iata"] == dep_iata.upper() and f["arrival"]["iata"] == arr_iata.upper())
+    ] + recorded
+    _write_fixture(FLIGHT_FIXTURES, fixtures)
+    print(f"Recorded {len(recorded)} flights for {dep_iata}-{arr_iata}")
+
+
+def _write_fixture(path: str, data: Dict[str, Any]):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=1)
+        f.write("\n")
+    os.replace(tmp_path, path)
+
+
+def _faults_from_args(args) -> Dict[str, Faults]:
+    return {
+        name: Faults(latency=args.latency, error_rate=args.error_rate, rate_limit_rate=args.rate_limit_rate,
+                     hang_rate=args.hang_rate)
+        for name in PROVIDERS
+    }
+
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Fake Amadeus/AviationStack server for offline testing")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    def add_fault_args(p):
+        p.add_argument("--latency", default="none", help="none | fixed:MS | uniform:MIN,MAX | lognormal:MEDIAN,SIGMA")
+        p.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+        p.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction answered with 429")
+        p.add_argument("--hang-rate", type=float, default=0.0, help="fraction that take 60s (client timeouts)")
+
+    serve_parser = sub.add_parser("serve", help="Run the fake provider server")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8790)
+    serve_parser.add_argument("--expand", type=int, default=1, help="repeat fixtures N times (pagination/load)")
+    add_fault_args(serve_parser)
+
+    bench_parser = sub.add_parser("bench", help="Benchmark travel_light provider calls against the fake server")
+    bench_parser.add_argument("--requests", type=int, default=2000)
+    bench_parser.add_argument("--concurrency", type=int, default=32)
+    bench_parser.add_argument("--target", choices=("hotels", "flights"), default="hotels")
+    bench_parser.add_argument("--url", help="use an already running fake server")
+    bench_parser.add_argument("--respect-rate-limits", action="store_true", help="keep provider token buckets")
+    bench_parser.add_argument("--cache", action="store_true", help="go through the tool-level provider cache")
+    add_fault_args(bench_parser)
+
+    record_hotels_parser = sub.add_parser("record-hotels", help="Record live Amadeus hotel offers as a fixture")
+    record_hotels_parser.add_argument("city_code")
+    record_hotels_parser.add_argument("check_in")
+    record_hotels_parser.add_argument("check_out")
+
+    record_flights_parser = sub.add_parser("record-flights", help="Record live AviationStack flights as fixtures")
+    record_flights_parser.add_argument("dep_iata")
+    record_flights_parser.add_argument("arr_iata")
+    record_flights_parser.add_argument("--date")
+
+    args = parser.parse_args(argv)
+    if args.command == "serve":
+        print(f"🧪 Fake providers on http://{args.host}:{args.port} (AMADEUS_BASE_URL / AVIATIONSTACK_BASE_URL)")
+        serve(args.host, args.port, _faults_from_args(args), args.expand)
+    elif args.command == "bench":
+        result = bench(args.requests, args.concurrency, args.target, args.url, _faults_from_args(args),
+                       args.respect_rate_limits, args.cache)
+        print(json.dumps(result, indent=2))
+    elif args.command == "record-hotels":
+        record_hotels(args.city_code, args.check_in, args.check_out)
+    elif args.command == "record-flights":
+        record_flights(args.dep_iata, args.arr_iata, args.date)
+
+
+if __name__ == "__main__":
+    main()
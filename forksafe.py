@@ -0,0 +1,57 @@
+"""Per-process resources for modules that run inside pre-forked workers.
+
+Threads, executors and SQLite connections do not survive fork(), so anything
+holding one is built lazily and rebuilt in each process:
+
+    _executor = forksafe.per_process(lambda: ThreadPoolExecutor(max_workers=8))
+    _executor().submit(...)
+"""
+import os
+import sqlite3
+import threading
+from typing import Callable, Generic, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+class per_process(Generic[T]):
+    """Call ``factory()`` at most once per process; calling the instance returns the result"""
+
+    def __init__(self, factory: Callable[[], T]):
+        self.factory = factory
+        self._state: Optional[Tuple[int, T]] = None
+        self._lock = threading.Lock()
+
+    def __call__(self) -> T:
+        state = self._state
+        if state is None or state[0] != os.getpid():
+            with self._lock:
+                state = self._state
+                if state is None or state[0] != os.getpid():
+                    state = self._state = (os.getpid(), self.factory())
+        return state[1]
+
+    def current(self) -> Optional[T]:
+        """The value built in this process, or None (never one inherited from the parent)"""
+        state = self._state
+        return state[1] if state is not None and state[0] == os.getpid() else None
+
+    def reset(self) -> Optional[T]:
+        """Forget the value so the next call builds a new one; returns this process's old value"""
+        with self._lock:
+            value = self.current()
+            self._state = None
+        return value
+
+
+def connect_sqlite(path: str, schema: str = "") -> sqlite3.Connection:
+    """Open a WAL-mode SQLite database shared by workers and create its schema"""
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10, check_same_thread=False, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    if schema:
+        conn.executescript(schema)
+    return conn
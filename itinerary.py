@@ -0,0 +1,965 @@
+"""
+Itinerary Module - Structured itineraries, generated and stored day by day
+
+An itinerary is JSON (see ``ITINERARY_SCHEMA``): trip header, flight, hotel,
+budget and a list of days with timed activities, meals and tips. The numbers
+(which stops, in what order, travel times, costs) come from the itinerary
+optimizer; the model only writes each day's prose, one small call per day, and
+days are written in parallel and streamed as soon as each one is ready.
+
+Each generated day is stored as a component addressed by a hash of exactly what
+the model was asked, so the same day (e.g. Ubud and the rice terraces on a
+mid-range Bali trip) is reused across trips, and an itinerary is just its header
+plus the list of its days' component hashes. Changing one day writes one new
+component and a new version of that list; versions are checked on save, so two
+concurrent edits can't silently overwrite each other.
+
+Configuration (environment):
+    TRAVEL_LIGHT_ITINERARY_DB           - SQLite database path (default "data/itineraries.db")
+    TRAVEL_LIGHT_ITINERARY_CONCURRENCY  - days written in parallel (default 4)
+    TRAVEL_LIGHT_ITINERARY_RETENTION    - seconds to keep unused itineraries and days (default 2592000)
+"""
+
+import os
+import re
+import json
+import time
+import uuid
+import sqlite3
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import forksafe
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("TRAVEL_LIGHT_ITINERARY_DB", os.path.join("data", "itineraries.db"))
+CONCURRENCY = int(os.getenv("TRAVEL_LIGHT_ITINERARY_CONCURRENCY", "4"))
+RETENTION = float(os.getenv("TRAVEL_LIGHT_ITINERARY_RETENTION", str(30 * 86400)))
+
+SCHEMA_VERSION = 1
+DAY_START_MINUTES = 9 * 60
+MAX_DAYS = 21
+STYLES = ("budget", "mid", "luxury")
+
+ITINERARY_DAYS = metrics.counter(
+    "travel_light_itinerary_days", "Itinerary days produced, by where they came from", ("source",)
+)
+ITINERARY_DAY_SECONDS = metrics.histogram("travel_light_itinerary_day_seconds", "Time to write one itinerary day")
+
+_ACTIVITY = {
+    "type": "object",
+    "required": ["name", "time", "hours", "cost"],
+    "properties": {
+        "name": {"type": "string"},
+        "kind": {"type": ["string", "null"]},
+        "time": {"type": "string", "description": "HH:MM start"},
+        "hours": {"type": "number"},
+        "cost": {"type": "number"},
+        "travel_minutes": {"type": "integer", "description": "from the previous stop or the hotel"},
+        "notes": {"type": "string"},
+    },
+}
+DAY_SCHEMA = {
+    "type": "object",
+    "required": ["day", "title", "activities", "cost"],
+    "properties": {
+        "day": {"type": "integer"},
+        "title": {"type": "string"},
+        "summary": {"type": "string"},
+        "activities": {"type": "array", "items": _ACTIVITY},
+        "meals": {"type": "array", "items": {"type": "object", "properties": {
+            "meal": {"type": "string"}, "suggestion": {"type": "string"}}}},
+        "tips": {"type": "array", "items": {"type": "string"}},
+        "travel_hours": {"type": "number"},
+        "cost": {"type": "number", "description": "activities plus daily spending"},
+        "component": {"type": "string", "description": "content hash of the stored day"},
+    },
+}
+ITINERARY_SCHEMA = {
+    "$schema": "https://json-schema.org/draft/2020-12/schema",
+    "title": "Travel Light itinerary",
+    "type": "object",
+    "required": ["id", "version", "trip", "budget", "days"],
+    "properties": {
+        "id": {"type": "string"},
+        "version": {"type": "integer", "description": "incremented by every edit"},
+        "schema_version": {"type": "integer"},
+        "trip": {"type": "object", "properties": {
+            "destination": {"type": "string"}, "code": {"type": ["string", "null"]},
+            "country": {"type": ["string", "null"]}, "days": {"type": "integer"},
+            "style": {"enum": list(STYLES)}, "interests": {"type": "array", "items": {"type": "string"}},
+            "currency": {"type": "string"}}},
+        "flight": {"type": ["object", "null"], "properties": {"name": {"type": "string"}, "price": {"type": "number"}}},
+        "hotel": {"type": ["object", "null"], "properties": {
+            "name": {"type": "string"}, "price_per_night": {"type": "number"}, "nights": {"type": "integer"}}},
+        "budget": {"type": "object", "properties": {
+            key: {"type": "number"} for key in
+            ("total", "flight", "hotel", "daily_spend", "activities", "planned", "remaining")}},
+        "unscheduled": {"type": "array", "items": {"type": "string"}},
+        "days": {"type": "array", "items": DAY_SCHEMA},
+    },
+}
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS day_components (
+    hash TEXT PRIMARY KEY,
+    day TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS itineraries (
+    id TEXT PRIMARY KEY,
+    session_id TEXT,
+    version INTEGER NOT NULL,
+    header TEXT NOT NULL,
+    day_hashes TEXT NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS itineraries_session ON itineraries (session_id, updated_at);
+"""
+
+
+class VersionConflict(ValueError):
+    """Raised when an itinerary was saved by someone else since it was loaded"""
+
+
+class ItineraryStore:
+    """SQLite-backed day components and itineraries (WAL mode, shared by pre-forked workers)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = forksafe.per_process(
+            lambda: forksafe.connect_sqlite(self.path, _SCHEMA_SQL)
+        )
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._connection().execute(sql, params)
+
+    def get_component(self, component_hash: str) -> Optional[Dict[str, Any]]:
+        row = self._execute("SELECT day FROM day_components WHERE hash = ?", (component_hash,)).fetchone()
+        if row is None:
+            return None
+        self._execute("UPDATE day_components SET used_at = ? WHERE hash = ?", (time.time(), component_hash))
+        return json.loads(row[0])
+
+    def put_component(self, component_hash: str, day: Dict[str, Any]):
+        now = time.time()
+        self._execute(
+            "INSERT OR REPLACE INTO day_components (hash, day, created_at, used_at) VALUES (?, ?, ?, ?)",
+            (component_hash, json.dumps(day, separators=(",", ":")), now, now),
+        )
+
+    def save(self, itinerary_id: str, session_id: Optional[str], header: Dict[str, Any],
+             day_hashes: List[str], expected_version: Optional[int] = None) -> int:
+        """Store an itinerary's header and day list; returns its new version
+
+        A new itinerary is inserted at version 1. An update must name the
+        version it was based on and raises VersionConflict if another writer
+        saved a newer one in the meantime.
+        """
+        now = time.time()
+        header_json = json.dumps(header, separators=(",", ":"))
+        if expected_version is None:
+            try:
+                self._execute(
+                    "INSERT INTO itineraries (id, session_id, version, header, day_hashes, created_at, updated_at) "
+                    "VALUES (?, ?, 1, ?, ?, ?, ?)",
+                    (itinerary_id, session_id, header_json, json.dumps(day_hashes), now, now),
+                )
+            except sqlite3.IntegrityError:
+                raise VersionConflict(f"itinerary {itinerary_id} already exists")
+            return 1
+        updated = self._execute(
+            "UPDATE itineraries SET version = version + 1, header = ?, day_hashes = ?, updated_at = ? "
+            "WHERE id = ? AND version = ?",
+            (header_json, json.dumps(day_hashes), now, itinerary_id, expected_version),
+        ).rowcount
+        if not updated:
+            raise VersionConflict(f"itinerary {itinerary_id} changed since version {expected_version}")
+        return expected_version + 1
+
+    def load(self, itinerary_id: str) -> Optional[Tuple[Dict[str, Any], List[str], int, Optional[str]]]:
+        """(header, day hashes, version, session id) of a stored itinerary"""
+        row = self._execute(
+            "SELECT header, day_hashes, version, session_id FROM itineraries WHERE id = ?", (itinerary_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        return json.loads(row[0]), json.loads(row[1]), row[2], row[3]
+
+    def latest_for_session(self, session_id: str) -> Optional[str]:
+        row = self._execute(
+            "SELECT id FROM itineraries WHERE session_id = ? ORDER BY updated_at DESC LIMIT 1", (session_id,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def prune(self, max_age: float = RETENTION) -> int:
+        cutoff = time.time() - max_age
+        removed = self._execute("DELETE FROM itineraries WHERE updated_at < ?", (cutoff,)).rowcount
+        return removed + self._execute("DELETE FROM day_components WHERE used_at < ?", (cutoff,)).rowcount
+
+
+_store: Optional[ItineraryStore] = None
+
+
+def store() -> ItineraryStore:
+    global _store
+    if _store is None:
+        _store = ItineraryStore(DB_PATH)
+    return _store
+
+
+_day_executor = forksafe.per_process(
+    lambda: ThreadPoolExecutor(max_workers=CONCURRENCY, thread_name_prefix="itinerary-day")
+)
+
+
+_DAYS_RE = re.compile(r"\b(\d{1,2})[- ]?(?:days?|nights?)\b", re.IGNORECASE)
+# Amounts with a symbol, or before/after any currency code the rate table knows
+_BUDGET_RE = re.compile(r"([$€£¥])\s?(\d[\d,]*)|(\d[\d,]*)\s?(dollars|euros|[a-z]{3})\b|\b([a-z]{3})\s?(\d[\d,]*)",
+                        re.IGNORECASE)
+_SYMBOL_CURRENCIES = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY", "dollars": "USD", "euros": "EUR"}
+# Currency codes that are also English words only count when written in capitals
+_WORD_CODES = {"all", "top", "cup", "pen", "try", "mop", "bob"}
+_INTERESTS = ("food", "culture", "history", "nature", "beach", "nightlife", "shopping", "art", "adventure", "temples")
+
+
+def parse_trip_request(payload: Dict[str, Any]) -> Dict[str, Any]:
+    """Trip parameters from explicit fields, falling back to the latest user messages.
+
+    Raises ValueError when no destination or an invalid value is given.
+    """
+    import destinations
+    import pricing
+
+    text = " ".join(str(m.get("content", "")) for m in payload.get("messages", []) if m.get("role") == "user")
+    lowered = text.lower()
+
+    destination = payload.get("destination")
+    dest = destinations.index().lookup(destination) if destination else None
+    if dest is None and not destination:
+        found = destinations.index().find_in_text(text)
+        dest = found[0] if found else None
+    if dest is None and not destination:
+        raise ValueError("no destination given")
+
+    days_match = _DAYS_RE.search(text)
+    days = int(payload.get("days") or (days_match.group(1) if days_match else 3))
+    if not 1 <= days <= MAX_DAYS:
+        raise ValueError(f"days must be between 1 and {MAX_DAYS}")
+
+    currency = str(payload.get("currency") or "").upper()
+    budget = payload.get("budget")
+    if budget is None:
+        found = _budget_in_text(text)
+        if found:
+            budget = found[0]
+            currency = currency or found[1]
+    currency = currency or pricing.DEFAULT_CURRENCY
+    pricing.table().position(currency)  # UnknownCurrency is a ValueError
+
+    style = payload.get("style") or next(
+        (s for s, words in (("budget", ("budget", "cheap", "backpack")), ("luxury", ("luxury", "upscale", "5-star")))
+         if any(w in lowered for w in words)), "mid")
+    if style not in STYLES:
+        raise ValueError(f"style must be one of {', '.join(STYLES)}")
+
+    return {
+        "destination": dest["name"] if dest else str(destination),
+        "code": dest["code"] if dest else None,
+        "days": days,
+        "budget": float(budget) if budget is not None else None,
+        "currency": currency,
+        "style": style,
+        "interests": list(payload.get("interests") or [w for w in _INTERESTS if w in lowered]),
+        "hotel_price_per_night": float(payload.get("hotel_price_per_night") or 0.0),
+        "flight_cost": float(payload.get("flight_cost") or 0.0),
+        "hours_per_day": float(payload.get("hours_per_day") or 8.0),
+    }
+
+
+def _budget_in_text(text: str) -> Optional[Tuple[float, str]]:
+    """First amount in `text` written with a currency symbol or known code, and that currency"""
+    import pricing
+
+    for match in _BUDGET_RE.finditer(text):
+        unit = match.group(1) or match.group(4) or match.group(5)
+        if unit.lower() in _WORD_CODES and not unit.isupper():
+            continue
+        currency = _SYMBOL_CURRENCIES.get(unit.lower(), unit.upper())
+        try:
+            pricing.table().position(currency)
+        except pricing.UnknownCurrency:
+            continue
+        return float((match.group(2) or match.group(3) or match.group(6)).replace(",", "")), currency
+    return None
+
+
+def plan_skeleton(trip: Dict[str, Any]) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """Header (USD amounts) and per-day stops computed by the optimizer.
+
+    Destinations outside the offline index get empty days for the model to fill.
+    """
+    import destinations
+    import itinerary_optimizer
+    import pricing
+
+    dest = destinations.index().lookup(trip["code"]) if trip.get("code") else None
+    to_usd = pricing.table().rate(trip["currency"], "USD")
+    days = trip["days"]
+    daily = float(dest["daily_cost_usd"][trip["style"]]) if dest else 0.0
+    # Typical daily cost covers the room too; roughly 40% of it is food and local transport
+    daily_spend = 0.4 * daily
+    if trip.get("budget"):
+        budget_usd = trip["budget"] * to_usd
+    else:
+        # No budget given: typical spending plus whatever flight and hotel were asked for
+        budget_usd = (daily * days + trip["flight_cost"] * to_usd
+                      + trip["hotel_price_per_night"] * to_usd * max(days - 1, 0))
+
+    header = {
+        "schema_version": SCHEMA_VERSION,
+        "trip": {
+            "destination": trip["destination"],
+            "code": trip.get("code"),
+            "country": dest["country"] if dest else None,
+            "days": days,
+            "style": trip["style"],
+            "interests": trip["interests"],
+            "currency": trip["currency"],
+        },
+        "flight": None,
+        "hotel": None,
+        "budget": {"total": round(budget_usd, 2)},
+        "unscheduled": [],
+    }
+    if dest is None:
+        return header, [{"day": n, "stops": [], "travel_hours": 0.0, "cost": 0.0} for n in range(1, days + 1)]
+
+    hotels = None
+    if trip["hotel_price_per_night"] > 0:
+        hotels = [{"name": "Hotel", "lat": dest["lat"], "lon": dest["lon"],
+                   "price_per_night": trip["hotel_price_per_night"] * to_usd}]
+    flights = [{"name": "Flight", "price": trip["flight_cost"] * to_usd}] if trip["flight_cost"] > 0 else None
+    plan = itinerary_optimizer.optimize(
+        dest["pois"], days, budget_usd, hotels=hotels, flights=flights,
+        hours_per_day=trip["hours_per_day"], daily_spend=daily_spend, center=dest,
+    )
+    if plan["flight"]:
+        header["flight"] = {"name": plan["flight"]["name"], "price": plan["budget"]["flight"]}
+    if plan["hotel"]:
+        header["hotel"] = {"name": plan["hotel"]["name"], "price_per_night": plan["hotel"]["price_per_night"],
+                           "nights": plan["budget"]["nights"]}
+    header["budget"] = {key: value for key, value in plan["budget"].items() if key != "nights"}
+    header["unscheduled"] = plan["unscheduled"]
+    return header, plan["days"]
+
+
+def _day_request(trip: Dict[str, Any], skeleton: Dict[str, Any]) -> Dict[str, Any]:
+    """Everything the model is told about one day; also what its component hash covers"""
+    return {
+        "destination": trip["destination"],
+        "style": trip["style"],
+        "interests": trip["interests"],
+        "stops": [{"name": s["name"], "kind": s.get("kind"), "hours": s["hours"]} for s in skeleton["stops"]],
+        "avoid": skeleton.get("avoid", []),
+        "request": skeleton.get("request", ""),
+        # Only present when the model should add stops of its own (keeps older hashes stable)
+        **({"propose": skeleton["propose"]} if skeleton.get("propose") else {}),
+    }
+
+
+def component_hash(request: Dict[str, Any], model: str) -> str:
+    payload = json.dumps({"v": SCHEMA_VERSION, "model": model, **request}, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+_DAY_SYSTEM_PROMPT = (
+    "You write one day of a travel itinerary. Reply with a single JSON object and nothing else, with keys: "
+    '"title" (short), "summary" (1-2 sentences), "notes" (object mapping each stop name to one practical tip), '
+    '"meals" (list of {"meal": "lunch" or "dinner", "suggestion"}), "tips" (list of up to 3 strings). '
+    'If "stops" is empty also give "activities": a list of 3-4 {"name", "kind", "hours", "cost_usd"}; '
+    'if "propose" is set, give that many "activities" to add to the stops. '
+    'Honour "request" and never include anything listed in "avoid".'
+)
+
+_KIND_NOTES = {
+    "museum": "Book a timed ticket online to skip the queue.",
+    "sight": "Go early or late in the day to avoid the crowds.",
+    "temple": "Dress modestly - shoulders and knees covered.",
+    "food": "Come hungry and bring some cash for small stalls.",
+    "nature": "Wear good shoes and bring water.",
+    "market": "Haggling is expected at most stalls.",
+    "park": "Pack a snack and take a break on the grass.",
+    "beach": "Bring sunscreen; stay for sunset.",
+    "neighbourhood": "Wander the side streets on foot.",
+}
+
+
+def _template_prose(trip: Dict[str, Any], request: Dict[str, Any]) -> Dict[str, Any]:
+    """Offline prose for demo mode and for model replies that are not usable JSON"""
+    stops = request["stops"]
+    if not stops:
+        return {"title": f"Free day in {trip['destination']}",
+                "summary": f"Explore {trip['destination']} at your own pace.",
+                "notes": {}, "meals": [{"meal": "dinner", "suggestion": "Ask your hotel for a local favourite"}],
+                "tips": []}
+    names = [s["name"] for s in stops]
+    return {
+        "title": " & ".join(names[:2]) + (" and more" if len(names) > 2 else ""),
+        "summary": f"{len(names)} stop{'s' if len(names) != 1 else ''} in {trip['destination']}, "
+                   f"ordered to keep travel short.",
+        "notes": {s["name"]: _KIND_NOTES.get(s.get("kind") or "", "") for s in stops},
+        "meals": [{"meal": "lunch", "suggestion": f"Near {names[min(1, len(names) - 1)]}"},
+                  {"meal": "dinner", "suggestion": f"Around {names[-1]}"}],
+        "tips": [],
+    }
+
+
+def _parse_json_object(text: str) -> Optional[Dict[str, Any]]:
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end <= start:
+        return None
+    try:
+        parsed = json.loads(text[start : end + 1])
+    except ValueError:
+        return None
+    return parsed if isinstance(parsed, dict) else None
+
+
+def _write_prose(trip: Dict[str, Any], request: Dict[str, Any], llm, callbacks: List[Any]) -> Tuple[Dict[str, Any], str]:
+    """(prose, source) for one day: the model's JSON, or the template"""
+    if llm is None:
+        return _template_prose(trip, request), "template"
+    messages = [("system", _DAY_SYSTEM_PROMPT), ("user", json.dumps(request, ensure_ascii=False))]
+    try:
+        reply = llm.invoke(messages, config={"callbacks": callbacks}) if callbacks else llm.invoke(messages)
+    except Exception as e:
+        logger.warning(f"Itinerary day generation failed, using template: {e}")
+        return _template_prose(trip, request), "template"
+    prose = _parse_json_object(getattr(reply, "content", None) or str(reply))
+    if prose is None:
+        return _template_prose(trip, request), "template"
+    return prose, "llm"
+
+
+def _build_component(skeleton: Dict[str, Any], prose: Dict[str, Any]) -> Dict[str, Any]:
+    """Stored day: optimizer numbers (USD) plus the prose, without a day number"""
+    notes = prose.get("notes") if isinstance(prose.get("notes"), dict) else {}
+    stops = skeleton["stops"]
+    # The optimizer's day cost is its stops plus the daily spending allowance
+    daily_spend = skeleton.get("cost", 0.0) - sum(s.get("cost", 0.0) for s in stops)
+    proposed = skeleton.get("propose", 0)
+    if not stops or proposed:
+        # Model-proposed activities (destinations without offline POIs, or "add" edits)
+        stops = list(stops)
+        items = prose.get("activities") or []
+        for item in items[:proposed] if proposed else items:
+            if isinstance(item, dict) and item.get("name"):
+                stops.append({"name": str(item["name"]), "kind": item.get("kind"),
+                              "hours": float(item.get("hours") or 1.5), "cost": float(item.get("cost_usd") or 0.0),
+                              "travel_minutes": 0})
+                notes.setdefault(str(item["name"]), str(item.get("notes") or ""))
+    clock = DAY_START_MINUTES
+    activities = []
+    for stop in stops:
+        clock += int(stop.get("travel_minutes", 0))
+        activities.append({
+            "name": stop["name"],
+            "kind": stop.get("kind"),
+            "time": f"{clock // 60 % 24:02d}:{clock % 60:02d}",
+            "hours": stop["hours"],
+            "cost": stop.get("cost", 0.0),
+            "travel_minutes": int(stop.get("travel_minutes", 0)),
+            "notes": str(notes.get(stop["name"]) or ""),
+        })
+        clock += round(stop["hours"] * 60)
+    activities_cost = sum(a["cost"] for a in activities)
+    return {
+        "title": str(prose.get("title") or "Exploring"),
+        "summary": str(prose.get("summary") or ""),
+        "activities": activities,
+        "meals": [m for m in prose.get("meals") or [] if isinstance(m, dict)][:3],
+        "tips": [str(t) for t in prose.get("tips") or []][:3],
+        "travel_hours": skeleton.get("travel_hours", 0.0),
+        "cost": round(activities_cost + daily_spend, 2),
+    }
+
+
+def present_day(component: Dict[str, Any], number: int, component_id: str, rate: float) -> Dict[str, Any]:
+    """A stored day as shown to clients: numbered, with amounts in the trip currency"""
+    return {
+        "day": number,
+        **component,
+        "activities": [{**a, "cost": round(a["cost"] * rate, 2)} for a in component["activities"]],
+        "cost": round(component["cost"] * rate, 2),
+        "component": component_id,
+    }
+
+
+def present_header(itinerary_id: str, version: int, header: Dict[str, Any]) -> Dict[str, Any]:
+    """Header amounts converted from USD to the trip currency"""
+    import pricing
+
+    rate = pricing.table().rate("USD", header["trip"]["currency"])
+    out = {"id": itinerary_id, "version": version, **header}
+    out["budget"] = {key: round(value * rate, 2) for key, value in header["budget"].items()}
+    if header.get("flight"):
+        out["flight"] = {**header["flight"], "price": round(header["flight"]["price"] * rate, 2)}
+    if header.get("hotel"):
+        out["hotel"] = {**header["hotel"], "price_per_night": round(header["hotel"]["price_per_night"] * rate, 2)}
+    return out
+
+
+def _active_llm():
+    """The shared chat model, or None in demo mode"""
+    from travel_light import is_demo_mode
+
+    if is_demo_mode():
+        return None
+    from llm_provider import get_active_llm
+
+    return get_active_llm()
+
+
+def _model_label() -> str:
+    from travel_light import get_active_model
+
+    return get_active_model()
+
+
+def write_days(trip: Dict[str, Any], skeletons: List[Dict[str, Any]], callbacks: Optional[List[Any]] = None,
+               llm=None, model: Optional[str] = None) -> Iterator[Tuple[int, str, Dict[str, Any], str]]:
+    """Yield (position, component hash, component, source) as each day is ready.
+
+    Stored components are returned straight away; the rest are written in
+    parallel on the day pool and yielded in completion order.
+    """
+    model = model or _model_label()
+    st = store()
+    pending = []
+    for position, skeleton in enumerate(skeletons):
+        request = _day_request(trip, skeleton)
+        # The stored day also holds the optimizer's numbers, so they are part of its identity
+        schedule = [[s.get("travel_minutes", 0), s.get("cost", 0.0)] for s in skeleton["stops"]]
+        key = component_hash({**request, "schedule": schedule, "cost": skeleton.get("cost", 0.0)}, model)
+        component = st.get_component(key)
+        if component is not None:
+            ITINERARY_DAYS.inc(source="cache")
+            yield position, key, component, "cache"
+        else:
+            pending.append((position, skeleton, request, key))
+    if not pending:
+        return
+    if llm is None and model != "demo-mode":
+        llm = _active_llm()
+
+    def write(skeleton, request):
+        start = time.perf_counter()
+        with tracing.start_span("itinerary.day", **{"itinerary.stops": len(request["stops"])}):
+            prose, source = _write_prose(trip, request, llm, callbacks or [])
+        ITINERARY_DAY_SECONDS.observe(time.perf_counter() - start)
+        return _build_component(dict(skeleton, stops=[dict(s) for s in skeleton["stops"]]), prose), source
+
+    executor = _day_executor()
+    futures = {
+        executor.submit(tracing.wrap_context(write), skeleton, request): (position, key)
+        for position, skeleton, request, key in pending
+    }
+    for future in as_completed(futures):
+        position, key = futures[future]
+        component, source = future.result()
+        ITINERARY_DAYS.inc(source=source)
+        # Template days stand in for failed model calls; don't pin them under the model's hash
+        if source == "llm" or model == "demo-mode":
+            st.put_component(key, component)
+        yield position, key, component, source
+
+
+def generate(trip: Dict[str, Any], session_id: Optional[str] = None,
+             callbacks: Optional[List[Any]] = None) -> Iterator[Dict[str, Any]]:
+    """Build, store and stream an itinerary.
+
+    Events: ``{"type": "itinerary"}`` with the header (empty ``days``), one
+    ``{"type": "day"}`` per day as it is ready (any order; use ``day["day"]``),
+    then ``{"type": "complete"}`` with the full itinerary.
+    """
+    import pricing
+
+    header, skeletons = plan_skeleton(trip)
+    itinerary_id = uuid.uuid4().hex
+    rate = pricing.table().rate("USD", trip["currency"])
+    yield {"type": "itinerary", "itinerary": {**present_header(itinerary_id, 1, header), "days": []}}
+
+    hashes: List[Optional[str]] = [None] * len(skeletons)
+    days: List[Optional[Dict[str, Any]]] = [None] * len(skeletons)
+    for position, key, component, source in write_days(trip, skeletons, callbacks):
+        hashes[position] = key
+        days[position] = present_day(component, position + 1, key, rate)
+        yield {"type": "day", "day": days[position], "source": source}
+
+    version = store().save(itinerary_id, session_id, {**header, "request": trip}, hashes)
+    yield {"type": "complete", "itinerary": {**present_header(itinerary_id, version, header), "days": days}}
+
+
+def load(itinerary_id: str) -> Optional[Dict[str, Any]]:
+    """A stored itinerary assembled from its components"""
+    import pricing
+
+    stored = store().load(itinerary_id)
+    if stored is None:
+        return None
+    header, hashes, version, _ = stored
+    header = {k: v for k, v in header.items() if k != "request"}
+    rate = pricing.table().rate("USD", header["trip"]["currency"])
+    days = []
+    for number, key in enumerate(hashes, start=1):
+        component = store().get_component(key)
+        if component is None:
+            return None
+        days.append(present_day(component, number, key, rate))
+    return {**present_header(itinerary_id, version, header), "days": days}
+
+
+_ORDINALS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "sixth": 6, "seventh": 7,
+             "eighth": 8, "ninth": 9, "tenth": 10}
+_DAY_REF_RE = re.compile(
+    r"\bdays?\s*(\d{1,2})(?:\s*(?:-|to|and|&|,)\s*(\d{1,2}))?\b|\b(" + "|".join(_ORDINALS) + r"|last|final)\s+day\b",
+    re.IGNORECASE,
+)
+# An edit is a clause that starts with one of these verbs (after "please", "can you", ...),
+# so questions like "tell me more about day 2" are not mistaken for edits
+_EDIT_CLAUSE_RE = re.compile(
+    r"^(?:(?:ok(?:ay)?|so|now|also|just|and|then)\s+)*"
+    r"(?:(?:can|could|would|will) you\s+|i(?:'d| would) like (?:you )?to\s+|i want (?:you )?to\s+|let'?s\s+)?"
+    r"(?:please\s+)?(?:also\s+)?"
+    r"(remove|drop|skip|cut|delete|clear|get rid of|take out|add|include|put|squeeze|fit|swap|replace|switch|change"
+    r"|make|update|rewrite|redo|relax|lighten|shorten)\b"
+)
+_CLAUSE_SPLIT_RE = re.compile(r"[.;!?\n]+|,\s*")
+# Clauses about things the day plans don't hold ("change my flight to the day 2
+# one", "update me on the weather for day 2") are questions for the agent
+_NOT_DAY_PLAN_RE = re.compile(
+    r"\b(flights?|planes?|airlines?|hotels?|rooms?|weather|forecast|reservations?|bookings?|tickets?|check[- ]?(?:in|out))\b"
+)
+# "skip day 3" / "remove the whole last day": a removal whose object is the day itself
+_CLEAR_DAY_RE = re.compile(
+    r"\b(?:remove|drop|skip|cut|delete|clear|get rid of|take out)\s+(?:the\s+)?(?:whole\s+|entire\s+)?"
+    r"(?:of\s+)?(?:day\s*\d{1,2}|(?:first|second|third|fourth|fifth|sixth|seventh|eighth|ninth|tenth|last|final)\s+day)\b"
+)
+_EDIT_ACTIONS = [
+    ("remove", re.compile(r"\b(remove|drop|skip|cut|delete|clear|without|get rid of|take out)\b")),
+    ("cheaper", re.compile(r"\b(cheaper|less expensive|cheap|save money|lower cost)\b")),
+    ("relax", re.compile(r"\b(relax(?:ed|ing)?|slower|less busy|lighter|lighten|shorten|fewer|easier)\b")),
+    ("replace", re.compile(r"\b(swap|replace|switch|something else|different|instead|change)\b")),
+    ("add", re.compile(r"\b(add|include|put|squeeze|fit)\b")),
+    ("rewrite", re.compile(r"\b(make|update|rewrite|redo)\b")),
+]
+# Words in an "add" request that pick the kind of stop to bring in
+_ADD_KINDS = {
+    "museum": ("museum", "museums", "gallery", "galleries", "exhibition"),
+    "sight": ("sight", "sights", "landmark", "landmarks", "monument", "monuments", "viewpoint"),
+    "neighbourhood": ("neighbourhood", "neighborhood", "district", "quarter", "stroll", "walk"),
+    "temple": ("temple", "temples", "shrine", "shrines"),
+    "food": ("food", "restaurant", "eat", "lunch", "dinner"),
+    "market": ("market", "markets", "shopping"),
+    "park": ("park", "parks", "garden", "gardens"),
+    "nature": ("nature", "hike", "hiking"),
+    "beach": ("beach", "beaches"),
+}
+# A "replace" must name a stop or say what kind of stop to swap
+_ACTIVITY_NOUN_RE = re.compile(
+    r"\b(stops?|activit(?:y|ies)|attractions?|places?|visits?|" + "|".join(
+        word for words in _ADD_KINDS.values() for word in words) + r")\b"
+)
+_MAX_INSTRUCTION = 300
+
+
+def parse_edit(instruction: str, components: List[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Which days an edit touches and what kind of edit it is (None if it doesn't look like one).
+
+    Days are found from explicit references ("day 2", "days 2-3", "last day")
+    or from the stops the instruction names; "make it cheaper" with no
+    target touches every day.
+    """
+    text = instruction.lower()
+    clauses = [c.strip() for c in _CLAUSE_SPLIT_RE.split(text)
+               if _EDIT_CLAUSE_RE.match(c.strip()) and not _NOT_DAY_PLAN_RE.search(c)]
+    named = [a["name"] for c in components for a in c["activities"] if a["name"].lower() in text]
+
+    def concrete(name: str, clause: str) -> bool:
+        return name != "replace" or any(n.lower() in clause for n in named) or bool(_ACTIVITY_NOUN_RE.search(clause))
+
+    action, clause = next(((name, clause) for name, pattern in _EDIT_ACTIONS for clause in clauses
+                           if pattern.search(clause) and concrete(name, clause)), (None, ""))
+    count = len(components)
+    positions = set()
+    for match in _DAY_REF_RE.finditer(text):
+        if match.group(1):
+            first = int(match.group(1))
+            last = int(match.group(2) or first)
+            positions.update(range(first - 1, max(first, last)))
+        elif match.group(3) in ("last", "final"):
+            positions.add(count - 1)
+        else:
+            positions.add(_ORDINALS[match.group(3)] - 1)
+    if not positions:
+        positions = {i for i, c in enumerate(components) if any(a["name"] in named for a in c["activities"])}
+    if not positions and action in ("cheaper", "relax"):
+        positions = set(range(count))
+    positions = sorted(p for p in positions if 0 <= p < count)
+    if not positions or action is None:
+        return None
+    parsed = {"days": positions, "action": action, "stops": named,
+              "instruction": instruction.strip()[:_MAX_INSTRUCTION]}
+    if action == "remove" and not named and _CLEAR_DAY_RE.search(clause):
+        parsed["clear"] = True
+    return parsed
+
+
+def _skeleton_from_component(component: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "stops": [{"name": a["name"], "kind": a.get("kind"), "hours": a["hours"], "cost": a["cost"],
+                   "travel_minutes": a.get("travel_minutes", 0)} for a in component["activities"]],
+        "travel_hours": component.get("travel_hours", 0.0),
+        "cost": component["cost"],
+    }
+
+
+def _edit_skeleton(trip: Dict[str, Any], header: Dict[str, Any], components: List[Dict[str, Any]],
+                   position: int, edit: Dict[str, Any]) -> Dict[str, Any]:
+    """New optimizer skeleton for one edited day; other days' stops stay off limits"""
+    import destinations
+    import itinerary_optimizer
+
+    current = _skeleton_from_component(components[position])
+    current_names = [s["name"] for s in current["stops"]]
+    activities_cost = sum(s["cost"] for s in current["stops"])
+    daily_spend = max(current["cost"] - activities_cost, 0.0)
+    skeleton = dict(current, request=edit["instruction"])
+    action = edit["action"]
+    if action == "rewrite":
+        return skeleton
+
+    elsewhere = {a["name"] for i, c in enumerate(components) if i != position for a in c["activities"]}
+    dest = destinations.index().lookup(trip["code"]) if trip.get("code") else None
+    candidates = [p for p in dest["pois"] if p["name"] not in elsewhere] if dest else []
+    hours_per_day = trip["hours_per_day"]
+    money = activities_cost
+    if action == "remove":
+        # Without a named stop: the whole day for "skip day 3", else its last stop
+        removed = set(edit["stops"]) or set(current_names if edit.get("clear") else current_names[-1:])
+        candidates = [p for p in candidates if p["name"] in current_names and p["name"] not in removed]
+        skeleton["avoid"] = sorted(removed)
+    elif action == "replace":
+        replaced = set(edit["stops"]) or set(current_names)
+        candidates = [p for p in candidates if p["name"] not in replaced]
+        skeleton["avoid"] = sorted(replaced)
+        # Replacements may use this day's share of the money left in the budget
+        money += max(header["budget"].get("remaining", 0.0), 0.0) / len(components)
+    elif action == "cheaper":
+        money = activities_cost / 2
+        if dest is not None:
+            daily_spend = min(daily_spend, 0.4 * float(dest["daily_cost_usd"]["budget"]))
+    elif action == "relax":
+        hours_per_day = max(hours_per_day - 3.0, 3.0)
+        candidates = [p for p in candidates if p["name"] in current_names]
+    elif action == "add":
+        candidates = _add_candidates(candidates, current_names, edit["instruction"])
+        # Room for the new stop: a little more time and this day's share of the money left
+        hours_per_day = min(hours_per_day + 2.0, 12.0)
+        money += max(header["budget"].get("remaining", 0.0), 0.0) / len(components)
+
+    if action == "cheaper" and candidates:
+        costs = [float(p.get("cost", itinerary_optimizer.KIND_COSTS.get(p.get("kind", ""), 10.0)))
+                 for p in candidates]
+        # Keep at least the cheapest stop rather than emptying the day
+        money = max(money, min(costs))
+
+    if dest is None:
+        # No offline POIs: the model proposes the day, steered by "avoid" and the request
+        if action == "add":
+            return dict(skeleton, propose=1)
+        if action == "remove":
+            kept = [s for s in current["stops"] if s["name"] not in skeleton["avoid"]]
+            return dict(skeleton, stops=kept, cost=round(sum(s["cost"] for s in kept) + daily_spend, 2))
+        return dict(skeleton, stops=[], cost=round(daily_spend, 2), avoid=sorted(set(current_names)))
+    if action == "add" and not any(p["name"] not in current_names for p in candidates):
+        # Every offline stop is already on the trip; the model suggests one
+        return dict(skeleton, propose=1)
+    if not candidates:
+        return dict(skeleton, stops=[], travel_hours=0.0, cost=round(daily_spend, 2))
+    try:
+        plan = itinerary_optimizer.optimize(candidates, 1, money + daily_spend, hours_per_day=hours_per_day,
+                                            daily_spend=daily_spend, center=dest)
+    except itinerary_optimizer.InfeasiblePlan:
+        return dict(skeleton, stops=[], travel_hours=0.0, cost=round(daily_spend, 2))
+    day = plan["days"][0]
+    return dict(skeleton, stops=day["stops"], travel_hours=day["travel_hours"], cost=day["cost"])
+
+
+def _add_candidates(candidates: List[Dict[str, Any]], current_names: List[str],
+                    instruction: str) -> List[Dict[str, Any]]:
+    """Candidates for an "add" edit, scored so the requested stop is scheduled first, then the day's own"""
+    text = instruction.lower()
+    words = set(re.findall(r"[a-z]+", text))
+    kinds = {kind for kind, names in _ADD_KINDS.items() if words & set(names)}
+    wanted = [p for p in candidates if p["name"] not in current_names
+              and (p["name"].lower() in text or p.get("kind") in kinds)]
+    if not wanted:
+        # Nothing specific asked for: any stop the trip doesn't already visit
+        wanted = [p for p in candidates if p["name"] not in current_names]
+    kept = [p for p in candidates if p["name"] in current_names]
+    return [dict(p, score=3.0) for p in wanted[:1]] + [dict(p, score=2.0) for p in kept] + \
+        [dict(p, score=1.0) for p in wanted[1:]]
+
+
+def _recompute_budget(header: Dict[str, Any], components: List[Dict[str, Any]]) -> Dict[str, Any]:
+    budget = dict(header["budget"])
+    if "planned" not in budget:
+        return budget
+    days_cost = sum(c["cost"] for c in components)
+    activities = sum(a["cost"] for c in components for a in c["activities"])
+    budget["activities"] = round(activities, 2)
+    budget["daily_spend"] = round(days_cost - activities, 2)
+    budget["planned"] = round(budget.get("flight", 0.0) + budget.get("hotel", 0.0) + days_cost, 2)
+    budget["remaining"] = round(budget["total"] - budget["planned"], 2)
+    return budget
+
+
+_SAVE_ATTEMPTS = 3
+
+
+def edit(itinerary_id: str, instruction: str, days: Optional[List[int]] = None,
+         callbacks: Optional[List[Any]] = None) -> Iterator[Dict[str, Any]]:
+    """Apply an edit to a stored itinerary, rewriting only the days it touches.
+
+    `days` (1-based) overrides the days found in the instruction. Events:
+    ``{"type": "edit"}`` naming the days being rewritten, ``{"type": "day"}``
+    for each new day, then ``{"type": "complete"}`` with the updated itinerary
+    and ``changed``. Raises ValueError for unknown itineraries and instructions
+    that don't identify a change.
+    """
+    import pricing
+
+    stored = store().load(itinerary_id)
+    if stored is None:
+        raise ValueError("unknown itinerary")
+    header, hashes, version, session_id = stored
+    components = [store().get_component(key) for key in hashes]
+    if any(c is None for c in components):
+        raise ValueError("itinerary has expired")
+    parsed = parse_edit(instruction, components)
+    if days:
+        positions = sorted({int(d) - 1 for d in days if 1 <= int(d) <= len(components)})
+        parsed = dict(parsed or {"action": "rewrite", "stops": [], "instruction": instruction.strip()[:_MAX_INSTRUCTION]},
+                      days=positions)
+    if parsed is None or not parsed["days"]:
+        raise ValueError("could not tell which days to change; name a day (e.g. \"day 2\") or a stop")
+
+    trip = header["request"]
+    rate = pricing.table().rate("USD", trip["currency"])
+    yield {"type": "edit", "itinerary_id": itinerary_id, "action": parsed["action"],
+           "days": [p + 1 for p in parsed["days"]]}
+    skeletons = [_edit_skeleton(trip, header, components, p, parsed) for p in parsed["days"]]
+    for index, key, component, source in write_days(trip, skeletons, callbacks):
+        position = parsed["days"][index]
+        hashes[position], components[position] = key, component
+        yield {"type": "day", "day": present_day(component, position + 1, key, rate), "source": source}
+
+    dropped = [name for skeleton in skeletons for name in skeleton.get("avoid", [])]
+    changed = {p: (hashes[p], components[p]) for p in parsed["days"]}
+    for attempt in range(_SAVE_ATTEMPTS):
+        scheduled = {a["name"] for c in components for a in c["activities"]}
+        header = dict(header, budget=_recompute_budget(header, components), unscheduled=[
+            name for name in dict.fromkeys(header.get("unscheduled", []) + dropped) if name not in scheduled])
+        try:
+            version = store().save(itinerary_id, session_id, header, hashes, expected_version=version)
+            break
+        except VersionConflict:
+            # Someone else saved an edit meanwhile: lay our days over theirs and try again
+            stored = store().load(itinerary_id)
+            if stored is None or attempt == _SAVE_ATTEMPTS - 1 or len(stored[1]) != len(hashes):
+                raise
+            header, hashes, version, _ = stored
+            components = [store().get_component(key) for key in hashes]
+            if any(c is None for c in components):
+                raise
+            for position, (key, component) in changed.items():
+                hashes[position], components[position] = key, component
+    public = {k: v for k, v in header.items() if k != "request"}
+    days_out = [present_day(c, n, key, rate) for n, (c, key) in enumerate(zip(components, hashes), start=1)]
+    yield {"type": "complete", "itinerary": {**present_header(itinerary_id, version, public), "days": days_out},
+           "changed": [p + 1 for p in parsed["days"]]}
+
+
+def match_edit(session_id: str, messages: List[Dict[str, Any]]) -> Optional[str]:
+    """ID of the session's latest itinerary when the last message edits it"""
+    if not session_id or not messages or messages[-1].get("role") != "user":
+        return None
+    itinerary_id = store().latest_for_session(session_id)
+    if itinerary_id is None:
+        return None
+    stored = store().load(itinerary_id)
+    components = [store().get_component(key) for key in stored[1]]
+    if any(c is None for c in components):
+        return None
+    return itinerary_id if parse_edit(str(messages[-1].get("content", "")), components) else None
+
+
+def to_markdown(itinerary: Dict[str, Any], only_days: Optional[List[int]] = None) -> str:
+    """Readable rendering of a structured itinerary (chat replies, exports); `only_days` limits the days shown"""
+    import pricing
+
+    currency = itinerary["trip"]["currency"]
+
+    def money(amount: float) -> str:
+        return pricing.format_price(amount, currency, whole=True)
+
+    trip = itinerary["trip"]
+    lines = [f"# {trip['days']}-day {trip['destination']} itinerary"]
+    if itinerary.get("flight") or itinerary.get("hotel"):
+        lines.append("")
+    if itinerary.get("flight"):
+        lines.append(f"**Flight:** {itinerary['flight']['name']} - {money(itinerary['flight']['price'])}")
+    if itinerary.get("hotel"):
+        hotel = itinerary["hotel"]
+        lines.append(f"**Hotel:** {hotel['name']} - {money(hotel['price_per_night'])}/night for {hotel['nights']} nights")
+    for day in itinerary["days"]:
+        if only_days and day["day"] not in only_days:
+            continue
+        lines += ["", f"## Day {day['day']}: {day['title']}"]
+        if day.get("summary"):
+            lines.append(day["summary"])
+        for activity in day["activities"]:
+            line = f"- {activity['time']} **{activity['name']}** (~{activity['hours']:g}h"
+            line += f", {money(activity['cost'])})" if activity["cost"] else ")"
+            if activity.get("notes"):
+                line += f" - {activity['notes']}"
+            lines.append(line)
+        for meal in day.get("meals", []):
+            lines.append(f"- {str(meal.get('meal', 'meal')).capitalize()}: {meal.get('suggestion', '')}")
+        for tip in day.get("tips", []):
+            lines.append(f"- Tip: {tip}")
+        lines.append(f"- Day cost: {money(day['cost'])}")
+    budget = itinerary.get("budget", {})
+    if "planned" in budget:
+        lines += ["", f"**Budget:** {money(budget['planned'])} of {money(budget['total'])} planned; "
+                      f"{money(budget['remaining'])} left"]
+    if itinerary.get("unscheduled"):
+        lines.append("**Did not fit:** " + ", ".join(itinerary["unscheduled"]))
+    return "\n".join(lines)
+
+
+__all__ = ["DAY_SCHEMA", "ITINERARY_SCHEMA", "ItineraryStore", "component_hash", "edit", "generate", "load",
+           "match_edit", "parse_edit", "parse_trip_request", "plan_skeleton", "present_day", "present_header",
+           "store", "to_markdown", "write_days", "VersionConflict"]
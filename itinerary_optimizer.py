@@ -0,0 +1,308 @@
+"""
+Itinerary Optimizer - Day-by-day schedules and budgets computed, not guessed
+
+Takes candidate points of interest (coordinates, visit hours, entry costs),
+optional hotel and flight options, a number of days and a total budget, and
+returns a schedule that fits each day's hours and the money available while
+keeping travel between stops short:
+
+    1. pick the flight and hotel with the best price + travel-time trade-off
+    2. pick the most valuable POIs that fit the remaining money and hours
+    3. split them into days by sweeping around the hotel (several start angles)
+    4. order each day with nearest-neighbour + 2-opt on a NumPy distance matrix
+
+Distances are vectorized great-circle distances scaled by a detour factor, so
+a few hundred candidates solve in milliseconds. The agent calls this through
+``itinerary_optimizer_tool`` and writes the prose around the numbers.
+
+Configuration (environment):
+    TRAVEL_LIGHT_CITY_SPEED_KMH  - average door-to-door speed between stops (default 20)
+    TRAVEL_LIGHT_VALUE_OF_TIME   - USD one hour of travel is worth when trading it off (default 20)
+"""
+
+import os
+import math
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+
+CITY_SPEED_KMH = float(os.getenv("TRAVEL_LIGHT_CITY_SPEED_KMH", "20"))
+VALUE_OF_TIME = float(os.getenv("TRAVEL_LIGHT_VALUE_OF_TIME", "20"))
+DETOUR_FACTOR = 1.3  # streets are not great circles
+EARTH_RADIUS_KM = 6371.0
+
+# Typical entry cost in USD when a candidate does not give one
+KIND_COSTS = {
+    "museum": 20.0, "sight": 15.0, "temple": 5.0, "food": 15.0, "nature": 10.0,
+    "market": 0.0, "park": 0.0, "beach": 0.0, "neighbourhood": 0.0,
+}
+_SWEEP_STARTS = 8
+
+
+class InfeasiblePlan(ValueError):
+    """Raised when fixed costs alone exceed the budget"""
+
+
+def distance_matrix(lat: np.ndarray, lon: np.ndarray,
+                    lat2: Optional[np.ndarray] = None, lon2: Optional[np.ndarray] = None) -> np.ndarray:
+    """Great-circle distances in km between two point sets (pairwise within one set by default)"""
+    if lat2 is None:
+        lat2, lon2 = lat, lon
+    phi, phi2 = np.radians(lat), np.radians(lat2)
+    dphi = phi[:, None] - phi2[None, :]
+    dlam = np.radians(lon)[:, None] - np.radians(lon2)[None, :]
+    a = np.sin(dphi / 2) ** 2 + np.cos(phi)[:, None] * np.cos(phi2)[None, :] * np.sin(dlam / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+def _route_length(route: List[int], hours: np.ndarray) -> float:
+    return float(hours[route[:-1], route[1:]].sum())
+
+
+def _nearest_neighbour(stops: List[int], base: int, hours: np.ndarray) -> List[int]:
+    route = [base]
+    remaining = list(stops)
+    while remaining:
+        row = hours[route[-1], remaining]
+        route.append(remaining.pop(int(np.argmin(row))))
+    route.append(base)
+    return route
+
+
+def two_opt(route: List[int], hours: np.ndarray) -> List[int]:
+    """Improve a closed route (fixed first/last node) with vectorized 2-opt moves"""
+    route = list(route)
+    if len(route) < 5:
+        return route
+    while True:
+        nodes = np.asarray(route)
+        a, b = nodes[:-1], nodes[1:]
+        # delta[i, j]: change from replacing edges (a_i,b_i),(a_j,b_j) with (a_i,a_j),(b_i,b_j)
+        delta = hours[np.ix_(a, a)] + hours[np.ix_(b, b)] - hours[a, b][:, None] - hours[a, b][None, :]
+        delta = np.triu(delta, k=2)
+        i, j = np.unravel_index(int(np.argmin(delta)), delta.shape)
+        if delta[i, j] >= -1e-9:
+            return route
+        route[i + 1 : j + 1] = route[i + 1 : j + 1][::-1]
+
+
+def _split_days(order: List[int], base: int, visit: np.ndarray, hours: np.ndarray,
+                days: int, hours_per_day: float) -> List[List[int]]:
+    """Cut a sweep order into consecutive days with a balanced load that fits the daily hours"""
+    plan: List[List[int]] = [[] for _ in range(days)]
+    path = [base] + order + [base]
+    load = float(visit[order].sum() + hours[path[:-1], path[1:]].sum())
+    target = min(hours_per_day, load / days)
+    day, used, last = 0, 0.0, base
+    for stop in order:
+        need = hours[last, stop] + visit[stop]
+        over_capacity = used + need + hours[stop, base] > hours_per_day
+        # Start the next day once this stop would end up mostly beyond the day's share
+        over_target = day < days - 1 and used + need / 2 > target
+        if plan[day] and (over_capacity or over_target):
+            day += 1
+            if day == days:
+                break
+            used, last = 0.0, base
+            need = hours[base, stop] + visit[stop]
+        plan[day].append(stop)
+        used += need
+        last = stop
+    return plan
+
+
+def _choose(options: Optional[List[Dict[str, Any]]], price_key: str, extra_cost) -> Optional[Dict[str, Any]]:
+    if not options:
+        return None
+    costs = np.array([float(o.get(price_key, 0.0)) + extra_cost(i, o) for i, o in enumerate(options)])
+    return options[int(np.argmin(costs))]
+
+
+def optimize(pois: List[Dict[str, Any]], days: int, budget: float,
+             hotels: Optional[List[Dict[str, Any]]] = None,
+             flights: Optional[List[Dict[str, Any]]] = None,
+             hours_per_day: float = 8.0, daily_spend: float = 0.0,
+             center: Optional[Dict[str, float]] = None,
+             speed_kmh: float = CITY_SPEED_KMH, value_of_time: float = VALUE_OF_TIME) -> Dict[str, Any]:
+    """Plan `days` days from candidate POIs within `budget` (USD).
+
+    POIs need ``name``, ``lat``, ``lon`` and may give ``hours``, ``cost`` (or a
+    ``kind`` to estimate it) and ``score`` (higher is more important; defaults
+    to list order). Hotels need ``price_per_night`` and coordinates; flights a
+    ``price`` and optionally ``hours``. A trip of `days` days needs
+    ``days - 1`` nights, so a day trip books no hotel. Without a hotel the day
+    base is `center` (or the POIs' centroid).
+    """
+    start_time = time.perf_counter()
+    if days < 1:
+        raise ValueError("days must be at least 1")
+    if not pois:
+        raise ValueError("no candidate points of interest")
+    nights = max(days - 1, 0)
+    n = len(pois)
+
+    poi_lat = np.array([float(p["lat"]) for p in pois])
+    poi_lon = np.array([float(p["lon"]) for p in pois])
+    visit_hours = np.array([float(p.get("hours", 1.5)) for p in pois])
+    entry_cost = np.array([float(p.get("cost", KIND_COSTS.get(p.get("kind", ""), 10.0))) for p in pois])
+    score = np.array([float(p.get("score", 1.0 - i / (2.0 * n))) for i, p in enumerate(pois)])
+    to_hours = DETOUR_FACTOR / speed_kmh
+
+    flight = _choose(flights, "price", lambda i, f: value_of_time * float(f.get("hours", 0.0)))
+    flight_cost = float(flight["price"]) if flight else 0.0
+
+    hotel = None
+    if hotels and nights:
+        hotel_lat = np.array([float(h["lat"]) for h in hotels])
+        hotel_lon = np.array([float(h["lon"]) for h in hotels])
+        # Mean hotel -> POI travel (weighted by importance) stands in for daily commuting
+        km = distance_matrix(hotel_lat, hotel_lon, poi_lat, poi_lon)
+        commute = (km * score).sum(axis=1) / score.sum() * to_hours * 2 * days
+        fixed = flight_cost + daily_spend * days
+        affordable = [i for i, h in enumerate(hotels) if fixed + nights * float(h["price_per_night"]) <= budget]
+        if not affordable:
+            raise InfeasiblePlan("no hotel fits the budget after flights and daily spending")
+        hotel = _choose([hotels[i] for i in affordable], "price_per_night",
+                        lambda i, h: value_of_time * commute[affordable[i]] / nights)
+    hotel_cost = nights * float(hotel["price_per_night"]) if hotel else 0.0
+
+    fixed_cost = flight_cost + hotel_cost + daily_spend * days
+    if fixed_cost > budget:
+        raise InfeasiblePlan(f"fixed costs (${fixed_cost:,.0f}) exceed the budget (${budget:,.0f})")
+
+    if hotel is not None:
+        base_lat, base_lon = float(hotel["lat"]), float(hotel["lon"])
+    elif center is not None:
+        base_lat, base_lon = float(center["lat"]), float(center["lon"])
+    else:
+        base_lat, base_lon = float(poi_lat.mean()), float(poi_lon.mean())
+
+    # Most valuable POIs per hour (travel to/from base approximates the detour) and dollar
+    from_base = distance_matrix(np.array([base_lat]), np.array([base_lon]), poi_lat, poi_lon)[0] * to_hours
+    money_left = budget - fixed_cost
+    time_left = days * hours_per_day
+    effort = visit_hours + from_base + entry_cost / max(value_of_time, 1e-9)
+    selected: List[int] = []
+    spent = used = 0.0
+    for i in np.argsort(-score / effort, kind="stable"):
+        if spent + entry_cost[i] <= money_left and used + visit_hours[i] + from_base[i] <= time_left:
+            selected.append(int(i))
+            spent += entry_cost[i]
+            used += visit_hours[i] + from_base[i]
+
+    # Routing works on the selected POIs only; the last node is the hotel / day start
+    nodes = np.array(selected + [n])
+    base = len(selected)
+    travel = distance_matrix(np.append(poi_lat, base_lat)[nodes], np.append(poi_lon, base_lon)[nodes]) * to_hours
+    visit = np.append(visit_hours, 0.0)[nodes]
+    node_score = np.append(score, 0.0)[nodes]
+
+    best = None
+    if selected:
+        angles = np.arctan2(poi_lat[selected] - base_lat,
+                            (poi_lon[selected] - base_lon) * math.cos(math.radians(base_lat)))
+        order = np.argsort(angles).tolist()
+        for start in sorted({round(k * len(order) / _SWEEP_STARTS) % len(order) for k in range(_SWEEP_STARTS)}):
+            rotated = order[start:] + order[:start]
+            routes = []
+            dropped: List[int] = []
+            for stops in _split_days(rotated, base, visit, travel, days, hours_per_day):
+                route = two_opt(_nearest_neighbour(stops, base, travel), travel)
+                # Drop the least important stop until the day fits
+                while len(route) > 2 and _route_length(route, travel) + visit[route].sum() > hours_per_day:
+                    worst = min(route[1:-1], key=lambda s: node_score[s])
+                    route.remove(worst)
+                    dropped.append(worst)
+                routes.append(route)
+            scheduled = {s for r in routes for s in r[1:-1]}
+            dropped += [s for s in rotated if s not in scheduled and s not in dropped]
+            total = sum(_route_length(r, travel) for r in routes)
+            key = (-float(node_score[list(scheduled)].sum()) if scheduled else 0.0, total)
+            if best is None or key < best[0]:
+                best = (key, routes, dropped)
+
+    routes = best[1] if best else [[base, base] for _ in range(days)]
+    dropped = best[2] if best else []
+    chosen = set(selected)
+    unscheduled = [int(nodes[s]) for s in dropped] + [i for i in range(n) if i not in chosen]
+
+    day_plans = []
+    activities_cost = 0.0
+    for number, route in enumerate(routes, start=1):
+        stops = []
+        for prev, node in zip(route[:-2], route[1:-1]):
+            stop = int(nodes[node])
+            stops.append({
+                "name": pois[stop]["name"],
+                "kind": pois[stop].get("kind"),
+                "hours": round(float(visit_hours[stop]), 2),
+                "cost": round(float(entry_cost[stop]), 2),
+                "travel_minutes": round(float(travel[prev, node]) * 60),
+            })
+        travel_h = _route_length(route, travel)
+        day_cost = float(entry_cost[nodes[route[1:-1]]].sum()) if len(route) > 2 else 0.0
+        activities_cost += day_cost
+        day_plans.append({
+            "day": number,
+            "stops": stops,
+            "travel_hours": round(travel_h, 2),
+            "travel_km": round(travel_h / to_hours, 1),
+            "activity_hours": round(float(visit[route].sum()), 2),
+            "cost": round(day_cost + daily_spend, 2),
+        })
+
+    total_cost = fixed_cost + activities_cost
+    return {
+        "days": day_plans,
+        "flight": flight,
+        "hotel": hotel,
+        "budget": {
+            "total": round(budget, 2),
+            "flight": round(flight_cost, 2),
+            "hotel": round(hotel_cost, 2),
+            "nights": nights if hotel else 0,
+            "daily_spend": round(daily_spend * days, 2),
+            "activities": round(activities_cost, 2),
+            "planned": round(total_cost, 2),
+            "remaining": round(budget - total_cost, 2),
+        },
+        "unscheduled": [pois[i]["name"] for i in unscheduled],
+        "travel_hours": round(sum(d["travel_hours"] for d in day_plans), 2),
+        "solve_ms": round((time.perf_counter() - start_time) * 1000, 2),
+    }
+
+
+def format_plan(plan: Dict[str, Any], title: str = "Optimized itinerary", currency: str = "USD") -> str:
+    """Compact text rendering for the agent to write prose around (amounts in `currency`)"""
+    import pricing
+
+    rate = pricing.table().rate("USD", currency)
+
+    def money(usd: float) -> str:
+        return pricing.format_price(usd * rate, currency, whole=True)
+
+    b = plan["budget"]
+    lines = [f"{title} (computed in {plan['solve_ms']:.1f} ms)"]
+    if plan["flight"]:
+        lines.append(f"Flight: {plan['flight'].get('name', 'selected flight')} - {money(b['flight'])}")
+    if plan["hotel"]:
+        lines.append(f"Hotel: {plan['hotel'].get('name', 'selected hotel')} - {money(b['hotel'])} "
+                     f"for {b['nights']} night{'s' if b['nights'] != 1 else ''}")
+    for day in plan["days"]:
+        lines.append(f"Day {day['day']} ({day['activity_hours']:g}h of visits, {day['travel_hours'] * 60:.0f} min "
+                     f"travel, {money(day['cost'])}):")
+        if not day["stops"]:
+            lines.append("  - Free day")
+        for stop in day["stops"]:
+            lines.append(f"  - {stop['name']} (~{stop['hours']:g}h, {money(stop['cost'])}, "
+                         f"{stop['travel_minutes']} min from previous stop)")
+    lines.append(f"Budget: {money(b['planned'])} of {money(b['total'])} planned (flight {money(b['flight'])}, "
+                 f"hotel {money(b['hotel'])}, daily spending {money(b['daily_spend'])}, "
+                 f"activities {money(b['activities'])}); {money(b['remaining'])} left")
+    if plan["unscheduled"]:
+        lines.append("Did not fit: " + ", ".join(plan["unscheduled"]))
+    return "\n".join(lines)
+
+
+__all__ = ["InfeasiblePlan", "distance_matrix", "format_plan", "optimize", "two_opt"]
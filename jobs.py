@@ -0,0 +1,395 @@
+"""
+Jobs Module - Durable asynchronous job queue for long-running trip plans
+
+``POST /api/plans`` stores a job in a local SQLite queue and returns its ID
+straight away; a pool of worker coroutines runs queued jobs through the
+conversation graph. Progress events (which graph node, tool or model call is
+running) and the final result can be polled, streamed over SSE, or delivered to
+a local webhook receiver.
+
+Jobs survive restarts: anything still queued, or running in a process that no
+longer exists, is queued again when the manager starts.
+
+Configuration (environment):
+    TRAVEL_LIGHT_JOB_DB         - SQLite database path (default "data/jobs.db")
+    TRAVEL_LIGHT_JOB_WORKERS    - concurrent jobs per process (default 2)
+    TRAVEL_LIGHT_JOB_RETENTION  - seconds to keep finished jobs (default 86400)
+"""
+
+import os
+import json
+import time
+import uuid
+import asyncio
+import sqlite3
+import logging
+import threading
+import ipaddress
+from urllib.parse import urlparse
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import forksafe
+import metrics
+
+logger = logging.getLogger(__name__)
+
+JOBS_SUBMITTED = metrics.counter("travel_light_jobs_submitted", "Plan jobs submitted")
+JOBS_FINISHED = metrics.counter("travel_light_jobs_finished", "Plan jobs finished", ("status",))
+JOBS_QUEUED = metrics.gauge("travel_light_jobs_queued", "Plan jobs waiting for a worker")
+JOB_SECONDS = metrics.histogram("travel_light_job_seconds", "Plan job run time")
+
+STATUS_QUEUED = "queued"
+STATUS_RUNNING = "running"
+STATUS_COMPLETED = "completed"
+STATUS_FAILED = "failed"
+TERMINAL_STATUSES = (STATUS_COMPLETED, STATUS_FAILED)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    messages TEXT NOT NULL,
+    session_id TEXT,
+    client TEXT,
+    webhook TEXT,
+    progress TEXT,
+    result TEXT,
+    error TEXT,
+    owner_pid INTEGER,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at);
+"""
+
+
+class JobStore:
+    """SQLite-backed job table (WAL mode, safe to share between pre-forked workers)"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = forksafe.per_process(self._open)
+        self._lock = threading.Lock()
+
+    def _open(self) -> sqlite3.Connection:
+        conn = forksafe.connect_sqlite(self.path, _SCHEMA)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql: str, params: tuple = ()) -> sqlite3.Cursor:
+        with self._lock:
+            return self._connection().execute(sql, params)
+
+    def insert(self, job_id: str, messages: List[Dict[str, Any]], session_id: Optional[str],
+               client: Optional[str], webhook: Optional[str]):
+        self._execute(
+            "INSERT INTO jobs (id, status, messages, session_id, client, webhook, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (job_id, STATUS_QUEUED, json.dumps(messages), session_id, client, webhook, time.time()),
+        )
+
+    def claim(self, job_id: str) -> bool:
+        """Atomically move a queued job to running for this process"""
+        cursor = self._execute(
+            "UPDATE jobs SET status = ?, owner_pid = ?, started_at = ?, attempts = attempts + 1 "
+            "WHERE id = ? AND status = ?",
+            (STATUS_RUNNING, os.getpid(), time.time(), job_id, STATUS_QUEUED),
+        )
+        return cursor.rowcount == 1
+
+    def set_progress(self, job_id: str, event: Dict[str, Any]):
+        self._execute("UPDATE jobs SET progress = ? WHERE id = ?", (json.dumps(event), job_id))
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict[str, Any]] = None, error: Optional[str] = None):
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, time.time(), job_id),
+        )
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        job["messages"] = json.loads(job["messages"])
+        for field in ("progress", "result"):
+            job[field] = json.loads(job[field]) if job[field] else None
+        return job
+
+    def queued_ids(self) -> List[str]:
+        rows = self._execute("SELECT id FROM jobs WHERE status = ? ORDER BY created_at", (STATUS_QUEUED,))
+        return [row["id"] for row in rows.fetchall()]
+
+    def recover(self, max_attempts: int = 3) -> int:
+        """Requeue jobs left running by processes that no longer exist"""
+        rows = self._execute("SELECT id, owner_pid, attempts FROM jobs WHERE status = ?", (STATUS_RUNNING,)).fetchall()
+        requeued = 0
+        for row in rows:
+            # Our own pid means a previous run with the same pid (e.g. pid 1 in a container)
+            if row["owner_pid"] != os.getpid() and _pid_alive(row["owner_pid"]):
+                continue
+            if row["attempts"] >= max_attempts:
+                self.finish(row["id"], STATUS_FAILED, error="Job interrupted too many times")
+                continue
+            self._execute("UPDATE jobs SET status = ?, owner_pid = NULL WHERE id = ? AND status = ?",
+                          (STATUS_QUEUED, row["id"], STATUS_RUNNING))
+            requeued += 1
+        return requeued
+
+    def prune(self, older_than: float) -> int:
+        cursor = self._execute(
+            "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?",
+            (STATUS_COMPLETED, STATUS_FAILED, time.time() - older_than),
+        )
+        return cursor.rowcount
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status").fetchall()
+        return {row["status"]: row["n"] for row in rows}
+
+
+def _pid_alive(pid: Optional[int]) -> bool:
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def validate_webhook(url: str) -> str:
+    """Webhooks may only target a local receiver (loopback address or localhost)"""
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("webhook must be an http(s) URL")
+    if parsed.hostname == "localhost":
+        return url
+    try:
+        address = ipaddress.ip_address(parsed.hostname)
+    except ValueError:
+        address = None
+    if address is None or not address.is_loopback:
+        raise ValueError("webhook must point to a local receiver")
+    return url
+
+
+def _post_webhook(url: str, payload: Dict[str, Any], attempts: int = 3):
+    """Deliver a job event to a webhook receiver (blocking; run in a thread)"""
+    import urllib.request
+
+    body = json.dumps(payload).encode("utf-8")
+    for attempt in range(attempts):
+        try:
+            request = urllib.request.Request(url, data=body, headers={"Content-Type": "application/json"})
+            with urllib.request.urlopen(request, timeout=5) as response:
+                if response.status < 500:
+                    return
+        except Exception as e:
+            logger.debug(f"Webhook delivery to {url} failed: {e}")
+        time.sleep(0.5 * 2 ** attempt)
+    logger.warning(f"Giving up on webhook {url} for job {payload.get('job_id')}")
+
+
+class JobManager:
+    """Worker pool running queued jobs, with in-memory progress fan-out"""
+
+    def __init__(self, store: JobStore, run: Callable[[Dict[str, Any], Callable[[Dict[str, Any]], None]],
+                                                     Awaitable[Dict[str, Any]]],
+                 workers: int = 2, retention: float = 86400.0):
+        self.store = store
+        self.run = run
+        self.workers = max(1, workers)
+        self.retention = retention
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Progress events of jobs run by this process, for SSE subscribers
+        self._events: Dict[str, List[Dict[str, Any]]] = {}
+        self._wakeups: Dict[str, asyncio.Event] = {}
+        self._deliveries: set = set()
+        JOBS_QUEUED.set_function(lambda: self._queue.qsize() if self._queue is not None else 0)
+
+    @property
+    def started(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        """Recover interrupted jobs and start the worker pool"""
+        self._loop = asyncio.get_running_loop()
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        recovered = await asyncio.to_thread(self.store.recover)
+        await asyncio.to_thread(self.store.prune, self.retention)
+        for job_id in await asyncio.to_thread(self.store.queued_ids):
+            self._queue.put_nowait(job_id)
+        if recovered:
+            logger.info(f"♻️ Requeued {recovered} interrupted plan jobs")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        self._tasks = []
+
+    async def submit(self, messages: List[Dict[str, Any]], session_id: Optional[str] = None,
+                     client: Optional[str] = None, webhook: Optional[str] = None) -> str:
+        job_id = uuid.uuid4().hex
+        await asyncio.to_thread(self.store.insert, job_id, messages, session_id, client, webhook)
+        JOBS_SUBMITTED.inc()
+        self._emit(job_id, {"type": "queued"})
+        # Before start() has run the job is picked up from the store instead
+        if self._queue is not None:
+            self._queue.put_nowait(job_id)
+        return job_id
+
+    def _emit(self, job_id: str, event: Dict[str, Any]):
+        """Record a progress event (event loop thread only)"""
+        event = {"job_id": job_id, "ts": time.time(), **event}
+        self._events.setdefault(job_id, []).append(event)
+        wakeup = self._wakeups.pop(job_id, None)
+        if wakeup is not None:
+            wakeup.set()
+
+    def _emitter(self, job_id: str) -> Callable[[Dict[str, Any]], None]:
+        """Thread-safe emit for graph callbacks running in worker threads"""
+        loop = self._loop
+
+        def emit(event: Dict[str, Any]):
+            # Latest progress is persisted so pollers in any process can see it
+            try:
+                self.store.set_progress(job_id, event)
+            except sqlite3.Error as e:
+                logger.debug(f"Failed to persist progress for job {job_id}: {e}")
+            loop.call_soon_threadsafe(self._emit, job_id, event)
+
+        return emit
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                await self._run_job(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Plan job {job_id} crashed: {e}")
+
+    async def _run_job(self, job_id: str):
+        if not await asyncio.to_thread(self.store.claim, job_id):
+            return  # taken by another process, or no longer queued
+        job = await asyncio.to_thread(self.store.get, job_id)
+        self._emit(job_id, {"type": "started"})
+        start_time = time.perf_counter()
+        emit = self._emitter(job_id)
+        try:
+            result = await self.run(job, emit)
+            status, error = STATUS_COMPLETED, None
+        except asyncio.CancelledError:
+            # Shutting down: leave it for recovery on the next start
+            raise
+        except Exception as e:
+            result, status, error = None, STATUS_FAILED, str(e) or type(e).__name__
+        JOB_SECONDS.observe(time.perf_counter() - start_time)
+        JOBS_FINISHED.inc(status=status)
+        await asyncio.to_thread(self.store.finish, job_id, status, result, error)
+        final = {"type": status, "result": result, "error": error}
+        self._emit(job_id, final)
+        if job.get("webhook"):
+            delivery = asyncio.create_task(asyncio.to_thread(_post_webhook, job["webhook"], {"job_id": job_id, **final}))
+            self._deliveries.add(delivery)
+            delivery.add_done_callback(self._deliveries.discard)
+        # Keep recent event history bounded
+        if len(self._events) > 1000:
+            for stale in list(self._events)[:200]:
+                self._events.pop(stale, None)
+
+    async def subscribe(self, job_id: str, heartbeat: float = 15.0) -> AsyncIterator[Optional[Dict[str, Any]]]:
+        """Yield a job's events until it finishes; None marks an idle heartbeat"""
+        index = 0
+        last_db_state = None
+        while True:
+            events = self._events.get(job_id, [])
+            while index < len(events):
+                event = events[index]
+                index += 1
+                yield event
+                if event["type"] in TERMINAL_STATUSES:
+                    return
+            if not events:
+                # Job runs (or ran) in another process: fall back to the database
+                job = await asyncio.to_thread(self.store.get, job_id)
+                if job is None:
+                    return
+                if job["status"] in TERMINAL_STATUSES:
+                    yield {"job_id": job_id, "type": job["status"], "result": job["result"], "error": job["error"]}
+                    return
+                state = (job["status"], json.dumps(job["progress"]))
+                if state != last_db_state:
+                    last_db_state = state
+                    yield {"job_id": job_id, "type": job["status"], "progress": job["progress"]}
+            wakeup = self._wakeups.setdefault(job_id, asyncio.Event())
+            try:
+                await asyncio.wait_for(wakeup.wait(), timeout=heartbeat if events else min(heartbeat, 1.0))
+            except asyncio.TimeoutError:
+                if events:
+                    yield None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "running": self.started,
+            "queued_local": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+
+def progress_callbacks(emit: Callable[[Dict[str, Any]], None]) -> List[Any]:
+    """LangChain callback handlers reporting graph progress ([] without langchain)"""
+    handler_class = _langchain_handler_class()
+    return [handler_class(emit)] if handler_class is not None else []
+
+
+_handler_class = None
+
+
+def _langchain_handler_class():
+    """Build the LangChain callback handler class on first use"""
+    global _handler_class
+    if _handler_class is not None:
+        return _handler_class or None
+    try:
+        from langchain_core.callbacks import BaseCallbackHandler
+    except ImportError:
+        _handler_class = False
+        return None
+
+    class ProgressCallbackHandler(BaseCallbackHandler):
+        """Turns graph node, tool and model events into job progress events"""
+
+        def __init__(self, emit: Callable[[Dict[str, Any]], None]):
+            self.emit = emit
+
+        def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+            node = (metadata or {}).get("langgraph_node")
+            if node and kwargs.get("name") == node:
+                self.emit({"type": "node", "node": node})
+
+        def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+            self.emit({"type": "tool_start", "tool": (serialized or {}).get("name") or kwargs.get("name")})
+
+        def on_tool_end(self, output, *, run_id, **kwargs):
+            self.emit({"type": "tool_end"})
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+            self.emit({"type": "llm_start"})
+
+    _handler_class = ProgressCallbackHandler
+    return _handler_class
+
+
+JOB_DB = os.getenv("TRAVEL_LIGHT_JOB_DB", "data/jobs.db")
+JOB_WORKERS = int(os.getenv("TRAVEL_LIGHT_JOB_WORKERS", "2"))
+JOB_RETENTION = float(os.getenv("TRAVEL_LIGHT_JOB_RETENTION", "86400"))
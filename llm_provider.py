@@ -1,25 +1,53 @@
 import os
-from langchain_openai import ChatOpenAI
-
-# Initialize the LLM provider with error handling
-try:
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        raise ValueError("OPENAI_API_KEY not found in environment variables")
-    
-    ACTIVE_LLM = ChatOpenAI(
-        model="gpt-4o-mini",  # You can change this to gpt-4 or other models
-        temperature=0.7,
-        api_key=api_key
-    )
-except Exception as e:
-    # Create a dummy LLM for demo purposes
-    class DummyLLM:
-        def __init__(self):
-            self.model = "demo-mode"
-            self.temperature = 0.7
-        
-        def invoke(self, *args, **kwargs):
-            return "Demo mode: This would be an AI response in the full version."
-    
-    ACTIVE_LLM = DummyLLM()
+import threading
+
+# The OpenAI client is created on first use so importing this module stays cheap.
+_active_llm = None
+_llm_lock = threading.Lock()
+
+
+def get_model_name() -> str:
+    """Model used for the travel agent; also used as the "model" label on metrics."""
+    return os.getenv("OPENAI_MODEL", "gpt-4o-mini")
+
+
+class DummyLLM:
+    """Stand-in LLM for demo purposes."""
+
+    def __init__(self):
+        self.model = "demo-mode"
+        self.temperature = 0.7
+
+    def invoke(self, *args, **kwargs):
+        return "Demo mode: This would be an AI response in the full version."
+
+
+def get_active_llm():
+    """Return the shared LLM, initializing the provider with error handling on first call."""
+    global _active_llm
+    if _active_llm is None:
+        with _llm_lock:
+            if _active_llm is None:
+                try:
+                    api_key = os.getenv("OPENAI_API_KEY")
+                    if not api_key:
+                        raise ValueError("OPENAI_API_KEY not found in environment variables")
+
+                    from langchain_openai import ChatOpenAI
+                    _active_llm = ChatOpenAI(
+                        model=get_model_name(),  # Set OPENAI_MODEL to use gpt-4 or other models
+                        temperature=0.7,
+                        api_key=api_key
+                    )
+                except Exception:
+                    _active_llm = DummyLLM()
+    return _active_llm
+
+
+def __getattr__(name):
+    # Keep `from llm_provider import ACTIVE_LLM` working without eager initialization
+    if name == "ACTIVE_LLM":
+        return get_active_llm()
+    if name == "MODEL_NAME":
+        return get_model_name()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,313 @@
+"""
+Metrics Module - Prometheus-style counters, gauges and histograms for Travel Light
+
+Every metric keeps one shard per thread, so recording on the hot path is a plain
+dict update with no locking. Shards are only merged when /metrics is scraped.
+"""
+
+import time
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Labels bound for the current request (e.g. route/model), applied to every observation
+_bound_labels: ContextVar[Dict[str, str]] = ContextVar("metrics_bound_labels", default={})
+
+# Labels added to every exported sample (e.g. the pre-fork worker serving /metrics)
+_constant_labels: Dict[str, str] = {}
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Render a Prometheus label set"""
+    parts = []
+    for name, value in list(zip(names, values)) + list(_constant_labels.items()):
+        escaped = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{name}="{escaped}"')
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    """Render a sample value the way Prometheus expects"""
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    """Base class holding per-thread shards for a labeled metric"""
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._local = threading.local()
+        self._shards: List[Dict[Tuple[str, ...], Any]] = []
+
+    def _shard(self) -> Dict[Tuple[str, ...], Any]:
+        """Return the calling thread's shard, creating it on first use"""
+        shard = getattr(self._local, "shard", None)
+        if shard is None:
+            shard = {}
+            self._local.shard = shard
+            # list.append is atomic under the GIL, so no lock is needed here
+            self._shards.append(shard)
+        return shard
+
+    def _key(self, labels: Dict[str, Any]) -> Tuple[str, ...]:
+        """Build the label key, falling back to labels bound for the current request"""
+        bound = _bound_labels.get()
+        return tuple(str(labels.get(name, bound.get(name, ""))) for name in self.labelnames)
+
+    def _snapshots(self) -> List[Dict[Tuple[str, ...], Any]]:
+        """Copy every shard (dict.copy is atomic in CPython)"""
+        return [shard.copy() for shard in list(self._shards)]
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+
+    type_name = "counter"
+
+    def inc(self, amount: float = 1.0, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        shard[key] = shard.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = self._key(labels)
+        return sum(snapshot.get(key, 0.0) for snapshot in self._snapshots())
+
+    def collect(self) -> Dict[Tuple[str, ...], float]:
+        merged: Dict[Tuple[str, ...], float] = {}
+        for snapshot in self._snapshots():
+            for key, value in snapshot.items():
+                merged[key] = merged.get(key, 0.0) + value
+        return merged
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}_total{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Gauge(_Metric):
+    """Point-in-time value; either set directly or computed by a callback at scrape time"""
+
+    type_name = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._function: Optional[Callable[[], float]] = None
+
+    def set(self, value: float, **labels):
+        self._values[self._key(labels)] = float(value)
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, function: Callable[[], float]):
+        """Compute the (unlabeled) value lazily when metrics are scraped"""
+        self._function = function
+
+    def collect(self) -> Dict[Tuple[str, ...], float]:
+        values = dict(self._values)
+        if self._function is not None:
+            try:
+                values[tuple("" for _ in self.labelnames)] = float(self._function())
+            except Exception:
+                pass
+        return values
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, value in sorted(self.collect().items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram(_Metric):
+    """Bucketed latency distribution with sum and count"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels):
+        shard = self._shard()
+        key = self._key(labels)
+        state = shard.get(key)
+        if state is None:
+            # [per-bucket counts (+Inf last), sum, count]
+            state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            shard[key] = state
+        state[0][bisect_left(self.buckets, value)] += 1
+        state[1] += value
+        state[2] += 1
+
+    def collect(self) -> Dict[Tuple[str, ...], Tuple[List[int], float, int]]:
+        merged: Dict[Tuple[str, ...], Tuple[List[int], float, int]] = {}
+        for snapshot in self._snapshots():
+            for key, (counts, total, count) in snapshot.items():
+                if key not in merged:
+                    merged[key] = (list(counts), total, count)
+                else:
+                    prev_counts, prev_total, prev_count = merged[key]
+                    merged[key] = (
+                        [a + b for a, b in zip(prev_counts, counts)],
+                        prev_total + total,
+                        prev_count + count,
+                    )
+        return merged
+
+    def render(self) -> List[str]:
+        lines = []
+        for key, (counts, total, count) in sorted(self.collect().items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class Registry:
+    """Collection of metrics rendered together on /metrics"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+
+    def register(self, metric: _Metric) -> _Metric:
+        existing = self._metrics.get(metric.name)
+        if existing is not None:
+            return existing
+        self._metrics[metric.name] = metric
+        return metric
+
+    def reset_totals(self):
+        """Zero every counter and histogram (gauges keep their values)"""
+        for metric in list(self._metrics.values()):
+            if isinstance(metric, (Counter, Histogram)):
+                for shard in list(metric._shards):
+                    shard.clear()
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def counter(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+    """Create (or fetch) a counter in the default registry"""
+    return REGISTRY.register(Counter(name, documentation, labelnames))
+
+
+def gauge(name: str, documentation: str, labelnames: Sequence[str] = ()) -> Gauge:
+    """Create (or fetch) a gauge in the default registry"""
+    return REGISTRY.register(Gauge(name, documentation, labelnames))
+
+
+def histogram(name: str, documentation: str, labelnames: Sequence[str] = (),
+              buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+    """Create (or fetch) a histogram in the default registry"""
+    return REGISTRY.register(Histogram(name, documentation, labelnames, buckets))
+
+
+def render_latest() -> str:
+    """Render every registered metric in the Prometheus text format"""
+    return REGISTRY.render()
+
+
+def set_constant_labels(**labels):
+    """Add fixed labels to every sample this process exports"""
+    _constant_labels.update({name: str(value) for name, value in labels.items()})
+
+
+def reset_totals():
+    """Zero counters and histograms in the default registry (e.g. ones inherited across fork)"""
+    REGISTRY.reset_totals()
+
+
+@contextmanager
+def bind_labels(**labels) -> Iterator[None]:
+    """Bind default label values (route, model, ...) for the current context"""
+    token = _bound_labels.set({**_bound_labels.get(), **{k: str(v) for k, v in labels.items()}})
+    try:
+        yield
+    finally:
+        _bound_labels.reset(token)
+
+
+@contextmanager
+def timer(metric: Histogram, **labels) -> Iterator[None]:
+    """Observe the wall-clock duration of a block"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        metric.observe(time.perf_counter() - start, **labels)
+
+
+# --- Travel Light metrics ---
+_LABELS = ("route", "model")
+
+REQUEST_SECONDS = histogram(
+    "travel_light_request_duration_seconds", "Total time to produce a response", _LABELS
+)
+LLM_SECONDS = histogram(
+    "travel_light_llm_duration_seconds", "Time spent invoking the conversation graph", _LABELS
+)
+TOOL_SECONDS = histogram(
+    "travel_light_tool_duration_seconds", "Time spent in each agent tool", _LABELS + ("tool",)
+)
+CACHE_LOOKUP_SECONDS = histogram(
+    "travel_light_cache_lookup_duration_seconds", "Response cache lookup time", _LABELS,
+    buckets=(0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1),
+)
+STREAM_SECONDS = histogram(
+    "travel_light_stream_duration_seconds", "Time spent streaming a response body", _LABELS
+)
+
+CACHE_HITS = counter("travel_light_cache_hits", "Response cache hits", _LABELS)
+CACHE_MISSES = counter("travel_light_cache_misses", "Response cache misses", _LABELS)
+COALESCED_REQUESTS = counter(
+    "travel_light_coalesced_requests", "Requests that waited on an identical in-flight request", _LABELS
+)
+RATE_LIMITED = counter("travel_light_rate_limited", "Requests rejected by the rate limiter", _LABELS)
+PROVIDER_ERRORS = counter(
+    "travel_light_provider_errors", "Failed calls to external providers", _LABELS + ("provider",)
+)
+
+CACHE_SIZE = gauge("travel_light_cache_entries", "Entries in the response cache")
+PENDING_REQUESTS = gauge("travel_light_pending_requests", "Requests currently being generated")
@@ -0,0 +1,415 @@
+"""
+Offer Index - Recently fetched hotel and flight offers, kept for refinement
+
+Every provider search stores its full result set here as compact columns
+(prices in USD as float32, star ratings, departure minutes as int16) with a
+sorted index per column. Narrowing a search ("under $150", "4-star only",
+"morning departures") is then a binary-search range filter plus top-k over the
+stored offers instead of another provider call.
+
+Result sets are shared globally by search (so two sessions looking at the same
+city and dates use one copy) and each session remembers which searches it ran.
+Memory is bounded by LRU eviction: a few searches per destination and a bounded
+number of destinations and sessions.
+
+Configuration (environment):
+    TRAVEL_LIGHT_OFFER_DESTINATIONS   - destinations kept (default 256)
+    TRAVEL_LIGHT_OFFER_SETS_PER_DEST  - searches kept per destination (default 4)
+    TRAVEL_LIGHT_OFFER_SESSIONS       - sessions whose recent searches are tracked (default 10000)
+"""
+
+import os
+import re
+import time
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+
+KIND_HOTELS = "hotels"
+KIND_FLIGHTS = "flights"
+
+MAX_DESTINATIONS = int(os.getenv("TRAVEL_LIGHT_OFFER_DESTINATIONS", "256"))
+SETS_PER_DESTINATION = int(os.getenv("TRAVEL_LIGHT_OFFER_SETS_PER_DEST", "4"))
+MAX_SESSIONS = int(os.getenv("TRAVEL_LIGHT_OFFER_SESSIONS", "10000"))
+
+OFFER_QUERIES = metrics.counter(
+    "travel_light_offer_queries", "Refinements answered from the offer index", ("kind", "source")
+)
+OFFER_SETS = metrics.gauge("travel_light_offer_sets", "Search result sets held in the offer index")
+
+# Conversation the current request belongs to (set by the API server / Streamlit app)
+_current_session: ContextVar[Optional[str]] = ContextVar("offer_index_session", default=None)
+
+_NO_DEPARTURE = -1
+
+
+def bind_session(session_id: Optional[str]):
+    """Attribute searches made in the current context to a conversation"""
+    return _current_session.set(session_id)
+
+
+def current_session() -> Optional[str]:
+    return _current_session.get()
+
+
+def search_key(kind: str, destination: str, *params: Any) -> Tuple[Any, ...]:
+    return (kind, destination.upper()) + tuple(params)
+
+
+class OfferSet:
+    """One search's offers as parallel columns with a sorted index per column"""
+
+    def __init__(self, key: Tuple[Any, ...], labels: Sequence[str], price_usd: Sequence[float],
+                 rating: Sequence[float], departure: Sequence[int],
+                 amount: Optional[Sequence[float]] = None, currency: Optional[Sequence[str]] = None):
+        self.key = key
+        self.kind, self.destination = key[0], key[1]
+        self.labels = list(labels)
+        self.price = np.asarray(price_usd, dtype=np.float32)
+        self.rating = np.asarray(rating, dtype=np.float32)
+        self.departure = np.asarray(departure, dtype=np.int16)
+        # Original provider price, for display next to the converted one
+        self.amount = np.asarray(amount if amount is not None else price_usd, dtype=np.float32)
+        self.currency = np.asarray(currency if currency is not None else ["USD"] * len(self.labels), dtype="<U3")
+        self.created_at = time.time()
+        # argsort puts NaN (unknown price/rating) last; `valid` counts the known values
+        self._sorted: Dict[str, Tuple[np.ndarray, np.ndarray, int]] = {}
+        for name, values, known in (
+            ("price", self.price, ~np.isnan(self.price)),
+            ("rating", self.rating, ~np.isnan(self.rating)),
+            ("departure", self.departure, self.departure != _NO_DEPARTURE),
+        ):
+            order = np.argsort(np.where(known, values, np.inf), kind="stable")
+            self._sorted[name] = (order, values[order], int(known.sum()))
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @property
+    def nbytes(self) -> int:
+        arrays = [self.price, self.rating, self.departure, self.amount, self.currency]
+        arrays += [order for order, _, _ in self._sorted.values()]
+        return sum(a.nbytes for a in arrays) + sum(len(label) for label in self.labels)
+
+    def _range(self, column: str, low: Optional[float], high: Optional[float]) -> np.ndarray:
+        order, values, valid = self._sorted[column]
+        start = int(np.searchsorted(values[:valid], low, side="left")) if low is not None else 0
+        end = int(np.searchsorted(values[:valid], high, side="right")) if high is not None else valid
+        mask = np.zeros(len(self), dtype=bool)
+        mask[order[start:end]] = True
+        return mask
+
+    def query(self, min_price: Optional[float] = None, max_price: Optional[float] = None,
+              min_rating: Optional[float] = None, depart_after: Optional[int] = None,
+              depart_before: Optional[int] = None, sort: str = "price", limit: int = 3) -> np.ndarray:
+        """Positions of offers within the ranges, best first (prices in USD, times in minutes)"""
+        mask = np.ones(len(self), dtype=bool)
+        if min_price is not None or max_price is not None:
+            mask &= self._range("price", min_price, max_price)
+        if min_rating is not None:
+            mask &= self._range("rating", min_rating, None)
+        if depart_after is not None or depart_before is not None:
+            mask &= self._range("departure", depart_after, depart_before)
+        order, _, valid = self._sorted[sort if sort in self._sorted else "price"]
+        if sort == "rating":
+            # Highest rated first, unrated last
+            order = np.concatenate([order[:valid][::-1], order[valid:]])
+        return order[mask[order]][:limit]
+
+
+class OfferIndex:
+    """LRU of offer sets per destination plus each session's recent searches"""
+
+    def __init__(self, max_destinations: int = MAX_DESTINATIONS, sets_per_destination: int = SETS_PER_DESTINATION,
+                 max_sessions: int = MAX_SESSIONS):
+        self.max_destinations = max_destinations
+        self.sets_per_destination = sets_per_destination
+        self.max_sessions = max_sessions
+        self._destinations: "OrderedDict[Tuple[str, str], OrderedDict[Tuple[Any, ...], OfferSet]]" = OrderedDict()
+        self._sessions: "OrderedDict[str, OrderedDict[Tuple[Any, ...], None]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def put(self, offers: OfferSet, session: Optional[str] = None):
+        with self._lock:
+            bucket_key = (offers.kind, offers.destination)
+            bucket = self._destinations.get(bucket_key)
+            if bucket is None:
+                bucket = self._destinations[bucket_key] = OrderedDict()
+            bucket[offers.key] = offers
+            bucket.move_to_end(offers.key)
+            self._destinations.move_to_end(bucket_key)
+            while len(bucket) > self.sets_per_destination:
+                bucket.popitem(last=False)
+            while len(self._destinations) > self.max_destinations:
+                self._destinations.popitem(last=False)
+            OFFER_SETS.set(sum(len(b) for b in self._destinations.values()))
+        self.remember(offers.key, session)
+
+    def get(self, key: Tuple[Any, ...]) -> Optional[OfferSet]:
+        with self._lock:
+            bucket = self._destinations.get((key[0], key[1]))
+            offers = bucket.get(key) if bucket is not None else None
+            if offers is not None:
+                bucket.move_to_end(key)
+                self._destinations.move_to_end((key[0], key[1]))
+            return offers
+
+    def remember(self, key: Tuple[Any, ...], session: Optional[str] = None):
+        """Record that a session (default: the bound one) looked at a search"""
+        session = session or current_session()
+        if not session:
+            return
+        with self._lock:
+            recent = self._sessions.get(session)
+            if recent is None:
+                recent = self._sessions[session] = OrderedDict()
+            recent[key] = None
+            recent.move_to_end(key)
+            self._sessions.move_to_end(session)
+            while len(recent) > 8:
+                recent.popitem(last=False)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def latest(self, kind: Optional[str] = None, destination: Optional[str] = None,
+               session: Optional[str] = None) -> Optional[OfferSet]:
+        """Most recent matching search of the session, else of anyone"""
+        session = session or current_session()
+        with self._lock:
+            keys = list(self._sessions.get(session, ())) if session else []
+        for key in reversed(keys):
+            if (kind is None or key[0] == kind) and (destination is None or key[1] == destination.upper()):
+                offers = self.get(key)
+                if offers is not None:
+                    return offers
+        if destination is None:
+            return None
+        with self._lock:
+            bucket = self._destinations.get((kind or KIND_HOTELS, destination.upper()))
+            return next(reversed(bucket.values())) if bucket else None
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sets = [s for bucket in self._destinations.values() for s in bucket.values()]
+            return {
+                "destinations": len(self._destinations),
+                "sets": len(sets),
+                "offers": sum(len(s) for s in sets),
+                "bytes": sum(s.nbytes for s in sets),
+                "sessions": len(self._sessions),
+            }
+
+
+index = OfferIndex()
+
+
+def _departure_minutes(scheduled: Optional[str]) -> int:
+    match = re.search(r"T(\d{2}):(\d{2})", scheduled or "")
+    return int(match.group(1)) * 60 + int(match.group(2)) if match else _NO_DEPARTURE
+
+
+def hotel_offers(key: Tuple[Any, ...], hotels: List[Dict[str, Any]]) -> OfferSet:
+    """Offer set from an Amadeus hotel-offers response"""
+    import pricing
+
+    amounts, currencies = pricing.offer_prices(hotels)
+    ratings = []
+    for item in hotels:
+        try:
+            ratings.append(float(item["hotel"].get("rating")))
+        except (TypeError, ValueError):
+            ratings.append(np.nan)
+    return OfferSet(
+        key,
+        labels=[item["hotel"]["name"] for item in hotels],
+        price_usd=pricing.convert_many(amounts, currencies, "USD"),
+        rating=ratings,
+        departure=[_NO_DEPARTURE] * len(hotels),
+        amount=amounts,
+        currency=currencies,
+    )
+
+
+def flight_offers(key: Tuple[Any, ...], flights: List[Dict[str, Any]]) -> OfferSet:
+    """Offer set from an AviationStack flights response (no fares, so no prices)"""
+    return OfferSet(
+        key,
+        labels=[f"{f['airline']['name']} flight {f['flight']['iata']} at {f['departure']['scheduled']}" for f in flights],
+        price_usd=[np.nan] * len(flights),
+        rating=[np.nan] * len(flights),
+        departure=[_departure_minutes(f["departure"].get("scheduled")) for f in flights],
+    )
+
+
+def format_offers(offers: OfferSet, positions: np.ndarray, currency: str) -> str:
+    """One line per offer; hotel prices in `currency` with the provider's price alongside"""
+    if offers.kind == KIND_FLIGHTS:
+        return "\n".join(offers.labels[i] for i in positions)
+    import pricing
+
+    rate = pricing.table().rate("USD", currency)
+    lines = []
+    converted = False
+    for i in positions:
+        line = offers.labels[i]
+        if not np.isnan(offers.rating[i]):
+            line += f" ({offers.rating[i]:g}★)"
+        if np.isnan(offers.price[i]):
+            # No usable amount, or a currency missing from the FX table
+            lines.append(line + " - price unavailable")
+            continue
+        line += f" - {pricing.format_price(float(offers.price[i]) * rate, currency)} total"
+        if offers.currency[i] != currency:
+            line += f" ({pricing.format_price(float(offers.amount[i]), offers.currency[i])})"
+            converted = True
+        lines.append(line)
+    if converted:
+        lines.append(f"(Prices converted to {currency} at rates as of {pricing.table().as_of}.)")
+    return "\n".join(lines)
+
+
+_DAY_PARTS = {"morning": (300, 719), "afternoon": (720, 1019), "evening": (1020, 1319)}
+_PRICE_RE = re.compile(
+    r"\b(?:under|below|less than|cheaper than|max(?:imum)?|up to|at most)\s*"
+    r"([$€£¥]|[a-z]{3}\s)?\s*(\d[\d,]*(?:\.\d+)?)(?![\d.])\s*([a-z]+|[$€£¥])?"
+)
+# A bare number after "under"/"up to" is only a price with a currency or one of these words
+_PRICE_WORDS = re.compile(r"\b(price[sd]?|budget|cost|cheaper|pay|spend|per night|a night|total)\b|/\s*night")
+_CURRENCY_WORDS = {"dollars": "USD", "bucks": "USD", "euros": "EUR", "pounds": "GBP", "yen": "JPY"}
+_NOT_PRICE_UNITS = {"star", "stars", "adult", "adults", "people", "guests", "person", "persons", "night",
+                    "nights", "days", "rooms", "hours", "hrs", "minutes", "mins", "km", "miles", "am", "pm"}
+_STARS_RE = re.compile(
+    r"\b(?:(up to|at most|under|below|less than|max(?:imum)?)\s+)?([1-5])\s*[- ]?\s*(?:stars?|\*|★)"
+)
+_TIME_RE = re.compile(r"\b(after|before)\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b")
+_SYMBOL_CURRENCIES = {"$": "USD", "€": "EUR", "£": "GBP", "¥": "JPY"}
+_NOT_REFINEMENT = re.compile(r"\b(plan|itinerary|book|reserve|days?|weeks?)\b")
+_MAX_REFINEMENT_LENGTH = 100
+
+
+def _currency_code(token: str) -> Optional[str]:
+    """ISO code for a currency symbol, word or code in the FX table (None if it isn't one)"""
+    import pricing
+
+    token = token.strip()
+    code = _SYMBOL_CURRENCIES.get(token) or _CURRENCY_WORDS.get(token) or token.upper()
+    try:
+        pricing.table().position(code)
+    except pricing.UnknownCurrency:
+        return None
+    return code
+
+
+def _max_price(text: str) -> Optional[Tuple[float, Optional[str]]]:
+    """(amount, currency or None) of the first price ceiling in the text"""
+    for match in _PRICE_RE.finditer(text):
+        prefix, amount, unit = (match.group(1) or "").strip(), match.group(2), match.group(3) or ""
+        if unit in _NOT_PRICE_UNITS:
+            continue
+        currency = (_currency_code(prefix) if prefix else None) or (_currency_code(unit) if unit else None)
+        if currency is None and (prefix or not _PRICE_WORDS.search(text)):
+            continue
+        return float(amount.replace(",", "")), currency
+    return None
+
+
+def parse_refinement(text: str) -> Optional[Dict[str, Any]]:
+    """Constraints in a short follow-up such as "4-star under €150" (None if there are none)"""
+    import pricing
+
+    text = text.lower()
+    constraints: Dict[str, Any] = {}
+    price = _max_price(text)
+    if price:
+        constraints["max_price"] = price[0]
+        constraints["currency"] = price[1] or pricing.DEFAULT_CURRENCY
+        # Only hotel offers carry prices (flight results have no fares)
+        constraints["kind"] = KIND_HOTELS
+    stars = _STARS_RE.search(text)
+    # "up to 4 stars" is a ceiling, which offer queries don't support
+    if stars and not stars.group(1):
+        constraints["min_rating"] = float(stars.group(2))
+        constraints["kind"] = KIND_HOTELS
+    departure: Dict[str, int] = {}
+    for part, (start, end) in _DAY_PARTS.items():
+        if part in text:
+            departure["depart_after"], departure["depart_before"] = start, end
+    for which, hour, minute, meridiem in _TIME_RE.findall(text):
+        minutes = int(hour) % 12 * 60 + int(minute or 0) + (720 if meridiem == "pm" else 0)
+        if not meridiem and int(hour) >= 12:
+            minutes = int(hour) * 60 + int(minute or 0)
+        departure["depart_after" if which == "after" else "depart_before"] = minutes
+    if re.search(r"\b(best|highest|top)[- ]rated\b", text):
+        constraints["sort"] = "rating"
+        constraints["kind"] = KIND_HOTELS
+    elif re.search(r"\b(cheapest|lowest price)\b", text):
+        constraints["sort"] = "price"
+    if re.search(r"\b(flights?|depart\w*)\b", text):
+        constraints["kind"] = KIND_FLIGHTS
+    elif re.search(r"\b(hotels?|stays?|rooms?)\b", text):
+        constraints["kind"] = KIND_HOTELS
+    elif departure and "kind" not in constraints:
+        constraints["kind"] = KIND_FLIGHTS
+    # Departure times only mean something for flights
+    if constraints.get("kind") == KIND_FLIGHTS:
+        constraints.update(departure)
+    return constraints if set(constraints) - {"kind", "currency"} else None
+
+
+def refine(offers: OfferSet, constraints: Dict[str, Any], limit: int = 3) -> Tuple[np.ndarray, str]:
+    """Apply parsed constraints to an offer set; returns positions and display currency"""
+    import pricing
+
+    currency = (constraints.get("currency") or pricing.DEFAULT_CURRENCY).upper()
+    max_price = constraints.get("max_price")
+    if max_price is not None:
+        max_price = pricing.convert(max_price, currency, "USD")
+    positions = offers.query(
+        max_price=max_price,
+        min_rating=constraints.get("min_rating"),
+        depart_after=constraints.get("depart_after"),
+        depart_before=constraints.get("depart_before"),
+        sort=constraints.get("sort", "departure" if offers.kind == KIND_FLIGHTS else "price"),
+        limit=limit,
+    )
+    return positions, currency
+
+
+def direct_refinement(messages: List[Dict[str, Any]]) -> Optional[str]:
+    """Answer a short narrowing follow-up from the session's last search, or None"""
+    session = current_session()
+    if not session or not messages or messages[-1].get("role") != "user":
+        return None
+    text = str(messages[-1].get("content", ""))
+    if len(text) > _MAX_REFINEMENT_LENGTH or _NOT_REFINEMENT.search(text.lower()):
+        return None
+    constraints = parse_refinement(text)
+    if constraints is None:
+        return None
+    offers = index.latest(kind=constraints.get("kind"), session=session)
+    if offers is None:
+        return None
+    import destinations
+
+    # A different city means a new search, not a refinement
+    if any(dest["code"] != offers.destination for dest in destinations.index().find_in_text(text)):
+        return None
+    try:
+        positions, currency = refine(offers, constraints)
+    except ValueError:
+        return None
+    OFFER_QUERIES.inc(kind=offers.kind, source="direct")
+    if not len(positions):
+        return f"None of the {len(offers)} {offers.kind} I found for {offers.destination} match that. Want me to search again?"
+    return f"Here are the best matches from the {len(offers)} {offers.kind} I found for {offers.destination}:\n" + \
+        format_offers(offers, positions, currency)
+
+
+__all__ = ["KIND_FLIGHTS", "KIND_HOTELS", "OfferIndex", "OfferSet", "bind_session", "current_session",
+           "direct_refinement", "flight_offers", "format_offers", "hotel_offers", "index", "parse_refinement",
+           "refine", "search_key"]
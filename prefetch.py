@@ -0,0 +1,199 @@
+"""
+Prefetch Module - Speculative precomputation of likely follow-up answers
+
+After Buddy proposes an itinerary the next user message is very predictable
+("Help me find hotels", "Can you make it cheaper?", ...). When enabled, the
+server precomputes the top-K follow-up answers into the response cache, and
+warms the provider cache with a hotel search for the parsed trip.
+
+Prefetching only runs on spare admission capacity at background priority, is
+never queued behind (or ahead of) real requests, and is cancelled as soon as the
+conversation moves somewhere else.
+
+Configuration (environment):
+    TRAVEL_LIGHT_PREFETCH             - set to 1 to enable (default off)
+    TRAVEL_LIGHT_PREFETCH_TOP_K       - follow-ups to precompute per reply (default 3)
+    TRAVEL_LIGHT_PREFETCH_FOLLOW_UPS  - "|"-separated follow-up messages, most likely first
+"""
+
+import os
+import re
+import asyncio
+import logging
+from datetime import date, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import admission
+import destinations
+import metrics
+
+logger = logging.getLogger(__name__)
+
+PREFETCHED = metrics.counter("travel_light_prefetch_completed", "Speculative prefetches completed", ("kind",))
+PREFETCH_SKIPPED = metrics.counter(
+    "travel_light_prefetch_skipped", "Prefetches skipped for lack of spare capacity", ("kind",)
+)
+PREFETCH_CANCELLED = metrics.counter("travel_light_prefetch_cancelled", "Prefetch jobs cancelled")
+PREFETCH_HITS = metrics.counter("travel_light_prefetch_hits", "Requests served from a prefetched answer")
+
+# Quick actions offered by the chat UI, most likely first
+DEFAULT_FOLLOW_UPS = [
+    "Help me find hotels",
+    "Give me flight booking tips",
+    "Can you make it cheaper?",
+    "Looks good!",
+]
+
+# Phrases that mark a reply as an itinerary proposal awaiting confirmation
+_PROPOSAL_MARKERS = ("does this look good", "sound good", "would you like", "shall i", "day 1")
+
+_DATE_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2})\b")
+_DAYS_RE = re.compile(r"\b(\d{1,2})[- ]day", re.IGNORECASE)
+
+
+def is_proposal(reply: str) -> bool:
+    lowered = reply.lower()
+    return any(marker in lowered for marker in _PROPOSAL_MARKERS)
+
+
+def predict_follow_ups(reply: str, follow_ups: List[str], top_k: int) -> List[str]:
+    """Most likely next user messages for an assistant reply"""
+    if not is_proposal(reply):
+        return []
+    return follow_ups[:top_k]
+
+
+def parse_trip(messages: List[Dict[str, Any]], reply: str) -> Optional[Dict[str, Any]]:
+    """Destination city code and dates mentioned in the conversation, if any"""
+    text = " ".join(str(m.get("content", "")) for m in messages if m.get("role") == "user").lower()
+    mentioned = destinations.index().find_in_text(text)
+    if not mentioned:
+        return None
+    city_code = mentioned[0]["code"]
+    dates = _DATE_RE.findall(text)
+    days_match = _DAYS_RE.search(text) or _DAYS_RE.search(reply)
+    try:
+        check_in = date.fromisoformat(dates[0]) if dates else None
+        check_out = date.fromisoformat(dates[1]) if len(dates) > 1 else None
+    except ValueError:
+        return {"city_code": city_code}
+    if check_in is not None and check_out is None and days_match:
+        check_out = check_in + timedelta(days=int(days_match.group(1)))
+    trip: Dict[str, Any] = {"city_code": city_code}
+    if check_in is not None and check_out is not None and check_out > check_in:
+        trip["check_in"] = check_in.isoformat()
+        trip["check_out"] = check_out.isoformat()
+    return trip
+
+
+class Prefetcher:
+    """Schedules and cancels speculative work, one job per conversation"""
+
+    def __init__(self, generate: Callable[[List[Dict[str, Any]]], Awaitable[bool]],
+                 enabled: bool = False, top_k: int = 3, follow_ups: Optional[List[str]] = None):
+        self.generate = generate
+        self.enabled = enabled
+        self.top_k = top_k
+        self.follow_ups = follow_ups or list(DEFAULT_FOLLOW_UPS)
+        self._jobs: Dict[str, asyncio.Task] = {}
+        # Follow-up cache keys each conversation's job is working on
+        self._expected: Dict[str, set] = {}
+
+    def cancel(self, conversation: str, keep_key: Optional[str] = None):
+        """Cancel a conversation's prefetch unless the new request is one it predicted"""
+        task = self._jobs.get(conversation)
+        if task is None or task.done():
+            return
+        if keep_key is not None and keep_key in self._expected.get(conversation, ()):
+            return
+        task.cancel()
+        PREFETCH_CANCELLED.inc()
+
+    def cancel_all(self):
+        for conversation in list(self._jobs):
+            self.cancel(conversation)
+
+    def schedule(self, conversation: str, messages: List[Dict[str, Any]], reply: str,
+                 key_for: Callable[[List[Dict[str, Any]]], str]) -> bool:
+        """Start prefetching follow-ups for a reply that was just sent"""
+        if not self.enabled:
+            return False
+        follow_ups = predict_follow_ups(reply, self.follow_ups, self.top_k)
+        if not follow_ups:
+            return False
+        trip = parse_trip(messages, reply)
+        self.cancel(conversation)
+        base = messages + [{"role": "assistant", "content": reply}]
+        candidates = [base + [{"role": "user", "content": text}] for text in follow_ups]
+        self._expected[conversation] = {key_for(candidate) for candidate in candidates}
+        task = asyncio.create_task(self._run(candidates, trip))
+        self._jobs[conversation] = task
+        task.add_done_callback(lambda t, c=conversation: self._forget(c, t))
+        return True
+
+    def _forget(self, conversation: str, task: asyncio.Task):
+        if self._jobs.get(conversation) is task:
+            del self._jobs[conversation]
+            self._expected.pop(conversation, None)
+
+    async def _run(self, candidates: List[List[Dict[str, Any]]], trip: Optional[Dict[str, Any]]):
+        # Provider searches first: cheap, and they also speed up the hotel follow-up
+        if trip and "check_in" in trip:
+            await self._prefetch_hotels(trip)
+
+        for messages in candidates:
+            if admission.controller.spare_capacity <= 0:
+                PREFETCH_SKIPPED.inc(kind="response")
+                return
+            try:
+                if await self.generate(messages):
+                    PREFETCHED.inc(kind="response")
+            except admission.AdmissionRejected:
+                PREFETCH_SKIPPED.inc(kind="response")
+                return
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.debug(f"Prefetch failed: {e}")
+
+    async def _prefetch_hotels(self, trip: Dict[str, Any]):
+        from travel_light import hotel_search_tool
+
+        if admission.controller.spare_capacity <= 0:
+            PREFETCH_SKIPPED.inc(kind="hotels")
+            return
+
+        async def search():
+            # timeout=0: take a free slot or skip, never wait in the queue
+            async with admission.controller.slot(admission.PRIORITY_BACKGROUND, timeout=0.0):
+                await asyncio.to_thread(
+                    hotel_search_tool, trip["city_code"], trip["check_in"], trip["check_out"], 1
+                )
+
+        try:
+            # Shielded: a cancelled job lets an in-flight search finish (and hold its slot)
+            await asyncio.shield(search())
+            PREFETCHED.inc(kind="hotels")
+        except admission.AdmissionRejected:
+            PREFETCH_SKIPPED.inc(kind="hotels")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.debug(f"Hotel prefetch failed: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "top_k": self.top_k,
+            "active_jobs": sum(1 for task in self._jobs.values() if not task.done()),
+        }
+
+
+def _follow_ups_from_env() -> Optional[List[str]]:
+    raw = os.getenv("TRAVEL_LIGHT_PREFETCH_FOLLOW_UPS", "")
+    return [item.strip() for item in raw.split("|") if item.strip()] or None
+
+
+ENABLED = os.getenv("TRAVEL_LIGHT_PREFETCH", "0") in ("1", "true", "True")
+TOP_K = int(os.getenv("TRAVEL_LIGHT_PREFETCH_TOP_K", "3"))
+FOLLOW_UPS = _follow_ups_from_env()
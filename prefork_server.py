@@ -0,0 +1,287 @@
+#!/usr/bin/env python3
+"""
+Pre-fork Server - Runs the Travel Light API on N worker processes
+
+The master process loads the conversation graph and warms caches once, binds the
+listening socket, then forks workers that share that state copy-on-write.
+
+Each worker is its own process, so in-memory state is per worker:
+    - /metrics reports the answering worker only; every sample carries a
+      ``worker`` label (the worker's slot) and counters restart from zero when
+      a worker is replaced, so sum the series across workers in Prometheus
+    - the per-IP rate limit, admission slots and queue
+      (TRAVEL_LIGHT_MAX_CONCURRENCY, TRAVEL_LIGHT_MAX_QUEUE), token budgets,
+      provider rate limits and circuit breakers all apply per worker; with N
+      workers the server as a whole allows up to N times each limit
+
+Signals (sent to the master):
+    SIGHUP          - graceful rolling restart of all workers
+    SIGTERM/SIGINT  - graceful shutdown
+
+Settings come from the command line or the environment:
+    TRAVEL_LIGHT_HOST, TRAVEL_LIGHT_PORT, TRAVEL_LIGHT_WORKERS,
+    TRAVEL_LIGHT_GRACEFUL_TIMEOUT, TRAVEL_LIGHT_HEARTBEAT_TIMEOUT, TRAVEL_LIGHT_LOG_LEVEL
+"""
+
+import os
+import sys
+import mmap
+import time
+import signal
+import socket
+import struct
+import logging
+import argparse
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger("prefork_server")
+
+# Per-worker slot in shared memory: pid, generation, started_at, heartbeat, requests
+_SLOT = struct.Struct("qqddq")
+
+
+class WorkerBoard:
+    """Worker status table in anonymous shared memory (survives fork, no locks needed)"""
+
+    def __init__(self, slots: int):
+        self.slots = slots
+        self._buffer = mmap.mmap(-1, _SLOT.size * slots)
+
+    def write(self, slot: int, pid: int, generation: int, started_at: float,
+              heartbeat: float, requests: int = 0):
+        _SLOT.pack_into(self._buffer, slot * _SLOT.size, pid, generation, started_at, heartbeat, requests)
+
+    def read(self, slot: int) -> Dict[str, Any]:
+        pid, generation, started_at, heartbeat, requests = _SLOT.unpack_from(self._buffer, slot * _SLOT.size)
+        return {
+            "slot": slot,
+            "pid": pid,
+            "generation": generation,
+            "started_at": started_at,
+            "heartbeat_age": round(time.time() - heartbeat, 3) if heartbeat else None,
+            "requests": requests,
+        }
+
+    def heartbeat(self, slot: int, requests: int):
+        pid, generation, started_at, _, _ = _SLOT.unpack_from(self._buffer, slot * _SLOT.size)
+        self.write(slot, pid, generation, started_at, time.time(), requests)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        return [self.read(slot) for slot in range(self.slots) if self.read(slot)["pid"]]
+
+
+def _parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Run the Travel Light API with pre-forked workers")
+    parser.add_argument("--host", default=os.getenv("TRAVEL_LIGHT_HOST", "127.0.0.1"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("TRAVEL_LIGHT_PORT", "8787")))
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("TRAVEL_LIGHT_WORKERS", str(os.cpu_count() or 1))))
+    parser.add_argument("--graceful-timeout", type=float,
+                        default=float(os.getenv("TRAVEL_LIGHT_GRACEFUL_TIMEOUT", "30")),
+                        help="Seconds to let workers finish in-flight requests on stop/reload")
+    parser.add_argument("--heartbeat-timeout", type=float,
+                        default=float(os.getenv("TRAVEL_LIGHT_HEARTBEAT_TIMEOUT", "30")),
+                        help="Restart a worker whose event loop has not checked in for this long")
+    parser.add_argument("--log-level", default=os.getenv("TRAVEL_LIGHT_LOG_LEVEL", "info"))
+    return parser.parse_args(argv)
+
+
+class PreforkServer:
+    """Master process: warms state, forks workers, restarts them and handles signals"""
+
+    def __init__(self, host: str, port: int, workers: int, graceful_timeout: float = 30.0,
+                 heartbeat_timeout: float = 30.0, log_level: str = "info"):
+        self.host = host
+        self.port = port
+        self.num_workers = max(1, workers)
+        self.graceful_timeout = graceful_timeout
+        self.heartbeat_timeout = heartbeat_timeout
+        self.log_level = log_level
+        # Twice as many slots as workers so a rolling restart can overlap generations
+        self.board = WorkerBoard(self.num_workers * 2)
+        self.workers: Dict[int, int] = {}  # pid -> slot
+        self.generation = 0
+        self._reload_requested = False
+        self._stopping = False
+        self._socket: Optional[socket.socket] = None
+
+    def _bind(self) -> socket.socket:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.listen(2048)
+        sock.set_inheritable(True)
+        return sock
+
+    def _free_slot(self) -> int:
+        used = set(self.workers.values())
+        for slot in range(self.board.slots):
+            if slot not in used:
+                return slot
+        raise RuntimeError("No free worker slot")
+
+    def _spawn(self) -> int:
+        slot = self._free_slot()
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker(slot)  # never returns
+        now = time.time()
+        self.board.write(slot, pid, self.generation, now, now)
+        self.workers[pid] = slot
+        logger.info(f"👷 Worker {pid} started (slot {slot}, generation {self.generation})")
+        return pid
+
+    def _run_worker(self, slot: int):
+        """Child process entry point"""
+        exit_code = 0
+        try:
+            for sig in (signal.SIGHUP, signal.SIGTERM, signal.SIGINT, signal.SIGCHLD):
+                signal.signal(sig, signal.SIG_DFL)
+
+            import uvicorn
+            import api_server
+
+            api_server.set_worker_context(slot, self.board)
+            config = uvicorn.Config(
+                api_server.app,
+                log_level=self.log_level,
+                access_log=False,
+                timeout_graceful_shutdown=int(self.graceful_timeout),
+            )
+            uvicorn.Server(config).run(sockets=[self._socket])
+        except Exception as e:
+            logger.error(f"Worker {os.getpid()} crashed: {e}")
+            exit_code = 1
+        finally:
+            # os._exit skips atexit and daemon threads; write out buffered spans first
+            if "tracing" in sys.modules:
+                try:
+                    sys.modules["tracing"].shutdown()
+                except Exception as e:
+                    logger.warning(f"Worker {os.getpid()} could not flush traces: {e}")
+            os._exit(exit_code)
+
+    def _stop_workers(self, pids: List[int]):
+        """Ask workers to finish in-flight requests, then force-kill stragglers"""
+        for pid in pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        deadline = time.time() + self.graceful_timeout
+        remaining = set(pids)
+        while remaining and time.time() < deadline:
+            self._reap(respawn=False)
+            remaining &= set(self.workers)
+            time.sleep(0.1)
+        for pid in remaining:
+            logger.warning(f"⚠️ Worker {pid} did not stop in time; killing")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        while remaining & set(self.workers):
+            self._reap(respawn=False)
+            time.sleep(0.05)
+
+    def _reap(self, respawn: bool = True):
+        """Collect exited workers and optionally replace them"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            slot = self.workers.pop(pid, None)
+            if slot is None:
+                continue
+            self.board.write(slot, 0, 0, 0.0, 0.0)
+            if respawn and not self._stopping:
+                logger.warning(f"⚠️ Worker {pid} exited (status {status}); restarting")
+                self._spawn()
+
+    def _check_heartbeats(self):
+        """Restart workers whose event loop appears stuck"""
+        now = time.time()
+        for pid, slot in list(self.workers.items()):
+            info = self.board.read(slot)
+            started_at = info["started_at"]
+            heartbeat_age = info["heartbeat_age"] or 0.0
+            # Give new workers time to start up before judging them
+            if now - started_at > self.heartbeat_timeout and heartbeat_age > self.heartbeat_timeout:
+                logger.warning(f"⚠️ Worker {pid} missed heartbeats for {heartbeat_age:.0f}s; killing")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except ProcessLookupError:
+                    pass
+
+    def _rolling_restart(self):
+        """Start a new generation of workers, then gracefully retire the old one"""
+        logger.info("🔄 Graceful reload: starting new worker generation")
+        old = list(self.workers)
+        self.generation += 1
+        for _ in range(self.num_workers):
+            self._spawn()
+        self._stop_workers(old)
+        logger.info("✅ Reload complete")
+
+    def run(self):
+        import api_server
+
+        logger.info(f"🚀 Starting Travel Light API with {self.num_workers} workers on {self.host}:{self.port}")
+        start_time = time.time()
+        api_server.warm_up()
+        logger.info(f"🔥 Warm state loaded in {time.time() - start_time:.2f}s; forking workers")
+
+        self._socket = self._bind()
+
+        def on_reload(signum, frame):
+            self._reload_requested = True
+
+        def on_stop(signum, frame):
+            self._stopping = True
+
+        signal.signal(signal.SIGHUP, on_reload)
+        signal.signal(signal.SIGTERM, on_stop)
+        signal.signal(signal.SIGINT, on_stop)
+
+        for _ in range(self.num_workers):
+            self._spawn()
+
+        try:
+            while not self._stopping:
+                self._reap()
+                if self._reload_requested:
+                    self._reload_requested = False
+                    self._rolling_restart()
+                self._check_heartbeats()
+                time.sleep(0.5)
+        finally:
+            logger.info("🛑 Shutting down workers...")
+            self._stopping = True
+            self._stop_workers(list(self.workers))
+            self._socket.close()
+
+
+def serve(host: str = "127.0.0.1", port: int = 8787, workers: Optional[int] = None,
+          graceful_timeout: float = 30.0, heartbeat_timeout: float = 30.0, log_level: str = "info"):
+    """Run the pre-fork server until SIGTERM/SIGINT"""
+    PreforkServer(host, port, workers or os.cpu_count() or 1, graceful_timeout,
+                  heartbeat_timeout, log_level).run()
+
+
+def main(argv: Optional[List[str]] = None):
+    args = _parse_args(argv)
+    logging.basicConfig(
+        level=args.log_level.upper(),
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if not hasattr(os, "fork"):
+        print("❌ Pre-fork mode requires a POSIX system; run `python api_server.py` instead.")
+        sys.exit(1)
+    serve(args.host, args.port, args.workers, args.graceful_timeout, args.heartbeat_timeout, args.log_level)
+
+
+if __name__ == "__main__":
+    main()
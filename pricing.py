@@ -0,0 +1,210 @@
+"""
+Pricing Module - Normalize provider prices to one currency
+
+Provider offers arrive in whatever currency the provider chose (EUR hotels in
+Paris, IDR in Bali, ...). Prices are converted with a rate table that ships as a
+bundled snapshot (``datasets/fx_rates.json``). Setting ``TRAVEL_LIGHT_FX_URL``
+opts in to refreshing it in the background and caching it on disk; without it
+conversion never touches the network. Whole result sets are converted, filtered and sorted with NumPy in one
+pass rather than offer by offer.
+
+Configuration (environment):
+    TRAVEL_LIGHT_CURRENCY      - currency prices are shown in (default USD)
+    TRAVEL_LIGHT_FX_URL        - JSON endpoint with {"rates": {...}} per USD, e.g.
+                                 https://open.er-api.com/v6/latest/USD (default empty: no refresh)
+    TRAVEL_LIGHT_FX_REFRESH    - seconds before the table is refreshed (default 86400)
+    TRAVEL_LIGHT_FX_CACHE      - refreshed table location (default cache/fx_rates.json)
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from typing import Any, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CURRENCY = os.getenv("TRAVEL_LIGHT_CURRENCY", "USD").upper()
+FX_URL = os.getenv("TRAVEL_LIGHT_FX_URL", "")
+FX_REFRESH = float(os.getenv("TRAVEL_LIGHT_FX_REFRESH", "86400"))
+FX_CACHE = os.getenv("TRAVEL_LIGHT_FX_CACHE", os.path.join("cache", "fx_rates.json"))
+SNAPSHOT_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datasets", "fx_rates.json")
+
+FX_REFRESHES = metrics.counter("travel_light_fx_refreshes", "FX rate table refresh attempts", ("status",))
+FX_AGE = metrics.gauge("travel_light_fx_age_seconds", "Age of the FX rate table in use")
+
+_SYMBOLS = {"USD": "$", "EUR": "€", "GBP": "£", "JPY": "¥", "INR": "₹", "KRW": "₩", "THB": "฿", "TRY": "₺"}
+# Currencies quoted without minor units
+_ZERO_DECIMAL = {"JPY", "KRW", "IDR", "VND", "ISK", "HUF", "CLP"}
+
+
+class UnknownCurrency(ValueError):
+    """Raised for currency codes missing from the rate table"""
+
+
+class FxTable:
+    """Units of each currency per 1 USD, as parallel code/rate arrays"""
+
+    def __init__(self, rates: Dict[str, float], as_of: str, fetched_at: float = 0.0, source: str = "snapshot"):
+        self.codes = sorted(code.upper() for code in rates)
+        self.per_usd = np.array([float(rates[code]) for code in sorted(rates, key=str.upper)])
+        self._positions = {code: i for i, code in enumerate(self.codes)}
+        self.as_of = as_of
+        self.fetched_at = fetched_at
+        self.source = source
+
+    def position(self, currency: str) -> int:
+        try:
+            return self._positions[(currency or "USD").upper()]
+        except KeyError:
+            raise UnknownCurrency(f"no exchange rate for {currency!r}")
+
+    def rate(self, from_currency: str, to_currency: str) -> float:
+        return float(self.per_usd[self.position(to_currency)] / self.per_usd[self.position(from_currency)])
+
+    def convert_many(self, amounts: Sequence[float], currencies: Sequence[str], to_currency: str) -> np.ndarray:
+        """Convert parallel amount/currency sequences in one vectorized step.
+
+        Amounts in currencies missing from the table come back as NaN.
+        """
+        amounts = np.asarray(amounts, dtype=float)
+        target = self.per_usd[self.position(to_currency)]
+        if not len(amounts):
+            return amounts
+        codes, inverse = np.unique(np.asarray([(c or "USD").upper() for c in currencies]), return_inverse=True)
+        known = np.array([self._positions.get(code, -1) for code in codes], dtype=np.intp)
+        per_usd = np.where(known >= 0, self.per_usd[known], np.nan)
+        return amounts / per_usd[inverse] * target
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "base": "USD",
+            "as_of": self.as_of,
+            "fetched_at": self.fetched_at,
+            "rates": dict(zip(self.codes, self.per_usd.tolist())),
+        }
+
+
+def _load_file(path: str, source: str) -> Optional[FxTable]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return FxTable(data["rates"], data.get("as_of", ""), float(data.get("fetched_at", 0.0)), source)
+    except (OSError, ValueError, KeyError) as e:
+        if source != "cache":
+            logger.warning(f"Could not load FX rates from {path}: {e}")
+        return None
+
+
+_table: Optional[FxTable] = None
+_table_lock = threading.Lock()
+_refreshing = False
+_next_refresh_at = 0.0  # backoff after a failed refresh; the table's fetched_at stays true
+
+
+def table() -> FxTable:
+    """The current rate table; starts a background refresh when it is stale"""
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = _load_file(FX_CACHE, "cache") or _load_file(SNAPSHOT_FILE, "snapshot")
+    current = _table
+    now = time.time()
+    if FX_URL and now - current.fetched_at > FX_REFRESH and now >= _next_refresh_at:
+        _start_refresh()
+    if current.fetched_at:
+        FX_AGE.set(now - current.fetched_at)
+    return current
+
+
+def _start_refresh():
+    global _refreshing
+    with _table_lock:
+        if _refreshing:
+            return
+        _refreshing = True
+    threading.Thread(target=refresh, name="fx-refresh", daemon=True).start()
+
+
+def refresh(timeout: float = 5.0) -> bool:
+    """Fetch fresh rates, swap them in and cache them on disk (False on failure)"""
+    global _table, _refreshing, _next_refresh_at
+    try:
+        import requests
+
+        response = requests.get(FX_URL, timeout=timeout)
+        response.raise_for_status()
+        data = response.json()
+        rates = {code.upper(): float(rate) for code, rate in data["rates"].items() if float(rate) > 0}
+        if abs(rates.get("USD", 0.0) - 1.0) > 1e-9:
+            raise ValueError("rates are not quoted per USD")
+        now = time.time()
+        fresh = FxTable(rates, time.strftime("%Y-%m-%d", time.gmtime(now)), now, "live")
+        os.makedirs(os.path.dirname(FX_CACHE) or ".", exist_ok=True)
+        tmp_path = f"{FX_CACHE}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(fresh.to_dict(), f)
+        os.replace(tmp_path, FX_CACHE)
+        _table = fresh
+        FX_REFRESHES.inc(status="ok")
+        return True
+    except Exception as e:
+        logger.warning(f"FX rate refresh failed, keeping rates as of {_table.as_of if _table else 'snapshot'}: {e}")
+        FX_REFRESHES.inc(status="error")
+        # Don't retry on every lookup while offline
+        _next_refresh_at = time.time() + min(FX_REFRESH, 3600)
+        return False
+    finally:
+        _refreshing = False
+
+
+def convert(amount: float, from_currency: str, to_currency: str = DEFAULT_CURRENCY) -> float:
+    return float(amount) * table().rate(from_currency, to_currency)
+
+
+def convert_many(amounts: Sequence[float], currencies: Sequence[str],
+                 to_currency: str = DEFAULT_CURRENCY) -> np.ndarray:
+    return table().convert_many(amounts, currencies, to_currency)
+
+
+def rank(amounts: Sequence[float], currencies: Sequence[str], to_currency: str = DEFAULT_CURRENCY,
+         max_price: Optional[float] = None, limit: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """Positions of offers sorted cheapest first (optionally within `max_price`), and all converted prices"""
+    converted = convert_many(amounts, currencies, to_currency)
+    mask = ~np.isnan(converted)
+    if max_price is not None:
+        mask &= converted <= max_price
+    positions = np.flatnonzero(mask)
+    order = positions[np.argsort(converted[positions], kind="stable")]
+    return (order[:limit] if limit is not None else order), converted
+
+
+def format_price(amount: float, currency: str = DEFAULT_CURRENCY, whole: bool = False) -> str:
+    """'$1,234.50', '€99.00', 'IDR 1,250,000' (`whole` drops minor units)"""
+    currency = (currency or "USD").upper()
+    number = f"{amount:,.0f}" if whole or currency in _ZERO_DECIMAL else f"{amount:,.2f}"
+    symbol = _SYMBOLS.get(currency)
+    return f"{symbol}{number}" if symbol else f"{currency} {number}"
+
+
+def offer_prices(offers: Iterable[Dict[str, Any]]) -> Tuple[np.ndarray, list]:
+    """Amounts and currencies of Amadeus hotel offers (first offer of each hotel)"""
+    amounts, currencies = [], []
+    for item in offers:
+        price = (item.get("offers") or [{}])[0].get("price", {})
+        try:
+            amounts.append(float(price.get("total") or price.get("base")))
+        except (TypeError, ValueError):
+            amounts.append(np.nan)
+        currencies.append(price.get("currency") or "USD")
+    return np.asarray(amounts, dtype=float), currencies
+
+
+__all__ = ["DEFAULT_CURRENCY", "FxTable", "UnknownCurrency", "convert", "convert_many", "format_price",
+           "offer_prices", "rank", "refresh", "table"]
@@ -0,0 +1,71 @@
+"""
+Rate Limit Module - Token buckets for outbound provider calls
+
+Each provider gets one shared bucket per process so tool calls from chat
+requests, prefetching and batch jobs together stay under the provider's quota.
+Rates are requests per second, configured per provider:
+
+    TRAVEL_LIGHT_RATE_AMADEUS       (default 10, the Amadeus test-tier limit)
+    TRAVEL_LIGHT_RATE_AVIATIONSTACK (default 5)
+    TRAVEL_LIGHT_RATE_OPENAI        (default 0 = unlimited; applied to batch jobs)
+"""
+
+import os
+import time
+import asyncio
+import threading
+from typing import Dict, Optional
+
+_DEFAULT_RATES = {
+    "amadeus": 10.0,
+    "aviationstack": 5.0,
+    "openai": 0.0,
+}
+
+
+class TokenBucket:
+    """Thread-safe token bucket usable from threads and coroutines"""
+
+    def __init__(self, rate: float, burst: Optional[float] = None):
+        self.rate = rate
+        self.capacity = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _reserve(self) -> float:
+        """Take a token, returning how long the caller must wait before using it"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1.0
+            if self._tokens >= 0:
+                return 0.0
+            return -self._tokens / self.rate
+
+    def acquire(self):
+        """Block the calling thread until a token is available"""
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+
+    async def acquire_async(self):
+        """Wait (without blocking the event loop) until a token is available"""
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+_limiters: Dict[str, Optional[TokenBucket]] = {}
+_limiters_lock = threading.Lock()
+
+
+def limiter(provider: str) -> Optional[TokenBucket]:
+    """Shared bucket for a provider, or None when it is unlimited"""
+    if provider not in _limiters:
+        with _limiters_lock:
+            if provider not in _limiters:
+                rate = float(os.getenv(f"TRAVEL_LIGHT_RATE_{provider.upper()}", _DEFAULT_RATES.get(provider, 0.0)))
+                _limiters[provider] = TokenBucket(rate) if rate > 0 else None
+    return _limiters[provider]
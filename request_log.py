@@ -0,0 +1,208 @@
+"""
+Request Log Module - Asynchronous, batched structured request logging
+
+Request handlers hand records to a bounded in-memory queue and return
+immediately; a background thread batches them into a JSONL file that is rotated
+and gzip-compressed once it grows past a size limit. When the queue is full new
+records are dropped (and counted) rather than blocking the request path.
+
+Configuration (environment):
+    TRAVEL_LIGHT_REQUEST_LOG_DIR        - log directory (default "logs"; empty disables)
+    TRAVEL_LIGHT_REQUEST_LOG_MAX_BYTES  - rotate after this many bytes (default 16 MB)
+    TRAVEL_LIGHT_REQUEST_LOG_BACKUPS    - compressed files to keep (default 20)
+    TRAVEL_LIGHT_LOG_MESSAGES           - opt in to logging each request's latest message, used by
+                                          cache warm-up (default 0: only the prompt hash is logged)
+"""
+
+import os
+import glob
+import gzip
+import json
+import time
+import queue
+import shutil
+import hashlib
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LOGGED = metrics.counter("travel_light_request_log_records", "Request log records written")
+DROPPED = metrics.counter("travel_light_request_log_dropped", "Request log records dropped under pressure")
+
+# Keyword buckets used to normalize a prompt into a coarse intent
+_INTENT_KEYWORDS = [
+    ("hotels", ("hotel", "hostel", "stay", "accommodation", "resort")),
+    ("flights", ("flight", "fly", "airline", "airport")),
+    ("plan_trip", ("plan", "itinerary", "trip", "days", "week")),
+    ("best_time", ("best time", "when to visit", "weather", "season")),
+    ("activities", ("things to do", "activities", "attractions", "see in", "visit in")),
+    ("tips", ("tip", "advice", "budget", "cheap")),
+]
+
+
+def normalize_intent(messages: List[Dict[str, Any]]) -> str:
+    """Coarse intent of the latest user message"""
+    content = ""
+    for message in reversed(messages):
+        if message.get("role") == "user":
+            content = str(message.get("content", "")).lower()
+            break
+    for intent, keywords in _INTENT_KEYWORDS:
+        if any(keyword in content for keyword in keywords):
+            return intent
+    return "other" if content else "empty"
+
+
+def hash_client(client: str) -> str:
+    """Stable pseudonymous client identifier (raw IPs are not logged)"""
+    return hashlib.blake2b(client.encode(), digest_size=8).hexdigest()
+
+
+class RequestLogWriter:
+    """Bounded queue + background thread writing rotating, compressed JSONL"""
+
+    def __init__(self, directory: str, max_bytes: int = 16 * 1024 * 1024, backup_count: int = 20,
+                 queue_size: int = 10_000, batch_size: int = 256, flush_interval: float = 1.0):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(maxsize=queue_size)
+        self._thread: Optional[threading.Thread] = None
+        self._pid: Optional[int] = None
+        self._rotations = 0
+        self._start_lock = threading.Lock()
+
+    @property
+    def path(self) -> str:
+        # One file per process so pre-forked workers never interleave writes
+        return os.path.join(self.directory, f"requests-{os.getpid()}.jsonl")
+
+    def _ensure_started(self):
+        # Threads do not survive fork(), so (re)start lazily in each process
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return
+            self._queue = queue.Queue(maxsize=self._queue.maxsize)
+            os.makedirs(self.directory, exist_ok=True)
+            self._thread = threading.Thread(target=self._run, name="request-log-writer", daemon=True)
+            self._thread.start()
+            self._pid = os.getpid()
+
+    def log(self, record: Dict[str, Any]) -> bool:
+        """Enqueue a record without blocking; returns False if it was dropped"""
+        self._ensure_started()
+        try:
+            self._queue.put_nowait(record)
+            return True
+        except queue.Full:
+            DROPPED.inc()
+            return False
+
+    def close(self, timeout: float = 5.0):
+        """Flush pending records and stop the writer thread"""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        try:
+            self._queue.put(None, timeout=timeout)
+        except queue.Full:
+            return
+        self._thread.join(timeout)
+        self._thread = None
+        self._pid = None
+
+    def _run(self):
+        while True:
+            batch = []
+            try:
+                item = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                continue
+            stop = item is None
+            if not stop:
+                batch.append(item)
+            while not stop and len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is None:
+                    stop = True
+                else:
+                    batch.append(item)
+            if batch:
+                self._write(batch)
+            if stop:
+                return
+
+    def _write(self, batch: List[Dict[str, Any]]):
+        lines = []
+        for record in batch:
+            try:
+                lines.append(json.dumps(record, separators=(",", ":"), default=str))
+            except (TypeError, ValueError):
+                continue
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write("\n".join(lines) + "\n")
+                size = f.tell()
+            LOGGED.inc(len(lines))
+            if size >= self.max_bytes:
+                self._rotate()
+        except OSError as e:
+            DROPPED.inc(len(lines))
+            logger.warning(f"Failed to write request log: {e}")
+
+    def _rotate(self):
+        """Compress the current file and prune old archives"""
+        self._rotations += 1
+        stamp = time.strftime("%Y%m%d-%H%M%S")
+        rotated = self.path[: -len(".jsonl")] + f"-{stamp}-{self._rotations:04d}.jsonl"
+        os.replace(self.path, rotated)
+        with open(rotated, "rb") as src, gzip.open(rotated + ".gz", "wb") as dst:
+            shutil.copyfileobj(src, dst)
+        os.remove(rotated)
+        archives = sorted(glob.glob(os.path.join(self.directory, "requests-*.jsonl.gz")), key=lambda p: (os.path.getmtime(p), p))
+        for old in archives[: max(0, len(archives) - self.backup_count)]:
+            try:
+                os.remove(old)
+            except OSError:
+                pass
+
+
+_log_dir = os.getenv("TRAVEL_LIGHT_REQUEST_LOG_DIR", "logs")
+LOG_MESSAGES = os.getenv("TRAVEL_LIGHT_LOG_MESSAGES", "0") not in ("0", "false", "False", "")
+
+
+def message_fields(messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Conversation fields for a record: the turn count, plus the latest message when opted in"""
+    fields: Dict[str, Any] = {"turns": len(messages)}
+    if LOG_MESSAGES and messages:
+        # Never the whole history; earlier turns may hold details the user gave in passing
+        fields["messages"] = messages[-1:]
+    return fields
+
+writer: Optional[RequestLogWriter] = RequestLogWriter(
+    _log_dir,
+    max_bytes=int(os.getenv("TRAVEL_LIGHT_REQUEST_LOG_MAX_BYTES", str(16 * 1024 * 1024))),
+    backup_count=int(os.getenv("TRAVEL_LIGHT_REQUEST_LOG_BACKUPS", "20")),
+) if _log_dir else None
+
+
+def log_request(record: Dict[str, Any]) -> bool:
+    """Hand a record to the background writer (no-op when logging is disabled)"""
+    if writer is None:
+        return False
+    return writer.log(record)
+
+
+def close():
+    if writer is not None:
+        writer.close()
@@ -0,0 +1,231 @@
+"""
+Resilience Module - Circuit breakers and hedged requests for travel providers
+
+Every outbound provider call goes through a per-provider circuit breaker:
+
+    closed     calls flow; outcomes are tracked over a rolling time window
+    open       the failure rate crossed the threshold; calls fail immediately
+    half-open  after a cool-down a few trial calls decide whether to close again
+
+Idempotent lookups can be hedged: if the first attempt has not answered by the
+provider's recent p95 latency a second identical request is sent and whichever
+answers first wins.
+
+Configuration (environment):
+    TRAVEL_LIGHT_BREAKER_FAILURE_RATE  - failure ratio that opens a breaker (default 0.5)
+    TRAVEL_LIGHT_BREAKER_MIN_CALLS     - calls in the window before it can open (default 5)
+    TRAVEL_LIGHT_BREAKER_WINDOW        - rolling window in seconds (default 30)
+    TRAVEL_LIGHT_BREAKER_OPEN_SECONDS  - cool-down before half-open trials (default 30)
+    TRAVEL_LIGHT_HEDGE                 - set to 0 to disable hedged requests (default 1)
+"""
+
+import os
+import time
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional, Tuple
+
+import forksafe
+import metrics
+import tracing
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+_STATE_VALUES = {STATE_CLOSED: 0, STATE_HALF_OPEN: 1, STATE_OPEN: 2}
+
+BREAKER_STATE = metrics.gauge(
+    "travel_light_breaker_state", "Circuit breaker state (0 closed, 1 half-open, 2 open)", ("provider",)
+)
+BREAKER_REJECTIONS = metrics.counter(
+    "travel_light_breaker_rejections", "Provider calls failed fast by an open breaker", ("provider",)
+)
+HEDGED_REQUESTS = metrics.counter(
+    "travel_light_hedged_requests", "Hedged second requests sent", ("provider", "winner")
+)
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling a provider whose breaker is open"""
+
+    def __init__(self, provider: str, retry_after: float):
+        super().__init__(
+            f"{provider} is temporarily unavailable; retry in {max(1, int(retry_after))}s instead of calling again now"
+        )
+        self.provider = provider
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Failure-rate circuit breaker over a rolling time window"""
+
+    def __init__(self, name: str, failure_rate: float = 0.5, min_calls: int = 5, window: float = 30.0,
+                 open_seconds: float = 30.0, half_open_calls: int = 1):
+        self.name = name
+        self.failure_rate = failure_rate
+        self.min_calls = min_calls
+        self.window = window
+        self.open_seconds = open_seconds
+        self.half_open_calls = half_open_calls
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self._outcomes: Deque[Tuple[float, bool]] = deque()
+        self._trials = 0
+        self._latencies: Deque[float] = deque(maxlen=256)
+        self._p95: Optional[float] = None
+        self._lock = threading.Lock()
+        BREAKER_STATE.set(0, provider=name)
+
+    def _set_state(self, state: str):
+        self.state = state
+        BREAKER_STATE.set(_STATE_VALUES[state], provider=self.name)
+
+    def _trim(self, now: float):
+        while self._outcomes and now - self._outcomes[0][0] > self.window:
+            self._outcomes.popleft()
+
+    def allow(self) -> bool:
+        """Whether a call may go ahead now (reserves a trial slot when half-open)"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            now = time.monotonic()
+            if self.state == STATE_OPEN:
+                if now - self.opened_at < self.open_seconds:
+                    return False
+                self._set_state(STATE_HALF_OPEN)
+                self._trials = 0
+            if self._trials < self.half_open_calls:
+                self._trials += 1
+                return True
+            return False
+
+    def retry_after(self) -> float:
+        return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def record(self, success: bool, latency: Optional[float] = None):
+        now = time.monotonic()
+        with self._lock:
+            if success and latency is not None:
+                self._latencies.append(latency)
+                self._p95 = None
+            if self.state == STATE_HALF_OPEN:
+                if success:
+                    self._set_state(STATE_CLOSED)
+                    self._outcomes.clear()
+                else:
+                    self._set_state(STATE_OPEN)
+                    self.opened_at = now
+                return
+            self._outcomes.append((now, success))
+            self._trim(now)
+            if self.state == STATE_CLOSED and len(self._outcomes) >= self.min_calls:
+                failures = sum(1 for _, ok in self._outcomes if not ok)
+                if failures / len(self._outcomes) >= self.failure_rate:
+                    self._set_state(STATE_OPEN)
+                    self.opened_at = now
+
+    def p95(self) -> Optional[float]:
+        """95th percentile of recent successful call latencies (None until there are enough)"""
+        with self._lock:
+            if self._p95 is None and len(self._latencies) >= 20:
+                ordered = sorted(self._latencies)
+                self._p95 = ordered[int(len(ordered) * 0.95) - 1]
+            return self._p95
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            self._trim(time.monotonic())
+            calls = len(self._outcomes)
+            failures = sum(1 for _, ok in self._outcomes if not ok)
+        p95 = self.p95()
+        return {
+            "state": self.state,
+            "window_calls": calls,
+            "failure_rate": round(failures / calls, 3) if calls else 0.0,
+            "p95_ms": round(p95 * 1000, 1) if p95 is not None else None,
+            "retry_after": round(self.retry_after(), 1) if self.state != STATE_CLOSED else 0.0,
+        }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker(provider: str) -> CircuitBreaker:
+    """The shared breaker for a provider"""
+    if provider not in _breakers:
+        with _breakers_lock:
+            if provider not in _breakers:
+                _breakers[provider] = CircuitBreaker(
+                    provider,
+                    failure_rate=float(os.getenv("TRAVEL_LIGHT_BREAKER_FAILURE_RATE", "0.5")),
+                    min_calls=int(os.getenv("TRAVEL_LIGHT_BREAKER_MIN_CALLS", "5")),
+                    window=float(os.getenv("TRAVEL_LIGHT_BREAKER_WINDOW", "30")),
+                    open_seconds=float(os.getenv("TRAVEL_LIGHT_BREAKER_OPEN_SECONDS", "30")),
+                )
+    return _breakers[provider]
+
+
+def snapshot() -> Dict[str, Dict[str, Any]]:
+    """Breaker state of every provider called so far (for /health)"""
+    return {name: b.snapshot() for name, b in list(_breakers.items())}
+
+
+HEDGING_ENABLED = os.getenv("TRAVEL_LIGHT_HEDGE", "1") not in ("0", "false", "False")
+_MIN_HEDGE_DELAY = 0.05
+
+_get_executor = forksafe.per_process(lambda: ThreadPoolExecutor(max_workers=16, thread_name_prefix="provider-hedge"))
+
+
+def call(provider: str, func: Callable[[], Any], is_failure: Callable[[Any], bool] = lambda result: False,
+         hedge: bool = False) -> Any:
+    """Run a provider call through its breaker, optionally hedging after the p95 latency"""
+    cb = breaker(provider)
+    if not cb.allow():
+        BREAKER_REJECTIONS.inc(provider=provider)
+        raise CircuitOpen(provider, cb.retry_after())
+
+    delay = cb.p95() if hedge and HEDGING_ENABLED and cb.state == STATE_CLOSED else None
+    start = time.monotonic()
+    try:
+        if delay is None:
+            result = func()
+        else:
+            result = _hedged(provider, func, max(delay, _MIN_HEDGE_DELAY), is_failure)
+    except Exception:
+        cb.record(False)
+        raise
+    cb.record(not is_failure(result), time.monotonic() - start)
+    return result
+
+
+def _hedged(provider: str, func: Callable[[], Any], delay: float, is_failure: Callable[[Any], bool]) -> Any:
+    executor = _get_executor()
+    # Each attempt runs in a copy of the caller's context so spans nest correctly
+    first = executor.submit(tracing.wrap_context(func))
+    done, _ = wait([first], timeout=delay)
+    if done:
+        return first.result()
+
+    second = executor.submit(tracing.wrap_context(func))
+    pending = {first, second}
+    last_error: Optional[BaseException] = None
+    fallback: Optional[Future] = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            error = future.exception()
+            if error is not None:
+                last_error = error
+                continue
+            if is_failure(future.result()):
+                fallback = fallback or future
+                continue
+            HEDGED_REQUESTS.inc(provider=provider, winner="primary" if future is first else "hedge")
+            return future.result()
+    HEDGED_REQUESTS.inc(provider=provider, winner="none")
+    if fallback is not None:
+        return fallback.result()
+    raise last_error
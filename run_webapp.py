@@ -6,23 +6,22 @@ Travel Light Launcher - Choose how to run the travel planning application
 import os
 import sys
 import subprocess
+from importlib.util import find_spec
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
+REQUIRED_MODULES = ["streamlit", "fpdf", "langgraph", "langchain"]
+
 def check_dependencies():
-    """Check if required dependencies are installed."""
-    try:
-        import streamlit
-        import fpdf
-        import langgraph
-        import langchain
-        return True
-    except ImportError as e:
-        print(f"❌ Missing dependency: {e}")
-        print("💡 Run: pip install -r requirements.txt")
-        return False
+    """Check if required dependencies are installed (without importing them)."""
+    for module in REQUIRED_MODULES:
+        if find_spec(module) is None:
+            print(f"❌ Missing dependency: No module named '{module}'")
+            print("💡 Run: pip install -r requirements.txt")
+            return False
+    return True
 
 def show_menu():
     """Show the main menu."""
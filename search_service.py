@@ -0,0 +1,434 @@
+"""
+Search Service Module - One search API over every flight, hotel, train and cab provider
+
+Each backend is a provider plugin (a ``SearchProvider`` subclass registered with
+``register()``) that answers one or more kinds of search. A search fans out to
+every provider for its kind at once and yields each provider's results as soon
+as they arrive, so the booking tabs can show the first answers while slower
+providers are still working; ``merge()`` de-duplicates and ranks everything
+received so far.
+
+The Amadeus hotel and AviationStack flight providers go through the same
+``travel_light.cached_provider_call`` cache (and stale fallback) as the chat
+agent's tools, and put their offers in the offer index under the browser
+session, so a search in a tab is reused by the agent and "under $150" in chat
+refines it. Trains and cabs come from sample providers until real ones are
+plugged in.
+
+Configuration (environment):
+    TRAVEL_LIGHT_SEARCH_WORKERS  - provider searches run in parallel (default 8)
+    TRAVEL_LIGHT_SEARCH_TIMEOUT  - seconds to wait for the slowest provider (default 20)
+"""
+
+import os
+import math
+import time
+import random
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FuturesTimeout
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import forksafe
+import metrics
+import tracing
+
+logger = logging.getLogger(__name__)
+
+WORKERS = int(os.getenv("TRAVEL_LIGHT_SEARCH_WORKERS", "8"))
+TIMEOUT = float(os.getenv("TRAVEL_LIGHT_SEARCH_TIMEOUT", "20"))
+# Same freshness as the provider cache shared with the chat tools
+CACHE_TTL = float(os.getenv("TRAVEL_LIGHT_PROVIDER_CACHE_TTL", "600"))
+_CACHE_MAX = 512
+
+KINDS = ("flights", "hotels", "trains", "cabs")
+
+SEARCHES = metrics.counter("travel_light_searches", "Searches fanned out to providers", ("kind",))
+SEARCH_PROVIDER_CALLS = metrics.counter(
+    "travel_light_search_provider_calls", "Provider answers to searches, by outcome", ("provider", "outcome")
+)
+SEARCH_PROVIDER_SECONDS = metrics.histogram(
+    "travel_light_search_provider_seconds", "Time for one provider to answer a search", ("provider",)
+)
+
+# Metro-area city codes (what the destination index knows) -> main airport,
+# for providers that only accept airport codes
+_MAIN_AIRPORTS = {
+    "NYC": "JFK", "LON": "LHR", "PAR": "CDG", "TYO": "NRT", "ROM": "FCO", "MIL": "MXP",
+    "OSA": "KIX", "SEL": "ICN", "BJS": "PEK", "CHI": "ORD", "WAS": "IAD", "SAO": "GRU",
+}
+
+
+class ProviderError(Exception):
+    """A provider could not answer (not configured, failed, bad query)"""
+
+
+class SearchProvider:
+    """Base class for search backends.
+
+    Subclasses set ``name`` and ``kinds`` and implement ``search(kind, query)``,
+    returning result dicts (see ``result()``) or raising ProviderError.
+    ``sample`` marks providers that return made-up data; providers with their
+    own cache set ``cache_results = False``.
+    """
+
+    name = ""
+    kinds: Tuple[str, ...] = ()
+    sample = False
+    cache_results = True
+
+    def search(self, kind: str, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        raise NotImplementedError
+
+
+def result(provider: str, kind: str, title: str, price_usd: Optional[float] = None,
+           rating: Optional[float] = None, departure: Optional[int] = None, details: str = "") -> Dict[str, Any]:
+    """One search result (``departure`` in minutes after midnight)"""
+    return {"kind": kind, "provider": provider, "title": title, "price_usd": price_usd,
+            "rating": rating, "departure": departure, "details": details}
+
+
+_providers: "OrderedDict[str, SearchProvider]" = OrderedDict()
+_providers_lock = threading.Lock()
+
+
+def register(provider: SearchProvider) -> SearchProvider:
+    """Add (or replace) a provider plugin"""
+    with _providers_lock:
+        _providers[provider.name] = provider
+    return provider
+
+
+def providers(kind: Optional[str] = None) -> List[SearchProvider]:
+    with _providers_lock:
+        return [p for p in _providers.values() if kind is None or kind in p.kinds]
+
+
+# --- Places ---
+
+def place(name: str) -> Optional[Dict[str, Any]]:
+    """The destination-index entry for a city name, alias or code"""
+    import destinations
+    return destinations.index().lookup(str(name))
+
+
+def city_code(name: str) -> str:
+    dest = place(name)
+    if dest is not None:
+        return dest["code"]
+    name = str(name).strip()
+    if len(name) == 3 and name.isalpha():
+        return name.upper()
+    raise ProviderError(f"Unknown city: {name}")
+
+
+def airport_code(name: str) -> str:
+    code = city_code(name)
+    return _MAIN_AIRPORTS.get(code, code)
+
+
+def _minutes(value: Any) -> Optional[int]:
+    text = str(value or "")
+    try:
+        hours, minutes = text.split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    except ValueError:
+        return None
+
+
+def _clock(minutes: int) -> str:
+    day, minutes = divmod(int(minutes), 24 * 60)
+    return f"{minutes // 60:02d}:{minutes % 60:02d}" + (f" (+{day})" if day else "")
+
+
+# --- Fan-out ---
+
+def _query_key(kind: str, query: Dict[str, Any]) -> Tuple[Any, ...]:
+    return (kind,) + tuple(sorted((k, str(v).strip().lower()) for k, v in query.items()))
+
+
+_cache: "OrderedDict[Tuple[Any, ...], Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+
+
+def _cached(key: Tuple[Any, ...]) -> Optional[List[Dict[str, Any]]]:
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None or time.time() - entry[0] >= CACHE_TTL:
+            return None
+        _cache.move_to_end(key)
+        return entry[1]
+
+
+def _store(key: Tuple[Any, ...], results: List[Dict[str, Any]]):
+    with _cache_lock:
+        _cache[key] = (time.time(), results)
+        _cache.move_to_end(key)
+        while len(_cache) > _CACHE_MAX:
+            _cache.popitem(last=False)
+
+
+def _run_provider(provider: SearchProvider, kind: str, query: Dict[str, Any]) -> Dict[str, Any]:
+    """One provider's answer as a search update; never raises"""
+    start = time.perf_counter()
+    key = (provider.name,) + _query_key(kind, query)
+    update = {"provider": provider.name, "sample": provider.sample, "results": [], "error": None, "cached": False}
+    cached = _cached(key) if provider.cache_results else None
+    if cached is not None:
+        SEARCH_PROVIDER_CALLS.inc(provider=provider.name, outcome="cached")
+        update.update(results=cached, cached=True)
+    else:
+        with tracing.start_span(f"search {provider.name}", **{"search.kind": kind}), \
+                metrics.timer(SEARCH_PROVIDER_SECONDS, provider=provider.name):
+            try:
+                update["results"] = provider.search(kind, query)
+                if provider.cache_results:
+                    _store(key, update["results"])
+                SEARCH_PROVIDER_CALLS.inc(provider=provider.name, outcome="ok")
+            except ProviderError as e:
+                SEARCH_PROVIDER_CALLS.inc(provider=provider.name, outcome="error")
+                update["error"] = str(e)
+            except Exception as e:
+                SEARCH_PROVIDER_CALLS.inc(provider=provider.name, outcome="error")
+                logger.warning(f"Search provider {provider.name} failed: {e}")
+                update["error"] = f"{provider.name} search failed"
+    update["ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return update
+
+
+_search_executor = forksafe.per_process(lambda: ThreadPoolExecutor(max_workers=WORKERS, thread_name_prefix="search"))
+
+
+def search(kind: str, query: Dict[str, Any], timeout: float = TIMEOUT) -> Iterator[Dict[str, Any]]:
+    """Ask every provider for ``kind`` at once; yields each provider's update as it arrives
+
+    An update is ``{"provider", "sample", "results", "error", "cached", "ms"}``.
+    Providers still running after ``timeout`` seconds are reported as timed out.
+    """
+    if kind not in KINDS:
+        raise ValueError(f"kind must be one of {', '.join(KINDS)}")
+    SEARCHES.inc(kind=kind)
+    executor = _search_executor()
+    # Each provider runs in the caller's context (session bound for the offer index)
+    futures = {
+        executor.submit(tracing.wrap_context(_run_provider), provider, kind, query): provider
+        for provider in providers(kind)
+    }
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=timeout):
+            pending.discard(future)
+            yield future.result()
+    except FuturesTimeout:
+        for future in pending:
+            provider = futures[future]
+            SEARCH_PROVIDER_CALLS.inc(provider=provider.name, outcome="timeout")
+            yield {"provider": provider.name, "sample": provider.sample, "results": [],
+                   "error": f"{provider.name} did not answer in {timeout:g}s", "cached": False,
+                   "ms": round(timeout * 1000, 1)}
+
+
+def _rank_key(item: Dict[str, Any]) -> Tuple[Any, ...]:
+    price, rating, departure = item["price_usd"], item["rating"], item["departure"]
+    return (price is None, price or 0.0, departure if departure is not None else 24 * 60, -(rating or 0.0))
+
+
+def merge(results: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """De-duplicate results from several providers (keeping the cheapest) and rank them
+
+    Cheapest first, then earliest departure, then best rated; results without
+    a price (e.g. flight schedules) come after priced ones.
+    """
+    best: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    for item in results:
+        key = (item["kind"], " ".join(item["title"].lower().split()), item["departure"])
+        current = best.get(key)
+        if current is None or _rank_key(item) < _rank_key(current):
+            best[key] = item
+    return sorted(best.values(), key=_rank_key)
+
+
+def stream(kind: str, query: Dict[str, Any], timeout: float = TIMEOUT
+           ) -> Iterator[Tuple[Dict[str, Any], List[Dict[str, Any]]]]:
+    """``search()`` plus the merged ranking of everything received so far after each update"""
+    received: List[Dict[str, Any]] = []
+    for update in search(kind, query, timeout):
+        received.extend(update["results"])
+        yield update, merge(received)
+
+
+def price_text(price_usd: Optional[float], currency: str) -> str:
+    import pricing
+    if price_usd is None:
+        return ""
+    return pricing.format_price(pricing.convert(price_usd, "USD", currency), currency)
+
+
+# --- Providers ---
+
+# Answers from travel_light's provider calls that mean "no results" rather than a failure
+_NO_RESULTS = ("No hotels found", "No flights found")
+
+
+def _provider_text(text: str) -> bool:
+    """True if the provider found results; raises ProviderError for failures"""
+    if text.startswith(_NO_RESULTS):
+        return False
+    if text.startswith(("Error", "Failed", "Unsupported", "Amadeus API credentials", "AviationStack API key")):
+        raise ProviderError(text.splitlines()[0])
+    return True
+
+
+class AmadeusHotels(SearchProvider):
+    """Hotel offers from Amadeus (shared cache and offer index with the chat agent)"""
+
+    name = "amadeus"
+    kinds = ("hotels",)
+    cache_results = False  # cached_provider_call already caches, and the offer index must see every search
+
+    def search(self, kind: str, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        import offer_index
+        import travel_light
+
+        code = city_code(query["city"])
+        check_in, check_out = str(query["check_in"]), str(query["check_out"])
+        if check_out <= check_in:
+            raise ProviderError("Check-out must be after check-in")
+        adults = int(query.get("guests", 1))
+        # Same arguments as the agent's hotel tool, so either one's search serves the other
+        args = (code, check_in, check_out, adults)
+        text = travel_light.cached_provider_call("amadeus", travel_light.search_hotels, *args)
+        if not _provider_text(text):
+            return []
+        key = offer_index.search_key(offer_index.KIND_HOTELS, code, check_in, check_out, adults)
+        offers = offer_index.index.get(key)
+        if offers is None:
+            # Text answer was cached but its offers have left the index
+            _provider_text(travel_light.search_hotels(*args))
+            offers = offer_index.index.get(key)
+            if offers is None:
+                return []
+        offer_index.index.remember(key)
+        results = []
+        for i in offers.query(limit=len(offers)):
+            price, rating = float(offers.price[i]), float(offers.rating[i])
+            details = "" if offers.currency[i] == "USD" else f"{offers.amount[i]:,.0f} {offers.currency[i]} at the hotel"
+            results.append(result(self.name, kind, offers.labels[i],
+                                  price_usd=None if math.isnan(price) else price,
+                                  rating=None if math.isnan(rating) else rating, details=details))
+        return results
+
+
+class AviationStackFlights(SearchProvider):
+    """Flight schedules from AviationStack (no fares)"""
+
+    name = "aviationstack"
+    kinds = ("flights",)
+    cache_results = False
+
+    def search(self, kind: str, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        import offer_index
+        import travel_light
+
+        source, destination = airport_code(query["origin"]), airport_code(query["destination"])
+        date = str(query["date"])
+        text = travel_light.cached_provider_call("aviationstack", travel_light.search_flight_route,
+                                                 source, destination, date)
+        if not _provider_text(text):
+            return []
+        key = offer_index.search_key(offer_index.KIND_FLIGHTS, destination, source, date)
+        offers = offer_index.index.get(key)
+        if offers is None:
+            _provider_text(travel_light.search_flight_route(source, destination, date))
+            offers = offer_index.index.get(key)
+            if offers is None:
+                return []
+        offer_index.index.remember(key)
+        return [
+            result(self.name, kind, offers.labels[i],
+                   departure=None if offers.departure[i] < 0 else int(offers.departure[i]),
+                   details=f"{source} → {destination}")
+            for i in offers.query(sort="departure", limit=len(offers))
+        ]
+
+
+def _rng(kind: str, query: Dict[str, Any]) -> random.Random:
+    """Random numbers fixed by the query, so a sample provider answers the same search the same way"""
+    seed = hashlib.sha1(repr(_query_key(kind, query)).encode("utf-8")).digest()
+    return random.Random(int.from_bytes(seed[:8], "big"))
+
+
+def _distance_km(origin: str, destination: str, rng: random.Random, low: float, high: float) -> float:
+    import destinations
+
+    a, b = place(origin), place(destination)
+    if a is not None and b is not None and a["code"] != b["code"]:
+        return destinations.haversine_km(a["lat"], a["lon"], b["lat"], b["lon"])
+    return rng.uniform(low, high)
+
+
+class SampleTrains(SearchProvider):
+    """Sample timetable (distance-based times and fares) until a rail provider is plugged in"""
+
+    name = "sample_rail"
+    kinds = ("trains",)
+    sample = True
+    FARE_PER_KM_USD = {"sleeper": 0.012, "ac": 0.03, "first class": 0.06}
+
+    def search(self, kind: str, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rng = _rng(kind, query)
+        origin, destination = str(query["origin"]).strip(), str(query["destination"]).strip()
+        # Rail routes run ~25% longer than the great-circle distance
+        km = _distance_km(origin, destination, rng, 120, 1200) * 1.25
+        travel_class = str(query.get("travel_class", "AC"))
+        per_km = self.FARE_PER_KM_USD.get(travel_class.lower(), 0.03)
+        results = []
+        departure = 5 * 60 + rng.randrange(0, 60, 5)
+        for _ in range(rng.randint(3, 6)):
+            speed = rng.uniform(55, 95)
+            minutes = int(km / speed * 60) + 20
+            number = rng.randint(12001, 22999)
+            results.append(result(
+                self.name, kind, f"Train {number} {origin} → {destination}",
+                price_usd=round(max(2.0, km * per_km * rng.uniform(0.9, 1.2)), 2), departure=departure,
+                details=f"{_clock(departure)} → {_clock(departure + minutes)} · {minutes / 60:.1f} h · {travel_class}",
+            ))
+            departure += rng.randrange(90, 300, 5)
+            if departure >= 23 * 60:
+                break
+        return results
+
+
+class SampleCabs(SearchProvider):
+    """Sample cab quotes (three vehicle types) until a ride provider is plugged in"""
+
+    name = "sample_cabs"
+    kinds = ("cabs",)
+    sample = True
+    TIERS = (("Mini", 2.0, 0.55), ("Sedan", 3.0, 0.8), ("SUV", 4.5, 1.15))  # base and per-km fares, USD
+
+    def search(self, kind: str, query: Dict[str, Any]) -> List[Dict[str, Any]]:
+        rng = _rng(kind, query)
+        km = _distance_km(query["pickup"], query["drop"], rng, 4, 40)
+        pickup = _minutes(query.get("time"))
+        results = []
+        for tier, base, per_km in self.TIERS:
+            eta = rng.randint(3, 15)
+            results.append(result(
+                self.name, kind, f"{tier} cab",
+                price_usd=round((base + km * per_km) * rng.uniform(0.95, 1.1), 2), departure=pickup,
+                details=f"{km:.0f} km · driver {eta} min away",
+            ))
+        return results
+
+
+register(AviationStackFlights())
+register(AmadeusHotels())
+register(SampleTrains())
+register(SampleCabs())
+
+
+__all__ = ["KINDS", "ProviderError", "SearchProvider", "merge", "price_text", "providers", "register",
+           "result", "search", "stream"]
@@ -0,0 +1,422 @@
+"""
+Session Store Module - Conversation histories shared by the Streamlit app and /api/chat
+
+A conversation is kept server-side under its session ID, so a user can start in
+the Streamlit chat and carry on in the chat widget (or any /api/chat client that
+sends ``sessionId``) without resending the history.
+
+Messages are stored compactly: the role is a small integer, long texts are
+zlib-compressed, and fixed texts registered with ``share()`` (the Buddy intro
+and other greetings) are interned - kept once and referenced by hash from every
+session that contains them. Each message is written through to SQLite as it is
+added, so only recently active sessions stay in memory (an LRU bounded by count
+and idle time); an idle session costs nothing but a few rows on disk and is
+loaded back on its next turn.
+
+Every write bumps the session's ``generation``, so a worker holding a session in
+memory notices when another worker replaced it and reloads it instead of
+splicing. Sessions first written through the API are bound to the caller's
+client ID (``claim()``); sessions created by the Streamlit app have no owner and
+are reachable only through their random ID.
+
+Configuration (environment):
+    TRAVEL_LIGHT_SESSION_DB         - SQLite database path (default "data/sessions.db")
+    TRAVEL_LIGHT_SESSION_MEMORY     - sessions kept in memory (default 1000)
+    TRAVEL_LIGHT_SESSION_IDLE       - seconds before an idle session leaves memory (default 600)
+    TRAVEL_LIGHT_SESSION_RETENTION  - seconds to keep inactive sessions on disk (default 604800)
+"""
+
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+import forksafe
+import metrics
+
+logger = logging.getLogger(__name__)
+
+DB_PATH = os.getenv("TRAVEL_LIGHT_SESSION_DB", os.path.join("data", "sessions.db"))
+MEMORY_SESSIONS = int(os.getenv("TRAVEL_LIGHT_SESSION_MEMORY", "1000"))
+IDLE_SECONDS = float(os.getenv("TRAVEL_LIGHT_SESSION_IDLE", "600"))
+RETENTION = float(os.getenv("TRAVEL_LIGHT_SESSION_RETENTION", str(7 * 86400)))
+
+ROLES = ("user", "assistant", "system")
+_ROLE_CODES = {role: code for code, role in enumerate(ROLES)}
+
+# How a message's text is stored
+KIND_TEXT = 0
+KIND_ZLIB = 1
+KIND_SHARED = 2
+KIND_JSON = 3  # non-string content (e.g. a list of parts)
+
+COMPRESS_MIN_BYTES = 512
+
+SESSION_LOADS = metrics.counter(
+    "travel_light_session_loads", "Session histories looked up, by where they were found", ("source",)
+)
+SESSION_SPILLS = metrics.counter("travel_light_session_spills", "Idle sessions dropped from memory")
+SESSIONS_IN_MEMORY = metrics.gauge("travel_light_sessions_in_memory", "Session histories held in memory")
+
+# A stored message: (role code or name, kind, payload)
+Encoded = Tuple[Any, int, Any]
+
+_SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id TEXT PRIMARY KEY,
+    length INTEGER NOT NULL,
+    generation INTEGER NOT NULL DEFAULT 0,
+    owner TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+CREATE TABLE IF NOT EXISTS session_messages (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    role,
+    kind INTEGER NOT NULL,
+    body,
+    PRIMARY KEY (session_id, seq)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS shared_texts (
+    hash TEXT PRIMARY KEY,
+    text TEXT NOT NULL
+);
+"""
+# Columns added after the first release, for databases created before them
+_MIGRATIONS = (
+    ("generation", "ALTER TABLE sessions ADD COLUMN generation INTEGER NOT NULL DEFAULT 0"),
+    ("owner", "ALTER TABLE sessions ADD COLUMN owner TEXT"),
+)
+
+
+def _text_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+def plain_message(message: Any) -> Dict[str, Any]:
+    """The role and content of a client message (a bare string is a user message)"""
+    if isinstance(message, str):
+        return {"role": "user", "content": message}
+    return {"role": message.get("role", "user"), "content": message.get("content", "")}
+
+
+class _Session:
+    __slots__ = ("messages", "generation", "touched")
+
+    def __init__(self, messages: List[Encoded], generation: int = 0):
+        self.messages = messages
+        self.generation = generation
+        self.touched = time.monotonic()
+
+
+class SessionStore:
+    """Write-through SQLite session histories with an in-memory LRU of active sessions"""
+
+    def __init__(self, path: str, max_sessions: int = MEMORY_SESSIONS, idle_seconds: float = IDLE_SECONDS):
+        self.path = path
+        self.max_sessions = max(1, max_sessions)
+        self.idle_seconds = idle_seconds
+        self._connection = forksafe.per_process(self._open)
+        self._lock = threading.RLock()
+        self._sessions: "OrderedDict[str, _Session]" = OrderedDict()
+        self._shared: Dict[str, str] = {}          # hash -> text
+        self._shared_by_text: Dict[str, str] = {}  # text -> hash
+
+    def _open(self) -> sqlite3.Connection:
+        conn = forksafe.connect_sqlite(self.path, _SCHEMA_SQL)
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+        for column, sql in _MIGRATIONS:
+            if column not in columns:
+                conn.execute(sql)
+        # Another process may have written to sessions we still hold
+        self._sessions.clear()
+        self._prune(conn, RETENTION)
+        return conn
+
+    # --- Encoding ---
+
+    def share(self, text: str) -> str:
+        """Intern a text that many sessions contain; returns its hash"""
+        with self._lock:
+            digest = self._shared_by_text.get(text)
+            if digest is None:
+                digest = _text_hash(text)
+                self._connection().execute(
+                    "INSERT OR IGNORE INTO shared_texts (hash, text) VALUES (?, ?)", (digest, text)
+                )
+                self._shared[digest] = text
+                self._shared_by_text[text] = digest
+            return digest
+
+    def _encode(self, message: Dict[str, Any]) -> Encoded:
+        role = message.get("role", "user")
+        role = _ROLE_CODES.get(role, role)
+        content = message.get("content", "")
+        if not isinstance(content, str):
+            return role, KIND_JSON, json.dumps(content, separators=(",", ":"))
+        digest = self._shared_by_text.get(content)
+        if digest is not None:
+            return role, KIND_SHARED, digest
+        data = content.encode("utf-8")
+        if len(data) >= COMPRESS_MIN_BYTES:
+            packed = zlib.compress(data, 6)
+            if len(packed) < len(data):
+                return role, KIND_ZLIB, packed
+        return role, KIND_TEXT, content
+
+    def _shared_text(self, digest: str) -> str:
+        text = self._shared.get(digest)
+        if text is None:
+            row = self._connection().execute("SELECT text FROM shared_texts WHERE hash = ?", (digest,)).fetchone()
+            if row is None:
+                return ""
+            text = self._shared[digest] = row[0]
+            self._shared_by_text[text] = digest
+        return text
+
+    def _decode(self, encoded: Encoded) -> Dict[str, Any]:
+        role, kind, payload = encoded
+        if isinstance(role, int):
+            role = ROLES[role]
+        if kind == KIND_ZLIB:
+            content: Any = zlib.decompress(payload).decode("utf-8")
+        elif kind == KIND_SHARED:
+            content = self._shared_text(payload)
+        elif kind == KIND_JSON:
+            content = json.loads(payload)
+        else:
+            content = payload
+        return {"role": role, "content": content}
+
+    # --- Memory ---
+
+    def _session(self, session_id: str) -> _Session:
+        """The session's history, loading whatever memory is missing from disk (call with the lock held)"""
+        conn = self._connection()
+        row = conn.execute("SELECT generation FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None:
+            # Unknown (or deleted by another worker): nothing to keep in memory until it is written
+            if self._sessions.pop(session_id, None) is not None:
+                SESSIONS_IN_MEMORY.set(len(self._sessions))
+            return _Session([])
+        generation = row[0]
+        session = self._sessions.get(session_id)
+        if session is not None and session.generation == generation:
+            SESSION_LOADS.inc(source="memory")
+        else:
+            # Spilled, or written by another worker process since we last saw it
+            SESSION_LOADS.inc(source="disk")
+            rows = conn.execute(
+                "SELECT role, kind, body FROM session_messages WHERE session_id = ? ORDER BY seq", (session_id,)
+            ).fetchall()
+            session = _Session([tuple(r) for r in rows], generation)
+            self._sessions[session_id] = session
+        session.touched = time.monotonic()
+        self._sessions.move_to_end(session_id)
+        self._spill()
+        return session
+
+    def _spill(self):
+        """Drop the least recently used sessions from memory; they stay on disk"""
+        cutoff = time.monotonic() - self.idle_seconds
+        while self._sessions:
+            session_id, oldest = next(iter(self._sessions.items()))
+            if len(self._sessions) <= self.max_sessions and oldest.touched >= cutoff:
+                break
+            del self._sessions[session_id]
+            SESSION_SPILLS.inc()
+        SESSIONS_IN_MEMORY.set(len(self._sessions))
+
+    # --- Public API ---
+
+    def exists(self, session_id: str) -> bool:
+        """Whether the session has ever been written (and not deleted since)"""
+        with self._lock:
+            return self._connection().execute("SELECT 1 FROM sessions WHERE id = ?", (session_id,)).fetchone() is not None
+
+    def length(self, session_id: str) -> int:
+        with self._lock:
+            return len(self._session(session_id).messages)
+
+    def generation(self, session_id: str) -> int:
+        """Counter bumped by every write to the session (0 for a new session)"""
+        with self._lock:
+            return self._session(session_id).generation
+
+    def history(self, session_id: str, start: int = 0, stop: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Decoded messages ``start:stop`` of a session (all of them by default)"""
+        with self._lock:
+            encoded = self._session(session_id).messages[start:stop]
+            return [self._decode(m) for m in encoded]
+
+    def append(self, session_id: str, *messages: Dict[str, Any]) -> int:
+        """Add messages to the end of a session; returns its new length"""
+        with self._lock:
+            session = self._session(session_id)
+            encoded = [self._encode(m) for m in messages]
+            start, generation = self._write(session_id, encoded, session.generation)
+            if start == len(session.messages) and generation == session.generation + 1:
+                session.messages.extend(encoded)
+                session.generation = generation
+                if session_id not in self._sessions:
+                    # First write of a new session
+                    self._sessions[session_id] = session
+                    self._spill()
+                return len(session.messages)
+            # Another worker wrote in between; the next read reloads the session
+            self._sessions.pop(session_id, None)
+            return start + len(encoded)
+
+    def replace(self, session_id: str, messages: List[Dict[str, Any]]):
+        """Overwrite a session's history"""
+        with self._lock:
+            encoded = [self._encode(m) for m in messages]
+            _, generation = self._write(session_id, encoded, truncate=True)
+            self._sessions[session_id] = _Session(encoded, generation)
+            self._sessions.move_to_end(session_id)
+            self._spill()
+
+    def delete(self, session_id: str):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._sessions.pop(session_id, None)
+            SESSIONS_IN_MEMORY.set(len(self._sessions))
+
+    def _write(self, session_id: str, encoded: List[Encoded], generation: Optional[int] = None,
+               truncate: bool = False) -> Tuple[int, int]:
+        """Append (or with ``truncate``, replace) messages; returns (first seq written, new generation)
+
+        Appends go after whatever is on disk, even if another worker wrote since
+        ``generation`` was read.
+        """
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if truncate:
+                start = 0
+                conn.execute("DELETE FROM session_messages WHERE session_id = ?", (session_id,))
+            else:
+                row = conn.execute("SELECT length FROM sessions WHERE id = ?", (session_id,)).fetchone()
+                start = row[0] if row else 0
+            conn.executemany(
+                "INSERT OR REPLACE INTO session_messages (session_id, seq, role, kind, body) VALUES (?, ?, ?, ?, ?)",
+                [(session_id, start + i, role, kind, body) for i, (role, kind, body) in enumerate(encoded)],
+            )
+            generation = conn.execute(
+                "INSERT INTO sessions (id, length, generation, created_at, updated_at) VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET length = excluded.length, generation = generation + 1, "
+                "updated_at = excluded.updated_at RETURNING generation",
+                (session_id, start + len(encoded), now, now),
+            ).fetchone()[0]
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return start, generation
+
+    # --- Ownership ---
+
+    def claim(self, session_id: str, owner: str) -> bool:
+        """Bind a new session to ``owner``; False if the session belongs to someone else"""
+        with self._lock:
+            conn = self._connection()
+            now = time.time()
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (id, length, generation, owner, created_at, updated_at) "
+                "VALUES (?, 0, 0, ?, ?, ?)",
+                (session_id, owner, now, now),
+            )
+            row = conn.execute("SELECT owner FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            return row[0] is None or row[0] == owner
+
+    def allows(self, session_id: str, owner: str) -> bool:
+        """Whether ``owner`` may read or delete the session (unowned and unknown sessions are open)"""
+        with self._lock:
+            row = self._connection().execute("SELECT owner FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            return row is None or row[0] is None or row[0] == owner
+
+    def turn(self, session_id: str, messages: Optional[List[Dict[str, Any]]] = None,
+             message: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """Record a new chat turn and return the full conversation to answer
+
+        ``message`` is appended to the stored history (a client that only sends
+        its latest message). ``messages`` is a client's full history: if it
+        extends what is stored only the new tail is written, otherwise it
+        replaces the stored history.
+        """
+        with self._lock:
+            stored = self.history(session_id)
+            if message is not None:
+                message = plain_message(message)
+                # A retried turn (e.g. after a 503) must not add the question twice
+                if not stored or stored[-1] != message:
+                    self.append(session_id, message)
+                    stored.append(message)
+                return stored
+            messages = [plain_message(m) for m in messages or []]
+            if messages[:len(stored)] == stored:
+                if len(messages) > len(stored):
+                    self.append(session_id, *messages[len(stored):])
+            else:
+                self.replace(session_id, messages)
+            return messages
+
+    def _prune(self, conn: sqlite3.Connection, max_age: float) -> int:
+        cutoff = time.time() - max_age
+        conn.execute(
+            "DELETE FROM session_messages WHERE session_id IN (SELECT id FROM sessions WHERE updated_at < ?)",
+            (cutoff,),
+        )
+        removed = conn.execute("DELETE FROM sessions WHERE updated_at < ?", (cutoff,)).rowcount
+        if removed:
+            logger.info(f"🧹 Removed {removed} inactive chat session(s)")
+        return removed
+
+    def prune(self, max_age: float = RETENTION) -> int:
+        with self._lock:
+            return self._prune(self._connection(), max_age)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            payload = sum(
+                len(body) if kind != KIND_SHARED else 0
+                for session in self._sessions.values() for _, kind, body in session.messages
+            )
+            return {
+                "in_memory": len(self._sessions),
+                "in_memory_bytes": payload,
+                "shared_texts": len(self._shared),
+                "max_in_memory": self.max_sessions,
+                "idle_seconds": self.idle_seconds,
+            }
+
+
+_store: Optional[SessionStore] = None
+_store_lock = threading.Lock()
+
+
+def store() -> SessionStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = SessionStore(DB_PATH)
+        return _store
+
+
+def share(text: str) -> str:
+    """Intern a fixed text (greeting, system prompt) shared by many sessions"""
+    return store().share(text)
+
+
+__all__ = ["SessionStore", "store", "share", "plain_message", "ROLES"]
@@ -0,0 +1,137 @@
+"""
+Streaming Module - Server-Sent Events encoder for chat responses
+
+Frames are ``data: <json>\\n\\n`` with valid JSON (orjson when installed), deltas
+are coalesced into larger frames by size and time window, and idle streams get
+``: ping`` comment frames so proxies and clients keep the connection open.
+"""
+
+import json
+import time
+import asyncio
+import logging
+from typing import Any, AsyncIterable, AsyncIterator, Callable, Dict, Iterable, Iterator, Optional, Union
+
+try:
+    import orjson
+
+    def dumps(obj: Any) -> bytes:
+        """Serialize to compact JSON bytes"""
+        return orjson.dumps(obj)
+except ImportError:  # pragma: no cover - orjson is optional
+    def dumps(obj: Any) -> bytes:
+        """Serialize to compact JSON bytes"""
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+logger = logging.getLogger(__name__)
+
+SSE_MEDIA_TYPE = "text/event-stream"
+SSE_HEADERS = {"X-Accel-Buffering": "no"}  # stop nginx from buffering the stream
+
+HEARTBEAT_FRAME = b": ping\n\n"
+DEFAULT_FRAME_CHARS = 4096       # max characters of text per delta frame
+DEFAULT_MAX_DELAY = 0.05         # seconds a delta may wait to be coalesced
+DEFAULT_HEARTBEAT_INTERVAL = 15.0
+
+
+def encode_event(payload: Dict[str, Any]) -> bytes:
+    """Encode one SSE data frame"""
+    return b"data: " + dumps(payload) + b"\n\n"
+
+
+def done_frame(**fields) -> bytes:
+    """Final frame telling the client the response is complete"""
+    return encode_event({"done": True, **fields})
+
+
+def error_frame(message: str) -> bytes:
+    return encode_event({"error": message, "done": True})
+
+
+def iter_text_frames(text: str, frame_chars: int = DEFAULT_FRAME_CHARS, **final_fields) -> Iterator[bytes]:
+    """Frames for an already complete text: a few large deltas and a done frame"""
+    for i in range(0, len(text), frame_chars):
+        yield encode_event({"delta": text[i : i + frame_chars], "done": False})
+    yield done_frame(**final_fields)
+
+
+def encode_text_body(text: str, frame_chars: int = DEFAULT_FRAME_CHARS, **final_fields) -> bytes:
+    """Whole SSE body for a complete text as a single buffer"""
+    return b"".join(iter_text_frames(text, frame_chars, **final_fields))
+
+
+async def sse_stream(
+    source: Union[AsyncIterable[str], Iterable[str]],
+    frame_chars: int = DEFAULT_FRAME_CHARS,
+    max_delay: float = DEFAULT_MAX_DELAY,
+    heartbeat_interval: float = DEFAULT_HEARTBEAT_INTERVAL,
+    done_fields: Optional[Callable[[], Dict[str, Any]]] = None,
+    **final_fields,
+) -> AsyncIterator[bytes]:
+    """Encode a stream of text deltas as SSE, coalescing by size/time and sending heartbeats
+
+    `done_fields` is called once the source is exhausted and its result is
+    added to the done frame (for values only known at the end, like usage).
+    """
+    if not hasattr(source, "__aiter__"):
+        text = "".join(source)
+        if done_fields is not None:
+            final_fields.update(done_fields())
+        for frame in iter_text_frames(text, frame_chars, **final_fields):
+            yield frame
+        return
+
+    iterator = source.__aiter__()
+    buffer = []
+    buffered = 0
+    first_buffered_at = 0.0
+    pending = None
+    try:
+        while True:
+            if pending is None:
+                pending = asyncio.ensure_future(iterator.__anext__())
+            if buffer:
+                timeout = max(0.0, max_delay - (time.monotonic() - first_buffered_at))
+            else:
+                timeout = heartbeat_interval
+            done, _ = await asyncio.wait({pending}, timeout=timeout)
+
+            if not done:
+                if buffer:
+                    yield encode_event({"delta": "".join(buffer), "done": False})
+                    buffer, buffered = [], 0
+                else:
+                    yield HEARTBEAT_FRAME
+                continue
+
+            try:
+                delta = pending.result()
+            except StopAsyncIteration:
+                break
+            finally:
+                pending = None
+
+            if not delta:
+                continue
+            if not buffer:
+                first_buffered_at = time.monotonic()
+            buffer.append(delta)
+            buffered += len(delta)
+            if buffered >= frame_chars:
+                yield encode_event({"delta": "".join(buffer), "done": False})
+                buffer, buffered = [], 0
+
+        if buffer:
+            yield encode_event({"delta": "".join(buffer), "done": False})
+            buffer, buffered = [], 0
+        if done_fields is not None:
+            final_fields.update(done_fields())
+        yield done_frame(**final_fields)
+    except Exception as e:
+        logger.error(f"Error in streaming: {e}")
+        if buffer:
+            yield encode_event({"delta": "".join(buffer), "done": False})
+        yield error_frame("Streaming error")
+    finally:
+        if pending is not None:
+            pending.cancel()
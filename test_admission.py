@@ -0,0 +1,183 @@
+"""Tests for admission: priority order, rejections under overload and cancelled waiters"""
+
+import asyncio
+
+import pytest
+
+import admission
+
+
+@pytest.fixture(autouse=True)
+def keep_gauges():
+    # Each controller points the queue/active gauges at itself; put the server's back
+    saved = admission.QUEUE_DEPTH._function, admission.ACTIVE_SLOTS._function
+    yield
+    admission.QUEUE_DEPTH._function, admission.ACTIVE_SLOTS._function = saved
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+async def settle():
+    for _ in range(5):
+        await asyncio.sleep(0)
+
+
+def test_waiters_are_served_by_priority_then_arrival():
+    async def scenario():
+        controller = admission.AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=60.0)
+        await controller.acquire(admission.PRIORITY_HIGH)
+        order = []
+
+        async def request(name, priority):
+            await controller.acquire(priority)
+            order.append(name)
+            controller.release()
+
+        tasks = []
+        for name, priority in [("low", admission.PRIORITY_LOW), ("normal-1", admission.PRIORITY_NORMAL),
+                               ("high", admission.PRIORITY_HIGH), ("normal-2", admission.PRIORITY_NORMAL)]:
+            tasks.append(asyncio.create_task(request(name, priority)))
+            await settle()
+        assert controller.queue_depth() == 4
+        controller.release()
+        await asyncio.gather(*tasks)
+        return order, controller.stats()
+
+    order, stats = run(scenario())
+    assert order == ["high", "normal-1", "normal-2", "low"]
+    assert stats["active"] == 0 and stats["queue_depth"] == 0 and stats["admitted"] == 5
+
+
+def test_full_queue_rejects_with_retry_after():
+    async def scenario():
+        controller = admission.AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=60.0)
+        await controller.acquire()
+        waiter = asyncio.create_task(controller.acquire(admission.PRIORITY_NORMAL))
+        await settle()
+        with pytest.raises(admission.AdmissionRejected) as rejected:
+            await controller.acquire(admission.PRIORITY_NORMAL)
+        waiter.cancel()
+        return rejected.value, controller
+
+    rejected, controller = run(scenario())
+    assert rejected.reason == "queue_full"
+    assert int(rejected.retry_after_header) >= 1
+    assert controller.rejected == 1
+
+
+def test_higher_priority_sheds_the_lowest_waiter():
+    async def scenario():
+        controller = admission.AdmissionController(max_concurrency=1, max_queue=1, queue_timeout=60.0)
+        await controller.acquire()
+        background = asyncio.create_task(controller.acquire(admission.PRIORITY_BACKGROUND))
+        await settle()
+        urgent = asyncio.create_task(controller.acquire(admission.PRIORITY_HIGH))
+        await settle()
+        with pytest.raises(admission.AdmissionRejected) as shed:
+            await background
+        controller.release()
+        await urgent
+        return shed.value
+
+    assert run(scenario()).reason == "shed"
+
+
+def test_expected_wait_past_the_deadline_is_rejected_up_front():
+    async def scenario():
+        controller = admission.AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=60.0)
+        await controller.acquire()
+        with pytest.raises(admission.AdmissionRejected) as no_wait:
+            await controller.acquire(admission.PRIORITY_BACKGROUND, timeout=0.0)
+        return no_wait.value
+
+    assert run(scenario()).reason == "deadline"
+
+
+def test_waiter_still_queued_at_its_deadline_is_rejected():
+    async def scenario():
+        controller = admission.AdmissionController(max_concurrency=1, max_queue=10)
+        controller._service_time = 0.001
+        await controller.acquire()
+        with pytest.raises(admission.AdmissionRejected) as late:
+            await controller.acquire(timeout=0.05)
+        return late.value, controller.stats()
+
+    late, stats = run(scenario())
+    assert late.reason == "timeout"
+    assert stats["queue_depth"] == 0 and stats["active"] == 1
+
+
+def test_cancelled_waiter_gives_up_its_place():
+    async def scenario():
+        controller = admission.AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=60.0)
+        await controller.acquire()
+        first = asyncio.create_task(controller.acquire(admission.PRIORITY_HIGH))
+        await settle()
+        second = asyncio.create_task(controller.acquire(admission.PRIORITY_NORMAL))
+        await settle()
+        first.cancel()
+        await settle()
+        assert controller.queue_depth() == 1
+        controller.release()
+        await asyncio.wait_for(second, 1.0)
+        stats = controller.stats()
+        controller.release()
+        return first, stats, controller.stats()
+
+    first, held, after = run(scenario())
+    assert first.cancelled()
+    assert held["active"] == 1 and held["queue_depth"] == 0
+    assert after["active"] == 0
+
+
+def test_waiter_cancelled_after_being_handed_a_slot_returns_it():
+    async def scenario():
+        controller = admission.AdmissionController(max_concurrency=1, max_queue=10, queue_timeout=60.0)
+        await controller.acquire()
+
+        async def request():
+            async with controller.slot():
+                await asyncio.sleep(60)
+
+        waiter = asyncio.create_task(request())
+        await settle()
+        controller.release()  # hands the slot to the waiter...
+        waiter.cancel()       # ...which goes away before it resumes
+        await settle()
+        return controller.stats()
+
+    assert run(scenario())["active"] == 0
+
+
+def test_slot_releases_on_error():
+    async def scenario():
+        controller = admission.AdmissionController(max_concurrency=1)
+        with pytest.raises(RuntimeError):
+            async with controller.slot():
+                raise RuntimeError("graph failed")
+        return controller.stats()
+
+    assert run(scenario())["active"] == 0
+
+
+def test_chat_returns_503_with_retry_after_when_the_queue_is_full(monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import api_server
+
+    full = admission.AdmissionController(max_concurrency=1, max_queue=0)
+    full._active = 1
+
+    async def graph_ready():
+        return True
+
+    monkeypatch.setattr(admission, "controller", full)
+    monkeypatch.setattr(api_server, "_ensure_graph", graph_ready)
+    monkeypatch.setattr(api_server, "_log_request", lambda record: None)
+    response = TestClient(api_server.app).post(
+        "/api/chat", json={"messages": [{"role": "user", "content": "an uncached question for the queue test"}]})
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert full.stats()["rejected"] == 1
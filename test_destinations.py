@@ -0,0 +1,41 @@
+"""Tests for destinations: which questions are answered directly from the index"""
+
+import pytest
+
+import destinations
+
+
+def ask(text):
+    return destinations.direct_answer([{"role": "user", "content": text}])
+
+
+@pytest.mark.parametrize("text, heading", [
+    ("best time to visit Paris", "Best time to visit Paris"),
+    ("When should I visit Rome?", "Best time to visit Rome"),
+    ("things to do in Tokyo", "Top things to do in Tokyo"),
+    ("What are the top attractions in Rome?", "Top things to do in Rome"),
+    ("how expensive is Bali", "daily spend per person in Bali"),
+    ("how much does a day in Paris cost", "daily spend per person in Paris"),
+    ("What's the IATA code for Paris?", "IATA city code"),
+    ("cities near Paris", "Destinations near Paris"),
+])
+def test_plain_questions_are_answered(text, heading):
+    answer = ask(text)
+    assert answer is not None and heading in answer
+
+
+@pytest.mark.parametrize("text", [
+    "what to do if I lose my passport in Paris",
+    "things to do in Paris with kids on a rainy day",
+    "What to see in Paris in winter?",
+    "best time to visit Paris for skiing",
+    "things to do in Paris or Rome",
+    "plan 3 days in Paris",
+    "tell me about Paris",
+])
+def test_questions_with_more_to_them_go_to_the_agent(text):
+    assert ask(text) is None
+
+
+def test_only_user_turns_are_answered():
+    assert destinations.direct_answer([{"role": "assistant", "content": "things to do in Tokyo"}]) is None
@@ -0,0 +1,131 @@
+"""Tests for itinerary: edit parsing, "add" edits and versioned saves"""
+
+import pytest
+
+import itinerary
+
+
+def day(*names):
+    return {"activities": [{"name": name} for name in names]}
+
+
+COMPONENTS = [day("Louvre Museum", "Eiffel Tower"), day("Le Marais"), day("Notre-Dame Cathedral")]
+
+
+@pytest.mark.parametrize("instruction, days, action", [
+    ("tell me more about day 2", None, None),
+    ("what is there to eat on day 3?", None, None),
+    ("more museums on day 2", None, None),
+    ("is day 1 too busy", None, None),
+    ("add a museum to day 3", [2], "add"),
+    ("please remove the Eiffel Tower", [0], "remove"),
+    ("can you make day 2 cheaper", [1], "cheaper"),
+    ("make it cheaper", [0, 1, 2], "cheaper"),
+    ("swap Le Marais for something else", [1], "replace"),
+    ("let's relax the last day", [2], "relax"),
+    ("thanks! now rewrite day 1", [0], "rewrite"),
+    # Questions about things the day plans don't hold
+    ("can you change my flight to the day 2 evening one?", None, None),
+    ("update me on the weather for day 2", None, None),
+    ("change the hotel for the last day", None, None),
+    # A replacement names a stop or the kind of stop
+    ("change day 2", None, None),
+    ("replace a museum on day 1 with a park", [0], "replace"),
+])
+def test_parse_edit(instruction, days, action):
+    parsed = itinerary.parse_edit(instruction, COMPONENTS)
+    if action is None:
+        assert parsed is None
+    else:
+        assert (parsed["days"], parsed["action"]) == (days, action)
+
+
+@pytest.mark.parametrize("instruction, clear", [
+    ("skip day 3", True),
+    ("please remove the last day", True),
+    ("drop the whole of day 2", True),
+    ("remove the last stop on day 1", False),
+    ("remove the Eiffel Tower on day 1", False),
+])
+def test_removing_a_day_clears_it(instruction, clear):
+    parsed = itinerary.parse_edit(instruction, COMPONENTS)
+    assert parsed["action"] == "remove"
+    assert parsed.get("clear", False) == clear
+
+
+@pytest.mark.parametrize("text, budget, currency", [
+    ("5 days in Bangkok, budget 30000 THB", 30000.0, "THB"),
+    ("Tokyo for 4 days with JPY 200,000", 200000.0, "JPY"),
+    ("Paris, 3 days, €1,500", 1500.0, "EUR"),
+    ("Paris for 3 days, 2000 usd", 2000.0, "USD"),
+    ("Paris for 3 days, top 10 sights", None, "USD"),
+    ("Paris for 3 days, 2 day trips", None, "USD"),
+])
+def test_budget_currency_from_text(text, budget, currency, monkeypatch):
+    monkeypatch.setattr("pricing.DEFAULT_CURRENCY", "USD")
+    trip = itinerary.parse_trip_request({"messages": [{"role": "user", "content": text}]})
+    assert (trip["budget"], trip["currency"]) == (budget, currency)
+
+
+def test_default_budget_covers_the_requested_hotel():
+    trip = itinerary.parse_trip_request({"destination": "Paris", "days": 3, "hotel_price_per_night": 250})
+    header, days = itinerary.plan_skeleton(trip)
+    assert header["hotel"]["nights"] == 2
+    assert header["budget"]["hotel"] == 500.0
+    assert len(days) == 3
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    test_store = itinerary.ItineraryStore(str(tmp_path / "itineraries.db"))
+    monkeypatch.setattr(itinerary, "_store", test_store)
+    monkeypatch.setattr(itinerary, "_model_label", lambda: "demo-mode")
+    return test_store
+
+
+def test_save_rejects_stale_versions(store):
+    assert store.save("trip", None, {"v": 1}, ["a"]) == 1
+    assert store.save("trip", None, {"v": 2}, ["b"], expected_version=1) == 2
+    with pytest.raises(itinerary.VersionConflict):
+        store.save("trip", None, {"v": 3}, ["c"], expected_version=1)
+    with pytest.raises(itinerary.VersionConflict):
+        store.save("trip", None, {"v": 1}, ["a"])
+    assert store.load("trip")[1:3] == (["b"], 2)
+
+
+def _generate(trip_request):
+    trip = itinerary.parse_trip_request(trip_request)
+    return list(itinerary.generate(trip))[-1]["itinerary"]
+
+
+def test_add_edit_brings_in_a_new_stop(store):
+    trip = _generate({"destination": "Paris", "days": 1, "budget": 3000})
+    before = [a["name"] for a in trip["days"][0]["activities"]]
+    assert "Musée d'Orsay" not in before or "Louvre Museum" not in before
+
+    done = list(itinerary.edit(trip["id"], "add a museum to day 1"))[-1]
+    after = [a["name"] for a in done["itinerary"]["days"][0]["activities"]]
+    added = set(after) - set(before)
+    assert added and added <= {"Louvre Museum", "Musée d'Orsay"}
+    assert done["itinerary"]["version"] == 2
+
+
+def test_edit_keeps_a_concurrent_edit_to_another_day(store):
+    trip = _generate({"destination": "Paris", "days": 3, "budget": 3000})
+    first = itinerary.edit(trip["id"], "remove the last stop on day 1")
+    second = itinerary.edit(trip["id"], "remove the last stop on day 3")
+    # Both edits load version 1 before either saves
+    next(first), next(second)
+    done_first = list(first)[-1]
+    done_second = list(second)[-1]
+    assert done_second["itinerary"]["version"] == 3
+    days = done_second["itinerary"]["days"]
+    assert days[0]["activities"] == done_first["itinerary"]["days"][0]["activities"]
+    assert len(days[2]["activities"]) == len(trip["days"][2]["activities"]) - 1
+
+
+def test_skip_day_empties_that_day_only(store):
+    trip = _generate({"destination": "Paris", "days": 3, "budget": 3000})
+    done = list(itinerary.edit(trip["id"], "skip day 3"))[-1]["itinerary"]
+    assert done["days"][2]["activities"] == []
+    assert done["days"][:2] == trip["days"][:2]
@@ -0,0 +1,69 @@
+"""Tests for itinerary_optimizer: budgets, hotel nights and day schedules"""
+
+import pytest
+
+import itinerary_optimizer
+
+CENTER = {"lat": 48.8566, "lon": 2.3522}
+POIS = [
+    {"name": "Louvre Museum", "lat": 48.8606, "lon": 2.3376, "hours": 3.0, "cost": 22.0},
+    {"name": "Eiffel Tower", "lat": 48.8584, "lon": 2.2945, "hours": 2.0, "cost": 29.0},
+    {"name": "Notre-Dame Cathedral", "lat": 48.8530, "lon": 2.3499, "hours": 1.0, "cost": 0.0},
+    {"name": "Le Marais", "lat": 48.8590, "lon": 2.3620, "hours": 2.0, "kind": "neighbourhood"},
+    {"name": "Montmartre", "lat": 48.8867, "lon": 2.3431, "hours": 2.5, "kind": "neighbourhood"},
+    {"name": "Musée d'Orsay", "lat": 48.8600, "lon": 2.3266, "hours": 2.5, "kind": "museum"},
+]
+HOTELS = [
+    {"name": "Central", "lat": 48.8570, "lon": 2.3500, "price_per_night": 200.0},
+    {"name": "Budget", "lat": 48.8300, "lon": 2.2500, "price_per_night": 90.0},
+]
+
+
+@pytest.mark.parametrize("days, nights", [(1, 0), (2, 1), (4, 3)])
+def test_hotel_nights_are_one_fewer_than_days(days, nights):
+    plan = itinerary_optimizer.optimize(POIS, days, 5000.0, hotels=HOTELS)
+    assert plan["budget"]["nights"] == nights
+    if nights:
+        assert plan["hotel"] is not None
+        assert plan["budget"]["hotel"] == nights * plan["hotel"]["price_per_night"]
+    else:
+        assert plan["hotel"] is None and plan["budget"]["hotel"] == 0.0
+
+
+def test_day_trip_budget_is_not_spent_on_a_hotel():
+    # 100 USD covers the day's entry fees but not a night at either hotel
+    plan = itinerary_optimizer.optimize(POIS, 1, 100.0, hotels=HOTELS, center=CENTER)
+    assert plan["hotel"] is None
+    assert plan["budget"]["planned"] <= 100.0
+    assert plan["days"][0]["stops"]
+
+
+def test_unaffordable_hotels_are_infeasible():
+    with pytest.raises(itinerary_optimizer.InfeasiblePlan):
+        itinerary_optimizer.optimize(POIS, 3, 150.0, hotels=HOTELS)
+
+
+def test_days_fit_their_hours_and_the_budget():
+    plan = itinerary_optimizer.optimize(POIS, 2, 800.0, hotels=HOTELS, hours_per_day=6.0, daily_spend=50.0)
+    assert len(plan["days"]) == 2
+    for day in plan["days"]:
+        assert day["activity_hours"] + day["travel_hours"] <= 6.0
+    scheduled = [stop["name"] for day in plan["days"] for stop in day["stops"]]
+    assert len(scheduled) == len(set(scheduled))
+    assert set(scheduled) | set(plan["unscheduled"]) == {p["name"] for p in POIS}
+    assert plan["budget"]["planned"] <= 800.0
+    assert plan["budget"]["daily_spend"] == 100.0
+
+
+def test_invalid_requests_are_rejected():
+    with pytest.raises(ValueError):
+        itinerary_optimizer.optimize(POIS, 0, 1000.0)
+    with pytest.raises(ValueError):
+        itinerary_optimizer.optimize([], 2, 1000.0)
+
+
+def test_format_plan_counts_nights():
+    plan = itinerary_optimizer.optimize(POIS, 2, 5000.0, hotels=HOTELS)
+    assert "for 1 night\n" in itinerary_optimizer.format_plan(plan)
+    day_trip = itinerary_optimizer.format_plan(itinerary_optimizer.optimize(POIS, 1, 5000.0, hotels=HOTELS))
+    assert "Hotel:" not in day_trip
@@ -0,0 +1,72 @@
+"""Tests for offer_index: refinement parsing and offer formatting"""
+
+import numpy as np
+import pytest
+
+import offer_index
+import pricing
+
+HOTELS = offer_index.KIND_HOTELS
+FLIGHTS = offer_index.KIND_FLIGHTS
+DEFAULT = pricing.DEFAULT_CURRENCY
+
+
+@pytest.mark.parametrize("text, expected", [
+    # Prices need a currency or a price word
+    ("under $150", {"max_price": 150.0, "currency": "USD", "kind": HOTELS}),
+    ("4-star under €150", {"max_price": 150.0, "currency": "EUR", "min_rating": 4.0, "kind": HOTELS}),
+    ("hotels below 200 eur", {"max_price": 200.0, "currency": "EUR", "kind": HOTELS}),
+    ("max usd 1,200", {"max_price": 1200.0, "currency": "USD", "kind": HOTELS}),
+    ("up to 90 euros", {"max_price": 90.0, "currency": "EUR", "kind": HOTELS}),
+    ("price under 120", {"max_price": 120.0, "currency": DEFAULT, "kind": HOTELS}),
+    ("something cheaper than 80", {"max_price": 80.0, "currency": DEFAULT, "kind": HOTELS}),
+    ("under 150 per night", {"max_price": 150.0, "currency": DEFAULT, "kind": HOTELS}),
+    ("under 200", None),
+    # Numbers that count something else are not prices
+    ("up to 4 stars", None),
+    ("at most 2 adults", None),
+    ("under 3 nights please", None),
+    ("at least 4 stars", {"min_rating": 4.0, "kind": HOTELS}),
+    ("5★ only", {"min_rating": 5.0, "kind": HOTELS}),
+    # Departure filters only apply to flights
+    ("flights after 6pm", {"depart_after": 1080, "kind": FLIGHTS}),
+    ("morning flights", {"depart_after": 300, "depart_before": 719, "kind": FLIGHTS}),
+    ("anything before 9:30", {"depart_before": 570, "kind": FLIGHTS}),
+    ("hotels for tomorrow morning under 200", None),
+    ("hotels for tomorrow morning under $200", {"max_price": 200.0, "currency": "USD", "kind": HOTELS}),
+    ("best rated", {"sort": "rating", "kind": HOTELS}),
+    ("cheapest flight", {"sort": "price", "kind": FLIGHTS}),
+    ("tell me about paris", None),
+])
+def test_parse_refinement(text, expected):
+    assert offer_index.parse_refinement(text) == expected
+
+
+def _hotels(prices, currencies):
+    return offer_index.OfferSet(
+        offer_index.search_key(HOTELS, "PAR", "2025-06-01", "2025-06-03", 1),
+        labels=[f"Hotel {i}" for i in range(len(prices))],
+        price_usd=pricing.convert_many(prices, currencies, "USD"),
+        rating=[4.0] * len(prices),
+        departure=[0] * len(prices),
+        amount=prices,
+        currency=currencies,
+    )
+
+
+def test_format_offers_masks_missing_prices():
+    offers = _hotels([100.0, np.nan, 50.0], ["USD", "USD", "XXX"])
+    text = offer_index.format_offers(offers, np.arange(3), "USD")
+    assert "nan" not in text.lower()
+    assert text.splitlines() == [
+        "Hotel 0 (4★) - $100.00 total",
+        "Hotel 1 (4★) - price unavailable",
+        "Hotel 2 (4★) - price unavailable",
+    ]
+
+
+def test_format_offers_notes_conversion():
+    offers = _hotels([100.0], ["EUR"])
+    text = offer_index.format_offers(offers, np.arange(1), "USD")
+    assert "(€100.00)" in text
+    assert "Prices converted to USD" in text
@@ -0,0 +1,89 @@
+"""Tests for pricing: vectorized conversion, ranking and the refresh policy"""
+
+import numpy as np
+import pytest
+
+import pricing
+
+
+@pytest.fixture
+def fx(monkeypatch):
+    fx_table = pricing.FxTable({"USD": 1.0, "EUR": 0.5, "JPY": 100.0}, "2025-01-01")
+    monkeypatch.setattr(pricing, "_table", fx_table)
+    monkeypatch.setattr(pricing, "FX_URL", "")
+    monkeypatch.setattr(pricing, "_next_refresh_at", 0.0)
+    return fx_table
+
+
+def test_convert_many_handles_mixed_and_unknown_currencies(fx):
+    converted = fx.convert_many([10.0, 5.0, 1000.0, 7.0, 3.0], ["USD", "eur", "JPY", "XXX", None], "EUR")
+    np.testing.assert_allclose(converted[[0, 1, 2, 4]], [5.0, 5.0, 5.0, 1.5])
+    assert np.isnan(converted[3])
+
+
+def test_convert_many_of_nothing_is_empty(fx):
+    converted = fx.convert_many([], [], "EUR")
+    assert converted.shape == (0,)
+    with pytest.raises(pricing.UnknownCurrency):
+        fx.convert_many([], [], "XXX")
+
+
+def test_rank_filters_and_sorts_in_the_target_currency(fx):
+    order, converted = pricing.rank([30.0, 10.0, 2000.0, 1.0], ["USD", "EUR", "JPY", "XXX"],
+                                    "USD", max_price=25.0)
+    assert order.tolist() == [1, 2]
+    np.testing.assert_allclose(converted[:3], [30.0, 20.0, 20.0])
+    order, _ = pricing.rank([], [], "USD")
+    assert order.tolist() == []
+
+
+def test_format_price():
+    assert pricing.format_price(1234.5, "USD") == "$1,234.50"
+    assert pricing.format_price(99, "eur") == "€99.00"
+    assert pricing.format_price(1250000, "IDR") == "IDR 1,250,000"
+    assert pricing.format_price(1234.5, "USD", whole=True) == "$1,234"
+
+
+def test_snapshot_is_used_without_refreshing_unless_a_url_is_set(fx, monkeypatch):
+    started = []
+    monkeypatch.setattr(pricing, "_start_refresh", lambda: started.append(True))
+    assert fx.fetched_at == 0.0
+    assert pricing.table() is fx
+    assert pricing.convert(10.0, "USD", "EUR") == 5.0
+    assert not started
+
+    monkeypatch.setattr(pricing, "FX_URL", "http://fx.invalid/latest")
+    pricing.table()
+    assert started
+
+
+def test_failed_refresh_backs_off_without_touching_the_table_age(fx, monkeypatch):
+    import requests
+
+    def offline(url, timeout):
+        raise requests.ConnectionError("offline")
+
+    now = [1_700_000_000.0]
+    monkeypatch.setattr(pricing.time, "time", lambda: now[0])
+    monkeypatch.setattr(requests, "get", offline)
+    monkeypatch.setattr(pricing, "FX_URL", "http://fx.invalid/latest")
+    fx.fetched_at = now[0] - 2 * pricing.FX_REFRESH
+
+    assert pricing.refresh() is False
+    assert fx.fetched_at == now[0] - 2 * pricing.FX_REFRESH
+    assert pricing._next_refresh_at > now[0]
+
+    started = []
+    monkeypatch.setattr(pricing, "_start_refresh", lambda: started.append(True))
+    pricing.table()
+    assert not started
+    assert pricing.FX_AGE.collect()[()] == 2 * pricing.FX_REFRESH
+
+    now[0] = pricing._next_refresh_at
+    pricing.table()
+    assert started
+
+
+def test_bundled_snapshot_loads():
+    snapshot = pricing._load_file(pricing.SNAPSHOT_FILE, "snapshot")
+    assert snapshot is not None and snapshot.rate("USD", "USD") == 1.0
@@ -0,0 +1,157 @@
+"""Tests for resilience: circuit breaker state changes and hedged provider calls"""
+
+import threading
+
+import pytest
+
+import resilience
+import travel_light
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(resilience, "time", fake)
+    return fake
+
+
+@pytest.fixture
+def provider(request):
+    name = f"test-{request.node.name}"
+    yield name
+    resilience._breakers.pop(name, None)
+
+
+def failing():
+    raise ConnectionError("provider down")
+
+
+def test_breaker_opens_half_opens_and_closes(clock, provider):
+    cb = resilience._breakers[provider] = resilience.CircuitBreaker(
+        provider, failure_rate=0.5, min_calls=4, window=60.0, open_seconds=30.0)
+    cb.record(True)
+    cb.record(False)
+    cb.record(True)
+    assert cb.state == resilience.STATE_CLOSED  # too few calls to judge
+    cb.record(False)
+    assert cb.state == resilience.STATE_OPEN
+
+    with pytest.raises(resilience.CircuitOpen) as rejected:
+        resilience.call(provider, lambda: "not called")
+    assert rejected.value.retry_after == 30.0
+    clock.advance(29.0)
+    assert not cb.allow()
+    assert cb.retry_after() == 1.0
+
+    # After the cool-down one trial goes through; a failed trial reopens the breaker
+    clock.advance(1.0)
+    with pytest.raises(ConnectionError):
+        resilience.call(provider, failing)
+    assert cb.state == resilience.STATE_OPEN
+    assert cb.opened_at == clock.now
+
+    clock.advance(30.0)
+    assert cb.allow()
+    assert cb.state == resilience.STATE_HALF_OPEN
+    assert not cb.allow()  # only one trial at a time
+    cb.record(True)
+    assert cb.state == resilience.STATE_CLOSED
+    assert resilience.call(provider, lambda: "ok") == "ok"
+    assert cb.snapshot()["window_calls"] == 1
+
+
+def test_failure_results_count_against_the_breaker(clock, provider):
+    cb = resilience._breakers[provider] = resilience.CircuitBreaker(provider, min_calls=2)
+    for _ in range(2):
+        assert resilience.call(provider, lambda: 503, is_failure=lambda status: status >= 500) == 503
+    assert cb.state == resilience.STATE_OPEN
+
+
+def test_outcomes_outside_the_window_are_forgotten(clock, provider):
+    cb = resilience.CircuitBreaker(provider, failure_rate=0.5, min_calls=4, window=10.0)
+    for _ in range(3):
+        cb.record(False)
+    clock.advance(11.0)
+    cb.record(False)
+    assert cb.state == resilience.STATE_CLOSED
+    assert cb.snapshot()["window_calls"] == 1
+
+
+class SlowThenFast:
+    """First attempt blocks until released; later attempts answer at once"""
+
+    def __init__(self):
+        self.calls = 0
+        self.release = threading.Event()
+        self._lock = threading.Lock()
+
+    def __call__(self):
+        with self._lock:
+            self.calls += 1
+            attempt = self.calls
+        if attempt == 1:
+            self.release.wait(5.0)
+            return "primary"
+        return "hedge"
+
+
+def seeded_breaker(provider, p95):
+    cb = resilience._breakers[provider] = resilience.CircuitBreaker(provider)
+    for _ in range(20):
+        cb.record(True, p95)
+    assert cb.p95() == p95
+    return cb
+
+
+def test_slow_call_is_hedged_after_the_p95(provider):
+    seeded_breaker(provider, 0.05)
+    func = SlowThenFast()
+    try:
+        assert resilience.call(provider, func, hedge=True) == "hedge"
+    finally:
+        func.release.set()
+    assert func.calls == 2
+    assert resilience.HEDGED_REQUESTS.value(provider=provider, winner="hedge") == 1
+
+
+def test_call_answering_before_the_p95_is_not_hedged(provider):
+    seeded_breaker(provider, 1.0)
+    calls = []
+    assert resilience.call(provider, lambda: calls.append(1) or "primary", hedge=True) == "primary"
+    assert len(calls) == 1
+    assert resilience.HEDGED_REQUESTS.value(provider=provider, winner="primary") == 0
+
+
+@pytest.mark.parametrize("hedge, samples", [(False, 20), (True, 19)])
+def test_no_hedge_unless_asked_and_the_p95_is_known(provider, hedge, samples):
+    cb = resilience._breakers[provider] = resilience.CircuitBreaker(provider)
+    for _ in range(samples):
+        cb.record(True, 0.05)
+    func = SlowThenFast()
+    func.release.set()
+    assert resilience.call(provider, func, hedge=hedge) == "primary"
+    assert func.calls == 1
+
+
+@pytest.mark.parametrize("method, hedged", [("GET", True), ("POST", False), ("DELETE", False)])
+def test_only_get_provider_requests_are_hedged(monkeypatch, method, hedged):
+    seen = {}
+
+    def fake_call(provider, func, is_failure, hedge=False):
+        seen.update(provider=provider, hedge=hedge)
+        return "response"
+
+    monkeypatch.setattr(travel_light.resilience, "call", fake_call)
+    assert travel_light._http_request(method, "https://provider.invalid/v1/search", "amadeus") == "response"
+    assert seen == {"provider": "amadeus", "hedge": hedged}
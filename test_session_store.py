@@ -0,0 +1,135 @@
+"""Tests for session_store: write-through histories shared by several workers"""
+
+import pytest
+
+import session_store
+
+
+def msg(role, content):
+    return {"role": role, "content": content}
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "sessions.db")
+
+
+def test_replace_from_another_worker_is_not_spliced(db_path):
+    a = session_store.SessionStore(db_path)
+    b = session_store.SessionStore(db_path)
+    a.append("s", msg("user", "hi"), msg("assistant", "hello"))
+    assert len(b.history("s")) == 2
+
+    b.replace("s", [msg("user", "plan paris"), msg("assistant", "ok"), msg("user", "cheaper")])
+
+    assert [m["content"] for m in a.history("s")] == ["plan paris", "ok", "cheaper"]
+
+
+def test_append_from_another_worker_is_loaded(db_path):
+    a = session_store.SessionStore(db_path)
+    b = session_store.SessionStore(db_path)
+    a.append("s", msg("user", "hi"))
+    a.history("s")
+    b.append("s", msg("assistant", "hello"))
+    a.append("s", msg("user", "plan paris"))
+
+    expected = ["hi", "hello", "plan paris"]
+    assert [m["content"] for m in a.history("s")] == expected
+    assert [m["content"] for m in b.history("s")] == expected
+
+
+def test_every_write_bumps_generation(db_path):
+    store = session_store.SessionStore(db_path)
+    assert store.generation("s") == 0
+    store.append("s", msg("user", "hi"))
+    store.append("s", msg("assistant", "hello"))
+    assert store.generation("s") == 2
+    store.replace("s", [msg("user", "new")])
+    assert store.generation("s") == 3
+    assert session_store.SessionStore(db_path).generation("s") == 3
+
+
+def test_turn_appends_only_new_messages_and_skips_retries(db_path):
+    store = session_store.SessionStore(db_path)
+    store.turn("s", message="hi")
+    store.turn("s", message="hi")
+    assert store.length("s") == 1
+    history = store.turn("s", messages=[msg("user", "hi"), msg("assistant", "hello"), msg("user", "more")])
+    assert [m["content"] for m in history] == ["hi", "hello", "more"]
+    assert store.generation("s") == 2
+
+
+def test_shared_and_compressed_texts_round_trip(db_path):
+    store = session_store.SessionStore(db_path)
+    greeting = "Welcome aboard! " * 10
+    long_text = "a long answer " * 100
+    store.share(greeting)
+    store.append("s", msg("assistant", greeting), msg("assistant", long_text), msg("user", ["part"]))
+    contents = [m["content"] for m in session_store.SessionStore(db_path).history("s")]
+    assert contents == [greeting, long_text, ["part"]]
+
+
+def test_claimed_session_is_private_to_its_owner(db_path):
+    store = session_store.SessionStore(db_path)
+    assert store.claim("s", "key:alice")
+    assert store.claim("s", "key:alice")
+    assert not store.claim("s", "key:mallory")
+    assert store.allows("s", "key:alice")
+    assert not store.allows("s", "key:mallory")
+
+
+def test_unowned_sessions_stay_open(db_path):
+    store = session_store.SessionStore(db_path)
+    store.append("streamlit", msg("user", "hi"))
+    assert store.allows("streamlit", "key:alice")
+    assert store.claim("streamlit", "key:alice")
+    assert store.allows("unknown", "key:alice")
+
+
+def test_old_database_is_migrated(tmp_path):
+    import sqlite3
+
+    path = str(tmp_path / "old.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE sessions (id TEXT PRIMARY KEY, length INTEGER NOT NULL, "
+                 "created_at REAL NOT NULL, updated_at REAL NOT NULL)")
+    conn.close()
+    store = session_store.SessionStore(path)
+    store.append("s", msg("user", "hi"))
+    assert store.generation("s") == 1
+
+
+def test_unknown_sessions_are_not_kept_in_memory(db_path):
+    store = session_store.SessionStore(db_path)
+    for i in range(50):
+        assert store.history(f"probe-{i}") == [] and store.length(f"probe-{i}") == 0
+    assert store.stats()["in_memory"] == 0
+    assert not store.exists("probe-0")
+
+    store.append("s", msg("user", "hi"))
+    assert store.exists("s") and store.stats()["in_memory"] == 1
+    assert store.history("s") == [msg("user", "hi")]
+
+
+def test_session_deleted_by_another_worker_leaves_memory(db_path):
+    a = session_store.SessionStore(db_path)
+    a.append("s", msg("user", "hi"))
+    session_store.SessionStore(db_path).delete("s")
+    assert a.history("s") == []
+    assert a.stats()["in_memory"] == 0 and not a.exists("s")
+
+
+def test_session_endpoint_returns_404_for_unknown_sessions(db_path, monkeypatch):
+    from fastapi.testclient import TestClient
+
+    import api_server
+
+    store = session_store.SessionStore(db_path)
+    store.append("known", msg("user", "hi"))
+    monkeypatch.setattr(session_store, "_store", store)
+    client = TestClient(api_server.app)
+
+    assert client.get("/api/sessions/unknown").status_code == 404
+    assert store.stats()["in_memory"] == 1
+    body = client.get("/api/sessions/known").json()
+    assert body["length"] == 1 and body["messages"] == [msg("user", "hi")]
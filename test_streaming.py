@@ -0,0 +1,96 @@
+"""Tests for streaming: SSE frames, coalescing, heartbeats and error frames"""
+
+import asyncio
+import json
+
+import streaming
+
+
+def collect(source, **kwargs):
+    async def run():
+        return [frame async for frame in streaming.sse_stream(source, **kwargs)]
+    return asyncio.run(run())
+
+
+def events(frames):
+    """Parse every data frame with json.loads; comment frames are returned as None"""
+    parsed = []
+    for frame in frames:
+        assert frame.endswith(b"\n\n")
+        if frame.startswith(b":"):
+            parsed.append(None)
+            continue
+        assert frame.startswith(b"data: ")
+        parsed.append(json.loads(frame[len(b"data: "):-2].decode("utf-8")))
+    return parsed
+
+
+def text_of(parsed):
+    return "".join(event["delta"] for event in parsed if event and "delta" in event)
+
+
+async def deltas(items, delay=0.0):
+    for item in items:
+        if delay:
+            await asyncio.sleep(delay)
+        yield item
+
+
+TRICKY = ['He said "hi"', "line one\nline two", "tab\there \\ backslash", "Zürich → 東京 🚀", "</script>"]
+
+
+def test_tricky_text_survives_as_valid_json():
+    parsed = events(collect(deltas(TRICKY), frame_chars=1))
+    assert text_of(parsed) == "".join(TRICKY)
+    assert parsed[-1] == {"done": True}
+
+
+def test_complete_text_frames_are_valid_json():
+    body = streaming.encode_text_body("".join(TRICKY), frame_chars=7, model="demo")
+    parsed = events([frame + b"\n\n" for frame in body.split(b"\n\n") if frame])
+    assert text_of(parsed) == "".join(TRICKY)
+    assert all(len(event["delta"]) <= 7 for event in parsed[:-1])
+    assert parsed[-1] == {"done": True, "model": "demo"}
+
+
+def test_small_deltas_are_coalesced_by_size():
+    parsed = events(collect(deltas(["ab"] * 10), frame_chars=8, max_delay=10.0))
+    assert [event["delta"] for event in parsed[:-1]] == ["abababab", "abababab", "abab"]
+
+
+def test_slow_deltas_are_flushed_by_time():
+    parsed = events(collect(deltas(["a", "b", "c"], delay=0.05), frame_chars=1000, max_delay=0.01))
+    assert [event["delta"] for event in parsed[:-1]] == ["a", "b", "c"]
+
+
+def test_idle_source_gets_heartbeats():
+    frames = collect(deltas(["late"], delay=0.2), heartbeat_interval=0.05)
+    assert frames.count(streaming.HEARTBEAT_FRAME) >= 2
+    parsed = events(frames)
+    assert text_of(parsed) == "late" and parsed[-1] == {"done": True}
+
+
+def test_source_error_ends_with_error_frame_after_buffered_text():
+    async def failing():
+        yield "partial answer"
+        raise RuntimeError("provider went away")
+
+    parsed = events(collect(failing(), max_delay=10.0))
+    assert text_of(parsed) == "partial answer"
+    assert parsed[-1] == {"error": "Streaming error", "done": True}
+
+
+def test_done_fields_are_read_when_the_source_ends():
+    state = {}
+
+    async def source():
+        yield "answer"
+        state["usage"] = {"total_tokens": 42}
+
+    parsed = events(collect(source(), done_fields=lambda: {"usage": state["usage"]}, model="demo"))
+    assert parsed[-1] == {"done": True, "model": "demo", "usage": {"total_tokens": 42}}
+
+
+def test_plain_iterables_are_framed_whole():
+    parsed = events(collect(["a", "b"], done_fields=lambda: {"n": 2}))
+    assert parsed == [{"delta": "ab", "done": False}, {"done": True, "n": 2}]
@@ -0,0 +1,24 @@
+"""Tests for tracing: the OTLP file exporter writes out buffered spans on shutdown"""
+
+import json
+
+import tracing
+
+
+def test_shutdown_stops_the_writer_and_flushes_pending_spans(tmp_path):
+    path = tmp_path / "traces.jsonl"
+    exporter = tracing.OTLPFileExporter(str(path), flush_interval=3600.0)
+    span = tracing.Span("chat", "ab" * 16, None, "SERVER", {"http.route": "/api/chat"})
+    span.end_ns = span.start_ns + 1_000_000
+    exporter.export(span)
+    assert not path.exists()  # still buffered: the writer only wakes hourly
+
+    exporter.shutdown()
+    assert not exporter._thread.is_alive()
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    spans = [s for record in records for rs in record["resourceSpans"]
+             for scope in rs["scopeSpans"] for s in scope["spans"]]
+    assert [s["name"] for s in spans] == ["chat"]
+
+    exporter.shutdown()  # a second shutdown (lifespan, then worker exit) writes nothing more
+    assert len(path.read_text().splitlines()) == 1
@@ -0,0 +1,58 @@
+"""Tests for travel_light's provider tools: one cached search shared with the search tabs"""
+
+import pytest
+
+import fake_providers
+import search_service
+import travel_light
+
+
+@pytest.fixture(scope="module")
+def provider_url():
+    return fake_providers.start_in_thread()
+
+
+@pytest.fixture
+def providers(provider_url, monkeypatch):
+    for name in ("AMADEUS_BASE_URL", "AVIATIONSTACK_BASE_URL"):
+        monkeypatch.setenv(name, provider_url)
+    for name in ("AMADEUS_API_KEY", "AMADEUS_API_SECRET", "AVIATIONSTACK_API_KEY"):
+        monkeypatch.setenv(name, "fake")
+    monkeypatch.setattr(travel_light, "_provider_cache", {})
+    calls = []
+
+    def counted(func):
+        def wrapper(*args):
+            calls.append((func.__name__,) + args)
+            return func(*args)
+        wrapper.__name__ = func.__name__
+        return wrapper
+
+    monkeypatch.setattr(travel_light, "search_hotels", counted(travel_light.search_hotels))
+    monkeypatch.setattr(travel_light, "search_flight_route", counted(travel_light.search_flight_route))
+    return calls
+
+
+def test_hotel_tool_and_tab_share_one_search_in_any_currency(providers, monkeypatch):
+    monkeypatch.setattr("pricing.DEFAULT_CURRENCY", "USD")
+    in_euros = travel_light.hotel_search_tool("par", "2025-06-01", "2025-06-03", 1, "EUR")
+    in_dollars = travel_light.hotel_search_tool("PAR", "2025-06-01", "2025-06-03", 1)
+    tab = search_service.AmadeusHotels().search(
+        "hotels", {"city": "Paris", "check_in": "2025-06-01", "check_out": "2025-06-03"})
+
+    assert providers == [("search_hotels", "PAR", "2025-06-01", "2025-06-03", 1)]
+    assert "€" in in_euros.splitlines()[0] and "$" not in in_euros
+    assert "$" in in_dollars.splitlines()[0]
+    assert tab and tab[0]["price_usd"] > 0
+    assert travel_light.hotel_search_tool("PAR", "2025-06-01", "2025-06-03", 1, "XYZ").startswith(
+        "Unsupported currency")
+
+
+def test_flight_tool_searches_the_requested_route(providers):
+    result = travel_light.flight_search_tool("jfk", "lhr", "2025-06-01")
+    tab = search_service.AviationStackFlights().search(
+        "flights", {"origin": "JFK", "destination": "LHR", "date": "2025-06-01"})
+
+    assert providers == [("search_flight_route", "JFK", "LHR", "2025-06-01")]
+    assert result and not result.startswith(("Error", "Failed"))
+    assert tab and tab[0]["details"] == "JFK → LHR"
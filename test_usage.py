@@ -0,0 +1,143 @@
+"""Tests for usage: token budgets, per-session/per-client accounting and /api/usage scoping"""
+
+import pytest
+
+import usage
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_700_000_000.0
+
+    def time(self):
+        return self.now
+
+    def advance(self, seconds):
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    fake = FakeClock()
+    monkeypatch.setattr(usage, "time", fake)
+    return fake
+
+
+def tokens(total, calls=1):
+    return usage.Usage(input_tokens=total - total // 4, output_tokens=total // 4, total_tokens=total, calls=calls)
+
+
+def test_budget_is_checked_per_client_and_window(clock):
+    ledger = usage.UsageLedger(default_budget=1000, budget_window=3600.0, budgets={"key:partner": 5000})
+    ledger.check_budget("key:a")  # no usage yet
+    ledger.record("key:a", None, tokens(600), "gpt-4o-mini")
+    ledger.check_budget("key:a")
+    clock.advance(600.0)
+    ledger.record("key:a", None, tokens(400), "gpt-4o-mini")
+
+    with pytest.raises(usage.BudgetExceeded) as exceeded:
+        ledger.check_budget("key:a")
+    assert exceeded.value.client == "key:a"
+    assert exceeded.value.retry_after == 3000.0  # until the window that began with the first call ends
+
+    ledger.check_budget("key:b")
+    ledger.record("key:partner", None, tokens(1000), "gpt-4o-mini")
+    ledger.check_budget("key:partner")  # its own, larger budget
+
+    clock.advance(3000.0)
+    ledger.check_budget("key:a")  # a new window
+    assert ledger.snapshot(client="key:a")["client"]["window_tokens"] == 0
+
+
+def test_zero_budget_is_unlimited(clock):
+    ledger = usage.UsageLedger(default_budget=0)
+    ledger.record("key:a", None, tokens(10_000_000), "gpt-4o-mini")
+    ledger.check_budget("key:a")
+
+
+def test_usage_is_accounted_per_session_and_client(clock):
+    ledger = usage.UsageLedger()
+    cost = ledger.record("key:a", "s1", tokens(1000), "gpt-4o-mini")
+    assert cost == pytest.approx((750 * 0.15 + 250 * 0.60) / 1e6)
+    ledger.record("key:a", "s2", tokens(200), "gpt-4o-mini")
+    ledger.record("key:b", "s3", tokens(50), "unknown-model")
+    ledger.record_cache_hit("key:a", "s1", tokens(1000), "gpt-4o-mini")
+
+    scoped = ledger.snapshot(client="key:a", session="s1")
+    assert scoped["client"]["total_tokens"] == 1200
+    assert scoped["client"]["requests"] == 3 and scoped["client"]["cache_hits"] == 1
+    assert scoped["client"]["tokens_saved"] == 1000
+    assert scoped["session"]["total_tokens"] == 1000 and scoped["session"]["requests"] == 2
+    assert ledger.snapshot(session="s3")["session"]["cost_usd"] == 0.0
+
+    everything = ledger.snapshot()
+    assert everything["total"]["total_tokens"] == 1250
+    assert [client["id"] for client in everything["clients"]] == ["key:a", "key:b"]
+    assert everything["tracked_sessions"] == 3
+
+
+def test_oldest_accounts_are_dropped_past_the_limit(clock):
+    ledger = usage.UsageLedger(max_accounts=2)
+    for client in ("key:a", "key:b", "key:a", "key:c"):
+        ledger.record(client, None, tokens(10), "gpt-4o-mini")
+    assert {client["id"] for client in ledger.snapshot()["clients"]} == {"key:a", "key:c"}
+
+
+def test_usage_from_messages_sums_metadata():
+    class Message:
+        def __init__(self, metadata):
+            self.usage_metadata = metadata
+
+    total = usage.usage_from_messages([
+        Message({"input_tokens": 100, "output_tokens": 20, "total_tokens": 120,
+                 "input_token_details": {"cache_read": 64}}),
+        Message(None),
+        Message({"input_tokens": 30, "output_tokens": 10}),
+    ])
+    assert total.to_dict() == {"input_tokens": 130, "output_tokens": 30, "cached_tokens": 64,
+                               "total_tokens": 160, "calls": 2}
+
+
+@pytest.fixture
+def api(monkeypatch, tmp_path):
+    from fastapi.testclient import TestClient
+
+    import api_server
+    import session_store
+
+    ledger = usage.UsageLedger()
+    ledger.record(usage.client_id("alice-key", ""), "alice-session", tokens(300), "gpt-4o-mini")
+    ledger.record(usage.client_id("bob-key", ""), "bob-session", tokens(700), "gpt-4o-mini")
+    sessions = session_store.SessionStore(str(tmp_path / "sessions.db"))
+    sessions.claim("alice-session", usage.client_id("alice-key", ""))
+    sessions.claim("bob-session", usage.client_id("bob-key", ""))
+    monkeypatch.setattr(usage, "ledger", ledger)
+    monkeypatch.setattr(usage, "ADMIN_TOKEN", "admin-secret")
+    monkeypatch.setattr(session_store, "_store", sessions)
+    return TestClient(api_server.app)
+
+
+def test_usage_endpoint_shows_the_callers_own_usage(api):
+    alice = {"X-API-Key": "alice-key"}
+    body = api.get("/api/usage", headers=alice).json()
+    assert body["client"]["id"] == usage.client_id("alice-key", "")
+    assert body["client"]["total_tokens"] == 300
+    assert "clients" not in body and "total" not in body
+
+    assert api.get("/api/usage", params={"session": "alice-session"}, headers=alice).json()["session"][
+        "total_tokens"] == 300
+    other = usage.client_id("bob-key", "")
+    assert api.get("/api/usage", params={"client": other}, headers=alice).status_code == 403
+    assert api.get("/api/usage", params={"session": "bob-session"}, headers=alice).status_code == 403
+    assert api.get("/api/usage", headers={**alice, "X-Admin-Token": "wrong"}).json()["client"]["total_tokens"] == 300
+
+
+def test_usage_endpoint_shows_everything_to_the_admin(api):
+    admin = {"X-Admin-Token": "admin-secret"}
+    body = api.get("/api/usage", headers=admin).json()
+    assert body["total"]["total_tokens"] == 1000
+    assert len(body["clients"]) == 2
+    bob = api.get("/api/usage", params={"client": usage.client_id("bob-key", "")}, headers=admin).json()
+    assert bob["client"]["total_tokens"] == 700
+    assert api.get("/api/usage", params={"session": "bob-session"}, headers=admin).json()["session"][
+        "total_tokens"] == 700
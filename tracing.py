@@ -0,0 +1,422 @@
+"""
+Tracing Module - Lightweight OpenTelemetry-compatible spans for Travel Light
+
+Spans are propagated with contextvars (use wrap_context() when handing work to a
+thread pool) and exported to an in-process collector and, optionally, to an
+OTLP/JSON lines file for offline analysis.
+
+Configuration (environment):
+    TRACE_SAMPLE_RATE  - fraction of root spans to record (default 0.05)
+    TRACE_OTLP_FILE    - path of the OTLP/JSON lines file (disabled when unset)
+    TRACE_BUFFER_SIZE  - spans kept by the in-process collector (default 2048)
+"""
+
+import os
+import json
+import time
+import random
+import logging
+import threading
+import contextvars
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+SERVICE_NAME = "travel-light"
+
+# OTLP span kinds
+SPAN_KINDS = {"INTERNAL": 1, "SERVER": 2, "CLIENT": 3, "PRODUCER": 4, "CONSUMER": 5}
+STATUS_OK = 1
+STATUS_ERROR = 2
+
+
+class Span:
+    """A single timed operation within a trace"""
+
+    __slots__ = ("trace_id", "span_id", "parent_id", "name", "kind", "attributes",
+                 "start_ns", "end_ns", "status_code", "status_message", "sampled")
+
+    def __init__(self, name: str, trace_id: str, parent_id: Optional[str] = None,
+                 kind: str = "INTERNAL", attributes: Optional[Dict[str, Any]] = None):
+        self.trace_id = trace_id
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.attributes = dict(attributes) if attributes else {}
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status_code = 0
+        self.status_message = ""
+        self.sampled = True
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def record_exception(self, exc: BaseException):
+        self.status_code = STATUS_ERROR
+        self.status_message = f"{type(exc).__name__}: {exc}"
+
+    def end(self):
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+            _tracer.on_end(self)
+
+    @property
+    def duration_ms(self) -> float:
+        end_ns = self.end_ns or time.time_ns()
+        return (end_ns - self.start_ns) / 1e6
+
+    @property
+    def traceparent(self) -> str:
+        """W3C trace context header value for outbound calls"""
+        return f"00-{self.trace_id}-{self.span_id}-01"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "kind": self.kind,
+            "start_time_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "status": "ERROR" if self.status_code == STATUS_ERROR else "OK",
+            "status_message": self.status_message,
+        }
+
+    def to_otlp(self) -> Dict[str, Any]:
+        span = {
+            "traceId": self.trace_id,
+            "spanId": self.span_id,
+            "name": self.name,
+            "kind": SPAN_KINDS.get(self.kind, 1),
+            "startTimeUnixNano": str(self.start_ns),
+            "endTimeUnixNano": str(self.end_ns or self.start_ns),
+            "attributes": [_otlp_attribute(k, v) for k, v in self.attributes.items()],
+            "status": {"code": self.status_code or STATUS_OK, "message": self.status_message},
+        }
+        if self.parent_id:
+            span["parentSpanId"] = self.parent_id
+        return span
+
+
+class _NonRecordingSpan:
+    """Stand-in for unsampled work; carries the decision so children are dropped too"""
+
+    sampled = False
+    trace_id = ""
+    span_id = ""
+    traceparent = ""
+    duration_ms = 0.0
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def record_exception(self, exc: BaseException):
+        pass
+
+    def end(self):
+        pass
+
+
+_NON_RECORDING = _NonRecordingSpan()
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("tracing_current_span", default=None)
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    """Convert an attribute to its OTLP/JSON representation"""
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    if isinstance(value, float):
+        return {"key": key, "value": {"doubleValue": value}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+class InMemoryCollector:
+    """Bounded ring buffer of finished spans for in-process inspection"""
+
+    def __init__(self, max_spans: int = 2048):
+        self._spans: deque = deque(maxlen=max_spans)
+
+    def export(self, span: Span):
+        self._spans.append(span)
+
+    def recent(self, limit: int = 100, trace_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        spans = list(self._spans)
+        if trace_id:
+            spans = [s for s in spans if s.trace_id == trace_id]
+        return [s.to_dict() for s in spans[-limit:]]
+
+    def clear(self):
+        self._spans.clear()
+
+
+class OTLPFileExporter:
+    """Writes spans as OTLP/JSON lines from a background thread"""
+
+    def __init__(self, path: str, flush_interval: float = 1.0, max_batch: int = 512):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self._pending: deque = deque(maxlen=100_000)
+        self._start_thread()
+
+    def _start_thread(self):
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="otlp-file-exporter", daemon=True)
+        self._thread.start()
+
+    def after_fork(self):
+        """Threads do not survive fork(); restart the writer in the child"""
+        self._pending.clear()
+        self._start_thread()
+
+    def export(self, span: Span):
+        self._pending.append(span)
+        if len(self._pending) >= self.max_batch:
+            self._wakeup.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def shutdown(self, timeout: float = 5.0):
+        """Stop the writer thread and write out whatever spans are still pending"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        self.flush()
+
+    def flush(self):
+        batch = []
+        while self._pending:
+            batch.append(self._pending.popleft())
+        if not batch:
+            return
+        record = {
+            "resourceSpans": [{
+                "resource": {"attributes": [_otlp_attribute("service.name", SERVICE_NAME),
+                                            _otlp_attribute("process.pid", os.getpid())]},
+                "scopeSpans": [{
+                    "scope": {"name": "travel_light.tracing"},
+                    "spans": [span.to_otlp() for span in batch],
+                }],
+            }]
+        }
+        try:
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, separators=(",", ":")) + "\n")
+        except OSError as e:
+            logger.warning(f"Failed to write traces to {self.path}: {e}")
+
+
+class Tracer:
+    """Creates spans, applies sampling and fans finished spans out to exporters"""
+
+    def __init__(self, sample_rate: float, exporters: List[Any]):
+        self.sample_rate = sample_rate
+        self.exporters = exporters
+
+    def start(self, name: str, parent: Any = None, kind: str = "INTERNAL", **attributes):
+        """Start a span without activating it (for callback-driven instrumentation)"""
+        if parent is None:
+            parent = _current_span.get()
+        if parent is None:
+            # Head sampling: decide once at the root, children inherit the decision
+            if self.sample_rate <= 0 or random.random() >= self.sample_rate:
+                return _NON_RECORDING
+            return Span(name, f"{random.getrandbits(128):032x}", None, kind, attributes)
+        if not parent.sampled:
+            return _NON_RECORDING
+        return Span(name, parent.trace_id, parent.span_id, kind, attributes)
+
+    def on_end(self, span: Span):
+        for exporter in self.exporters:
+            try:
+                exporter.export(span)
+            except Exception as e:
+                logger.debug(f"Span export failed: {e}")
+
+
+class _ActiveSpan:
+    """Context manager that activates a span for the duration of a block"""
+
+    __slots__ = ("_name", "_kind", "_attributes", "_span", "_token")
+
+    def __init__(self, name: str, kind: str, attributes: Dict[str, Any]):
+        self._name = name
+        self._kind = kind
+        self._attributes = attributes
+
+    def __enter__(self):
+        self._span = _tracer.start(self._name, kind=self._kind, **self._attributes)
+        self._token = _current_span.set(self._span)
+        return self._span
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc is not None:
+            self._span.record_exception(exc)
+        _current_span.reset(self._token)
+        self._span.end()
+        return False
+
+
+collector = InMemoryCollector(int(os.getenv("TRACE_BUFFER_SIZE", "2048")))
+_exporters: List[Any] = [collector]
+if os.getenv("TRACE_OTLP_FILE"):
+    _exporters.append(OTLPFileExporter(os.environ["TRACE_OTLP_FILE"]))
+
+_tracer = Tracer(float(os.getenv("TRACE_SAMPLE_RATE", "0.05")), _exporters)
+
+
+def _after_fork_in_child():
+    for exporter in _exporters:
+        if hasattr(exporter, "after_fork"):
+            exporter.after_fork()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+
+def shutdown():
+    """Flush and stop the exporters (call before the process exits)"""
+    for exporter in _exporters:
+        if hasattr(exporter, "shutdown"):
+            exporter.shutdown()
+
+
+def start_span(name: str, kind: str = "INTERNAL", **attributes) -> _ActiveSpan:
+    """Open a span as the current span: ``with start_span("cache.get") as span: ...``"""
+    return _ActiveSpan(name, kind, attributes)
+
+
+def current_span():
+    """Return the active span (or a non-recording span)"""
+    return _current_span.get() or _NON_RECORDING
+
+
+def set_sample_rate(rate: float):
+    """Change the head-sampling rate at runtime"""
+    _tracer.sample_rate = max(0.0, min(1.0, rate))
+
+
+def get_sample_rate() -> float:
+    return _tracer.sample_rate
+
+
+def traced(name: Optional[str] = None, kind: str = "INTERNAL"):
+    """Decorator that wraps a function call in a span"""
+    def decorator(func: Callable) -> Callable:
+        span_name = name or func.__qualname__
+
+        def wrapper(*args, **kwargs):
+            with start_span(span_name, kind=kind):
+                return func(*args, **kwargs)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+
+def wrap_context(func: Callable) -> Callable:
+    """Bind the caller's context (active span included) to a callable run on another thread"""
+    context = contextvars.copy_context()
+
+    def wrapper(*args, **kwargs):
+        return context.run(func, *args, **kwargs)
+
+    return wrapper
+
+
+def langchain_callbacks() -> List[Any]:
+    """Callback handlers that emit spans for graph nodes, tools and model calls.
+
+    Returns an empty list when the current request is not sampled, so unsampled
+    requests pay nothing for graph instrumentation.
+    """
+    parent = _current_span.get()
+    if parent is None or not parent.sampled:
+        return []
+    return [_langchain_handler_class()(parent)]
+
+
+_handler_class = None
+
+
+def _langchain_handler_class():
+    """Build the LangChain callback handler class on first use"""
+    global _handler_class
+    if _handler_class is not None:
+        return _handler_class
+
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TracingCallbackHandler(BaseCallbackHandler):
+        """Maps LangChain run lifecycle events onto spans (runs may finish on other threads)"""
+
+        def __init__(self, root):
+            self.root = root
+            self.spans: Dict[Any, Any] = {}
+
+        def _start(self, run_id, parent_run_id, name: str, **attributes):
+            parent = self.spans.get(parent_run_id, self.root)
+            self.spans[run_id] = _tracer.start(name, parent=parent, **attributes)
+
+        def _end(self, run_id, error: Optional[BaseException] = None):
+            span = self.spans.pop(run_id, None)
+            if span is None:
+                return
+            if error is not None:
+                span.record_exception(error)
+            span.end()
+
+        def on_chain_start(self, serialized, inputs, *, run_id, parent_run_id=None, metadata=None, **kwargs):
+            node = (metadata or {}).get("langgraph_node")
+            name = kwargs.get("name") or (serialized or {}).get("name") or "chain"
+            self._start(run_id, parent_run_id, f"graph.node {node}" if node else f"chain {name}",
+                        **({"langgraph.node": node} if node else {}))
+
+        def on_chain_end(self, outputs, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_chain_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error)
+
+        def on_tool_start(self, serialized, input_str, *, run_id, parent_run_id=None, **kwargs):
+            name = (serialized or {}).get("name") or kwargs.get("name") or "tool"
+            self._start(run_id, parent_run_id, f"tool {name}", **{"tool.name": name})
+
+        def on_tool_end(self, output, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_tool_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error)
+
+        def on_chat_model_start(self, serialized, messages, *, run_id, parent_run_id=None, **kwargs):
+            self._start(run_id, parent_run_id, "llm.chat", kind="CLIENT",
+                        **{"llm.message_count": sum(len(batch) for batch in messages)})
+
+        def on_llm_start(self, serialized, prompts, *, run_id, parent_run_id=None, **kwargs):
+            self._start(run_id, parent_run_id, "llm.completion", kind="CLIENT")
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            self._end(run_id)
+
+        def on_llm_error(self, error, *, run_id, **kwargs):
+            self._end(run_id, error)
+
+    _handler_class = TracingCallbackHandler
+    return _handler_class
@@ -2,7 +2,7 @@
 Travel Graph Module - Imports the conversation graph from travel_light.py
 """
 
-from travel_light import build_conversation_graph
+from travel_light import build_conversation_graph, get_active_model
 
-# Re-export the function for the webpage
-__all__ = ['build_conversation_graph']
+# Re-export the functions for the webpage
+__all__ = ['build_conversation_graph', 'get_active_model']
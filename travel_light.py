@@ -1,159 +1,615 @@
 import os
-import requests
-from dotenv import load_dotenv
-
-# Load environment variables
-load_dotenv()
-
-# Check for OpenAI API key early
-if not os.getenv("OPENAI_API_KEY"):
-    print("⚠️  Warning: OPENAI_API_KEY not found. Running in demo mode.")
-    print("💡 To use the full AI version, set OPENAI_API_KEY in your .env file")
-    
-    # Demo mode - create simple functions that return demo data
-    def build_conversation_graph():
-        """Demo version of the conversation graph."""
-        class DemoGraph:
-            def invoke(self, state):
-                user_msg = state.get("messages", [])[-1] if state.get("messages") else {"content": ""}
-                content = user_msg.get("content", "").lower()
-                
-                if "bali" in content:
-                    return {
-                        "messages": [
-                            {"role": "assistant", "content": "🌴 Here's a 3-day budget trip to Bali:\n\nDay 1: Arrive in Bali, check into budget hostel in Kuta, explore Kuta Beach\nDay 2: Visit Sacred Monkey Forest in Ubud, explore Ubud Palace\nDay 3: Sunrise at Mount Batur, visit Tanah Lot Temple\n\nDoes this look good to you?"}
-                        ]
-                    }
-                else:
-                    return {
-                        "messages": [
-                            {"role": "assistant", "content": "🎯 I can help you plan trips! Try asking for a specific destination, like 'Plan a 3-day budget trip to Bali'"}
-                        ]
-                    }
-        
-        return DemoGraph()
-    
-    # Export the demo function
-    __all__ = ['build_conversation_graph']
-    
-else:
-    # Full AI mode - import the real components
-    from llm_provider import ACTIVE_LLM
-    from langgraph.prebuilt import create_react_agent
+import time
+import threading
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import metrics
+import ratelimit
+import resilience
+import tracing
+
+# Heavy dependencies (dotenv, requests, langgraph, langchain_openai) are imported on
+# first use so that importing this module - from the API server, the Streamlit app
+# or a freshly autoscaled worker - stays cheap.
+
+_env_loaded = False
+
+
+def load_environment():
+    """Load variables from .env once, on first use rather than at import time."""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def is_demo_mode() -> bool:
+    """True when no OpenAI key is configured and the demo graph should be used."""
+    load_environment()
+    return not os.getenv("OPENAI_API_KEY")
+
+
+def get_active_model() -> str:
+    """Name of the model behind the conversation graph (used as a metrics label)."""
+    if is_demo_mode():
+        return "demo-mode"
+    from llm_provider import get_model_name
+    return get_model_name()
+
+
+class DemoGraph:
+    """Demo version of the conversation graph."""
+
+    def invoke(self, state, config=None):
+        user_msg = state.get("messages", [])[-1] if state.get("messages") else {"content": ""}
+        content = user_msg.get("content", "").lower()
+
+        if "bali" in content:
+            return {
+                "messages": [
+                    {"role": "assistant", "content": "🌴 Here's a 3-day budget trip to Bali:\n\nDay 1: Arrive in Bali, check into budget hostel in Kuta, explore Kuta Beach\nDay 2: Visit Sacred Monkey Forest in Ubud, explore Ubud Palace\nDay 3: Sunrise at Mount Batur, visit Tanah Lot Temple\n\nDoes this look good to you?"}
+                ]
+            }
+        else:
+            return {
+                "messages": [
+                    {"role": "assistant", "content": "🎯 I can help you plan trips! Try asking for a specific destination, like 'Plan a 3-day budget trip to Bali'"}
+                ]
+            }
+
+
+PROVIDER_TIMEOUT = float(os.getenv("TRAVEL_LIGHT_PROVIDER_TIMEOUT", "10"))
+
+
+def _is_provider_failure(response) -> bool:
+    """Responses that count against a provider's circuit breaker."""
+    return response.status_code >= 500 or response.status_code == 429
+
+
+_http_local = threading.local()
+
+
+def _http_session() -> "requests.Session":
+    """Per-thread session so provider connections are kept alive and reused."""
+    session = getattr(_http_local, "session", None)
+    if session is None:
+        import requests
+        session = _http_local.session = requests.Session()
+    return session
+
+
+def _http_request(method: str, url: str, provider: str, **kwargs) -> "requests.Response":
+    """Make an outbound provider call inside a client span.
+
+    Calls go through the provider's circuit breaker (raising
+    resilience.CircuitOpen while it is open); GET lookups are hedged.
+    """
+    kwargs.setdefault("timeout", PROVIDER_TIMEOUT)
+
+    def attempt():
+        # Shared per-provider quota (chat, prefetch and batch traffic together)
+        bucket = ratelimit.limiter(provider)
+        if bucket is not None:
+            bucket.acquire()
+
+        with tracing.start_span(f"HTTP {method} {provider}", kind="CLIENT", **{
+            "http.method": method,
+            "peer.service": provider,
+            "http.url": url.split("?", 1)[0],
+        }) as span:
+            call_kwargs = kwargs
+            if span.sampled:
+                call_kwargs = {**kwargs, "headers": {**kwargs.get("headers", {}), "traceparent": span.traceparent}}
+            response = _http_session().request(method, url, **call_kwargs)
+            span.set_attribute("http.status_code", response.status_code)
+            return response
+
+    return resilience.call(provider, attempt, is_failure=_is_provider_failure, hedge=method == "GET")
+
 
-    AMADEUS_API_KEY = os.getenv("AMADEUS_API_KEY")
-    AMADEUS_API_SECRET = os.getenv("AMADEUS_API_SECRET")
-    AVIATIONSTACK_API_KEY = os.getenv("AVIATIONSTACK_API_KEY")
+# Provider results are cached briefly so repeated tool calls (and speculative
+# prefetches) for the same search don't hit the provider again. Expired results
+# are kept a while longer as a stale fallback for when the provider is down.
+PROVIDER_CACHE_TTL = float(os.getenv("TRAVEL_LIGHT_PROVIDER_CACHE_TTL", "600"))
+PROVIDER_STALE_TTL = float(os.getenv("TRAVEL_LIGHT_PROVIDER_STALE_TTL", "86400"))
+PROVIDER_CACHE_HITS = metrics.counter(
+    "travel_light_provider_cache_hits", "Provider searches served from cache", ("provider",)
+)
+PROVIDER_STALE_SERVED = metrics.counter(
+    "travel_light_provider_stale_served", "Stale provider results served while the provider failed", ("provider",)
+)
+_provider_cache: Dict[Tuple[Any, ...], Tuple[float, str]] = {}
+_provider_cache_lock = threading.Lock()
+_PROVIDER_CACHE_MAX = 1024
 
-    def get_amadeus_access_token():
-        """Obtain Amadeus API OAuth2 Access Token."""
-        url = "https://test.api.amadeus.com/v1/security/oauth2/token"
+
+def cached_provider_call(provider: str, func: Callable[..., str], *args) -> str:
+    """Call a provider search, reusing a recent successful result for the same arguments.
+
+    If the provider fails (or its circuit breaker is open) a stale result for
+    the same search is returned instead, marked with its age.
+    """
+    key = (provider, func.__name__) + args
+    now = time.time()
+    with _provider_cache_lock:
+        cached = _provider_cache.get(key)
+        if cached is not None and now - cached[0] < PROVIDER_CACHE_TTL:
+            PROVIDER_CACHE_HITS.inc(provider=provider)
+            return cached[1]
+
+    result = func(*args)
+    if result.startswith(("Error", "Failed")):
+        if cached is not None and now - cached[0] < PROVIDER_STALE_TTL:
+            PROVIDER_STALE_SERVED.inc(provider=provider)
+            minutes = int((now - cached[0]) // 60)
+            return f"{cached[1]}\n(Live search unavailable; showing results from {minutes} minutes ago.)"
+        return result
+    # Only cache real answers, not configuration or provider errors
+    if not result.startswith(("Amadeus API credentials", "AviationStack API key")):
+        with _provider_cache_lock:
+            if len(_provider_cache) >= _PROVIDER_CACHE_MAX:
+                expired = [k for k, (ts, _) in _provider_cache.items() if now - ts >= PROVIDER_STALE_TTL]
+                for k in expired or list(_provider_cache)[: _PROVIDER_CACHE_MAX // 4]:
+                    del _provider_cache[k]
+            _provider_cache[key] = (now, result)
+    return result
+
+
+def amadeus_base_url() -> str:
+    """Amadeus API root (AMADEUS_BASE_URL points it at e.g. the fake provider server)."""
+    return os.getenv("AMADEUS_BASE_URL", "https://test.api.amadeus.com").rstrip("/")
+
+
+def aviationstack_base_url() -> str:
+    """AviationStack API root (AVIATIONSTACK_BASE_URL overrides it)."""
+    return os.getenv("AVIATIONSTACK_BASE_URL", "http://api.aviationstack.com").rstrip("/")
+
+
+# OAuth2 tokens are valid for ~30 minutes; reuse one instead of fetching a new
+# token before every search. The fetch itself runs under a per-credential lock
+# (single flight) so a slow token endpoint doesn't block other credentials.
+_amadeus_tokens: Dict[Tuple[str, str], Tuple[float, str]] = {}
+_amadeus_fetch_locks: Dict[Tuple[str, str], threading.Lock] = {}
+_amadeus_token_lock = threading.Lock()
+
+
+def _amadeus_token_key() -> Tuple[str, str]:
+    return (amadeus_base_url(), os.getenv("AMADEUS_API_KEY") or "")
+
+
+def _cached_amadeus_token(cache_key: Tuple[str, str]) -> Optional[str]:
+    with _amadeus_token_lock:
+        cached = _amadeus_tokens.get(cache_key)
+    if cached is not None and time.monotonic() < cached[0]:
+        return cached[1]
+    return None
+
+
+def get_amadeus_access_token():
+    """Obtain Amadeus API OAuth2 Access Token."""
+    load_environment()
+    cache_key = _amadeus_token_key()
+    token = _cached_amadeus_token(cache_key)
+    if token is not None:
+        return token
+
+    with _amadeus_token_lock:
+        fetch_lock = _amadeus_fetch_locks.setdefault(cache_key, threading.Lock())
+    with fetch_lock:
+        # Another thread may have fetched the token while we waited
+        token = _cached_amadeus_token(cache_key)
+        if token is not None:
+            return token
+
+        url = f"{cache_key[0]}/v1/security/oauth2/token"
         payload = {
             'grant_type': 'client_credentials',
-            'client_id': AMADEUS_API_KEY,
-            'client_secret': AMADEUS_API_SECRET
+            'client_id': os.getenv("AMADEUS_API_KEY"),
+            'client_secret': os.getenv("AMADEUS_API_SECRET")
         }
-        response = requests.post(url, data=payload)
+        response = _http_request("POST", url, "amadeus", data=payload)
         if response.status_code == 200:
-            return response.json()["access_token"]
+            data = response.json()
+            expires_in = float(data.get("expires_in", 0))
+            if expires_in > 60:
+                with _amadeus_token_lock:
+                    _amadeus_tokens[cache_key] = (time.monotonic() + expires_in - 60, data["access_token"])
+            return data["access_token"]
         else:
             raise Exception(f"Failed to retrieve Amadeus token: {response.text}")
 
-    def search_hotels(city_code: str, check_in: str, check_out: str, adults: int = 1) -> str:
-        """Search hotels using Amadeus API based on city, dates, and number of adults."""
-        if not AMADEUS_API_KEY or not AMADEUS_API_SECRET:
-            return "Amadeus API credentials not configured. Please set AMADEUS_API_KEY and AMADEUS_API_SECRET in your .env file."
-        
-        try:
-            token = get_amadeus_access_token()
-            url = f"https://test.api.amadeus.com/v2/shopping/hotel-offers?cityCode={city_code}&checkInDate={check_in}&checkOutDate={check_out}&adults={adults}"
-            headers = {"Authorization": f"Bearer {token}"}
-            response = requests.get(url, headers=headers)
-            if response.status_code != 200:
-                return f"Failed to retrieve hotels: {response.text}"
-            hotels = response.json().get("data", [])
-            if not hotels:
-                return "No hotels found."
-            return "\n".join([
-                f"{h['hotel']['name']} - ${h['offers'][0]['price']['total']}"
-                for h in hotels[:3]
-            ])
-        except Exception as e:
-            return f"Error searching hotels: {str(e)}"
 
-    def hotel_search_tool(city_code: str, check_in: str, check_out: str, adults: int = 1) -> str:
-        """Retrieve hotel options for specified city and dates using Amadeus API."""
-        return search_hotels(city_code, check_in, check_out, adults)
+def invalidate_amadeus_token(token: str) -> None:
+    """Forget a cached token the provider rejected (401) so the next call fetches a new one."""
+    cache_key = _amadeus_token_key()
+    with _amadeus_token_lock:
+        cached = _amadeus_tokens.get(cache_key)
+        if cached is not None and cached[1] == token:
+            del _amadeus_tokens[cache_key]
+
+
+def search_hotels(city_code: str, check_in: str, check_out: str, adults: int = 1, currency: str = "") -> str:
+    """Search hotels using Amadeus API based on city, dates, and number of adults.
+
+    Offers are converted to `currency` (default TRAVEL_LIGHT_CURRENCY) and the
+    cheapest are listed first.
+    """
+    import offer_index
+    import pricing
+
+    load_environment()
+    currency = (currency or pricing.DEFAULT_CURRENCY).upper()
+    try:
+        pricing.table().position(currency)
+    except pricing.UnknownCurrency:
+        return f"Unsupported currency {currency}; use an ISO code such as USD or EUR."
+    if not os.getenv("AMADEUS_API_KEY") or not os.getenv("AMADEUS_API_SECRET"):
+        return "Amadeus API credentials not configured. Please set AMADEUS_API_KEY and AMADEUS_API_SECRET in your .env file."
+
+    try:
+        token = get_amadeus_access_token()
+        url = f"{amadeus_base_url()}/v2/shopping/hotel-offers?cityCode={city_code}&checkInDate={check_in}&checkOutDate={check_out}&adults={adults}"
+        headers = {"Authorization": f"Bearer {token}"}
+        response = _http_request("GET", url, "amadeus", headers=headers)
+        if response.status_code == 401:
+            # Token revoked or expired early: drop it and retry once with a fresh one
+            invalidate_amadeus_token(token)
+            headers = {"Authorization": f"Bearer {get_amadeus_access_token()}"}
+            response = _http_request("GET", url, "amadeus", headers=headers)
+        if response.status_code != 200:
+            metrics.PROVIDER_ERRORS.inc(provider="amadeus")
+            return f"Failed to retrieve hotels: {response.text}"
+        hotels = response.json().get("data", [])
+        if not hotels:
+            return "No hotels found."
+        # Keep the whole result set so follow-ups ("under $150", "4-star") are
+        # answered from the offer index instead of another search
+        offers = offer_index.hotel_offers(
+            offer_index.search_key(offer_index.KIND_HOTELS, city_code, check_in, check_out, adults), hotels
+        )
+        offer_index.index.put(offers)
+        positions = offers.query(min_price=0.0, limit=3)
+        if not len(positions):
+            return "No hotels found with a usable price."
+        return offer_index.format_offers(offers, positions, currency)
+    except resilience.CircuitOpen as e:
+        # Failed fast without calling the provider; not a new provider error
+        return f"Error searching hotels: {str(e)}"
+    except Exception as e:
+        metrics.PROVIDER_ERRORS.inc(provider="amadeus")
+        return f"Error searching hotels: {str(e)}"
+
+
+def hotel_search_tool(city_code: str, check_in: str, check_out: str, adults: int = 1, currency: str = "") -> str:
+    """Retrieve the cheapest hotel options for specified city and dates using Amadeus API,
+    with prices converted to `currency` (ISO code such as USD or EUR; default USD)."""
+    import offer_index
+    import pricing
+
+    city_code = city_code.strip().upper()
+    currency = (currency or pricing.DEFAULT_CURRENCY).upper()
+    try:
+        pricing.table().position(currency)
+    except pricing.UnknownCurrency:
+        return f"Unsupported currency {currency}; use an ISO code such as USD or EUR."
+    key = offer_index.search_key(offer_index.KIND_HOTELS, city_code, check_in, check_out, adults)
+    with metrics.timer(metrics.TOOL_SECONDS, tool="hotel_search_tool"):
+        # Cached in the default currency under the same key as the Hotels tab's search
+        result = cached_provider_call("amadeus", search_hotels, city_code, check_in, check_out, adults)
+        offer_index.index.remember(key)
+        offers = offer_index.index.get(key)
+        if currency != pricing.DEFAULT_CURRENCY and offers is not None:
+            positions = offers.query(min_price=0.0, limit=3)
+            listed = offer_index.format_offers(offers, positions, pricing.DEFAULT_CURRENCY)
+            if len(positions) and result.startswith(listed):
+                result = offer_index.format_offers(offers, positions, currency) + result[len(listed):]
+        return result
+
+
+# Route searched by search_flights(), which predates route arguments
+EXAMPLE_FLIGHT_ROUTE = ("JFK", "LHR", "2025-06-01")
+
+
+def search_flights(query: str) -> str:
+    """Search flights using AviationStack API (static example route)."""
+    return search_flight_route(*EXAMPLE_FLIGHT_ROUTE)
+
+
+def search_flight_route(source: str, destination: str, date: str) -> str:
+    """Search flights between two airports (IATA codes) on a date using AviationStack API."""
+    import offer_index
+
+    load_environment()
+    api_key = os.getenv("AVIATIONSTACK_API_KEY")
+    if not api_key:
+        return "AviationStack API key not configured. Please set AVIATIONSTACK_API_KEY in your .env file."
+
+    try:
+        url = f"{aviationstack_base_url()}/v1/flights?access_key={api_key}&dep_iata={source}&arr_iata={destination}&flight_date={date}"
+        response = _http_request("GET", url, "aviationstack")
+        if response.status_code != 200:
+            metrics.PROVIDER_ERRORS.inc(provider="aviationstack")
+            return f"Failed to fetch flight data: {response.text}"
+        flights = response.json().get('data', [])
+        if not flights:
+            return "No flights found."
+        offers = offer_index.flight_offers(
+            offer_index.search_key(offer_index.KIND_FLIGHTS, destination, source, date), flights
+        )
+        offer_index.index.put(offers)
+        return "\n".join(offers.labels[:3])
+    except resilience.CircuitOpen as e:
+        # Failed fast without calling the provider; not a new provider error
+        return f"Error searching flights: {str(e)}"
+    except Exception as e:
+        metrics.PROVIDER_ERRORS.inc(provider="aviationstack")
+        return f"Error searching flights: {str(e)}"
+
+
+def flight_search_tool(source: str, destination: str, date: str) -> str:
+    """Search for flights between two airports (IATA codes such as JFK and LHR) on a date
+    (YYYY-MM-DD) using AviationStack API."""
+    import offer_index
+
+    source, destination = source.strip().upper(), destination.strip().upper()
+    with metrics.timer(metrics.TOOL_SECONDS, tool="flight_search_tool"):
+        # Same cache entry as a search for this route from the Flights tab
+        result = cached_provider_call("aviationstack", search_flight_route, source, destination, date)
+        offer_index.index.remember(offer_index.search_key(offer_index.KIND_FLIGHTS, destination, source, date))
+        return result
+
+
+def refine_offers_tool(destination: str, kind: str = "hotels", max_price: float = 0.0, min_rating: float = 0.0,
+                       departure_after: str = "", departure_before: str = "", sort: str = "price",
+                       limit: int = 3, currency: str = "") -> str:
+    """Narrow the hotels or flights already found for a destination without searching again:
+    price cap (in `currency`), minimum star rating, departure window ("HH:MM") and
+    sort order (price, rating or departure). Use it for follow-ups like "under $150",
+    "only 4-star" or "morning flights" after hotel_search_tool/flight_search_tool.
+    """
+    import destinations
+    import offer_index
+    import pricing
 
-    def flight_search_tool(query: str) -> str:
-        """Search for flights using AviationStack API (static example)."""
-        if not AVIATIONSTACK_API_KEY:
-            return "AviationStack API key not configured. Please set AVIATIONSTACK_API_KEY in your .env file."
-        
+    with metrics.timer(metrics.TOOL_SECONDS, tool="refine_offers_tool"):
+        kind = offer_index.KIND_FLIGHTS if kind.lower().startswith("flight") else offer_index.KIND_HOTELS
+        dest = destinations.index().lookup(destination)
+        code = dest["code"] if dest is not None else destination
+        offers = offer_index.index.latest(kind=kind, destination=code) or offer_index.index.latest(kind=kind)
+        if offers is None:
+            return f"No recent {kind} search to refine; search first."
+        constraints: Dict[str, Any] = {"currency": currency or pricing.DEFAULT_CURRENCY, "sort": sort}
+        if max_price > 0:
+            constraints["max_price"] = max_price
+        if min_rating > 0:
+            constraints["min_rating"] = min_rating
+        for name, value in (("depart_after", departure_after), ("depart_before", departure_before)):
+            if value:
+                try:
+                    hours, _, minutes = value.partition(":")
+                    constraints[name] = int(hours) * 60 + int(minutes or 0)
+                except ValueError:
+                    return f"Could not read departure time {value!r}; use HH:MM."
         try:
-            source = "JFK"
-            destination = "LHR"
-            date = "2025-06-01"
-            url = f"http://api.aviationstack.com/v1/flights?access_key={AVIATIONSTACK_API_KEY}&dep_iata={source}&arr_iata={destination}&flight_date={date}"
-            response = requests.get(url)
-            if response.status_code != 200:
-                return f"Failed to fetch flight data: {response.text}"
-            flights = response.json().get('data', [])
-            if not flights:
-                return "No flights found."
-            return "\n".join([
-                f"{f['airline']['name']} flight {f['flight']['iata']} at {f['departure']['scheduled']}"
-                for f in flights[:3]
-            ])
-        except Exception as e:
-            return f"Error searching flights: {str(e)}"
+            positions, display_currency = offer_index.refine(offers, constraints, limit=max(1, int(limit)))
+        except pricing.UnknownCurrency as e:
+            return f"Could not refine the results: {e}."
+        offer_index.OFFER_QUERIES.inc(kind=kind, source="tool")
+        if not len(positions):
+            return f"None of the {len(offers)} {kind} found for {offers.destination} match; widen the filters."
+        return offer_index.format_offers(offers, positions, display_currency)
+
+
+def destination_info_tool(destination: str, topic: str = "overview") -> str:
+    """Instant offline facts about a destination city: best time to visit, top things to do,
+    typical daily costs, IATA city code and nearby destinations.
 
-    # Create a simple travel planning agent with all tools
-    travel_agent_prompt = """
-    You are a world-class travel planning assistant.
+    topic is one of: overview, best_time, activities, cost, code, nearby.
+    """
+    import destinations
 
-    You can help users with:
-    1. Creating detailed day-by-day itineraries
-    2. Searching for hotels (use hotel_search_tool)
-    3. Searching for flights (use flight_search_tool)
+    with metrics.timer(metrics.TOOL_SECONDS, tool="destination_info_tool"):
+        dest = destinations.index().lookup(destination)
+        if dest is None:
+            return f"No offline information for {destination!r}."
+        return destinations.describe(dest, topic)
 
-    When creating itineraries, include:
-    - Key activities for each day
-    - Recommended dining options
-    - Cultural highlights
-    - Local tips
-    - Budget estimates
 
-    Always be helpful, detailed, and provide practical travel advice.
+def itinerary_optimizer_tool(destination: str, days: int, budget: float, hotel_price_per_night: float = 0.0,
+                             flight_cost: float = 0.0, daily_spend: float = 0.0, hours_per_day: float = 8.0,
+                             currency: str = "") -> str:
+    """Compute a day-by-day schedule of a destination's top sights that minimizes travel time
+    and fits the total budget, with an exact cost breakdown. All amounts are in `currency`
+    (ISO code, default USD). Pass hotel and flight prices when known (e.g. from
+    hotel_search_tool/flight_search_tool) and a per-day amount for food and local transport.
     """
+    import destinations
+    import itinerary_optimizer
+    import pricing
+
+    currency = (currency or pricing.DEFAULT_CURRENCY).upper()
+    with metrics.timer(metrics.TOOL_SECONDS, tool="itinerary_optimizer_tool"):
+        dest = destinations.index().lookup(destination)
+        if dest is None:
+            return f"No offline points of interest for {destination!r}; plan this one without the optimizer."
+        try:
+            to_usd = pricing.table().rate(currency, "USD")
+        except pricing.UnknownCurrency as e:
+            return f"Could not optimize the itinerary: {e}."
+        hotels = None
+        if hotel_price_per_night > 0:
+            hotels = [{"name": "Hotel", "lat": dest["lat"], "lon": dest["lon"],
+                       "price_per_night": hotel_price_per_night * to_usd}]
+        flights = [{"name": "Flight", "price": flight_cost * to_usd}] if flight_cost > 0 else None
+        try:
+            plan = itinerary_optimizer.optimize(
+                dest["pois"], int(days), float(budget) * to_usd, hotels=hotels, flights=flights,
+                hours_per_day=float(hours_per_day), daily_spend=float(daily_spend) * to_usd, center=dest,
+            )
+        except itinerary_optimizer.InfeasiblePlan as e:
+            return f"Budget too small for this trip: {e}."
+        except ValueError as e:
+            return f"Could not optimize the itinerary: {e}."
+        return itinerary_optimizer.format_plan(plan, title=f"{int(days)}-day {dest['name']} plan", currency=currency)
+
+
+TRAVEL_AGENT_PROMPT = """
+You are a world-class travel planning assistant.
+
+You can help users with:
+1. Creating detailed day-by-day itineraries
+2. Searching for hotels (use hotel_search_tool)
+3. Searching for flights (use flight_search_tool)
+4. Destination facts - best time to visit, top sights, typical costs, city codes (use destination_info_tool; it is instant, prefer it over guessing)
+5. Day-by-day routes and budget totals (use itinerary_optimizer_tool and build the itinerary around its schedule and numbers instead of doing the arithmetic yourself)
+6. Narrowing hotels or flights already found - price caps, star ratings, departure times (use refine_offers_tool instead of searching again)
+
+When creating itineraries, include:
+- Key activities for each day
+- Recommended dining options
+- Cultural highlights
+- Local tips
+- Budget estimates
+
+Always be helpful, detailed, and provide practical travel advice.
+"""
+
+
+def get_agent_tools():
+    """Tools available to the travel agent."""
+    return [hotel_search_tool, flight_search_tool, refine_offers_tool, destination_info_tool, itinerary_optimizer_tool]
+
 
-    # Create the main travel agent with all tools
-    travel_agent = create_react_agent(
-        model=ACTIVE_LLM,
-        tools=[hotel_search_tool, flight_search_tool],
-        prompt=travel_agent_prompt,
+def create_travel_agent(llm=None):
+    """Create the ReAct travel agent with all tools (imports langgraph on first call)."""
+    from langgraph.prebuilt import create_react_agent
+    from llm_provider import get_active_llm
+
+    return create_react_agent(
+        model=llm or get_active_llm(),
+        tools=get_agent_tools(),
+        prompt=TRAVEL_AGENT_PROMPT,
         name="travel_agent"
     )
 
-    def build_conversation_graph():
-        """Build a simple conversation graph with the travel agent."""
-        return travel_agent
 
-    # Export the function
-    __all__ = ['build_conversation_graph']
+class DirectAnswerGraph:
+    """Answers short factual destination questions from the offline index and
+    narrowing follow-ups from the offer index, and passes everything else to the
+    wrapped graph."""
+
+    def __init__(self, graph):
+        self.graph = graph
+
+    def invoke(self, state, config=None):
+        import destinations
+        import offer_index
+
+        messages = state.get("messages", [])
+        answer = destinations.direct_answer(messages)
+        if answer is None:
+            answer = offer_index.direct_refinement(messages)
+        if answer is not None:
+            return {"messages": [{"role": "assistant", "content": answer}]}
+        if config is None:
+            return self.graph.invoke(state)
+        return self.graph.invoke(state, config=config)
+
+
+_conversation_graph = None
+_graph_lock = threading.Lock()
+
+
+def build_conversation_graph():
+    """Return the shared conversation graph, creating it on first call."""
+    global _conversation_graph
+    if _conversation_graph is None:
+        with _graph_lock:
+            if _conversation_graph is None:
+                if is_demo_mode():
+                    print("⚠️  Warning: OPENAI_API_KEY not found. Running in demo mode.")
+                    print("💡 To use the full AI version, set OPENAI_API_KEY in your .env file")
+                    _conversation_graph = DirectAnswerGraph(DemoGraph())
+                else:
+                    _conversation_graph = DirectAnswerGraph(create_travel_agent())
+    return _conversation_graph
+
+
+def run_batch_file(input_path=None, output_path=None, job_id=None, concurrency=None):
+    """Run a JSONL batch of planning requests against the local graph (see batch.py)."""
+    import sys
+    import json
+    import asyncio
+    import hashlib
+    import batch
+
+    if job_id:
+        job = batch.BatchJob.open(job_id)
+    else:
+        with open(input_path, "r", encoding="utf-8") as f:
+            job = batch.BatchJob.create(batch.parse_lines(f))
+    print(f"📦 Batch job {job.job_id} (resume with --resume {job.job_id})", file=sys.stderr)
+
+    graph = build_conversation_graph()
+
+    def answer(messages):
+        result = graph.invoke({"messages": messages})
+        latest = (result.get("messages") or [""])[-1]
+        if isinstance(latest, dict):
+            return latest.get("content", "") or ""
+        return getattr(latest, "content", None) or str(latest)
+
+    async def generate(messages):
+        return await asyncio.to_thread(answer, messages)
+
+    def key_for(messages):
+        return hashlib.md5(json.dumps(messages, sort_keys=True).encode()).hexdigest()
+
+    async def run(out):
+        async for result in batch.run_batch(job, generate, lambda messages: None, key_for,
+                                            concurrency or batch.DEFAULT_CONCURRENCY):
+            out.write(json.dumps(result) + "\n")
+            out.flush()
+
+    if output_path:
+        with open(output_path, "a" if job_id else "w", encoding="utf-8") as out:
+            asyncio.run(run(out))
+    else:
+        asyncio.run(run(sys.stdout))
+    return job.job_id
+
+
+# Export the functions
+__all__ = ['build_conversation_graph', 'cached_provider_call', 'create_travel_agent', 'get_active_model',
+           'destination_info_tool', 'hotel_search_tool', 'flight_search_tool', 'itinerary_optimizer_tool',
+           'is_demo_mode', 'refine_offers_tool', 'run_batch_file']
 
 if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Travel Light - AI Travel Planning Assistant")
+    parser.add_argument("--batch", metavar="JSONL", help="Run a JSONL file of planning requests")
+    parser.add_argument("--resume", metavar="JOB_ID", help="Resume a partially finished batch")
+    parser.add_argument("--output", metavar="PATH", help="Write batch results here (default: stdout)")
+    parser.add_argument("--concurrency", type=int, default=None, help="Parallel batch requests")
+    args = parser.parse_args()
+
+    if args.batch or args.resume:
+        run_batch_file(args.batch, args.output, args.resume, args.concurrency)
+        exit(0)
+
     # Check if OpenAI API key is set
-    if not os.getenv("OPENAI_API_KEY"):
+    if is_demo_mode():
         print("❌ Error: OPENAI_API_KEY not found in environment variables.")
         print("Please create a .env file with your OpenAI API key:")
         print("OPENAI_API_KEY=your_api_key_here")
         print("\n💡 Running demo mode instead...")
-        
+
         # Run demo
         graph = build_conversation_graph()
         test_state = {"messages": [{"role": "user", "content": "Plan a 3-day solo budget trip to Bali"}]}
-        
+
         try:
             result = graph.invoke(test_state)
             print("\n📋 Demo Response:")
@@ -162,15 +618,15 @@ if __name__ == "__main__":
                 print(f"{msg['role'].capitalize()}: {msg['content']}")
         except Exception as e:
             print(f"❌ Demo error: {str(e)}")
-        
+
         exit(0)
-    
+
     print("🚀 Starting Travel Light - AI Travel Planning Assistant")
     print("=" * 50)
-    
+
     graph = build_conversation_graph()
     test_state = {"messages": [{"role": "user", "content": "Plan a 3-day solo budget trip to Bali"}]}
-    
+
     try:
         result = graph.invoke(test_state)
         print("\n📋 Conversation History:")
@@ -1,14 +1,237 @@
 import streamlit as st
-from datetime import date
+from datetime import date, timedelta
 import os
 from dotenv import load_dotenv
 from streamlit.components.v1 import html as st_html
 from api_server import start_server_in_thread
+import session_store
 
 # Load environment variables
 load_dotenv()
 start_server_in_thread()
 
+# Ties this browser session's hotel/flight searches to its follow-up questions
+if "session_id" not in st.session_state:
+    import uuid
+    st.session_state["session_id"] = uuid.uuid4().hex
+
+# Chat history is shown a page at a time; older pages load on request
+CHAT_PAGE_SIZE = max(1, int(os.getenv("TRAVEL_LIGHT_CHAT_PAGE_SIZE", "20")))
+
+# Fragments (Streamlit >= 1.37) rerun only the tab or panel that changed instead
+# of the whole page; older versions fall back to a full-page run
+fragment = getattr(st, "fragment", None) or getattr(st, "experimental_fragment", None) or (lambda func: func)
+
+BUDDY_INTRO = "Hey there! I'm <b>Buddy</b> 🧑‍🚀, your AI travel companion! I'm here to help you plan the perfect trip. Whether you need itinerary suggestions, travel tips, or just want to chat about destinations, I've got you covered! What's on your mind today?"
+# Every conversation starts with it, so the session store keeps one copy
+session_store.share(BUDDY_INTRO)
+
+# --- Destination Image Mapping ---
+DEST_IMAGES = {
+    "bali": "https://images.unsplash.com/photo-1507525428034-b723cf961d3e?auto=format&fit=crop&w=800&q=80",
+    "paris": "https://images.unsplash.com/photo-1465101046530-73398c7f28ca?auto=format&fit=crop&w=800&q=80",
+    "tokyo": "https://images.unsplash.com/photo-1512453979798-5ea266f8880c?auto=format&fit=crop&w=800&q=80",
+    "new york": "https://images.unsplash.com/photo-1464983953574-0892a716854b?auto=format&fit=crop&w=800&q=80",
+    "default": "https://images.unsplash.com/photo-1465101178521-c1a9136a3b41?auto=format&fit=crop&w=800&q=80"
+}
+
+QUICK_ACTIONS = [
+    ("🗺️ Plan Trip", "quick_plan", "Plan a trip for me"),
+    ("🏨 Find Hotels", "quick_hotels", "Help me find hotels"),
+    ("✈️ Flight Tips", "quick_flights", "Give me flight booking tips"),
+    ("🌍 Travel Tips", "quick_tips", "Share some travel tips"),
+]
+
+
+def destination_image(text):
+    """Image for the first pictured destination mentioned in ``text``, or None."""
+    import destinations
+    # Aliases ("NYC", "Ubud", ...) resolve through the destination index
+    for dest in destinations.index().find_in_text(text):
+        key = dest["name"].lower()
+        if key in DEST_IMAGES:
+            return DEST_IMAGES[key]
+    return None
+
+
+def init_chat_state():
+    """Set up the chat once per browser session (Buddy introduces himself).
+
+    The conversation itself lives in the session store under this browser
+    session's ID, shared with /api/chat; only view state is kept here.
+    """
+    if "chat_pages" in st.session_state:
+        return
+    sessions = session_store.store()
+    if not sessions.length(st.session_state["session_id"]):
+        sessions.append(st.session_state["session_id"], {"role": "assistant", "content": BUDDY_INTRO})
+    st.session_state["dest_image"] = DEST_IMAGES["default"]
+    st.session_state["chat_pages"] = 1
+
+
+def reset_chat():
+    import uuid
+    session_store.store().delete(st.session_state["session_id"])
+    st.session_state["session_id"] = uuid.uuid4().hex
+    for key in ("dest_image", "chat_pages", "ai_chat_summary"):
+        st.session_state.pop(key, None)
+    init_chat_state()
+
+
+def show_earlier_messages():
+    st.session_state["chat_pages"] += 1
+
+
+def ask_buddy(text):
+    """Add the user's message and Buddy's reply to the conversation."""
+    state = st.session_state
+    sessions = session_store.store()
+    session_id = state["session_id"]
+    sessions.append(session_id, {"role": "user", "content": text})
+    # Only the new message needs checking: the latest destination mentioned wins
+    state["dest_image"] = destination_image(text) or state["dest_image"]
+    with st.spinner("🧑‍🚀 Buddy is thinking..."):
+        from travel_graph import build_conversation_graph
+        import offer_index
+        graph = build_conversation_graph()
+        offer_index.bind_session(session_id)
+        result = graph.invoke({"messages": sessions.history(session_id)})
+    bot_messages = result.get("messages", [])
+    if bot_messages:
+        latest_bot_msg = bot_messages[-1]
+        if hasattr(latest_bot_msg, 'content'):
+            bot_content = latest_bot_msg.content
+        elif isinstance(latest_bot_msg, dict):
+            bot_content = latest_bot_msg.get("content", "")
+        else:
+            bot_content = str(latest_bot_msg)
+    else:
+        bot_content = "Buddy didn't return a response."
+    sessions.append(session_id, {"role": "assistant", "content": bot_content})
+
+
+def conversation_summary(session_id):
+    """Buddy's replies so far (built only when the summary is opened)."""
+    return "\n".join(
+        m["content"] for m in session_store.store().history(session_id)[1:] if m["role"] == "assistant"
+    )
+
+
+def show_search(kind, query, limit=10):
+    """Search every provider for ``kind``, redrawing the ranked results as each one answers."""
+    import offer_index
+    import pricing
+    import search_service
+    # Hotel and flight results are then what "under $150" in the chat refines
+    offer_index.bind_session(st.session_state["session_id"])
+    currency = pricing.DEFAULT_CURRENCY
+    status = st.status(f"Searching {kind}...")
+    table = st.empty()
+    ranked = []
+    for update, ranked in search_service.stream(kind, query):
+        provider = update["provider"] + (" (sample data)" if update["sample"] else "")
+        if update["error"]:
+            status.write(f"⚠️ {provider}: {update['error']}")
+        else:
+            status.write(f"✅ {provider}: {len(update['results'])} result(s) in {update['ms']:.0f} ms"
+                         + (" (cached)" if update["cached"] else ""))
+        if ranked:
+            table.dataframe([
+                {
+                    "Option": item["title"],
+                    "Price": search_service.price_text(item["price_usd"], currency),
+                    "Rating": f"{item['rating']:g}★" if item["rating"] is not None else "",
+                    "Departs": f"{item['departure'] // 60:02d}:{item['departure'] % 60:02d}" if item["departure"] is not None else "",
+                    "Details": item["details"],
+                    "Provider": item["provider"],
+                }
+                for item in ranked[:limit]
+            ], hide_index=True)
+    if ranked:
+        status.update(label=f"{len(ranked)} {kind} found", state="complete", expanded=False)
+    else:
+        status.update(label=f"No {kind} found", state="error", expanded=True)
+
+
+def bubble_html(msg):
+    if msg["role"] == "user":
+        return (
+            "<div style='background-color:#e1f5fe;padding:12px 16px;border-radius:12px;margin-bottom:8px;max-width:80%;margin-left:auto;text-align:right;'>"
+            f"<b>🧑‍💼 You:</b> {msg['content']}</div>"
+        )
+    return (
+        "<div style='background-color:#fffbe7;padding:12px 16px;border-radius:12px;margin-bottom:8px;max-width:80%;margin-right:auto;text-align:left;'>"
+        f"<b>🧑‍🚀 Buddy:</b> {msg['content']}</div>"
+    )
+
+
+def page_key(messages):
+    """Length and digest of a page's messages, so its HTML is rebuilt only when they change"""
+    import hashlib
+    import json
+    digest = hashlib.blake2b(json.dumps(messages, sort_keys=True).encode("utf-8"), digest_size=16).hexdigest()
+    return len(messages), digest
+
+
+@st.cache_data(max_entries=512, show_spinner=False)
+def full_page_html(key, _messages):
+    """HTML of a full history page, cached on its content (``_messages`` is not hashed).
+
+    Keyed on the page's own messages rather than the session's generation,
+    which every append bumps: appending to the newest page leaves the full
+    pages before it untouched, while a rewrite (another UI or worker replacing
+    the history) changes their content and so their key.
+    """
+    return "\n".join(bubble_html(msg) for msg in _messages)
+
+
+def render_history(session_id):
+    """Show the newest page of the chat plus any older pages the user opened.
+
+    Each page goes out as a single markdown element, so a rerun sends the same
+    handful of elements however long the conversation gets, and full pages are
+    rendered to HTML once per distinct content.
+    """
+    sessions = session_store.store()
+    length = sessions.length(session_id)
+    total = (length + CHAT_PAGE_SIZE - 1) // CHAT_PAGE_SIZE
+    first = max(0, total - st.session_state["chat_pages"])
+    if first:
+        st.button(
+            f"⬆️ Show earlier messages ({first * CHAT_PAGE_SIZE} hidden)",
+            key="ai_chat_earlier", on_click=show_earlier_messages,
+        )
+    for page in range(first, total):
+        messages = sessions.history(session_id, page * CHAT_PAGE_SIZE, (page + 1) * CHAT_PAGE_SIZE)
+        if len(messages) == CHAT_PAGE_SIZE:
+            body = full_page_html(page_key(messages), messages)
+        else:
+            body = "\n".join(bubble_html(msg) for msg in messages)
+        st.markdown(body, unsafe_allow_html=True)
+
+
+init_chat_state()
+
+# --- Sidebar AI Chatbot (replacing Quick Access) ---
+# Runs before the main page so a message sent here is already in the AI Chat tab
+# when it renders; the full transcript is only shown there.
+with st.sidebar:
+    st.markdown("### 🧑‍🚀 Buddy (AI Chat)")
+
+    # Input form in sidebar
+    with st.form("sidebar_chat_form", clear_on_submit=True):
+        sidebar_user_input = st.text_input("Ask Buddy anything...", key="sidebar_ai_chat_input")
+        submitted = st.form_submit_button("Send")
+
+    if submitted and sidebar_user_input and sidebar_user_input.strip():
+        ask_buddy(sidebar_user_input.strip())
+
+    # No reply preview here: the AI Chat panel is a fragment and reruns without
+    # the sidebar, so a preview drawn here would fall behind the conversation
+    st.caption("Buddy's replies are in the AI Chat tab.")
+
+    st.button("Reset Chat", key="sidebar_ai_chat_reset", on_click=reset_chat)
+
 # --- Floating Shortcut Button CSS ---
 st.markdown("", unsafe_allow_html=True)
 
@@ -44,7 +267,8 @@ st.markdown("""
 tabs = st.tabs(["Flights", "Hotels", "Trains", "Cabs", "AI Chat"])
 
 # --- Flights Tab ---
-with tabs[0]:
+@fragment
+def flights_tab():
     st.markdown("#### Search Flights")
     col1, col2, col3 = st.columns(3)
     with col1:
@@ -59,10 +283,12 @@ with tabs[0]:
     with col5:
         flight_class = st.selectbox("Class", ["Economy", "Business", "First"], key="flight_class")
     if st.button("🔍 Search Flights", key="flight_search"):
-        st.success(f"Searching flights from {from_city} to {to_city} on {depart_date} for {passengers} passenger(s) in {flight_class} class.")
+        show_search("flights", {"origin": from_city, "destination": to_city, "date": depart_date,
+                                "passengers": passengers, "cabin": flight_class})
 
 # --- Hotels Tab ---
-with tabs[1]:
+@fragment
+def hotels_tab():
     st.markdown("#### Search Hotels")
     col1, col2 = st.columns(2)
     with col1:
@@ -71,14 +297,15 @@ with tabs[1]:
         check_in = st.date_input("Check-in", date.today(), key="hotel_checkin")
     col3, col4 = st.columns(2)
     with col3:
-        check_out = st.date_input("Check-out", date.today(), key="hotel_checkout")
+        check_out = st.date_input("Check-out", date.today() + timedelta(days=1), key="hotel_checkout")
     with col4:
         guests = st.number_input("Guests", 1, 10, 1, key="hotel_guests")
     if st.button("🔍 Search Hotels", key="hotel_search"):
-        st.success(f"Searching hotels in {city} from {check_in} to {check_out} for {guests} guest(s).")
+        show_search("hotels", {"city": city, "check_in": check_in, "check_out": check_out, "guests": guests})
 
 # --- Trains Tab ---
-with tabs[2]:
+@fragment
+def trains_tab():
     st.markdown("#### Search Trains")
     col1, col2 = st.columns(2)
     with col1:
@@ -91,10 +318,12 @@ with tabs[2]:
     with col4:
         train_class = st.selectbox("Class", ["Sleeper", "AC", "First Class"], key="train_class")
     if st.button("🔍 Search Trains", key="train_search"):
-        st.success(f"Searching trains from {from_station} to {to_station} on {train_date} in {train_class} class.")
+        show_search("trains", {"origin": from_station, "destination": to_station, "date": train_date,
+                               "travel_class": train_class})
 
 # --- Cabs Tab ---
-with tabs[3]:
+@fragment
+def cabs_tab():
     st.markdown("#### Book a Cab")
     col1, col2 = st.columns(2)
     with col1:
@@ -106,40 +335,62 @@ with tabs[3]:
         cab_date = st.date_input("Pickup Date", date.today(), key="cab_date")
     with col4:
         cab_time = st.time_input("Pickup Time", key="cab_time")
-    if st.button("🚕 Book Cab", key="cab_book"):
-        st.success(f"Booking cab from {pickup} to {drop} on {cab_date} at {cab_time}.")
+    if st.button("🚕 Find Cabs", key="cab_book"):
+        show_search("cabs", {"pickup": pickup, "drop": drop, "date": cab_date, "time": cab_time})
+
+# --- AI Chat Panel ---
+# Sending a message reruns only this fragment: the booking tabs and the rest of
+# the page are not rebuilt, and only the newest page of history is re-sent.
+@fragment
+def chat_panel():
+    # --- Quick Reply Buttons ---
+    st.markdown("### 🚀 Quick Actions")
+    quick_action = None
+    for col, (label, key, prompt) in zip(st.columns(len(QUICK_ACTIONS)), QUICK_ACTIONS):
+        with col:
+            if st.button(label, key=key):
+                quick_action = prompt
+
+    # --- Chat Section with Visual Bubbles ---
+    st.markdown("### 💬 Chat with Buddy")
+    history = st.container()
+
+    # --- User Input ---
+    with st.form("ai_chat_form", clear_on_submit=True):
+        user_input = st.text_input("Ask Buddy anything about your trip!", key="ai_chat_input")
+        sent = st.form_submit_button("Send")
+    col1, col2 = st.columns(2)
+    with col1:
+        st.button("🔄 Reset Chat", key="ai_chat_reset", on_click=reset_chat)
+    with col2:
+        st.checkbox("🐛 Debug Mode", key="ai_chat_debug")
+
+    # Handled before the history is drawn so the reply shows up in this same run
+    text = quick_action or (user_input.strip() if sent and user_input else "")
+    with history:
+        if text:
+            ask_buddy(text)
+        render_history(st.session_state["session_id"])
+
+    # --- Show Destination Visual ---
+    st.image(st.session_state["dest_image"], caption="Your Dream Destination", use_column_width=True)
+
+    # --- Show Summary ---
+    if session_store.store().length(st.session_state["session_id"]) > 1 and \
+            st.toggle("📝 View Conversation Summary", key="ai_chat_summary"):
+        st.success(conversation_summary(st.session_state["session_id"]))
+
+with tabs[0]:
+    flights_tab()
+with tabs[1]:
+    hotels_tab()
+with tabs[2]:
+    trains_tab()
+with tabs[3]:
+    cabs_tab()
 
 # --- AI Chat Tab ---
 with tabs[4]:
-    # --- Destination Image Mapping ---
-    DEST_IMAGES = {
-        "bali": "https://images.unsplash.com/photo-1507525428034-b723cf961d3e?auto=format&fit=crop&w=800&q=80",
-        "paris": "https://images.unsplash.com/photo-1465101046530-73398c7f28ca?auto=format&fit=crop&w=800&q=80",
-        "tokyo": "https://images.unsplash.com/photo-1512453979798-5ea266f8880c?auto=format&fit=crop&w=800&q=80",
-        "new york": "https://images.unsplash.com/photo-1464983953574-0892a716854b?auto=format&fit=crop&w=800&q=80",
-        "default": "https://images.unsplash.com/photo-1465101178521-c1a9136a3b41?auto=format&fit=crop&w=800&q=80"
-    }
-    def get_destination_image(messages):
-        for msg in reversed(messages):
-            if msg["role"] == "user":
-                for dest in DEST_IMAGES:
-                    if dest in msg["content"].lower():
-                        return DEST_IMAGES[dest]
-        return DEST_IMAGES["default"]
-
-    # --- Session State ---
-    if "messages" not in st.session_state:
-        st.session_state["messages"] = []
-    if "graph_state" not in st.session_state:
-        st.session_state["graph_state"] = {"messages": []}
-    if "summary" not in st.session_state:
-        st.session_state["summary"] = ""
-        if not st.session_state["messages"]:
-            # Buddy introduces itself at the start
-            buddy_intro = {"role": "assistant", "content": "Hey there! I'm <b>Buddy</b> 🧑‍🚀, your AI travel companion! I'm here to help you plan the perfect trip. Whether you need itinerary suggestions, travel tips, or just want to chat about destinations, I've got you covered! What's on your mind today?"}
-            st.session_state["messages"].append(buddy_intro)
-            st.session_state["graph_state"]["messages"].append(buddy_intro)
-
     # --- Buddy Avatar and Tips ---
     col1, col2 = st.columns([1, 2])
     with col1:
@@ -160,100 +411,7 @@ with tabs[4]:
         - "Help me find cheap flights to New York"
         """)
 
-    # --- Quick Reply Buttons ---
-    st.markdown("### 🚀 Quick Actions")
-    quick_col1, quick_col2, quick_col3, quick_col4 = st.columns(4)
-    with quick_col1:
-        if st.button("🗺️ Plan Trip", key="quick_plan"):
-            st.session_state["quick_action"] = "Plan a trip for me"
-    with quick_col2:
-        if st.button("🏨 Find Hotels", key="quick_hotels"):
-            st.session_state["quick_action"] = "Help me find hotels"
-    with quick_col3:
-        if st.button("✈️ Flight Tips", key="quick_flights"):
-            st.session_state["quick_action"] = "Give me flight booking tips"
-    with quick_col4:
-        if st.button("🌍 Travel Tips", key="quick_tips"):
-            st.session_state["quick_action"] = "Share some travel tips"
-
-    # --- Chat Section with Visual Bubbles ---
-    st.markdown("### 💬 Chat with Buddy")
-    for msg in st.session_state["messages"]:
-        if msg["role"] == "user":
-            st.markdown(f"""
-            <div style='background-color:#e1f5fe;padding:12px 16px;border-radius:12px;margin-bottom:8px;max-width:80%;margin-left:auto;text-align:right;'>
-                <b>🧑‍💼 You:</b> {msg['content']}
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div style='background-color:#fffbe7;padding:12px 16px;border-radius:12px;margin-bottom:8px;max-width:80%;margin-right:auto;text-align:left;'>
-                <b>🧑‍🚀 Buddy:</b> {msg['content']}
-            </div>
-            """, unsafe_allow_html=True)
-
-    # --- User Input ---
-    user_input = st.text_input("Ask Buddy anything about your trip!", key="ai_chat_input")
-    col1, col2 = st.columns(2)
-    with col1:
-        reset_button = st.button("🔄 Reset Chat", key="ai_chat_reset")
-    with col2:
-        debug_mode = st.checkbox("🐛 Debug Mode", key="ai_chat_debug")
-
-    # --- Handle Reset ---
-    if reset_button:
-        st.session_state["messages"] = []
-        st.session_state["graph_state"] = {"messages": []}
-        st.session_state["summary"] = ""
-        st.rerun()
-
-    # --- Handle Quick Actions ---
-    if "quick_action" in st.session_state and st.session_state["quick_action"]:
-        user_msg = {"role": "user", "content": st.session_state["quick_action"]}
-        st.session_state["messages"].append(user_msg)
-        st.session_state["graph_state"]["messages"].append(user_msg)
-        del st.session_state["quick_action"]
-        st.rerun()
-
-    # --- Handle User Input ---
-    if user_input and user_input.strip():
-        user_msg = {"role": "user", "content": user_input.strip()}
-        st.session_state["messages"].append(user_msg)
-        st.session_state["graph_state"]["messages"].append(user_msg)
-        with st.spinner("🧑‍🚀 Buddy is thinking..."):
-            from travel_graph import build_conversation_graph
-            graph = build_conversation_graph()
-            result = graph.invoke(st.session_state["graph_state"])
-        bot_messages = result.get("messages", [])
-        if bot_messages:
-            latest_bot_msg = bot_messages[-1]
-            if hasattr(latest_bot_msg, 'content'):
-                bot_content = latest_bot_msg.content
-            elif isinstance(latest_bot_msg, dict):
-                bot_content = latest_bot_msg.get("content", "")
-            else:
-                bot_content = str(latest_bot_msg)
-            bot_msg = {"role": "assistant", "content": bot_content}
-            st.session_state["messages"].append(bot_msg)
-            st.session_state["graph_state"]["messages"].append(bot_msg)
-            st.session_state["summary"] = "\n".join(
-                getattr(m, 'content', str(m)) for m in bot_messages if getattr(m, 'role', 'assistant') == 'assistant'
-            )
-        else:
-            st.session_state["summary"] = "Buddy didn't return a response."
-            st.session_state["messages"].append({"role": "assistant", "content": st.session_state["summary"]})
-            st.session_state["graph_state"]["messages"].append({"role": "assistant", "content": st.session_state["summary"]})
-        st.rerun()
-
-    # --- Show Destination Visual ---
-    if st.session_state["messages"]:
-        dest_img = get_destination_image(st.session_state["messages"])
-        st.image(dest_img, caption="Your Dream Destination", use_column_width=True)
-
-    # --- Show Summary ---
-    if st.session_state["summary"]:
-        with st.expander("📝 View Conversation Summary"):
-            st.success(st.session_state["summary"])
+    chat_panel()
 
     # --- Buddy's Mood/Status ---
     st.markdown("---")
@@ -283,79 +441,6 @@ st.markdown("""
     </div>
 """, unsafe_allow_html=True)
 
-# --- Sidebar AI Chatbot (replacing Quick Access) ---
-with st.sidebar:
-    st.markdown("### 🧑‍🚀 Buddy (AI Chat)")
-
-    # Ensure session state exists (safe to re-check here)
-    if "messages" not in st.session_state:
-        st.session_state["messages"] = []
-    if "graph_state" not in st.session_state:
-        st.session_state["graph_state"] = {"messages": []}
-    if "summary" not in st.session_state:
-        st.session_state["summary"] = ""
-        if not st.session_state["messages"]:
-            buddy_intro = {"role": "assistant", "content": "Hey there! I'm <b>Buddy</b> 🧑‍🚀, your AI travel companion! I'm here to help you plan the perfect trip. Whether you need itinerary suggestions, travel tips, or just want to chat about destinations, I've got you covered! What's on your mind today?"}
-            st.session_state["messages"].append(buddy_intro)
-            st.session_state["graph_state"]["messages"].append(buddy_intro)
-
-    # Show conversation
-    for msg in st.session_state["messages"]:
-        if msg["role"] == "user":
-            st.markdown(f"""
-            <div style='background-color:#e1f5fe;padding:10px 12px;border-radius:10px;margin-bottom:6px;text-align:right;'>
-                <b>You:</b> {msg['content']}
-            </div>
-            """, unsafe_allow_html=True)
-        else:
-            st.markdown(f"""
-            <div style='background-color:#fffbe7;padding:10px 12px;border-radius:10px;margin-bottom:6px;text-align:left;'>
-                <b>Buddy:</b> {msg['content']}
-            </div>
-            """, unsafe_allow_html=True)
-
-    # Input form in sidebar
-    with st.form("sidebar_chat_form", clear_on_submit=True):
-        sidebar_user_input = st.text_input("Ask Buddy anything...", key="sidebar_ai_chat_input")
-        submitted = st.form_submit_button("Send")
-
-    reset_sidebar = st.button("Reset Chat", key="sidebar_ai_chat_reset")
-
-    if reset_sidebar:
-        st.session_state["messages"] = []
-        st.session_state["graph_state"] = {"messages": []}
-        st.session_state["summary"] = ""
-        st.rerun()
-
-    if submitted and sidebar_user_input and sidebar_user_input.strip():
-        user_msg = {"role": "user", "content": sidebar_user_input.strip()}
-        st.session_state["messages"].append(user_msg)
-        st.session_state["graph_state"]["messages"].append(user_msg)
-        with st.spinner("🧑‍🚀 Buddy is thinking..."):
-            from travel_graph import build_conversation_graph
-            graph = build_conversation_graph()
-            result = graph.invoke(st.session_state["graph_state"])
-        bot_messages = result.get("messages", [])
-        if bot_messages:
-            latest_bot_msg = bot_messages[-1]
-            if hasattr(latest_bot_msg, 'content'):
-                bot_content = latest_bot_msg.content
-            elif isinstance(latest_bot_msg, dict):
-                bot_content = latest_bot_msg.get("content", "")
-            else:
-                bot_content = str(latest_bot_msg)
-            bot_msg = {"role": "assistant", "content": bot_content}
-            st.session_state["messages"].append(bot_msg)
-            st.session_state["graph_state"]["messages"].append(bot_msg)
-            st.session_state["summary"] = "\n".join(
-                getattr(m, 'content', str(m)) for m in bot_messages if getattr(m, 'role', 'assistant') == 'assistant'
-            )
-        else:
-            st.session_state["summary"] = "Buddy didn't return a response."
-            st.session_state["messages"].append({"role": "assistant", "content": st.session_state["summary"]})
-            st.session_state["graph_state"]["messages"].append({"role": "assistant", "content": st.session_state["summary"]})
-        st.rerun()
-
 # --- Floating Chatbot Widget ---
 st_html("""
 <div id="chatbot-widget">
@@ -583,7 +668,9 @@ st_html("""
       const state = {
         isOpen: false,
         isStreaming: false,
-        sessionId: null,
+        // Same conversation as the Streamlit chat: the server keeps the history
+        sessionId: '__SESSION_ID__' || null,
+        historyLoaded: false,
         messages: [] // {role:'user'|'assistant'|'error', content:string}
       };
 
@@ -611,10 +698,30 @@ st_html("""
         scrollToBottom();
       }
 
+      async function loadHistory() {
+        if (!state.sessionId || state.historyLoaded) return;
+        state.historyLoaded = true;
+        try {
+          const res = await fetch('http://127.0.0.1:8787/api/sessions/' + encodeURIComponent(state.sessionId) + '?limit=50');
+          if (!res.ok) return;
+          const data = await res.json();
+          const offset = data.length - data.messages.length;
+          data.messages.forEach((m, i) => {
+            // The stored greeting is the one this widget already shows
+            if (offset + i === 0 && m.role === 'assistant') return;
+            appendMessage(m.role, m.content);
+            state.messages.push(m);
+          });
+        } catch (_) {
+          state.historyLoaded = false;
+        }
+      }
+
       function setOpen(open) {
         state.isOpen = open;
         panel.setAttribute('aria-hidden', open ? 'false' : 'true');
         if (open) {
+          loadHistory();
           // Focus trap: focus input
           setTimeout(() => input.focus(), 0);
         } else {
@@ -648,10 +755,11 @@ st_html("""
           const res = await fetch('http://127.0.0.1:8787/api/chat', {
             method: 'POST',
             headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({
-              sessionId: state.sessionId || undefined,
-              messages: state.messages.concat([{ role: 'user', content: userText }])
-            })
+            // With a session the server already has the history; send just the new message.
+            // Otherwise handleSend has already appended the user message to state.messages
+            body: JSON.stringify(state.sessionId
+              ? { sessionId: state.sessionId, message: userText }
+              : { messages: state.messages })
           });
           if (!res.ok || !res.body) throw new Error('Network error');
 
@@ -668,7 +776,8 @@ st_html("""
                 const line = buffer.slice(0, idx).trim();
                 buffer = buffer.slice(idx + 1);
                 if (!line) continue;
-                // Expect lines like: data: {"delta":"...", "done":false}
+                // Expect SSE frames like: data: {"delta":"...","done":false}
+                // (comment lines such as ": ping" are heartbeats and are skipped)
                 const prefix = 'data:';
                 if (line.startsWith(prefix)) {
                   const payloadRaw = line.slice(prefix.length).trim();
@@ -678,7 +787,13 @@ st_html("""
                       assistantNode.textContent += json.delta;
                       scrollToBottom();
                     }
-                    if (json.done === true) {
+                    if (json.error) {
+                      assistantNode.classList.add('cbw-error');
+                      if (!assistantNode.textContent) {
+                        updateMessage(assistantNode, 'Sorry, something went wrong. Please try again.');
+                      }
+                    }
+                    if (json.done === true && !json.error) {
                       // finalize
                       state.messages.push({ role: 'assistant', content: assistantNode.textContent });
                     }
@@ -752,4 +867,4 @@ st_html("""
     })();
   </script>
 </div>
-""", height=120, scrolling=False)
\ No newline at end of file
+""".replace("__SESSION_ID__", st.session_state["session_id"]), height=120, scrolling=False)
\ No newline at end of file
@@ -0,0 +1,355 @@
+"""
+Usage Module - Token usage and cost accounting for LLM calls
+
+Usage is captured from every model call made while the conversation graph runs
+(via a LangChain callback, falling back to ``usage_metadata`` on the result
+messages), then aggregated per request, per session and per client. Optional
+per-client token budgets are checked before the graph is invoked.
+
+Configuration (environment):
+    TRAVEL_LIGHT_TOKEN_BUDGET         - default tokens per client per window (0 = unlimited)
+    TRAVEL_LIGHT_TOKEN_BUDGET_WINDOW  - budget window in seconds (default 86400)
+    TRAVEL_LIGHT_TOKEN_BUDGETS        - JSON object of per-client overrides, e.g. {"key:partner": 500000}
+    TRAVEL_LIGHT_MODEL_PRICES         - JSON object of USD per 1M tokens, e.g. {"gpt-4o": [2.5, 1.25, 10]}
+    TRAVEL_LIGHT_ADMIN_TOKEN          - X-Admin-Token value that may read every client's usage (unset: nobody)
+"""
+
+import os
+import hmac
+import json
+import time
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+TOKENS = metrics.counter("travel_light_llm_tokens", "LLM tokens consumed", ("route", "model", "kind"))
+LLM_CALLS = metrics.counter("travel_light_llm_calls", "Model calls made by the conversation graph", ("route", "model"))
+COST_USD = metrics.counter("travel_light_llm_cost_usd", "Estimated LLM spend in USD", ("route", "model"))
+TOKENS_SAVED = metrics.counter("travel_light_llm_tokens_saved", "Tokens avoided by serving from cache", ("route", "model"))
+BUDGET_REJECTIONS = metrics.counter("travel_light_token_budget_rejections", "Requests rejected by token budgets")
+
+# USD per 1M tokens: (input, cached input, output)
+_DEFAULT_PRICES: Dict[str, Tuple[float, float, float]] = {
+    "gpt-4o-mini": (0.15, 0.075, 0.60),
+    "gpt-4o": (2.50, 1.25, 10.00),
+    "gpt-4.1-mini": (0.40, 0.10, 1.60),
+    "gpt-4.1": (2.00, 0.50, 8.00),
+    "demo-mode": (0.0, 0.0, 0.0),
+}
+
+
+def _load_json_env(name: str) -> Dict[str, Any]:
+    raw = os.getenv(name, "")
+    if not raw:
+        return {}
+    try:
+        value = json.loads(raw)
+        return value if isinstance(value, dict) else {}
+    except ValueError:
+        logger.warning(f"Ignoring invalid JSON in {name}")
+        return {}
+
+
+PRICES = {**_DEFAULT_PRICES, **{k: tuple(v) for k, v in _load_json_env("TRAVEL_LIGHT_MODEL_PRICES").items()}}
+
+
+def price_for(model: str) -> Optional[Tuple[float, float, float]]:
+    """Prices for a model, matching dated snapshots (gpt-4o-2024-08-06) by prefix"""
+    if model in PRICES:
+        return PRICES[model]
+    for name in sorted(PRICES, key=len, reverse=True):
+        if model.startswith(name):
+            return PRICES[name]
+    return None
+
+
+class Usage:
+    """Token counts for one or more model calls"""
+
+    __slots__ = ("input_tokens", "output_tokens", "cached_tokens", "total_tokens", "calls")
+
+    def __init__(self, input_tokens: int = 0, output_tokens: int = 0, cached_tokens: int = 0,
+                 total_tokens: int = 0, calls: int = 0):
+        self.input_tokens = input_tokens
+        self.output_tokens = output_tokens
+        self.cached_tokens = cached_tokens
+        self.total_tokens = total_tokens
+        self.calls = calls
+
+    def add(self, other: "Usage"):
+        self.input_tokens += other.input_tokens
+        self.output_tokens += other.output_tokens
+        self.cached_tokens += other.cached_tokens
+        self.total_tokens += other.total_tokens
+        self.calls += other.calls
+
+    def cost(self, model: str) -> float:
+        """Estimated USD cost (0.0 for unknown models)"""
+        prices = price_for(model)
+        if prices is None:
+            return 0.0
+        input_price, cached_price, output_price = prices
+        uncached = max(0, self.input_tokens - self.cached_tokens)
+        return (uncached * input_price + self.cached_tokens * cached_price + self.output_tokens * output_price) / 1e6
+
+    def to_dict(self) -> Dict[str, int]:
+        return {
+            "input_tokens": self.input_tokens,
+            "output_tokens": self.output_tokens,
+            "cached_tokens": self.cached_tokens,
+            "total_tokens": self.total_tokens,
+            "calls": self.calls,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Optional[Dict[str, Any]]) -> "Usage":
+        data = data or {}
+        return cls(*(int(data.get(field, 0) or 0) for field in cls.__slots__))
+
+    @classmethod
+    def from_metadata(cls, metadata: Optional[Dict[str, Any]]) -> Optional["Usage"]:
+        """Parse a LangChain ``usage_metadata`` dict"""
+        if not metadata:
+            return None
+        details = metadata.get("input_token_details") or {}
+        input_tokens = int(metadata.get("input_tokens", 0) or 0)
+        output_tokens = int(metadata.get("output_tokens", 0) or 0)
+        return cls(
+            input_tokens=input_tokens,
+            output_tokens=output_tokens,
+            cached_tokens=int(details.get("cache_read", 0) or 0),
+            total_tokens=int(metadata.get("total_tokens", 0) or input_tokens + output_tokens),
+            calls=1,
+        )
+
+
+def usage_from_messages(messages: Iterable[Any]) -> Usage:
+    """Sum ``usage_metadata`` over the AI messages of a graph result"""
+    total = Usage()
+    for message in messages:
+        usage = Usage.from_metadata(getattr(message, "usage_metadata", None))
+        if usage is not None:
+            total.add(usage)
+    return total
+
+
+class UsageRecorder:
+    """Collects usage from every model call made during one graph invocation"""
+
+    def __init__(self):
+        self.usage = Usage()
+        self._lock = threading.Lock()  # callbacks may fire on executor threads
+
+    def record(self, usage: Usage):
+        with self._lock:
+            self.usage.add(usage)
+
+    def callbacks(self) -> List[Any]:
+        """LangChain callback handlers feeding this recorder ([] without langchain)"""
+        handler_class = _langchain_handler_class()
+        return [handler_class(self)] if handler_class is not None else []
+
+
+_handler_class = None
+
+
+def _langchain_handler_class():
+    """Build the LangChain callback handler class on first use"""
+    global _handler_class
+    if _handler_class is not None:
+        return _handler_class or None
+    try:
+        from langchain_core.callbacks import BaseCallbackHandler
+    except ImportError:
+        _handler_class = False
+        return None
+
+    class UsageCallbackHandler(BaseCallbackHandler):
+        """Reads token usage from each finished model call"""
+
+        def __init__(self, recorder: UsageRecorder):
+            self.recorder = recorder
+
+        def on_llm_end(self, response, *, run_id, **kwargs):
+            for generations in getattr(response, "generations", None) or []:
+                for generation in generations:
+                    message = getattr(generation, "message", None)
+                    usage = Usage.from_metadata(getattr(message, "usage_metadata", None))
+                    if usage is not None:
+                        self.recorder.record(usage)
+
+    _handler_class = UsageCallbackHandler
+    return _handler_class
+
+
+def client_id(api_key: Optional[str], client_ip: str) -> str:
+    """Accounting identity: a hashed API key when given, else the hashed client IP"""
+    if api_key:
+        return "key:" + hashlib.blake2b(api_key.encode(), digest_size=8).hexdigest()
+    return "ip:" + hashlib.blake2b(client_ip.encode(), digest_size=8).hexdigest()
+
+
+ADMIN_TOKEN = os.getenv("TRAVEL_LIGHT_ADMIN_TOKEN", "")
+
+
+def is_admin(token: Optional[str]) -> bool:
+    """Whether a request's X-Admin-Token grants access to every client's usage"""
+    return bool(ADMIN_TOKEN and token) and hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode())
+
+
+class BudgetExceeded(Exception):
+    """Raised when a client has used its token budget for the current window"""
+
+    def __init__(self, client: str, retry_after: float):
+        super().__init__(f"Token budget exceeded for {client}")
+        self.client = client
+        self.retry_after = retry_after
+
+
+class _Account:
+    __slots__ = ("usage", "cost", "requests", "cache_hits", "tokens_saved", "window_start", "window_tokens",
+                 "last_seen")
+
+    def __init__(self):
+        self.usage = Usage()
+        self.cost = 0.0
+        self.requests = 0
+        self.cache_hits = 0
+        self.tokens_saved = 0
+        self.window_start = time.time()
+        self.window_tokens = 0
+        self.last_seen = self.window_start
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            **self.usage.to_dict(),
+            "cost_usd": round(self.cost, 6),
+            "requests": self.requests,
+            "cache_hits": self.cache_hits,
+            "tokens_saved": self.tokens_saved,
+            "window_tokens": self.window_tokens,
+            "last_seen": self.last_seen,
+        }
+
+
+class UsageLedger:
+    """Per-session and per-client usage totals with optional client budgets"""
+
+    def __init__(self, default_budget: int = 0, budget_window: float = 86400.0,
+                 budgets: Optional[Dict[str, int]] = None, max_accounts: int = 10_000):
+        self.default_budget = default_budget
+        self.budget_window = budget_window
+        self.budgets = {k: int(v) for k, v in (budgets or {}).items()}
+        self.max_accounts = max_accounts
+        self.total = _Account()
+        self._clients: "OrderedDict[str, _Account]" = OrderedDict()
+        self._sessions: "OrderedDict[str, _Account]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _account(self, table: "OrderedDict[str, _Account]", key: str) -> _Account:
+        account = table.get(key)
+        if account is None:
+            account = table[key] = _Account()
+            if len(table) > self.max_accounts:
+                table.popitem(last=False)
+        else:
+            table.move_to_end(key)
+        return account
+
+    def _roll_window(self, account: _Account, now: float):
+        if now - account.window_start >= self.budget_window:
+            account.window_start = now
+            account.window_tokens = 0
+
+    def budget_for(self, client: str) -> int:
+        return self.budgets.get(client, self.default_budget)
+
+    def check_budget(self, client: str):
+        """Raise BudgetExceeded if the client has no tokens left in this window"""
+        budget = self.budget_for(client)
+        if budget <= 0:
+            return
+        now = time.time()
+        with self._lock:
+            account = self._clients.get(client)
+            if account is None:
+                return
+            self._roll_window(account, now)
+            if account.window_tokens >= budget:
+                BUDGET_REJECTIONS.inc()
+                raise BudgetExceeded(client, account.window_start + self.budget_window - now)
+
+    def record(self, client: str, session: Optional[str], usage: Usage, model: str, route: str = "/api/chat") -> float:
+        """Account a generated response; returns its estimated cost"""
+        cost = usage.cost(model)
+        now = time.time()
+        with self._lock:
+            accounts = [self.total, self._account(self._clients, client)]
+            if session:
+                accounts.append(self._account(self._sessions, session))
+            for account in accounts:
+                self._roll_window(account, now)
+                account.usage.add(usage)
+                account.cost += cost
+                account.requests += 1
+                account.window_tokens += usage.total_tokens
+                account.last_seen = now
+        for kind in ("input", "output", "cached"):
+            count = getattr(usage, f"{kind}_tokens")
+            if count:
+                TOKENS.inc(count, route=route, model=model, kind=kind)
+        if usage.calls:
+            LLM_CALLS.inc(usage.calls, route=route, model=model)
+        if cost:
+            COST_USD.inc(cost, route=route, model=model)
+        return cost
+
+    def record_cache_hit(self, client: str, session: Optional[str], saved: Usage, model: str,
+                         route: str = "/api/chat"):
+        """Account a response served from cache and the tokens it avoided"""
+        now = time.time()
+        with self._lock:
+            accounts = [self.total, self._account(self._clients, client)]
+            if session:
+                accounts.append(self._account(self._sessions, session))
+            for account in accounts:
+                account.requests += 1
+                account.cache_hits += 1
+                account.tokens_saved += saved.total_tokens
+                account.last_seen = now
+        if saved.total_tokens:
+            TOKENS_SAVED.inc(saved.total_tokens, route=route, model=model)
+
+    def snapshot(self, client: Optional[str] = None, session: Optional[str] = None, limit: int = 50) -> Dict[str, Any]:
+        with self._lock:
+            if client is not None or session is not None:
+                result: Dict[str, Any] = {}
+                if client is not None:
+                    account = self._clients.get(client)
+                    result["client"] = {"id": client, "budget": self.budget_for(client),
+                                        **(account.to_dict() if account else _Account().to_dict())}
+                if session is not None:
+                    account = self._sessions.get(session)
+                    result["session"] = {"id": session, **(account.to_dict() if account else _Account().to_dict())}
+                return result
+            top = sorted(self._clients.items(), key=lambda item: item[1].usage.total_tokens, reverse=True)
+            return {
+                "total": self.total.to_dict(),
+                "budget": {"default": self.default_budget, "window_seconds": self.budget_window},
+                "clients": [{"id": key, **account.to_dict()} for key, account in top[:limit]],
+                "tracked_clients": len(self._clients),
+                "tracked_sessions": len(self._sessions),
+            }
+
+
+ledger = UsageLedger(
+    default_budget=int(os.getenv("TRAVEL_LIGHT_TOKEN_BUDGET", "0")),
+    budget_window=float(os.getenv("TRAVEL_LIGHT_TOKEN_BUDGET_WINDOW", "86400")),
+    budgets=_load_json_env("TRAVEL_LIGHT_TOKEN_BUDGETS"),
+)